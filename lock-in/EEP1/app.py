@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, has_request_context
 from flask_cors import CORS
 import requests
 import os
@@ -6,11 +6,29 @@ from dotenv import load_dotenv
 import json
 from datetime import datetime, timedelta
 from copy import deepcopy
+import time
 import logging
+import contextvars
+from contextlib import nullcontext
+from functools import wraps
+from metrics_helper import setup_metrics
+from service_client import ServiceClientRegistry
+from health import create_prober_from_env
+from streaming import format_sse, iter_sse_events, iter_anthropic_text, IncrementalCalendarParser, IncompleteStreamError
+from jobs import create_job_manager_from_env, public_job
+from persistence.job_repository import create_job_repository_from_env
 from prompts import PARSING_PROMPT
-from helpers import save_schedule, load_schedule, convert_to_24h, validate_and_fix_times, check_missing_info, clean_missing_info_from_tasks, clean_schedule, convert_answer_value, update_schedule_with_answers, ensure_ids, reset_schedules
+from helpers import save_schedule, load_schedule, convert_to_24h, validate_and_fix_times, check_missing_info, clean_missing_info_from_tasks, clean_schedule, convert_answer_value, update_schedule_with_answers, apply_answer, ensure_ids, reset_schedules
+from schedule_model import ScheduleModel
+from missing_info import MissingInfoAnalyzer, create_analyzer_cache_from_env
+from schedule_chunking import create_chunked_parser_from_env, count_lines, merge_schedules
+from rule_parser import create_rule_parser_from_env
 import uuid
-from schedule_prompts import get_schedule_prompt, get_response_parsing_prompt
+from schedule_prompts import get_schedule_prompt, build_schedule_prompt, set_fragment_cache, get_response_parsing_prompt, get_description_polish_prompt, get_calendar_fix_prompt
+from prompt_fragments import create_fragment_cache_from_env
+from local_solver import solve_schedule, day_window
+from json_repair import extract_json, record_extraction, AUTO_CLOSED
+from calendar_validation import validate_calendar, repair_calendar, expected_fixed_events, END_OF_DAY, DAYS
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -32,10 +50,154 @@ logger.debug(f"Using IEP2_URL: {IEP2_URL}")
 logger.debug(f"Using IEP3_URL: {IEP3_URL}")
 logger.debug(f"Using IEP4_URL: {IEP4_URL}")
 
+# Schedule generation engine: 'llm' (IEP2), 'local' (deterministic solver) or
+# 'hybrid' (local solver, IEP2 only rewrites session descriptions)
+SCHEDULE_ENGINES = ('local', 'llm', 'hybrid')
+SCHEDULE_ENGINE = os.getenv('SCHEDULE_ENGINE', 'llm')
+
+# Schedule text parser: 'llm' (IEP1), 'rules' (local rules only) or 'hybrid'
+# (local rules, IEP1 only for the lines they do not understand)
+SCHEDULE_PARSERS = ('llm', 'rules', 'hybrid')
+SCHEDULE_PARSER = os.getenv('SCHEDULE_PARSER', 'hybrid')
+
+# Re-send only the still-invalid days of a generated calendar to IEP2 after local repair
+CALENDAR_REPROMPT = os.getenv('CALENDAR_REPROMPT', 'true').lower() not in ('0', 'false', 'no')
+
+# Setup metrics
+metrics_dict = setup_metrics(app, 'eep1')
+
+# Keep-alive connection pools for downstream services; the timeouts are used
+# when a call site does not pass its own
+HEALTH_TIMEOUTS = {'/health': float(os.getenv('HEALTH_PROBE_TIMEOUT', '1'))}
+http_client = ServiceClientRegistry(metrics_dict=metrics_dict, service_name='eep1')
+http_client.register('iep1', IEP1_URL, timeouts=HEALTH_TIMEOUTS)
+http_client.register('iep2', IEP2_URL, timeouts=HEALTH_TIMEOUTS)
+http_client.register('iep3', IEP3_URL, timeouts=HEALTH_TIMEOUTS)
+http_client.register('iep4', IEP4_URL, timeouts=HEALTH_TIMEOUTS)
+
+# Downstream health, probed in parallel from a background thread and cached;
+# /health/ready fails while one of the required dependencies is unhealthy
+HEALTH_REQUIRED_DEPENDENCIES = [name.strip() for name in os.getenv('HEALTH_REQUIRED_DEPENDENCIES', 'iep1,iep2').split(',') if name.strip()]
+
+def probe_service(base_url):
+    """Check for the background prober: one /health call, without retries."""
+    def check():
+        response = http_client.get(f"{base_url}/health", idempotent=False)
+        if response.status_code == 200:
+            return True, None
+        try:
+            detail = response.json().get('error') or response.json().get('status')
+        except ValueError:
+            detail = None
+        return False, detail or f"HTTP {response.status_code}"
+    return check
+
+health_prober = create_prober_from_env({
+    'iep1': probe_service(IEP1_URL),
+    'iep2': probe_service(IEP2_URL),
+    'iep3': probe_service(IEP3_URL),
+    'iep4': probe_service(IEP4_URL)
+}, metrics_dict=metrics_dict, service_name='eep1')
+
+# Rendered prompt fragments (preferences, Google Calendar events, meetings, tasks) keyed by content hash
+set_fragment_cache(create_fragment_cache_from_env(metrics_dict=metrics_dict, service_name='eep1'))
+
+# Per-user missing-info analyzers, reused across consecutive answers
+missing_info_cache = create_analyzer_cache_from_env()
+
+# Long schedule texts are parsed by IEP1 in concurrent chunks
+chunked_parser = create_chunked_parser_from_env(metrics_dict=metrics_dict, service_name='eep1')
+
+# Formulaic lines are parsed locally, ahead of IEP1
+rule_parser = create_rule_parser_from_env(metrics_dict=metrics_dict, service_name='eep1')
+
+# Background schedule-generation jobs (records shared through the schedule store backend)
+job_manager = create_job_manager_from_env(create_job_repository_from_env(), metrics_dict=metrics_dict)
+
+def get_request_user_id():
+    """
+    Identify the user a request belongs to, so schedules are stored per user.
+    Checks the X-User-ID header first, then user_id in the JSON body or query string.
+    """
+    user_id = request.headers.get('X-User-ID')
+    if not user_id:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            user_id = data.get('user_id')
+    if not user_id:
+        user_id = request.args.get('user_id')
+    return str(user_id) if user_id else None
+
+def user_id_required(f):
+    """Reject requests that do not identify a user (400), so no schedule is shared between callers."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not get_request_user_id():
+            return jsonify({"error": "Missing user id (X-User-ID header or user_id)"}), 400
+        return f(*args, **kwargs)
+    return decorated_function
+
+def get_request_user_tier():
+    """The user's tier sent by the UI in the X-User-Tier header, if any."""
+    return request.headers.get('X-User-Tier') or None
+
+# User and tier an LLM call is made for outside a request (background jobs)
+llm_user = contextvars.ContextVar('llm_user', default=None)
+llm_tier = contextvars.ContextVar('llm_tier', default=None)
+
+def llm_headers(feature, size=None):
+    """
+    Headers attributing an LLM call to a feature and user in the IEP usage
+    ledgers. size (items in the input) and the user's tier let the IEPs
+    route small calls to their fast model.
+    """
+    user_id = llm_user.get() or (get_request_user_id() if has_request_context() else None)
+    headers = {'X-LLM-Feature': feature}
+    if user_id:
+        headers['X-User-ID'] = user_id
+    if size is not None:
+        headers['X-LLM-Size'] = str(size)
+    tier = llm_tier.get() or (get_request_user_tier() if has_request_context() else None)
+    if tier:
+        headers['X-User-Tier'] = tier
+    return headers
+
 # -------------------------------
 # Parsing and Storage Endpoints
 # -------------------------------
+def request_schedule_parse(text, headers):
+    """
+    Parse one chunk of schedule text with IEP1. Returns (schedule, error), with
+    error a (message, status code) pair; the schedule is None when IEP1's
+    answer was truncated. Runs on the chunked parser's threads, so the
+    headers are built by the request.
+    """
+    prompt = f"{PARSING_PROMPT}\n\nSchedule text:\n{text}"
+    logger.debug(f"Sending request to IEP1 at {IEP1_URL}/predict with prompt length: {len(prompt)}")
+    response = http_client.post(
+        f"{IEP1_URL}/predict",
+        json={'prompt': prompt},
+        headers=dict(headers, **{'X-LLM-Size': str(count_lines(text))}),
+        timeout=30
+    )
+    logger.debug(f"IEP1 response status: {response.status_code}")
+    
+    if response.status_code != 200:
+        logger.error(f"IEP1 returned error: {response.text}")
+        return None, (f'IEP1 error: {response.text}', response.status_code)
+    
+    try:
+        schedule = response.json()
+    except ValueError as e:
+        logger.error(f"Failed to decode IEP1 response as JSON: {e}")
+        return None, ('Invalid JSON response from IEP1', 500)
+    if response.headers.get('X-LLM-Truncated') == 'true':
+        logger.warning(f"IEP1 answer for {count_lines(text)} lines was truncated")
+        return None, None
+    return schedule, None
+
 @app.route('/parse-schedule', methods=['POST'])
+@user_id_required
 def parse_schedule():
     try:
         data = request.get_json()
@@ -45,58 +207,67 @@ def parse_schedule():
             logger.error("Missing text parameter in request")
             return jsonify({'error': 'Missing text parameter'}), 400
 
-        # Prepare prompt for IEP1
-        prompt = f"{PARSING_PROMPT}\n\nSchedule text:\n{data['text']}"
-        logger.debug(f"Sending request to IEP1 with prompt length: {len(prompt)}")
+        parser_mode = data.get('parser') or SCHEDULE_PARSER
+        if parser_mode not in SCHEDULE_PARSERS:
+            return jsonify({'error': f"Unknown parser '{parser_mode}'. Use one of: {', '.join(SCHEDULE_PARSERS)}"}), 400
 
-        # Call IEP1 for parsing
         try:
-            logger.debug(f"Making request to IEP1 at {IEP1_URL}/predict")
-            response = requests.post(
-                f"{IEP1_URL}/predict",
-                json={'prompt': prompt},
-                timeout=30
-            )
-            logger.debug(f"IEP1 response status: {response.status_code}")
-            logger.debug(f"IEP1 response content: {response.text}")
-            
-            if response.status_code != 200:
-                logger.error(f"IEP1 returned error: {response.text}")
-                return jsonify({'error': f'IEP1 error: {response.text}'}), response.status_code
-                
-            response.raise_for_status()
-            
-            # Get the response text and clean it
-            try:
-                response_text = response.json()
-                logger.debug(f"Cleaned response text: {response_text}")
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to decode IEP1 response as JSON: {e}")
-                return jsonify({'error': 'Invalid JSON response from IEP1'}), 500
-            
-            # Ensure all items have IDs
-            response_text = ensure_ids(response_text)
+            # Parse the formulaic lines locally; IEP1 only gets the lines the rules do not understand
+            text = data['text']
+            local = None
+            extra = {}
+            if parser_mode != 'llm':
+                local_start = time.time()
+                local = rule_parser.parse(text)
+                local_seconds = time.time() - local_start
+                extra['parse_stats'] = local.stats()
+                logger.info(f"Parsed {len(local.matches)} of {local.lines} lines locally")
+                if local.matches:
+                    text = local.residue
+            schedules = [local.schedule] if local and local.matches else []
+
+            if parser_mode == 'rules':
+                extra['unparsed'] = local.residue
+            elif local is None or text.strip():
+                # Call IEP1 for parsing, one request per chunk of a long text
+                headers = llm_headers('parse')
+                llm_start = time.time()
+                llm_schedule, error = chunked_parser.parse(
+                    text, lambda chunk: request_schedule_parse(chunk, headers)
+                )
+                if error is not None:
+                    message, status_code = error
+                    return jsonify({'error': message}), status_code
+                rule_parser.observe_llm(time.time() - llm_start, count_lines(text))
+                schedules.append(llm_schedule)
+            if local is not None:
+                rule_parser.record_saved(local, local_seconds)
+            schedule = merge_schedules(schedules)
             
-            # Check for missing information
-            questions = check_missing_info(response_text)
+            # Check for missing information; the analyzer is kept for the answers that follow
+            analyzer = MissingInfoAnalyzer(ScheduleModel.from_dict(schedule))
+            questions = analyzer.questions()
             
             if questions:
+                missing_info_cache.put(get_request_user_id(), schedule, analyzer)
                 return jsonify({
                     'status': 'questions_needed',
                     'questions': questions,
-                    'schedule': response_text
+                    'schedule': schedule,
+                    **extra
                 })
             
             # Save the parsed schedule
             try:
-                save_schedule(response_text)
+                save_schedule(schedule, user_id=get_request_user_id())
             except Exception as e:
                 logger.error(f"Failed to save schedule: {e}")
                 return jsonify({'error': 'Failed to save schedule'}), 500
             
             return jsonify({
                 'status': 'complete',
-                'schedule': response_text
+                'schedule': schedule,
+                **extra
             })
             
         except requests.exceptions.RequestException as e:
@@ -111,6 +282,7 @@ def parse_schedule():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/store-schedule', methods=['POST'])
+@user_id_required
 def store_schedule_endpoint():
     try:
         data = request.get_json()
@@ -119,7 +291,7 @@ def store_schedule_endpoint():
 
         schedule = data['schedule']
         schedule = ensure_ids(schedule)
-        save_schedule(schedule)
+        save_schedule(schedule, user_id=get_request_user_id())
         return jsonify({
             'status': 'success',
             'schedule': schedule
@@ -129,9 +301,10 @@ def store_schedule_endpoint():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/get-schedule', methods=['GET'])
+@user_id_required
 def get_schedule():
     try:
-        schedule = load_schedule(is_final=True)
+        schedule = load_schedule(is_final=True, user_id=get_request_user_id())
         if not schedule:
             return jsonify({'error': 'No schedule found'}), 404
             
@@ -146,7 +319,36 @@ def get_schedule():
 # -------------------------------
 # Missing Information and Answer Endpoints
 # -------------------------------
+def load_schedule_to_answer(user_id):
+    """The user's stored schedule, or None when it has no meetings or tasks to answer questions about."""
+    schedule = load_schedule(user_id=user_id)
+    if not schedule.get('meetings') and not schedule.get('tasks'):
+        return None
+    return schedule
+
+def save_answered_schedule(analyzer, answered_items, user_id):
+    """
+    Save a schedule whose model was just updated with answers and return
+    (schedule, remaining questions). Only the answered items and the items
+    depending on them are re-analysed; while questions remain, the analyzer
+    is kept for the next answer.
+    """
+    propagated = analyzer.refresh(answered_items)
+    if propagated:
+        logger.info(f"Answers changed the questions of related items {propagated}")
+
+    schedule = save_schedule(analyzer.model.to_dict(), user_id=user_id)
+    questions = analyzer.questions()
+    if questions:
+        missing_info_cache.put(user_id, schedule, analyzer)
+    else:
+        schedule = clean_schedule(schedule)
+        save_schedule(schedule, user_id=user_id)
+        logger.info("No questions remaining, schedule cleaned")
+    return schedule, questions
+
 @app.route('/answer-question', methods=['POST'])
+@user_id_required
 def answer_question():
     try:
         data = request.get_json()
@@ -155,14 +357,10 @@ def answer_question():
 
         logger.info(f"Processing answer for {data.get('type', 'unknown')} question")
 
-        schedule = load_schedule()
-        if not schedule:
-            return jsonify({'error': 'No schedule found'}), 404
-
-        # DEBUG: Log the initial state of tasks
-        logger.info("INITIAL TASKS STATE:")
-        for task in schedule.get('tasks', []):
-            logger.info(f"Task: {task.get('description')}, course_code: {task.get('course_code')}, missing_info: {task.get('missing_info')}, related_event: {task.get('related_event')}")
+        user_id = get_request_user_id()
+        schedule = load_schedule_to_answer(user_id)
+        if schedule is None:
+            return jsonify({'error': 'No schedule to answer for'}), 404
 
         item_id = data.get('item_id')
         answer_type = data.get('type')
@@ -171,108 +369,19 @@ def answer_question():
         if not all([item_id, answer_type, answer_value]):
             return jsonify({'error': 'Missing required fields'}), 400
 
-        updated = False
-        for item_list in [schedule.get('meetings', []), schedule.get('tasks', [])]:
-            for item in item_list:
-                if item.get('id') == item_id:
-                    logger.info(f"Found item to update: {item.get('description')}, type: {'meeting' if item_list == schedule.get('meetings', []) else 'task'}")
-                    
-                    if answer_type == 'time':
-                        item['time'] = convert_to_24h(answer_value)
-                    elif answer_type == 'ampm':
-                        # Handle AM/PM clarification
-                        original_time = data.get('original_time')
-                        if original_time and answer_value:
-                            # Construct full time string with AM/PM and convert
-                            full_time = f"{original_time} {answer_value}"
-                            item['time'] = convert_to_24h(full_time)
-                            logger.info(f"Updated time for {item.get('description')} from ambiguous {original_time} to {item['time']} based on {answer_value}")
-                    elif answer_type == 'duration':
-                        try:
-                            item['duration_minutes'] = int(answer_value)
-                        except ValueError:
-                            return jsonify({'error': 'Invalid duration value'}), 400
-                    elif answer_type == 'course_code':
-                        logger.info(f"Updating course_code for {item.get('description')} to {answer_value}")
-                        item['course_code'] = answer_value
-                        
-                        # If this is a meeting with a course code, propagate to related tasks
-                        if item_list == schedule.get('meetings', []):
-                            meeting_description = item.get('description')
-                            logger.info(f"Looking for tasks related to meeting: {meeting_description}")
-                            # Find and update any tasks related to this meeting
-                            for task in schedule.get('tasks', []):
-                                # Use partial matching: if meeting description is contained within related_event
-                                # or if related_event is contained within meeting description
-                                task_related_event = task.get('related_event', '')
-                                if (meeting_description and task_related_event and 
-                                   (meeting_description in task_related_event or 
-                                    task_related_event in meeting_description)):
-                                    logger.info(f"Found related task: {task.get('description')}, missing_info before: {task.get('missing_info')}")
-                                    task['course_code'] = answer_value
-                                    # Also remove course_code from the task's missing_info array if present
-                                    if 'missing_info' in task and 'course_code' in task['missing_info']:
-                                        task['missing_info'].remove('course_code')
-                                        logger.info(f"Removed course_code from missing_info, now: {task.get('missing_info')}")
-                                        # If missing_info is now empty, remove it entirely
-                                        if not task['missing_info']:
-                                            del task['missing_info']
-                                            logger.info("Deleted empty missing_info array")
-                                    else:
-                                        logger.info(f"No course_code in missing_info or no missing_info field")
-                                    logger.info(f"Propagated course code {answer_value} to task {task.get('description')}")
-                    elif answer_type == 'day':
-                        # Capitalize the day name for consistency
-                        day_value = answer_value.strip().capitalize()
-                        # Make sure it's a valid day of the week
-                        valid_days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-                        if day_value in valid_days:
-                            item['day'] = day_value
-                            logger.info(f"Updated day for {item.get('description')} to {day_value}")
-                        else:
-                            logger.warning(f"Invalid day value received: {day_value}")
-                            # Use the value anyway, but log a warning
-                            item['day'] = day_value
-
-                    field_map = {
-                        'time': 'time',
-                        'ampm': 'time', # Map ampm to time field for missing_info updates
-                        'duration': 'duration_minutes',
-                        'course_code': 'course_code',
-                        'day': 'day'
-                    }
-                    if field_map[answer_type] in item.get('missing_info', []):
-                        item['missing_info'].remove(field_map[answer_type])
-                        logger.info(f"Removed {field_map[answer_type]} from missing_info of {item.get('description')}")
-                    updated = True
-                    break
-            if updated:
-                break
-        if not updated:
+        analyzer = missing_info_cache.take(user_id, schedule)
+        item = analyzer.model.get(item_id)
+        if item is None:
             return jsonify({'error': 'Item not found'}), 404
 
-        save_schedule(schedule)
-        
-        # DEBUG: Log the state after updates
-        logger.info("TASKS STATE AFTER UPDATES:")
-        for task in schedule.get('tasks', []):
-            logger.info(f"Task: {task.get('description')}, course_code: {task.get('course_code')}, missing_info: {task.get('missing_info')}, related_event: {task.get('related_event')}")
-        
-        questions = check_missing_info(schedule)
-        
-        # DEBUG: Log the questions generated
-        logger.info(f"Questions generated by check_missing_info: {questions}")
-        
-        if not questions:
-            schedule = clean_schedule(schedule)
-            save_schedule(schedule)
-            logger.info("No questions remaining, schedule cleaned")
-        
-        # DEBUG: Log final state before returning
-        logger.info("FINAL TASKS STATE:")
-        for task in schedule.get('tasks', []):
-            logger.info(f"Task: {task.get('description')}, course_code: {task.get('course_code')}, missing_info: {task.get('missing_info')}")
-        
+        logger.info(f"Found item to update: {item.get('description')}, type: {type(item).__name__.lower()}")
+        try:
+            apply_answer(analyzer.model, item, answer_type, answer_value, data.get('original_time'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        schedule, questions = save_answered_schedule(analyzer, [item], user_id)
+
         return jsonify({
             'success': True,
             'has_more_questions': len(questions) > 0,
@@ -285,6 +394,49 @@ def answer_question():
         logger.error(f"Error processing answer: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/answer-questions', methods=['POST'])
+@user_id_required
+def answer_questions():
+    """
+    Apply every answer of the question form at once. Answers use the
+    /answer-question format; either all of them are applied and saved, or
+    none is. Questions are recomputed once for the final schedule.
+    """
+    try:
+        data = request.get_json()
+        answers = data.get('answers') if data else None
+        if not isinstance(answers, list) or not answers or not all(isinstance(answer, dict) for answer in answers):
+            return jsonify({'error': 'A non-empty list of answers is required'}), 400
+
+        user_id = get_request_user_id()
+        schedule = load_schedule_to_answer(user_id)
+        if schedule is None:
+            return jsonify({'error': 'No schedule to answer for'}), 404
+
+        analyzer = missing_info_cache.take(user_id, schedule)
+        logger.info(f"Processing {len(answers)} answers")
+
+        try:
+            update_schedule_with_answers(analyzer.model, answers)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        answered = [analyzer.model.get(answer.get('item_id')) for answer in answers]
+        schedule, questions = save_answered_schedule(analyzer, answered, user_id)
+
+        return jsonify({
+            'success': True,
+            'answered': len(answers),
+            'has_more_questions': len(questions) > 0,
+            'questions': questions if questions else None,
+            'schedule': schedule,
+            'ready_for_optimization': len(questions) == 0
+        })
+
+    except Exception as e:
+        logger.error(f"Error processing answers: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/handle-missing-info', methods=['POST'])
 def handle_missing_info():
     try:
@@ -376,6 +528,7 @@ def construct_schedule_prompt():
         return jsonify({'error': str(e)}), 500
         
 @app.route('/parse-schedule-llm-response', methods=['POST'])
+@user_id_required
 def parse_schedule_llm_response():
     """
     Parse and validate the LLM's response, ensuring it follows the correct format.
@@ -402,69 +555,10 @@ def parse_schedule_llm_response():
             else:
                 return jsonify({'error': 'Could not extract text from Anthropic response'}), 400
         
-        # Extract generated calendar from LLM response
-        generated_calendar = None
-        
-        # First attempt: try to parse the response directly as JSON
-        try:
-            # Try to find a JSON object in the response
-            json_start = llm_response.find('{')
-            json_end = llm_response.rfind('}') + 1
-            
-            if json_start >= 0 and json_end > json_start:
-                json_str = llm_response[json_start:json_end]
-                parsed_response = json.loads(json_str)
-                
-                # Check if it's a complete calendar object or just the generated_calendar
-                if "generated_calendar" in parsed_response:
-                    generated_calendar = parsed_response["generated_calendar"]
-                else:
-                    # Assume the entire object is the calendar
-                    generated_calendar = parsed_response
-            else:
-                logger.warning("Could not find JSON in LLM response")
-        except json.JSONDecodeError as e:
-            logger.warning(f"Failed to parse LLM response as JSON: {e}")
-            
-        # If we couldn't parse it, we need further processing
-        if not generated_calendar:
-            # Call IEP1 to help parse the response
-            try:
-                parsing_prompt = get_response_parsing_prompt(llm_response, original_data)
-                
-                parsing_response = requests.post(
-                    f"{IEP1_URL}/predict",
-                    json={'prompt': parsing_prompt},
-                    timeout=30
-                )
-                
-                if parsing_response.status_code != 200:
-                    return jsonify({'error': f'Failed to parse LLM response: {parsing_response.text}'}), 500
-                    
-                parsed_result = parsing_response.json()
-                
-                # Try to extract the JSON part from the parsing result
-                if isinstance(parsed_result, str):
-                    json_start = parsed_result.find('{')
-                    json_end = parsed_result.rfind('}') + 1
-                    
-                    if json_start >= 0 and json_end > json_start:
-                        json_str = parsed_result[json_start:json_end]
-                        parsed_json = json.loads(json_str)
-                        
-                        if "schedule" in parsed_json and "generated_calendar" in parsed_json["schedule"]:
-                            generated_calendar = parsed_json["schedule"]["generated_calendar"]
-                else:
-                    # If it's already a dict
-                    if "schedule" in parsed_result and "generated_calendar" in parsed_result["schedule"]:
-                        generated_calendar = parsed_result["schedule"]["generated_calendar"]
-                
-            except Exception as e:
-                logger.error(f"Error parsing LLM response with IEP1: {str(e)}", exc_info=True)
-                
-        # If we still don't have a calendar, return an error
-        if not generated_calendar:
-            return jsonify({'error': 'Could not extract valid schedule from LLM response'}), 500
+        # Extract generated calendar from LLM response (IEP1 re-parses it only as a last resort)
+        generated_calendar, error = extract_generated_calendar(llm_response, original_data.get('schedule', original_data))
+        if error:
+            return jsonify({'error': error}), 500
             
         # Now construct the final response
         if 'schedule' in original_data:
@@ -476,8 +570,15 @@ def parse_schedule_llm_response():
                 'course_codes': original_data.get('course_codes', [])
             }
             
+        # Validate the calendar; repairable problems are fixed without another full LLM round-trip
+        generated_calendar, issues = check_generated_calendar(
+            generated_calendar, schedule_out, original_data.get('preferences'), original_data.get('google_calendar')
+        )
+        
         # Add the generated calendar
         schedule_out['generated_calendar'] = generated_calendar
+        if issues:
+            schedule_out['validation_issues'] = issues
         
         # Construct the complete response
         result = {
@@ -487,7 +588,7 @@ def parse_schedule_llm_response():
         }
         
         # Save the final schedule
-        save_schedule(schedule_out, is_final=True)
+        save_schedule(schedule_out, is_final=True, user_id=get_request_user_id())
         
         return jsonify(result)
         
@@ -495,57 +596,474 @@ def parse_schedule_llm_response():
         logger.error(f"Error parsing LLM response: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+def extract_llm_text(llm_response_data):
+    """Join the text blocks of a Claude response returned by IEP2."""
+    llm_response = ""
+    for content_item in llm_response_data.get('content', []):
+        if content_item.get('type') == 'text':
+            llm_response += content_item.get('text', '')
+    return llm_response
+
+def extract_generated_calendar(llm_response, cleaned_schedule):
+    """
+    Extract the generated calendar from the LLM's text, repairing common JSON
+    defects locally. IEP1 is only asked to re-parse the response when no JSON
+    can be recovered at all. Returns (generated_calendar, error message).
+    """
+    extraction = extract_json(
+        llm_response, prefer_keys=('generated_calendar',), metrics_dict=metrics_dict, service_name='eep1'
+    )
+    # A calendar that had to be closed by the repair was cut off; re-parsing cannot bring back the rest
+    if extraction and AUTO_CLOSED in extraction.repairs:
+        return None, 'Generated schedule was cut off before it was complete'
+    generated_calendar = extraction.value if extraction else None
+    # Unwrap {"generated_calendar": {...}} so callers always get the day object
+    if isinstance(generated_calendar, dict) and isinstance(generated_calendar.get("generated_calendar"), dict):
+        generated_calendar = generated_calendar["generated_calendar"]
+    if not isinstance(generated_calendar, dict):
+        generated_calendar = None
+
+    # If we couldn't parse it, we need further processing
+    if not generated_calendar:
+        record_extraction(metrics_dict, 'eep1', 'llm_fallback')
+        # Call IEP1 to help parse the response
+        parsing_prompt = get_response_parsing_prompt(llm_response, {'schedule': cleaned_schedule})
+
+        parsing_response = http_client.post(
+            f"{IEP1_URL}/predict",
+            json={'prompt': parsing_prompt},
+            headers=llm_headers('parse_fallback'),
+            timeout=30
+        )
+
+        if parsing_response.status_code != 200:
+            return None, f'Failed to parse LLM response: {parsing_response.text}'
+
+        parsed_result = parsing_response.json()
+
+        # IEP1 wraps output that is not valid JSON as {"response": text}
+        if isinstance(parsed_result, dict) and isinstance(parsed_result.get('response'), str):
+            extraction = extract_json(parsed_result['response'], prefer_keys=('schedule',))
+            parsed_result = extraction.value if extraction and AUTO_CLOSED not in extraction.repairs else None
+
+        if isinstance(parsed_result, dict) and isinstance(parsed_result.get("schedule"), dict):
+            generated_calendar = parsed_result["schedule"].get("generated_calendar")
+
+    # If we still don't have a calendar, return an error
+    if not generated_calendar:
+        return None, 'Could not extract valid schedule from LLM response'
+
+    return generated_calendar, None
+
+def reprompt_invalid_days(calendar, report, cleaned_schedule=None, google_calendar=None):
+    """Ask IEP2 to fix only the days that still fail validation. Returns the updated calendar."""
+    days = [day for day in report.days() if day in calendar]
+    if not days:
+        return calendar
+    
+    fixed_events = {}
+    for day, event in expected_fixed_events(cleaned_schedule, google_calendar).values():
+        if day in days:
+            fixed_events.setdefault(day, []).append(event)
+    prompt = get_calendar_fix_prompt(
+        {day: calendar[day] for day in days},
+        [issue for issue in report.issues if issue['day'] in days],
+        fixed_events
+    )
+    
+    try:
+        response = http_client.post(
+            f"{IEP2_URL}/api/generate",
+            json={'prompt': prompt, 'max_tokens': 2000, 'temperature': 0.2},
+            headers=llm_headers('calendar_reprompt', size=len(days)),
+            timeout=120
+        )
+        if response.status_code != 200:
+            raise ValueError(f"IEP2 returned {response.status_code}")
+        extraction = extract_json(extract_llm_text(response.json()), metrics_dict=metrics_dict, service_name='eep1')
+        if extraction is None or not isinstance(extraction.value, dict):
+            raise ValueError("Expected a JSON object of days")
+        fixed_days = extraction.value
+    except (requests.RequestException, ValueError) as e:
+        logger.warning(f"Re-prompting for invalid days failed: {str(e)}")
+        return calendar
+    
+    calendar = dict(calendar)
+    for day in days:
+        if isinstance(fixed_days.get(day), list):
+            calendar[day] = fixed_days[day]
+    return calendar
+
+def check_generated_calendar(generated_calendar, cleaned_schedule, preferences=None, google_calendar=None):
+    """
+    Validate a generated calendar against the fixed meetings, Google Calendar
+    events and wake/sleep hours. Problems are repaired locally where possible
+    and only the days whose remaining problems involve flexible events are
+    sent back to IEP2; conflicts between fixed events are only reported.
+    Returns (calendar, remaining issues).
+    """
+    if preferences and (preferences.get('wake_time') or preferences.get('sleep_time')):
+        day_start, day_end = day_window(preferences)
+    else:
+        day_start, day_end = 0, END_OF_DAY
+    
+    report = validate_calendar(generated_calendar, cleaned_schedule, google_calendar, day_start=day_start, day_end=day_end)
+    if report.valid:
+        return generated_calendar, []
+    
+    logger.info(f"Generated calendar has {len(report.issues)} issue(s) on {', '.join(report.days())}")
+    for issue in report.issues:
+        metrics_dict['calendar_issues_total'].labels(service='eep1', code=issue['code']).inc()
+    
+    calendar, remaining = repair_calendar(
+        generated_calendar, cleaned_schedule, google_calendar, day_start=day_start, day_end=day_end
+    )
+    method = 'local'
+    regenerable = remaining.regenerable(calendar)
+    if not regenerable.valid and CALENDAR_REPROMPT:
+        calendar = reprompt_invalid_days(calendar, regenerable, cleaned_schedule, google_calendar)
+        calendar, remaining = repair_calendar(
+            calendar, cleaned_schedule, google_calendar, day_start=day_start, day_end=day_end
+        )
+        method = 'reprompt'
+    if not remaining.valid:
+        method = 'unresolved'
+        logger.warning(f"Generated calendar still has {len(remaining.issues)} issue(s) after repair")
+    metrics_dict['calendar_repairs_total'].labels(service='eep1', method=method).inc()
+    
+    return calendar, remaining.issues
+
+def build_final_schedule(cleaned_schedule, generated_calendar, preferences=None, google_calendar=None,
+                         validation_issues=None):
+    """Merge the generated calendar into the schedule returned to the UI."""
+    final_schedule = {
+        'meetings': cleaned_schedule.get('meetings', []),
+        'tasks': cleaned_schedule.get('tasks', []),
+        'course_codes': cleaned_schedule.get('course_codes', []),
+        'generated_calendar': generated_calendar
+    }
+    
+    # Problems the validator could not repair, so the UI can point them out
+    if validation_issues:
+        final_schedule['validation_issues'] = validation_issues
+    
+    # Include user preferences in the final schedule if available
+    if preferences:
+        final_schedule['preferences'] = preferences
+    
+    # Include a reference to the Google Calendar if it was used
+    if google_calendar:
+        final_schedule['used_google_calendar'] = True
+    
+    return final_schedule
+
+def polish_calendar_descriptions(generated_calendar):
+    """
+    Ask IEP2 to rewrite the descriptions of the task sessions placed by the
+    local solver. Times are never changed; on any failure the solver's
+    descriptions are kept.
+    """
+    sessions = [
+        event for events in generated_calendar.values() for event in events
+        if event.get('type') == 'task' and event.get('id')
+    ]
+    if not sessions:
+        return generated_calendar
+    
+    prompt = get_description_polish_prompt([
+        {'id': event['id'], 'description': event.get('description', ''), 'course_code': event.get('course_code')}
+        for event in sessions
+    ])
+    try:
+        response = http_client.post(
+            f"{IEP2_URL}/api/generate",
+            json={'prompt': prompt, 'max_tokens': 1000, 'temperature': 0.3},
+            headers=llm_headers('description_polish', size=len(sessions)),
+            timeout=60
+        )
+        if response.status_code != 200:
+            raise ValueError(f"IEP2 returned {response.status_code}")
+        extraction = extract_json(extract_llm_text(response.json()), metrics_dict=metrics_dict, service_name='eep1')
+        if extraction is None or not isinstance(extraction.value, dict):
+            raise ValueError("Expected a JSON object of descriptions")
+        descriptions = extraction.value
+    except (requests.RequestException, ValueError) as e:
+        logger.warning(f"Keeping local solver descriptions, polishing failed: {str(e)}")
+        return generated_calendar
+    
+    for event in sessions:
+        description = descriptions.get(event['id'])
+        if isinstance(description, str) and description.strip():
+            event['description'] = description.strip()
+    return generated_calendar
+
+def solve_local_schedule(generation):
+    """
+    Build the final schedule with the local solver (engine 'local' or 'hybrid').
+    Tasks that did not fit in the week are listed under 'unscheduled_tasks'.
+    """
+    start_time = time.time()
+    generated_calendar, unscheduled = solve_schedule(
+        generation['cleaned_schedule'], generation['preferences'], generation['google_calendar']
+    )
+    logger.info(f"Local solver built the calendar in {(time.time() - start_time) * 1000:.1f} ms")
+    
+    if generation['engine'] == 'hybrid':
+        polish_calendar_descriptions(generated_calendar)
+    
+    final_schedule = build_final_schedule(
+        generation['cleaned_schedule'], generated_calendar,
+        generation['preferences'], generation['google_calendar']
+    )
+    final_schedule['engine'] = generation['engine']
+    if unscheduled:
+        final_schedule['unscheduled_tasks'] = unscheduled
+    return final_schedule
+
+class ScheduleGenerationError(Exception):
+    """Raised when IEP2/IEP1 cannot produce a generated calendar."""
+
+def stream_calendar_days(prompt, parser, check=None, feature='generate', system=None, size=None):
+    """
+    Ask IEP2 for a streamed completion and yield (day, events) for each day of
+    the calendar as soon as it is complete. The full text stays in parser.text.
+    check, if given, is called after every chunk and may raise to abort.
+    system, if given, holds the stable instructions IEP2 sends as a cached system prompt.
+    size is the number of meetings and tasks, used by IEP2 to pick the model.
+    """
+    payload = {
+        'prompt': prompt,
+        'max_tokens': 4000,
+        'temperature': 0.2,
+        'stream': True
+    }
+    if system:
+        payload['system'] = system
+    response = http_client.post(
+        f"{IEP2_URL}/api/generate",
+        json=payload,
+        headers=llm_headers(feature, size=size),
+        stream=True,
+        timeout=(10, 350)
+    )
+    try:
+        if response.status_code != 200:
+            raise ScheduleGenerationError(f'Failed to generate schedule: {response.text}')
+        events = iter_sse_events(response.iter_lines(decode_unicode=True))
+        for text in iter_anthropic_text(events):
+            for day, day_events in parser.feed(text):
+                yield day, day_events
+            if check:
+                check()
+    except IncompleteStreamError as e:
+        raise ScheduleGenerationError(f'Schedule generation stopped early: {str(e)}')
+    finally:
+        response.close()
+
+def complete_calendar(parser, cleaned_schedule, google_calendar=None):
+    """
+    Return the calendar gathered by the parser, falling back to full-text
+    extraction (and IEP1) when nothing could be parsed incrementally.
+    Raises ScheduleGenerationError if a day holding a fixed meeting or
+    Google Calendar event is missing, as the answer is then incomplete.
+    """
+    if parser.calendar:
+        generated_calendar = parser.calendar
+    else:
+        generated_calendar, error = extract_generated_calendar(parser.text, cleaned_schedule)
+        if error:
+            raise ScheduleGenerationError(error)
+    
+    expected_days = {day for day, _ in expected_fixed_events(cleaned_schedule, google_calendar).values()}
+    missing_days = [day for day in DAYS if day in expected_days and day not in generated_calendar]
+    if missing_days:
+        raise ScheduleGenerationError(f"Generated schedule is incomplete: {', '.join(missing_days)} missing")
+    return generated_calendar
+
+def stream_optimized_schedule(generation, user_id):
+    """
+    Stream schedule generation as server-sent events.
+
+    Events: 'day' ({day, events}) for each completed day of the calendar,
+    'complete' with the final schedule, or 'error' ({error}).
+    """
+    def generate():
+        yield format_sse('status', {'stage': 'generating'})
+        parser = IncrementalCalendarParser()
+        try:
+            if generation['engine'] != 'llm':
+                final_schedule = solve_local_schedule(generation)
+                for day, day_events in final_schedule['generated_calendar'].items():
+                    yield format_sse('day', {'day': day, 'events': day_events})
+            else:
+                for day, day_events in stream_calendar_days(generation['prompt'], parser, feature=generation['feature'],
+                                                            system=generation.get('system'),
+                                                            size=generation.get('size')):
+                    yield format_sse('day', {'day': day, 'events': day_events})
+                
+                generated_calendar = complete_calendar(parser, generation['cleaned_schedule'],
+                                                       generation['google_calendar'])
+                generated_calendar, issues = check_generated_calendar(
+                    generated_calendar, generation['cleaned_schedule'],
+                    generation['preferences'], generation['google_calendar']
+                )
+                final_schedule = build_final_schedule(
+                    generation['cleaned_schedule'], generated_calendar,
+                    generation['preferences'], generation['google_calendar'], issues
+                )
+            save_schedule(final_schedule, is_final=True, user_id=user_id)
+            yield format_sse('complete', final_schedule)
+        
+        except ScheduleGenerationError as e:
+            yield format_sse('error', {'error': str(e)})
+        except Exception as e:
+            logger.error(f"Error in streaming schedule generation: {str(e)}")
+            yield format_sse('error', {'error': f'Error generating schedule: {str(e)}'})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def run_schedule_generation_job(context, generation, user_id, tier=None):
+    """Job body: generate the calendar, recording each finished day as partial output."""
+    token = llm_user.set(user_id)
+    tier_token = llm_tier.set(tier)
+    try:
+        return generate_schedule_in_job(context, generation, user_id)
+    finally:
+        llm_tier.reset(tier_token)
+        llm_user.reset(token)
+
+def generate_schedule_in_job(context, generation, user_id):
+    if generation['engine'] != 'llm':
+        # Only the hybrid description polish calls IEP2
+        with context.limit('iep2') if generation['engine'] == 'hybrid' else nullcontext():
+            final_schedule = solve_local_schedule(generation)
+        context.check_cancelled()
+        save_schedule(final_schedule, is_final=True, user_id=user_id)
+        return final_schedule
+    
+    parser = IncrementalCalendarParser()
+    with context.limit('iep2'):
+        for day, day_events in stream_calendar_days(generation['prompt'], parser, check=context.check_cancelled,
+                                                    feature=generation['feature'], system=generation.get('system'),
+                                                    size=generation.get('size')):
+            context.set_partial(day, day_events)
+    
+    # Only the IEP1 fallback parse needs an IEP1 slot
+    with context.limit('iep1') if not parser.calendar else nullcontext():
+        generated_calendar = complete_calendar(parser, generation['cleaned_schedule'], generation['google_calendar'])
+    
+    context.check_cancelled()
+    # A re-prompt for invalid days goes to IEP2 again
+    with context.limit('iep2'):
+        generated_calendar, issues = check_generated_calendar(
+            generated_calendar, generation['cleaned_schedule'],
+            generation['preferences'], generation['google_calendar']
+        )
+    final_schedule = build_final_schedule(
+        generation['cleaned_schedule'], generated_calendar,
+        generation['preferences'], generation['google_calendar'], issues
+    )
+    save_schedule(final_schedule, is_final=True, user_id=user_id)
+    return final_schedule
+
+def prepare_schedule_generation(data):
+    """
+    Validate a generation request and build its prompt.
+    Returns (generation, None) or (None, (error body, status code)).
+    """
+    # Get schedule and preferences directly from request
+    if not data or 'schedule' not in data:
+        logger.error("No schedule provided in request")
+        return None, ({'error': 'No schedule provided in request. Data must come from UI.'}, 400)
+        
+    schedule = data['schedule']
+    preferences = data.get('preferences', None)
+    google_calendar = data.get('google_calendar', None)
+    custom_prompt = data.get('custom_prompt', None)
+    engine = data.get('engine') or SCHEDULE_ENGINE
+    if engine not in SCHEDULE_ENGINES:
+        return None, ({'error': f"Unknown engine '{engine}'. Use one of: {', '.join(SCHEDULE_ENGINES)}"}, 400)
+        
+    # Validate the schedule
+    questions = check_missing_info(schedule)
+    if questions:
+        return None, ({
+            'error': 'Schedule is incomplete',
+            'questions': questions
+        }, 400)
+        
+    cleaned_schedule = clean_schedule(schedule)
+    logger.info("Preparing to generate schedule...")
+    
+    # Log whether we have a Google Calendar
+    if google_calendar:
+        logger.info("Using Google Calendar data from request")
+    else:
+        logger.info("No Google Calendar data provided in request")
+    
+    # The local solver needs no prompt; the default template sends its instructions
+    # as a separate system prompt that IEP2 marks for Anthropic prompt caching
+    system = None
+    if engine != 'llm':
+        logger.info(f"Using the local solver (engine={engine})")
+        prompt = None
+    elif custom_prompt:
+        logger.info("Using custom prompt from request")
+        prompt = custom_prompt
+    else:
+        # Generate the prompt using our helper function
+        logger.info("Using default prompt template")
+        rendered = build_schedule_prompt(cleaned_schedule, preferences, google_calendar)
+        logger.info(f"Prompt fragment sizes: {rendered.sizes()}")
+        system, prompt = rendered.split_system()
+    
+    return {
+        'prompt': prompt,
+        'system': system,
+        'size': len(cleaned_schedule.get('meetings', [])) + len(cleaned_schedule.get('tasks', [])),
+        'cleaned_schedule': cleaned_schedule,
+        'preferences': preferences,
+        'google_calendar': google_calendar,
+        'engine': engine,
+        'feature': 'regenerate' if data.get('regenerate') else 'generate'
+    }, None
+
 @app.route('/generate-optimized-schedule', methods=['POST'])
+@user_id_required
 def generate_optimized_schedule():
     """Generate an optimized schedule using EEP1 service, which will call IEP2."""
     try:
         data = request.get_json()
         
-        # Get schedule and preferences directly from request
-        if not data or 'schedule' not in data:
-            logger.error("No schedule provided in request")
-            return jsonify({'error': 'No schedule provided in request. Data must come from UI.'}), 400
-            
-        schedule = data['schedule']
-        preferences = data.get('preferences', None)
-        google_calendar = data.get('google_calendar', None)
-        custom_prompt = data.get('custom_prompt', None)
-            
-        # Validate the schedule
-        questions = check_missing_info(schedule)
-        if questions:
-            return jsonify({
-                'error': 'Schedule is incomplete',
-                'questions': questions
-            }), 400
-            
-        cleaned_schedule = clean_schedule(schedule)
-        logger.info("Preparing to generate schedule...")
-        
-        # Log whether we have a Google Calendar
-        if google_calendar:
-            logger.info("Using Google Calendar data from request")
-        else:
-            logger.info("No Google Calendar data provided in request")
+        generation, error = prepare_schedule_generation(data)
+        if error:
+            return jsonify(error[0]), error[1]
+        cleaned_schedule = generation['cleaned_schedule']
         
         try:
-            # Check if custom prompt is available
-            if custom_prompt:
-                logger.info("Using custom prompt from request")
-                prompt = custom_prompt
-            else:
-                # Generate the prompt using our helper function
-                logger.info("Using default prompt template")
-                prompt = get_schedule_prompt(cleaned_schedule, preferences, google_calendar)
+            # Streaming mode: relay each day of the calendar as soon as it is complete
+            if data.get('stream'):
+                return stream_optimized_schedule(generation, get_request_user_id())
+            
+            if generation['engine'] != 'llm':
+                final_schedule = solve_local_schedule(generation)
+                save_schedule(final_schedule, is_final=True, user_id=get_request_user_id())
+                return jsonify(final_schedule)
             
             # Call IEP2 to get the LLM response
-            response = requests.post(
+            response = http_client.post(
                 f"{IEP2_URL}/api/generate",
                 json={
-                    'prompt': prompt,
+                    'prompt': generation['prompt'],
+                    'system': generation['system'],
                     'max_tokens': 4000,
                     'temperature': 0.2
                 },
+                headers=llm_headers(generation['feature'], size=generation['size']),
                 timeout=350
             )
             
@@ -553,83 +1071,21 @@ def generate_optimized_schedule():
                 return jsonify({'error': f'Failed to generate schedule: {response.text}'}), 500
                 
             # Extract content from the LLM response
-            llm_response_data = response.json()
-            llm_response = ""
+            llm_response = extract_llm_text(response.json())
             
-            # Extract the actual content from the Claude response format
-            if 'content' in llm_response_data:
-                for content_item in llm_response_data['content']:
-                    if content_item.get('type') == 'text':
-                        llm_response += content_item.get('text', '')
+            generated_calendar, error = extract_generated_calendar(llm_response, cleaned_schedule)
+            if error:
+                return jsonify({'error': error}), 500
             
-            # Try to extract the calendar part from the response
-            try:
-                # Find JSON object in the response
-                json_start = llm_response.find('{')
-                json_end = llm_response.rfind('}') + 1
-                
-                if json_start >= 0 and json_end > json_start:
-                    json_str = llm_response[json_start:json_end]
-                    generated_calendar = json.loads(json_str)
-                else:
-                    generated_calendar = None
-            except json.JSONDecodeError:
-                generated_calendar = None
-                
-            # If we couldn't parse it, we need further processing
-            if not generated_calendar:
-                # Call IEP1 to help parse the response
-                parsing_prompt = get_response_parsing_prompt(llm_response, {'schedule': cleaned_schedule})
-                
-                parsing_response = requests.post(
-                    f"{IEP1_URL}/predict",
-                    json={'prompt': parsing_prompt},
-                    timeout=30
-                )
-                
-                if parsing_response.status_code != 200:
-                    return jsonify({'error': f'Failed to parse LLM response: {parsing_response.text}'}), 500
-                    
-                parsed_result = parsing_response.json()
-                
-                # Try to extract the JSON part from the parsing result
-                if isinstance(parsed_result, str):
-                    json_start = parsed_result.find('{')
-                    json_end = parsed_result.rfind('}') + 1
-                    
-                    if json_start >= 0 and json_end > json_start:
-                        json_str = parsed_result[json_start:json_end]
-                        parsed_json = json.loads(json_str)
-                        
-                        if "schedule" in parsed_json and "generated_calendar" in parsed_json["schedule"]:
-                            generated_calendar = parsed_json["schedule"]["generated_calendar"]
-                else:
-                    # If it's already a dict
-                    if "schedule" in parsed_result and "generated_calendar" in parsed_result["schedule"]:
-                        generated_calendar = parsed_result["schedule"]["generated_calendar"]
-            
-            # If we still don't have a calendar, return an error
-            if not generated_calendar:
-                return jsonify({'error': 'Could not extract valid schedule from LLM response'}), 500
-                
-            # Merge the generated calendar into the schedule
-            final_schedule = {
-                'meetings': cleaned_schedule.get('meetings', []),
-                'tasks': cleaned_schedule.get('tasks', []),
-                'course_codes': cleaned_schedule.get('course_codes', []),
-                'generated_calendar': generated_calendar
-            }
-            
-            # Include user preferences in the final schedule if available
-            if preferences:
-                final_schedule['preferences'] = preferences
-            
-            # Include a reference to the Google Calendar if it was used
-            if google_calendar:
-                final_schedule['used_google_calendar'] = True
+            generated_calendar, issues = check_generated_calendar(
+                generated_calendar, cleaned_schedule, generation['preferences'], generation['google_calendar']
+            )
+            final_schedule = build_final_schedule(
+                cleaned_schedule, generated_calendar, generation['preferences'], generation['google_calendar'], issues
+            )
             
             # Save the final schedule
-            save_schedule(final_schedule, is_final=True)
+            save_schedule(final_schedule, is_final=True, user_id=get_request_user_id())
             
             return jsonify(final_schedule)
             
@@ -641,6 +1097,64 @@ def generate_optimized_schedule():
         logger.error(f"Error in generate_optimized_schedule: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# -------------------------------
+# Background Schedule Generation Jobs
+# -------------------------------
+@app.route('/jobs/generate-schedule', methods=['POST'])
+@user_id_required
+def submit_schedule_job():
+    """
+    Queue schedule generation and return a job id immediately (202).
+    An identical submission still in flight for the same user returns the existing job.
+    """
+    try:
+        data = request.get_json()
+        generation, error = prepare_schedule_generation(data)
+        if error:
+            return jsonify(error[0]), error[1]
+        
+        user_id = get_request_user_id()
+        tier = get_request_user_tier()
+        fingerprint_payload = {
+            key: data.get(key) for key in ('schedule', 'preferences', 'google_calendar', 'custom_prompt', 'engine')
+        }
+        job, deduplicated = job_manager.submit(
+            user_id,
+            fingerprint_payload,
+            lambda context: run_schedule_generation_job(context, generation, user_id, tier)
+        )
+        
+        response = public_job(job)
+        response['deduplicated'] = deduplicated
+        return jsonify(response), 202
+    except Exception as e:
+        logger.error(f"Error submitting schedule job: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def get_owned_job(job_id):
+    """Return the job if it belongs to the requesting user, else None."""
+    job = job_manager.get(job_id)
+    if job is None or job.get('user_id') != get_request_user_id():
+        return None
+    return job
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+@user_id_required
+def get_job(job_id):
+    """Return a job's status, partial output (finished days) and result."""
+    job = get_owned_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(public_job(job))
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+@user_id_required
+def cancel_job(job_id):
+    """Cancel a queued or running job."""
+    if get_owned_job(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(public_job(job_manager.cancel(job_id)))
+
 # -------------------------------
 # Google Calendar Integration Endpoints
 # -------------------------------
@@ -654,7 +1168,7 @@ def google_calendar_authorize():
             return jsonify({'error': 'Missing redirect_uri parameter'}), 400
         
         # Forward the request to IEP3
-        response = requests.get(
+        response = http_client.get(
             f"{IEP3_URL}/authorize",
             params={'redirect_uri': redirect_uri},
             timeout=10
@@ -679,7 +1193,7 @@ def google_calendar_callback():
             return jsonify({'error': 'Code is required'}), 400
         
         # Forward the request to IEP3
-        response = requests.post(
+        response = http_client.post(
             f"{IEP3_URL}/callback",
             json=data,
             timeout=10
@@ -709,10 +1223,11 @@ def google_calendar_fetch():
         }
         
         # Forward request to IEP3
-        response = requests.post(
+        response = http_client.post(
             f"{IEP3_URL}/fetch-calendar",
             json=request_data,
-            timeout=30
+            timeout=30,
+            idempotent=True  # Read-only, safe to retry
         )
         
         if response.status_code != 200:
@@ -778,7 +1293,7 @@ def export_schedule_to_google():
             })
         
         # Send the events to IEP3 for creation
-        response = requests.post(
+        response = http_client.post(
             f"{IEP3_URL}/create-events",
             json={
                 'credentials': credentials,
@@ -799,43 +1314,51 @@ def export_schedule_to_google():
         return jsonify({'error': str(e)}), 500
 
 # -------------------------------
-# Health Endpoint
+# Health Endpoints
 # -------------------------------
+def dependency_health():
+    """
+    Cached downstream health from the background prober (started on first use).
+    Returns (body, ready), where ready means every required dependency is healthy.
+    """
+    health_prober.start()
+    services = health_prober.results()
+    ready = all(services.get(name, {}).get('status') == 'healthy' for name in HEALTH_REQUIRED_DEPENDENCIES)
+    all_healthy = all(service['status'] == 'healthy' for service in services.values())
+    return {
+        "status": "healthy" if all_healthy else ("partially healthy" if ready else "unhealthy"),
+        "required": HEALTH_REQUIRED_DEPENDENCIES,
+        "services": services
+    }, ready
+
+@app.route('/health/live', methods=['GET'])
+def liveness():
+    """Liveness probe: answers as long as the process serves requests, whatever the dependencies."""
+    return jsonify({"status": "alive"}), 200
+
+@app.route('/health/ready', methods=['GET'])
+def readiness():
+    """Readiness probe: 503 while a required dependency is unhealthy."""
+    body, ready = dependency_health()
+    return jsonify(body), 200 if ready else 503
+
 @app.route('/health', methods=['GET'])
 def health():
-    try:
-        iep1_response = requests.get(f"{IEP1_URL}/health")
-        iep1_status = iep1_response.status_code == 200
-        
-        # Check IEP3 health too
-        try:
-            iep3_response = requests.get(f"{IEP3_URL}/health")
-            iep3_status = iep3_response.status_code == 200
-        except:
-            iep3_status = False
-        
-        return jsonify({
-            "status": "healthy" if (iep1_status and iep3_status) else "partially healthy",
-            "services": {
-                "iep1": "healthy" if iep1_status else "unhealthy",
-                "iep3": "healthy" if iep3_status else "unhealthy"
-            }
-        }), 200 if (iep1_status and iep3_status) else 500
-    except Exception as e:
-        return jsonify({
-            "status": "unhealthy",
-            "error": str(e)
-        }), 500
+    body, ready = dependency_health()
+    return jsonify(body), 200 if ready else 500
 
 # -------------------------------
 # Reset Stored Schedule Endpoint
 # -------------------------------
 @app.route('/reset-stored-schedule', methods=['POST'])
+@user_id_required
 def reset_stored_schedule():
     try:
-        # Use the new in-memory reset function
-        reset_schedules()
-        logger.info("Reset all in-memory schedules")
+        # Reset only the caller's schedules
+        user_id = get_request_user_id()
+        reset_schedules(user_id)
+        missing_info_cache.discard(user_id)
+        logger.info(f"Reset stored schedules for user: {user_id}")
         
         return jsonify({"status": "stored schedule reset"}), 200
     except Exception as e:
@@ -846,6 +1369,7 @@ def reset_stored_schedule():
 # IEP4 Chat and Prompt Integration
 # -------------------------------
 @app.route('/chat', methods=['POST'])
+@user_id_required
 def handle_chat():
     """Handle chat messages and update schedule through IEP4."""
     try:
@@ -862,8 +1386,9 @@ def handle_chat():
         if not user_id:
             return jsonify({'error': 'No user ID provided'}), 400
             
-        # Get the current schedule
-        schedule = load_schedule(is_final=True)
+        # Get the current schedule for this user
+        store_user_id = get_request_user_id()
+        schedule = load_schedule(is_final=True, user_id=store_user_id)
         if not schedule:
             return jsonify({'error': 'No schedule found'}), 404
             
@@ -879,9 +1404,10 @@ def handle_chat():
         
         # Send to IEP4
         try:
-            response = requests.post(
+            response = http_client.post(
                 f"{IEP4_URL}/chat",
                 json=iep4_data,
+                headers=llm_headers('chat'),
                 timeout=300  # Increased timeout to 300 seconds (5 minutes)
             )
             response.raise_for_status()
@@ -892,7 +1418,7 @@ def handle_chat():
             # Extract updated schedule and save it
             if 'schedule' in response_data:
                 updated_schedule = response_data['schedule']
-                save_schedule(updated_schedule)
+                save_schedule(updated_schedule, user_id=store_user_id)
                 
             return jsonify(response_data)
             
@@ -930,9 +1456,10 @@ def update_prompt():
         
         # Send to IEP4
         try:
-            response = requests.post(
+            response = http_client.post(
                 f"{IEP4_URL}/update-prompt",
                 json=iep4_data,
+                headers=llm_headers('update_prompt'),
                 timeout=300
             )
             response.raise_for_status()
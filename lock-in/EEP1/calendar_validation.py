@@ -0,0 +1,346 @@
+"""
+Validation and repair of generated calendars.
+
+Each day's events are indexed as an interval list sorted by start time, so a
+single sweep per day finds overlaps. Together with the checks for times
+outside the day, lost or moved fixed events and IDs dropped from a reference
+calendar, validation runs in O(n log n). The structured issues let callers
+repair the calendar locally or re-prompt only for the affected days.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Issue codes
+UNKNOWN_DAY = 'unknown_day'
+INVALID_TIME = 'invalid_time'
+OUT_OF_BOUNDS = 'out_of_bounds'
+OVERLAP = 'overlap'
+DUPLICATE_ID = 'duplicate_id'
+MISSING_FIXED_EVENT = 'missing_fixed_event'
+MOVED_FIXED_EVENT = 'moved_fixed_event'
+LOST_ID = 'lost_id'
+
+# Issues about a single event (or a pair), which a regeneration can fix if the event is flexible
+EVENT_ISSUES = (INVALID_TIME, OUT_OF_BOUNDS, OVERLAP, DUPLICATE_ID)
+
+# Event types that must stay where they are; everything else may be moved to repair a conflict
+FIXED_TYPES = {'google_event', 'meeting', 'exam', 'presentation', 'interview', 'project_deadline', 'regular', 'class'}
+
+END_OF_DAY = 24 * 60
+
+
+def to_minutes(value):
+    """Convert 'HH:MM' to minutes after midnight; None if invalid."""
+    if not isinstance(value, str):
+        return None
+    try:
+        hours, minutes = value.strip().split(':')[:2]
+        hours, minutes = int(hours), int(minutes)
+    except ValueError:
+        return None
+    if not (0 <= hours <= 24 and 0 <= minutes < 60) or hours * 60 + minutes > END_OF_DAY:
+        return None
+    return hours * 60 + minutes
+
+
+def format_minutes(minutes):
+    minutes = min(max(int(minutes), 0), END_OF_DAY - 1)
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def is_fixed(event):
+    return event.get('type') in FIXED_TYPES
+
+
+# ===============================
+# Per-day Interval Index
+# ===============================
+
+class DayIndex:
+    """Events of one day sorted by (start, end)."""
+
+    def __init__(self, events=()):
+        self.intervals = []  # (start, end, position, event)
+        for position, event in enumerate(events):
+            start, end = to_minutes(event.get('start_time')), to_minutes(event.get('end_time'))
+            if start is not None and end is not None and end > start:
+                self.intervals.append((start, end, position, event))
+        self.intervals.sort(key=lambda interval: interval[:3])
+
+    def overlapping_pairs(self):
+        """
+        Yield (earlier, later) event pairs that overlap. Each event is paired
+        with the running event that ends last, so n events yield at most n - 1 pairs.
+        """
+        latest = None
+        for start, end, _, event in self.intervals:
+            if latest and start < latest[1]:
+                yield latest[3], event
+            if latest is None or end > latest[1]:
+                latest = (start, end, None, event)
+
+    def free_slots(self, day_start=0, day_end=END_OF_DAY, ignore=None):
+        """Yield (start, end) gaps between events inside the day window."""
+        cursor = day_start
+        for start, end, _, event in self.intervals:
+            if event is ignore:
+                continue
+            if start > cursor:
+                yield cursor, min(start, day_end)
+            cursor = max(cursor, end)
+            if cursor >= day_end:
+                return
+        if cursor < day_end:
+            yield cursor, day_end
+
+
+# ===============================
+# Validation
+# ===============================
+
+class ValidationReport:
+    """Issues found in a calendar. Each issue is a dict with at least code, day and message."""
+
+    def __init__(self, issues=None):
+        self.issues = issues or []
+
+    @property
+    def valid(self):
+        return not self.issues
+
+    def add(self, code, day, message, **details):
+        self.issues.append(dict(code=code, day=day, message=message, **details))
+
+    def by_code(self, *codes):
+        return [issue for issue in self.issues if issue['code'] in codes]
+
+    def days(self):
+        """Days that have at least one issue, in week order."""
+        affected = {issue['day'] for issue in self.issues}
+        return [day for day in DAYS if day in affected]
+
+    def to_dict(self):
+        return {'valid': self.valid, 'issues': self.issues}
+
+    def regenerable(self, calendar):
+        """
+        Report of the issues a regeneration of their day could fix: those that
+        involve a flexible event (one without an ID counts as flexible).
+        Conflicts between fixed events are left as they are.
+        """
+        def flexible(day, event_id):
+            if not event_id:
+                return True
+            event = next((event for event in calendar.get(day) or [] if event.get('id') == event_id), None)
+            return event is None or not is_fixed(event)
+
+        return ValidationReport([
+            issue for issue in self.issues
+            if issue['code'] in EVENT_ISSUES and (
+                flexible(issue['day'], issue.get('event_id'))
+                or (issue['code'] == OVERLAP and flexible(issue['day'], issue.get('other_id')))
+            )
+        ])
+
+
+def expected_fixed_events(schedule=None, google_calendar=None):
+    """
+    Return {key: (day, event)} for events that must appear unchanged: meetings
+    with a day and time, and Google Calendar events. Keys are IDs, or the
+    description when an event has no ID.
+    """
+    expected = {}
+    for day, events in (google_calendar or {}).items():
+        for event in events or []:
+            if to_minutes(event.get('start_time')) is None:
+                continue
+            expected[event.get('id') or event.get('description')] = (day, dict(event, type='google_event'))
+
+    for meeting in (schedule or {}).get('meetings', []):
+        day, start = meeting.get('day'), to_minutes(meeting.get('time'))
+        if day not in DAYS or start is None:
+            continue
+        try:
+            duration = int(meeting.get('duration_minutes') or 60)
+        except (TypeError, ValueError):
+            duration = 60
+        event = {key: value for key, value in meeting.items() if key not in ('missing_info', 'time', 'day')}
+        event.update({
+            'type': meeting.get('type') or 'meeting',
+            'start_time': format_minutes(start),
+            'end_time': format_minutes(min(start + duration, END_OF_DAY - 1)),
+            'duration': duration
+        })
+        expected[meeting.get('id') or meeting.get('description')] = (day, event)
+    return expected
+
+
+def _event_key(event):
+    return event.get('id') or event.get('description')
+
+
+def validate_calendar(calendar, schedule=None, google_calendar=None, reference_calendar=None,
+                      day_start=0, day_end=END_OF_DAY):
+    """
+    Check a generated_calendar.
+
+    Args:
+        calendar: {day: [events]} to validate
+        schedule: Optional schedule whose meetings must be kept at their day/time
+        google_calendar: Optional Google Calendar events that must be kept
+        reference_calendar: Optional previous calendar whose event IDs must all still be present
+        day_start, day_end: Minutes after midnight bounding every event (e.g. wake/sleep time)
+
+    Returns:
+        ValidationReport
+    """
+    report = ValidationReport()
+    located = {}  # event key -> (day, event)
+    seen_ids = {}
+
+    for day, events in (calendar or {}).items():
+        if day not in DAYS:
+            report.add(UNKNOWN_DAY, day, f"Unknown day '{day}'")
+            continue
+        for event in events:
+            start, end = to_minutes(event.get('start_time')), to_minutes(event.get('end_time'))
+            if start is None or end is None or end <= start:
+                report.add(INVALID_TIME, day, f"Invalid time {event.get('start_time')}-{event.get('end_time')}",
+                           event_id=event.get('id'))
+            elif start < day_start or end > day_end:
+                report.add(OUT_OF_BOUNDS, day, f"{event.get('description')} is outside {format_minutes(day_start)}-{format_minutes(day_end)}",
+                           event_id=event.get('id'))
+            if event.get('id'):
+                if event['id'] in seen_ids:
+                    report.add(DUPLICATE_ID, day, f"Duplicate id {event['id']}", event_id=event['id'], other_day=seen_ids[event['id']])
+                seen_ids[event['id']] = day
+            located.setdefault(_event_key(event), (day, event))
+            if event.get('description'):
+                located.setdefault(event['description'], (day, event))
+
+        for earlier, later in DayIndex(events).overlapping_pairs():
+            report.add(OVERLAP, day, f"{earlier.get('description')} overlaps {later.get('description')}",
+                       event_id=later.get('id'), other_id=earlier.get('id'))
+
+    for key, (day, expected) in expected_fixed_events(schedule, google_calendar).items():
+        found = located.get(key) or located.get(expected.get('description'))
+        if not found:
+            report.add(MISSING_FIXED_EVENT, day, f"Fixed event {expected.get('description')} is missing", event_id=key)
+        elif found[0] != day or to_minutes(found[1].get('start_time')) != to_minutes(expected['start_time']):
+            report.add(MOVED_FIXED_EVENT, found[0], f"Fixed event {expected.get('description')} was moved",
+                       event_id=key, expected_day=day, expected_start=expected['start_time'])
+
+    if reference_calendar:
+        for day, events in reference_calendar.items():
+            for event in events:
+                if event.get('id') and event['id'] not in seen_ids:
+                    report.add(LOST_ID, day, f"{event.get('description')} ({event['id']}) was dropped", event_id=event['id'])
+
+    return report
+
+
+# ===============================
+# Repair
+# ===============================
+
+def _remove_event(calendar, target):
+    for events in calendar.values():
+        for position, event in enumerate(events):
+            if event is target:
+                del events[position]
+                return
+
+
+def _conflicting_flexible_events(index, day_start, day_end):
+    """Yield flexible events that are outside the day or overlap another event."""
+    for start, end, _, event in index.intervals:
+        if not is_fixed(event) and (start < day_start or end > day_end):
+            yield event
+    for earlier, later in index.overlapping_pairs():
+        flexible = later if not is_fixed(later) else earlier
+        if not is_fixed(flexible):
+            yield flexible
+
+
+def _move_to_free_slot(index, event, day_start, day_end):
+    """Move an event to the free slot closest to its current time. Returns False if none fits."""
+    original = to_minutes(event['start_time'])
+    length = to_minutes(event['end_time']) - original
+    slots = [(start, end) for start, end in index.free_slots(day_start, day_end, ignore=event) if end - start >= length]
+    if not slots:
+        return False
+    new_start = min(
+        (min(max(original, start), end - length) for start, end in slots),
+        key=lambda candidate: abs(candidate - original)
+    )
+    event['start_time'] = format_minutes(new_start)
+    event['end_time'] = format_minutes(new_start + length)
+    return True
+
+
+def repair_calendar(calendar, schedule=None, google_calendar=None, reference_calendar=None,
+                    day_start=0, day_end=END_OF_DAY, restore_lost=True, removed_ids=()):
+    """
+    Fix what can be fixed without the LLM: restore missing fixed events,
+    move moved ones back, restore dropped reference events (if restore_lost)
+    except those in removed_ids, which were removed on purpose, and move
+    flexible events (tasks, meals, study sessions) out of conflicts into the
+    nearest free slot of the same day.
+
+    Returns (repaired calendar, ValidationReport of the remaining issues).
+    """
+    calendar = {day: [dict(event) for event in events] for day, events in (calendar or {}).items()}
+    if reference_calendar and removed_ids:
+        # Events removed on purpose are neither restored nor reported as lost
+        removed_ids = set(removed_ids)
+        reference_calendar = {
+            day: [event for event in events if event.get('id') not in removed_ids]
+            for day, events in reference_calendar.items()
+        }
+    report = validate_calendar(calendar, schedule, google_calendar, reference_calendar, day_start, day_end)
+    if report.valid:
+        return calendar, report
+
+    expected = expected_fixed_events(schedule, google_calendar)
+    for issue in report.by_code(MISSING_FIXED_EVENT, MOVED_FIXED_EVENT):
+        day, event = expected[issue['event_id']]
+        if issue['code'] == MOVED_FIXED_EVENT:
+            for moved in list(calendar.get(issue['day'], [])):
+                if _event_key(moved) == issue['event_id'] or moved.get('description') == event.get('description'):
+                    _remove_event(calendar, moved)
+                    event = dict(moved, start_time=event['start_time'], end_time=event['end_time'], duration=event['duration'])
+                    break
+        calendar.setdefault(day, []).append(event)
+
+    if restore_lost and reference_calendar:
+        lost = {issue['event_id'] for issue in report.by_code(LOST_ID)}
+        for day, events in reference_calendar.items():
+            for event in events:
+                if event.get('id') in lost:
+                    calendar.setdefault(day, []).append(dict(event))
+
+    # Move flexible events out of conflicts, trying each event at most once
+    for day in DAYS:
+        events = calendar.get(day)
+        if not events:
+            continue
+        attempted = set()
+        while True:
+            index = DayIndex(events)
+            candidate = next((event for event in _conflicting_flexible_events(index, day_start, day_end)
+                              if id(event) not in attempted), None)
+            if candidate is None:
+                break
+            attempted.add(id(candidate))
+            _move_to_free_slot(index, candidate, day_start, day_end)
+
+    for day in calendar:
+        calendar[day].sort(key=lambda event: (event.get('start_time') or '', event.get('end_time') or ''))
+    remaining = validate_calendar(
+        calendar, schedule, google_calendar, reference_calendar if restore_lost else None, day_start, day_end
+    )
+    return calendar, remaining
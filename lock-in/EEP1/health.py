@@ -0,0 +1,216 @@
+"""
+Cheap liveness and readiness state for Lock-in services.
+
+Health endpoints only read cached state, so a probe never calls an LLM or
+waits on a downstream service:
+
+- CallHealth derives the health of an LLM provider passively, from the
+  success rate and latency of the real calls the service made recently.
+- HealthProber checks downstream services from a background thread, in
+  parallel and with a tight deadline, and caches each result with a TTL.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+HEALTHY = 'healthy'
+DEGRADED = 'degraded'
+UNHEALTHY = 'unhealthy'
+UNKNOWN = 'unknown'
+
+
+class CallHealth:
+    """
+    Health of an upstream from the outcome of recent real calls.
+
+    Args:
+        window_seconds: Only calls in this window count
+        max_calls: Maximum number of recent calls kept
+        min_calls: Calls needed before the upstream can be judged unhealthy or degraded
+        unhealthy_below: Success rate under which the upstream is unhealthy
+        degraded_below: Success rate under which the upstream is degraded
+        slow_seconds: Average latency of successful calls above which the upstream is degraded (None to ignore)
+    """
+
+    def __init__(self, window_seconds=300, max_calls=100, min_calls=3, unhealthy_below=0.5,
+                 degraded_below=0.9, slow_seconds=None, clock=time.monotonic):
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.unhealthy_below = unhealthy_below
+        self.degraded_below = degraded_below
+        self.slow_seconds = slow_seconds
+        self._clock = clock
+        self._calls = deque(maxlen=max_calls)  # (timestamp, success, latency)
+        self._last_error = None
+        self._lock = threading.Lock()
+
+    def record(self, success, latency=None, error=None):
+        with self._lock:
+            self._calls.append((self._clock(), bool(success), latency))
+            if not success and error:
+                self._last_error = str(error)[:200]
+
+    def snapshot(self):
+        """Status plus the success rate and average latency of the calls in the window."""
+        cutoff = self._clock() - self.window_seconds
+        with self._lock:
+            calls = [call for call in self._calls if call[0] >= cutoff]
+            last_error = self._last_error
+        if not calls:
+            return {'status': UNKNOWN, 'calls': 0}
+
+        successes = [call for call in calls if call[1]]
+        success_rate = len(successes) / len(calls)
+        latencies = [call[2] for call in successes if call[2] is not None]
+        avg_latency = sum(latencies) / len(latencies) if latencies else None
+
+        status = HEALTHY
+        if len(calls) >= self.min_calls:
+            if success_rate < self.unhealthy_below:
+                status = UNHEALTHY
+            elif success_rate < self.degraded_below or (
+                    self.slow_seconds and avg_latency is not None and avg_latency > self.slow_seconds):
+                status = DEGRADED
+        snapshot = {
+            'status': status,
+            'calls': len(calls),
+            'success_rate': round(success_rate, 3),
+            'avg_latency_ms': round(avg_latency * 1000, 1) if avg_latency is not None else None
+        }
+        if status != HEALTHY and last_error:
+            snapshot['last_error'] = last_error
+        return snapshot
+
+
+class HealthProber:
+    """
+    Checks dependencies in the background and caches the results.
+
+    Args:
+        checks: {name: function() -> bool or (bool, detail)}; raising counts as unhealthy
+        interval: Seconds between two rounds of checks
+        ttl: Seconds after which a cached result is reported as unknown
+        timeout: Deadline in seconds for one round; checks still running are unhealthy
+        metrics_dict: Optional metrics dictionary returned by setup_metrics
+        service_name: Service label for metrics
+    """
+
+    def __init__(self, checks, interval=10, ttl=30, timeout=1.0, metrics_dict=None, service_name=None,
+                 clock=time.monotonic):
+        self.checks = dict(checks)
+        self.interval = interval
+        self.ttl = ttl
+        self.timeout = timeout
+        self.metrics_dict = metrics_dict
+        self.service_name = service_name
+        self._clock = clock
+        self._results = {}  # name -> (checked_at, healthy, detail, latency)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(len(self.checks), 1), thread_name_prefix='health')
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start the background thread (once), running a first round before returning."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name='health-prober', daemon=True)
+        self.refresh()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._executor.shutdown(wait=False)
+
+    def refresh(self):
+        """Run every check in parallel and wait at most timeout for all of them."""
+        started = {name: self._clock() for name in self.checks}
+        futures = {self._executor.submit(check): name for name, check in self.checks.items()}
+        done, _ = wait(futures, timeout=self.timeout)
+        for future, name in futures.items():
+            if future not in done:
+                self._store(name, False, f"no answer within {self.timeout}s", None)
+                continue
+            try:
+                result = future.result()
+                healthy, detail = result if isinstance(result, tuple) else (bool(result), None)
+            except Exception as e:
+                healthy, detail = False, str(e)
+            self._store(name, healthy, detail, self._clock() - started[name])
+
+    def results(self):
+        """Cached result per dependency: status, detail, age and latency of the last check."""
+        now = self._clock()
+        with self._lock:
+            results = dict(self._results)
+        report = {}
+        for name in self.checks:
+            if name not in results or now - results[name][0] > self.ttl:
+                report[name] = {'status': UNKNOWN}
+                continue
+            checked_at, healthy, detail, latency = results[name]
+            report[name] = {'status': HEALTHY if healthy else UNHEALTHY, 'age_seconds': round(now - checked_at, 1)}
+            if latency is not None:
+                report[name]['latency_ms'] = round(latency * 1000, 1)
+            if detail:
+                report[name]['detail'] = detail
+        return report
+
+    def _store(self, name, healthy, detail, latency):
+        with self._lock:
+            self._results[name] = (self._clock(), bool(healthy), detail, latency)
+        if self.metrics_dict and 'dependency_up' in self.metrics_dict:
+            self.metrics_dict['dependency_up'].labels(service=self.service_name, dependency=name).set(1 if healthy else 0)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Health probe round failed: {str(e)}")
+
+
+def is_upstream_failure(status_code):
+    """Whether an HTTP status from an LLM provider counts against its health (server errors, auth, rate limits)."""
+    return status_code >= 500 or status_code in (401, 403, 408, 429)
+
+
+def create_call_health_from_env():
+    """CallHealth configured by the LLM_HEALTH_* environment variables."""
+    slow_seconds = float(os.getenv('LLM_HEALTH_SLOW_SECONDS', '0')) or None
+    return CallHealth(
+        window_seconds=float(os.getenv('LLM_HEALTH_WINDOW', '300')),
+        min_calls=int(os.getenv('LLM_HEALTH_MIN_CALLS', '3')),
+        slow_seconds=slow_seconds
+    )
+
+
+def create_prober_from_env(checks, metrics_dict=None, service_name=None):
+    """HealthProber configured by the HEALTH_PROBE_* environment variables."""
+    return HealthProber(
+        checks,
+        interval=float(os.getenv('HEALTH_PROBE_INTERVAL', '10')),
+        ttl=float(os.getenv('HEALTH_CACHE_TTL', '30')),
+        timeout=float(os.getenv('HEALTH_PROBE_TIMEOUT', '1')),
+        metrics_dict=metrics_dict,
+        service_name=service_name
+    )
+
+
+def llm_service_health(call_health, config_error=None, **info):
+    """
+    Body and healthy flag for the health endpoints of an LLM-backed service,
+    from its configuration and the passive health of its provider.
+    """
+    llm = call_health.snapshot()
+    if config_error:
+        return {'status': UNHEALTHY, 'error': config_error, 'llm': llm, **info}, False
+    status = llm['status'] if llm['status'] in (UNHEALTHY, DEGRADED) else HEALTHY
+    return {'status': status, 'llm': llm, **info}, status != UNHEALTHY
@@ -9,9 +9,11 @@ import logging
 # ===============================
 # (Ensure that all import statements and constant definitions are below this header)
 
-# In-memory storage for schedules
-_CURRENT_SCHEDULE = None
-_FINAL_SCHEDULE = None
+from persistence.schedule_repository import ScheduleRepository, create_backend_from_env
+from schedule_model import ScheduleModel, Meeting
+
+# Per-user schedule storage (backend selected with the SCHEDULE_STORE environment variable)
+_SCHEDULE_REPOSITORY = ScheduleRepository(create_backend_from_env())
 
 # ===============================
 # Schedule Storage Operations
@@ -19,49 +21,47 @@ _FINAL_SCHEDULE = None
 
 # Functions for saving and loading schedules
 
-def save_schedule(schedule, is_final=False):
-    """Save the schedule to in-memory storage."""
-    global _CURRENT_SCHEDULE, _FINAL_SCHEDULE
-    
+def get_schedule_repository():
+    """Return the repository backing save_schedule/load_schedule."""
+    return _SCHEDULE_REPOSITORY
+
+
+def set_schedule_repository(repository):
+    """Swap the schedule repository (used by tests and alternative deployments)."""
+    global _SCHEDULE_REPOSITORY
+    _SCHEDULE_REPOSITORY = repository
+
+
+def save_schedule(schedule, is_final=False, user_id=None):
+    """Save the schedule for a user to the schedule store."""
     try:
         # Ensure the schedule has all required IDs
         schedule = ensure_ids(schedule)
         
-        # Store in the appropriate in-memory variable
-        if is_final:
-            _FINAL_SCHEDULE = schedule
-        else:
-            _CURRENT_SCHEDULE = schedule
+        # Store under the user's current or final key
+        _SCHEDULE_REPOSITORY.save(user_id, schedule, is_final=is_final)
             
         return schedule
     except Exception as e:
         raise Exception(f"Error saving schedule: {str(e)}")
 
 
-def load_schedule(is_final=False):
-    """Load the schedule from in-memory storage."""
-    global _CURRENT_SCHEDULE, _FINAL_SCHEDULE
-    
+def load_schedule(is_final=False, user_id=None):
+    """Load the schedule for a user from the schedule store."""
     try:
-        # Return the appropriate in-memory schedule
-        if is_final:
-            if _FINAL_SCHEDULE is None:
-                return {"meetings": [], "tasks": [], "course_codes": []}
-            return _FINAL_SCHEDULE
-        else:
-            if _CURRENT_SCHEDULE is None:
-                return {"meetings": [], "tasks": [], "course_codes": []}
-            return _CURRENT_SCHEDULE
+        schedule = _SCHEDULE_REPOSITORY.load(user_id, is_final=is_final)
+        if schedule is None:
+            return {"meetings": [], "tasks": [], "course_codes": []}
+        return schedule
     except Exception as e:
         # Return empty schedule if any error occurs
+        logging.getLogger(__name__).error(f"Error loading schedule: {str(e)}")
         return {"meetings": [], "tasks": [], "course_codes": []}
 
-# Reset the in-memory schedules
-def reset_schedules():
-    """Reset all in-memory schedules."""
-    global _CURRENT_SCHEDULE, _FINAL_SCHEDULE
-    _CURRENT_SCHEDULE = None
-    _FINAL_SCHEDULE = None
+# Reset the stored schedules
+def reset_schedules(user_id):
+    """Reset the stored schedules of one user."""
+    _SCHEDULE_REPOSITORY.reset(user_id)
     return True
 
 # ===============================
@@ -138,228 +138,152 @@ def validate_and_fix_times(data: dict) -> dict:
 
 # Functions to check for missing information and clean schedule data
 
-def check_missing_info(schedule: dict) -> list:
-    logger = logging.getLogger(__name__)
-    
-    # Create separate lists for different types of questions to allow prioritization
-    day_questions = []
-    time_questions = []
-    ampm_questions = [] # New list for AM/PM clarification questions
-    duration_questions = []
-    course_code_questions = []
-    
-    logger.info("Starting check_missing_info function")
-    
-    # Create mappings to track relationships and avoid redundant questions
-    meeting_ids_with_missing_course = set()  # Track meeting IDs missing course codes
-    meeting_descriptions = {}  # Map meeting IDs to descriptions
-    related_tasks = {}  # Map meeting descriptions to their related task IDs
-    
-    # Dictionary to track meeting counts by description
-    meeting_counts = {}
-    for meeting in schedule.get("meetings", []):
-        desc = meeting.get("description", "")
-        meeting_counts[desc] = meeting_counts.get(desc, 0) + 1
-    
-    # First pass: collect all meetings and their properties
-    for meeting in schedule.get("meetings", []):
-        meeting_id = meeting.get("id")
-        description = meeting.get("description")
-        if meeting_id and description:
-            meeting_descriptions[meeting_id] = description
-        
-        # Track meetings missing course codes
-        if not meeting.get("course_code") and meeting.get("type") in ["exam", "presentation"]:
-            if meeting_id:
-                meeting_ids_with_missing_course.add(meeting_id)
-                logger.info(f"Meeting {description} (id: {meeting_id}) is missing course_code")
-    
-    logger.info(f"Meetings missing course codes: {meeting_ids_with_missing_course}")
-    
-    # Second pass: identify related tasks
-    for task in schedule.get("tasks", []):
-        related_event = task.get("related_event")
-        task_id = task.get("id")
-        if related_event and task_id:
-            if related_event not in related_tasks:
-                related_tasks[related_event] = []
-            related_tasks[related_event].append(task_id)
-    
-    logger.info(f"Related tasks mapping: {related_tasks}")
-    
-    # Function to generate a more specific description for ambiguous meetings
-    def get_specific_description(meeting):
-        desc = meeting.get("description", "")
-        
-        # Check if this description appears more than once
-        if meeting_counts.get(desc, 0) > 1:
-            # Include time in the description if available
-            if meeting.get("time") and not is_time_ambiguous(meeting.get("time")):
-                return f"{desc} at {get_clean_time(meeting.get('time'))}"
-            # Include day if available
-            elif meeting.get("day"):
-                return f"{desc} on {meeting.get('day')}"
-        
-        return desc
-    
-    # Now generate questions for meetings
-    for meeting in schedule.get("meetings", []):
-        specific_desc = get_specific_description(meeting)
-        
-        # Check for missing day - essential for scheduling
-        if not meeting.get("day"):
-            day_questions.append({
-                "type": "day",
-                "question": f"On which day of the week is the {specific_desc}?",
-                "field": "day",
-                "target": meeting.get("description"),
-                "target_type": "meeting",
-                "target_id": meeting.get("id"),
-                "input_type": "dropdown",
-                "options": [
-                    {"value": "Monday", "text": "Monday"},
-                    {"value": "Tuesday", "text": "Tuesday"},
-                    {"value": "Wednesday", "text": "Wednesday"},
-                    {"value": "Thursday", "text": "Thursday"},
-                    {"value": "Friday", "text": "Friday"},
-                    {"value": "Saturday", "text": "Saturday"},
-                    {"value": "Sunday", "text": "Sunday"}
-                ]
-            })
-        
-        # Check for ambiguous time (missing AM/PM)
-        if meeting.get("time") and is_time_ambiguous(meeting.get("time")):
-            clean_time = get_clean_time(meeting.get("time"))
-            ampm_questions.append({
-                "type": "ampm",
-                "question": f"Is {clean_time} for the {specific_desc} AM or PM?",
-                "field": "time_ampm",
-                "target": meeting.get("description"),
-                "target_type": "meeting",
-                "target_id": meeting.get("id"),
-                "original_time": clean_time,
-                "input_type": "dropdown",
-                "options": [
-                    {"value": "am", "text": "AM"},
-                    {"value": "pm", "text": "PM"}
-                ]
-            })
-        # Check for missing time
-        elif not meeting.get("time"):
-            time_questions.append({
-                "type": "time",
-                "question": f"What time is the {specific_desc}?",
-                "field": "time",
-                "target": meeting.get("description"),
-                "target_type": "meeting",
-                "target_id": meeting.get("id")
-            })
-        
-        if not meeting.get("duration_minutes"):
-            duration_questions.append({
-                "type": "duration",
-                "question": f"How long is the {specific_desc} (in minutes)?",
-                "field": "duration_minutes",
-                "target": meeting.get("description"),
-                "target_type": "meeting",
-                "target_id": meeting.get("id")
-            })
-        if not meeting.get("course_code") and meeting.get("type") in ["exam", "presentation"]:
-            course_code_questions.append({
-                "type": "course_code",
-                "question": f"What is the course code for the {specific_desc}?",
-                "field": "course_code",
-                "target": meeting.get("description"),
-                "target_type": "meeting",
-                "target_id": meeting.get("id")
-            })
-    
-    # Check tasks - ask for day if missing, and course_code when not related to a meeting we're already asking about
-    for task in schedule.get("tasks", []):
-        # DEBUG: Log task properties
-        logger.info(f"Checking task: {task.get('description')}, course_code: {task.get('course_code')}, category: {task.get('category')}, day: {task.get('day')}, missing_info: {task.get('missing_info')}")
-        
-        # Check for missing day on tasks that need scheduling
-        if not task.get("day") and task.get("is_fixed_time", False):
-            task_desc = task.get("description", "")
-            day_questions.append({
-                "type": "day",
-                "question": f"On which day of the week is the task '{task_desc}'?",
-                "field": "day",
-                "target": task_desc,
-                "target_type": "task",
-                "target_id": task.get("id"),
-                "input_type": "dropdown",
-                "options": [
-                    {"value": "Monday", "text": "Monday"},
-                    {"value": "Tuesday", "text": "Tuesday"},
-                    {"value": "Wednesday", "text": "Wednesday"},
-                    {"value": "Thursday", "text": "Thursday"},
-                    {"value": "Friday", "text": "Friday"},
-                    {"value": "Saturday", "text": "Saturday"},
-                    {"value": "Sunday", "text": "Sunday"}
-                ]
-            })
-        
-        # Check for ambiguous time (missing AM/PM)
-        if task.get("time") and is_time_ambiguous(task.get("time")) and task.get("is_fixed_time", False):
-            clean_time = get_clean_time(task.get("time"))
-            task_desc = task.get("description", "")
-            ampm_questions.append({
-                "type": "ampm",
-                "question": f"Is {clean_time} for the task '{task_desc}' AM or PM?",
-                "field": "time_ampm",
-                "target": task_desc,
-                "target_type": "task",
-                "target_id": task.get("id"),
-                "original_time": clean_time,
-                "input_type": "dropdown",
-                "options": [
-                    {"value": "am", "text": "AM"},
-                    {"value": "pm", "text": "PM"}
-                ]
-            })
-        
-        # Only process tasks that don't have a course code and are preparation tasks
-        if not task.get("course_code") and task.get("category") == "preparation":
-            logger.info(f"Task {task.get('description')} is a preparation task without course_code")
-            related_event = task.get("related_event")
-            logger.info(f"Related event: {related_event}")
-            
-            # Skip if this task is related to a meeting we're already asking about
-            should_skip = False
-            for meeting in schedule.get("meetings", []):
-                # If the meeting description is contained in the related_event or vice versa
-                meeting_id = meeting.get("id")
-                meeting_desc = meeting.get("description")
-                logger.info(f"Checking meeting: {meeting_desc}, id: {meeting_id}, in missing_course: {meeting_id in meeting_ids_with_missing_course}")
-                
-                # Use partial matching for related events
-                if (related_event and meeting_desc and 
-                   (meeting_desc in related_event or related_event in meeting_desc) and 
-                   meeting_id in meeting_ids_with_missing_course):
-                    should_skip = True
-                    logger.info(f"Should skip question for task {task.get('description')} - related to meeting being queried")
-                    break
-            
-            # Only add the question if we shouldn't skip it
-            if not should_skip:
-                logger.info(f"Adding course code question for task: {task.get('description')}")
-                course_code_questions.append({
-                    "type": "course_code",
-                    "question": f"What is the course code for the {task.get('description')}?",
-                    "field": "course_code",
-                    "target": task.get("description"),
-                    "target_type": "task",
-                    "target_id": task.get("id")
-                })
-            else:
-                logger.info(f"Skipping course code question for task: {task.get('description')}")
-    
-    # Combine questions in priority order: day, ampm, time, duration, course_code
-    questions = day_questions + ampm_questions + time_questions + duration_questions + course_code_questions
-    
-    logger.info(f"Final questions list (prioritized): {questions}")
+DAY_OPTIONS = [{"value": day, "text": day} for day in
+               ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']]
+AMPM_OPTIONS = [{"value": "am", "text": "AM"}, {"value": "pm", "text": "PM"}]
+
+
+def _meeting_missing_course(meeting) -> bool:
+    return bool(meeting.get("id")) and not meeting.get("course_code") and meeting.get("type") in ["exam", "presentation"]
+
+
+# Question types in the order they are asked
+QUESTION_ORDER = ('day', 'ampm', 'time', 'duration', 'course_code')
+
+
+def _specific_description(model, meeting) -> str:
+    """Meeting description, with its time or day added when several meetings share it."""
+    desc = meeting.get("description") or ""
+    if model.count_meetings(desc) > 1:
+        # Include time in the description if available
+        if meeting.get("time") and not is_time_ambiguous(meeting.get("time")):
+            return f"{desc} at {get_clean_time(meeting.get('time'))}"
+        # Include day if available
+        elif meeting.get("day"):
+            return f"{desc} on {meeting.get('day')}"
+    return desc
+
+
+def meeting_questions(model, meeting) -> dict:
+    """Questions about one meeting, as {question type: [questions]}."""
+    specific_desc = _specific_description(model, meeting)
+    target = {"target": meeting.get("description"), "target_type": "meeting", "target_id": meeting.get("id")}
+    questions = {}
+
+    # Check for missing day - essential for scheduling
+    if not meeting.get("day"):
+        questions["day"] = [{
+            "type": "day",
+            "question": f"On which day of the week is the {specific_desc}?",
+            "field": "day",
+            **target,
+            "input_type": "dropdown",
+            "options": DAY_OPTIONS
+        }]
+
+    # Check for ambiguous time (missing AM/PM)
+    if meeting.get("time") and is_time_ambiguous(meeting.get("time")):
+        clean_time = get_clean_time(meeting.get("time"))
+        questions["ampm"] = [{
+            "type": "ampm",
+            "question": f"Is {clean_time} for the {specific_desc} AM or PM?",
+            "field": "time_ampm",
+            **target,
+            "original_time": clean_time,
+            "input_type": "dropdown",
+            "options": AMPM_OPTIONS
+        }]
+    # Check for missing time
+    elif not meeting.get("time"):
+        questions["time"] = [{
+            "type": "time",
+            "question": f"What time is the {specific_desc}?",
+            "field": "time",
+            **target
+        }]
+
+    if not meeting.get("duration_minutes"):
+        questions["duration"] = [{
+            "type": "duration",
+            "question": f"How long is the {specific_desc} (in minutes)?",
+            "field": "duration_minutes",
+            **target
+        }]
+    if not meeting.get("course_code") and meeting.get("type") in ["exam", "presentation"]:
+        questions["course_code"] = [{
+            "type": "course_code",
+            "question": f"What is the course code for the {specific_desc}?",
+            "field": "course_code",
+            **target
+        }]
+    return questions
+
+
+def task_questions(model, task) -> dict:
+    """
+    Questions about one task, as {question type: [questions]}. The course code
+    question depends on the task's related meetings: it is not asked while one
+    of them is already being asked for its own course code.
+    """
+    task_desc = task.get("description") or ""
+    target = {"target": task_desc, "target_type": "task", "target_id": task.get("id")}
+    questions = {}
+
+    # Check for missing day on tasks that need scheduling
+    if not task.get("day") and task.get("is_fixed_time", False):
+        questions["day"] = [{
+            "type": "day",
+            "question": f"On which day of the week is the task '{task_desc}'?",
+            "field": "day",
+            **target,
+            "input_type": "dropdown",
+            "options": DAY_OPTIONS
+        }]
+
+    # Check for ambiguous time (missing AM/PM)
+    if task.get("time") and is_time_ambiguous(task.get("time")) and task.get("is_fixed_time", False):
+        clean_time = get_clean_time(task.get("time"))
+        questions["ampm"] = [{
+            "type": "ampm",
+            "question": f"Is {clean_time} for the task '{task_desc}' AM or PM?",
+            "field": "time_ampm",
+            **target,
+            "original_time": clean_time,
+            "input_type": "dropdown",
+            "options": AMPM_OPTIONS
+        }]
+
+    # Preparation tasks without a course code, unless a related meeting is already being asked about
+    if (not task.get("course_code") and task.get("category") == "preparation"
+            and not any(_meeting_missing_course(meeting) for meeting in model.related_meetings(task))):
+        questions["course_code"] = [{
+            "type": "course_code",
+            "question": f"What is the course code for the {task.get('description')}?",
+            "field": "course_code",
+            "target": task.get("description"),
+            "target_type": "task",
+            "target_id": task.get("id")
+        }]
+    return questions
+
+
+def item_questions(model, item) -> dict:
+    return meeting_questions(model, item) if isinstance(item, Meeting) else task_questions(model, item)
+
+
+def order_questions(per_item) -> list:
+    """Flatten per-item question dicts (in schedule order) into the priority order of QUESTION_ORDER."""
+    return [question for question_type in QUESTION_ORDER
+            for questions in per_item for question in questions.get(question_type, ())]
+
+
+def check_missing_info(schedule) -> list:
+    """Build the clarifying questions for a schedule dict or ScheduleModel, in priority order."""
+    model = schedule if isinstance(schedule, ScheduleModel) else ScheduleModel.from_dict(schedule)
+    questions = order_questions([item_questions(model, item) for item in model.meetings + model.tasks])
+    logging.getLogger(__name__).info(
+        f"check_missing_info: {len(questions)} questions for {len(model.meetings)} meetings and {len(model.tasks)} tasks"
+    )
     return questions
 
 
@@ -422,79 +346,126 @@ def convert_answer_value(answer_type: str, value: str) -> any:
     return value
 
 
-def update_schedule_with_answers(schedule: dict, answers: list) -> dict:
-    import copy
-    import logging
+ANSWER_FIELDS = {
+    'time': 'time',
+    'ampm': 'time',  # AM/PM clarifications complete the time field
+    'duration': 'duration_minutes',
+    'course_code': 'course_code',
+    'day': 'day'
+}
+
+
+def check_answer_value(answer_type, answer_value) -> None:
+    """
+    Raise ValueError for an unknown answer type, a duration that is not a
+    number, or another answer that is not text.
+    """
+    if answer_type not in ANSWER_FIELDS:
+        raise ValueError(f"Invalid answer type {answer_type!r}")
+    if answer_type == 'duration':
+        try:
+            int(answer_value)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid duration value")
+    elif not isinstance(answer_value, str):
+        raise ValueError(f"Invalid {answer_type} value: expected text")
+
+
+def apply_answer(model, item, answer_type: str, answer_value, original_time=None) -> None:
+    """
+    Apply one /answer-question answer to an item of a ScheduleModel. A course
+    code given for a meeting is also set on its related tasks. Raises
+    ValueError for an invalid answer (see check_answer_value).
+    """
     logger = logging.getLogger(__name__)
-    
-    schedule = copy.deepcopy(schedule)
-    
-    # First pass: update meetings and tasks directly based on their IDs
-    for answer in answers:
+    check_answer_value(answer_type, answer_value)
+    field = ANSWER_FIELDS[answer_type]
+
+    if answer_type == 'time':
+        item.set('time', convert_to_24h(answer_value))
+    elif answer_type == 'ampm':
+        if original_time and answer_value:
+            item.set('time', convert_to_24h(f"{original_time} {answer_value}"))
+            logger.info(f"Updated time for {item.get('description')} from ambiguous {original_time} to {item.get('time')}")
+    elif answer_type == 'duration':
+        item.set('duration_minutes', int(answer_value))
+    elif answer_type == 'course_code':
+        item.set('course_code', answer_value)
+        # A meeting's course code covers the tasks that prepare for it
+        if isinstance(item, Meeting):
+            for task in model.related_tasks(item):
+                task.set('course_code', answer_value)
+                task.resolve_missing('course_code')
+                logger.info(f"Propagated course code {answer_value} to task {task.get('description')}")
+    elif answer_type == 'day':
+        day_value = answer_value.strip().capitalize()
+        if day_value not in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']:
+            # Use the value anyway, but log a warning
+            logger.warning(f"Invalid day value received: {day_value}")
+        item.set('day', day_value)
+
+    item.resolve_missing(field)
+
+
+def _item_answer_target(model, answer: dict, position: int):
+    """Check a {item_id, type, answer} answer before anything is applied; returns its item."""
+    item = model.get(answer.get("item_id"))
+    if item is None:
+        raise ValueError(f"Answer {position}: item {answer.get('item_id')} not found")
+    if answer.get("type") not in ANSWER_FIELDS or not answer.get("answer"):
+        raise ValueError(f"Answer {position}: invalid answer type or value")
+    try:
+        check_answer_value(answer["type"], answer["answer"])
+    except ValueError as e:
+        raise ValueError(f"Answer {position}: {e}")
+    return item
+
+
+def update_schedule_with_answers(schedule, answers: list) -> dict:
+    """
+    Apply a list of answers and return the updated schedule dict. A schedule
+    dict (or JSON string) is not modified; a ScheduleModel is updated in place,
+    so callers holding a model see the answers applied to it.
+
+    Answers are either /answer-question answers ({item_id, type, answer,
+    original_time}), applied with apply_answer, or field updates ({field,
+    value, type, target_id or target}). Answers of the first kind are all
+    checked before any is applied; a ValueError names the first bad one.
+    """
+    logger = logging.getLogger(__name__)
+    model = schedule if isinstance(schedule, ScheduleModel) else ScheduleModel.from_dict(schedule)
+
+    items = {position: _item_answer_target(model, answer, position)
+             for position, answer in enumerate(answers) if "item_id" in answer}
+
+    for position, answer in enumerate(answers):
+        if position in items:
+            apply_answer(model, items[position], answer["type"], answer["answer"], answer.get("original_time"))
+            continue
+
         field = answer.get("field")
         value = answer.get("value")
-        target = answer.get("target")
-        target_id = answer.get("target_id")
         if not all([field, value]):
             continue
-        
+
         value = convert_answer_value(answer.get("type", ""), value)
-        
-        found = False
-        # Try to update by ID first (most accurate)
-        if target_id:
-            # Update meetings
-            for meeting in schedule.get("meetings", []):
-                if meeting.get("id") == target_id:
-                    meeting[field] = value
-                    logger.info(f"Updated meeting {meeting.get('description')} {field} to {value} by ID")
-                    found = True
-                    break
-            
-            # Update tasks
-            if not found:
-                for task in schedule.get("tasks", []):
-                    if task.get("id") == target_id:
-                        task[field] = value
-                        logger.info(f"Updated task {task.get('description')} {field} to {value} by ID")
-                        found = True
-                        break
-        
-        # Fallback to description match if ID didn't work
-        if not found and target:
-            # Try exact match first
-            for meeting in schedule.get("meetings", []):
-                if meeting.get("description") == target:
-                    meeting[field] = value
-                    logger.info(f"Updated meeting {meeting.get('description')} {field} to {value} by description")
-                    found = True
-            
-            for task in schedule.get("tasks", []):
-                if task.get("description") == target:
-                    task[field] = value
-                    logger.info(f"Updated task {task.get('description')} {field} to {value} by description")
-                    found = True
-    
+
+        # By ID first (most accurate), then every item with the exact description
+        for item in model.resolve(answer.get("target_id"), answer.get("target")):
+            item.set(field, value)
+            logger.info(f"Updated {type(item).__name__.lower()} {item.get('description')} {field} to {value}")
+
     # Remove missing_info entries for fields that are now filled
-    for collection in ["meetings", "tasks"]:
-        for item in schedule.get(collection, []):
-            if "missing_info" in item:
-                for field in list(item.get("missing_info", [])):
-                    if field in item and item[field] is not None:
-                        item["missing_info"].remove(field)
-                if not item["missing_info"]:
-                    del item["missing_info"]
-    
+    for item in model.meetings + model.tasks:
+        for field in list(item.get("missing_info") or []):
+            if item.get(field) is not None:
+                item.resolve_missing(field)
+        if "missing_info" in item and not item.get("missing_info"):
+            item.discard("missing_info")
+
     # Update the course_codes array with any new course codes
-    course_codes = set(schedule.get("course_codes", []))
-    for collection in ["meetings", "tasks"]:
-        for item in schedule.get(collection, []):
-            if item.get("course_code"):
-                course_codes.add(item["course_code"])
-    
-    schedule["course_codes"] = list(course_codes)
-    
-    return schedule
+    model.extra["course_codes"] = model.course_codes()
+    return model.to_dict()
 
 # ===============================
 # Utility Functions
@@ -0,0 +1,245 @@
+"""
+Background jobs for long-running schedule generation.
+Submitting returns a job id at once; a bounded worker pool runs the job and
+records its status, partial output and result in a JobRepository so clients
+can poll from any gunicorn worker.
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+ACTIVE_STATUSES = {QUEUED, RUNNING}
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once it has been cancelled."""
+
+
+def job_fingerprint(payload):
+    """Hash of a submission, used to deduplicate identical in-flight jobs."""
+    data = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def public_job(job):
+    """Return the job fields exposed to clients."""
+    return {key: value for key, value in job.items() if key != 'fingerprint'}
+
+
+class JobContext:
+    """Handle passed to a running job to report progress and honour cancellation."""
+
+    def __init__(self, manager, job_id, check_interval=1.0):
+        self.manager = manager
+        self.job_id = job_id
+        self.check_interval = check_interval
+        self._last_check = 0.0
+
+    def set_partial(self, key, value):
+        """Record partial output (e.g. one finished day of the calendar)."""
+        self.manager._update(self.job_id, partial_key=key, partial_value=value)
+
+    def check_cancelled(self):
+        """Raise JobCancelled if the job was cancelled here or by another worker."""
+        if self.job_id in self.manager._cancelled:
+            raise JobCancelled()
+        now = time.time()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            job = self.manager.repository.load(self.job_id)
+            if job and job['status'] == CANCELLED:
+                raise JobCancelled()
+
+    @contextmanager
+    def limit(self, downstream):
+        """Hold one of the concurrency slots of a downstream service."""
+        semaphore = self.manager.downstream_limits.get(downstream)
+        if semaphore is None:
+            yield
+            return
+        with semaphore:
+            self.check_cancelled()
+            yield
+
+
+class JobManager:
+    """
+    Runs jobs on a thread pool (cooperative greenlets under gevent workers).
+
+    Args:
+        repository: JobRepository holding the job records
+        max_workers: Number of jobs run at once by this process
+        downstream_limits: Mapping of downstream name -> maximum concurrent calls
+        stale_after_seconds: Active jobs not updated for this long, and not owned
+            by this process, are reported as failed (e.g. after a restart)
+        metrics_dict: Optional metrics dictionary returned by setup_metrics
+        service_name: Service label for metrics
+    """
+
+    def __init__(self, repository, max_workers=4, downstream_limits=None, stale_after_seconds=400,
+                 metrics_dict=None, service_name='eep1'):
+        self.repository = repository
+        self.max_workers = max_workers
+        self.downstream_limits = {
+            name: threading.BoundedSemaphore(limit)
+            for name, limit in (downstream_limits or {}).items()
+        }
+        self.stale_after_seconds = stale_after_seconds
+        self.metrics_dict = metrics_dict
+        self.service_name = service_name
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._lock = threading.RLock()
+        self._local_jobs = set()
+        self._cancelled = set()
+
+    def submit(self, user_id, payload, runner):
+        """
+        Queue runner(context) for a user. Returns (job, deduplicated); an identical
+        submission that is still queued or running is returned instead of a new job.
+        """
+        fingerprint = job_fingerprint(payload)
+        with self._lock:
+            existing = self.repository.find_by_fingerprint(user_id, fingerprint)
+            if existing:
+                existing = self._check_stale(existing)
+                if existing['status'] in ACTIVE_STATUSES:
+                    logger.info(f"Reusing in-flight job {existing['job_id']} for user {user_id}")
+                    return existing, True
+
+            now = time.time()
+            job = {
+                'job_id': str(uuid.uuid4()),
+                'user_id': user_id,
+                'status': QUEUED,
+                'created_at': now,
+                'updated_at': now,
+                'partial': {},
+                'result': None,
+                'error': None,
+                'fingerprint': fingerprint
+            }
+            self.repository.save(job)
+            self.repository.index_fingerprint(user_id, fingerprint, job['job_id'])
+            self._local_jobs.add(job['job_id'])
+
+        self._record('queued')
+        self._executor.submit(self._run, job['job_id'], runner)
+        return job, False
+
+    def get(self, job_id):
+        job = self.repository.load(job_id)
+        if job is None:
+            return None
+        return self._check_stale(job)
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job. Returns the updated job, or None if unknown."""
+        job = self.repository.load(job_id)
+        if job is None:
+            return None
+        if job['status'] in ACTIVE_STATUSES:
+            self._cancelled.add(job_id)
+            job = self._update(job_id, status=CANCELLED, error='Cancelled by user')
+            self._record(CANCELLED)
+        return job
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    # -------------------------------
+    # Execution
+    # -------------------------------
+
+    def _run(self, job_id, runner):
+        context = JobContext(self, job_id)
+        try:
+            job = self.repository.load(job_id)
+            if job is None or job['status'] != QUEUED or job_id in self._cancelled:
+                return
+            self._update(job_id, status=RUNNING)
+            self._set_active_gauge()
+            result = runner(context)
+            self._finish(job_id, SUCCEEDED, result=result)
+        except JobCancelled:
+            logger.info(f"Job {job_id} cancelled")
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            self._finish(job_id, FAILED, error=str(e))
+        finally:
+            with self._lock:
+                self._local_jobs.discard(job_id)
+                self._cancelled.discard(job_id)
+            self._set_active_gauge()
+
+    def _finish(self, job_id, status, result=None, error=None):
+        job = self.repository.load(job_id)
+        # A cancellation recorded by another worker wins over a late result
+        if job is None or job['status'] == CANCELLED:
+            return
+        self._update(job_id, status=status, result=result, error=error)
+        self._record(status)
+
+    def _update(self, job_id, partial_key=None, partial_value=None, **fields):
+        def change(job):
+            if job['status'] == CANCELLED and fields.get('status') != CANCELLED:
+                # Never resurrect a cancelled job; drop late progress
+                return False
+            if partial_key is not None:
+                job['partial'][partial_key] = partial_value
+            job.update(fields)
+            job['updated_at'] = time.time()
+            return True
+
+        # Written over the record it was read from, so a cancel by another worker is never overwritten
+        return self.repository.update(job_id, change)
+
+    def _check_stale(self, job):
+        if job['status'] not in ACTIVE_STATUSES or job['job_id'] in self._local_jobs:
+            return job
+        if time.time() - job['updated_at'] > self.stale_after_seconds:
+            job = self._update(job['job_id'], status=FAILED, error='Job was interrupted') or job
+        return job
+
+    # -------------------------------
+    # Metrics
+    # -------------------------------
+
+    def _record(self, status):
+        if self.metrics_dict and 'jobs_total' in self.metrics_dict:
+            self.metrics_dict['jobs_total'].labels(service=self.service_name, status=status).inc()
+
+    def _set_active_gauge(self):
+        if self.metrics_dict and 'jobs_active' in self.metrics_dict:
+            self.metrics_dict['jobs_active'].labels(service=self.service_name).set(len(self._local_jobs))
+
+
+def create_job_manager_from_env(repository, metrics_dict=None, service_name='eep1'):
+    """
+    Build a JobManager configured by JOB_WORKERS, JOB_IEP1_CONCURRENCY,
+    JOB_IEP2_CONCURRENCY and JOB_STALE_SECONDS.
+    """
+    return JobManager(
+        repository,
+        max_workers=int(os.getenv('JOB_WORKERS', '8')),
+        downstream_limits={
+            'iep1': int(os.getenv('JOB_IEP1_CONCURRENCY', '4')),
+            'iep2': int(os.getenv('JOB_IEP2_CONCURRENCY', '4'))
+        },
+        stale_after_seconds=float(os.getenv('JOB_STALE_SECONDS', '400')),
+        metrics_dict=metrics_dict,
+        service_name=service_name
+    )
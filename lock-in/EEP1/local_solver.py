@@ -0,0 +1,384 @@
+"""
+Deterministic local schedule solver.
+Builds the same generated_calendar the LLM is asked for in schedule_prompts
+(fixed meetings, Google Calendar events, meals and tasks split into study
+sessions) directly from the schedule and the user's preferences.
+"""
+
+import math
+import bisect
+import logging
+
+from helpers import convert_to_24h, get_clean_time
+
+logger = logging.getLogger(__name__)
+
+# ===============================
+# Constants
+# ===============================
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+WEEKEND = {'Saturday', 'Sunday'}
+
+DEFAULT_WAKE_TIME = '07:00'
+DEFAULT_SLEEP_TIME = '23:00'
+DEFAULT_MEETING_DURATION = 60
+DEFAULT_MEAL_TIMES = {'breakfast': '08:00', 'lunch': '12:30', 'dinner': '19:00'}
+MEAL_DURATIONS = {'breakfast': 30, 'lunch': 60, 'dinner': 60}
+# How far a meal may move from its preferred time to avoid a fixed event
+MEAL_FLEXIBILITY = 90
+
+SESSION_LENGTHS = {'short': 45, 'medium': 90, 'long': 120}
+DEFAULT_SESSION_LENGTH = 90
+# Shortest leftover worth its own session; shorter remainders join the previous one
+MIN_SESSION_LENGTH = 15
+
+BREAK_LENGTHS = {'short_frequent': 10, 'medium': 20, 'long_infrequent': 45}
+DEFAULT_BREAK_LENGTH = 15
+
+# Hours of the day (in minutes) matching the productivity_pattern preference
+PRODUCTIVE_HOURS = {
+    'morning': (6 * 60, 11 * 60),
+    'midday': (11 * 60, 15 * 60),
+    'afternoon': (15 * 60, 18 * 60),
+    'evening': (18 * 60, 22 * 60),
+    'night': (22 * 60, 24 * 60)
+}
+
+# Maximum minutes of task sessions on one day
+DAILY_TASK_MINUTES = 6 * 60
+LIGHT_WEEKEND_TASK_MINUTES = 3 * 60
+
+PRIORITY_ORDER = {'urgent': 0, 'high': 0, '1': 0, 'medium': 1, '2': 1, 'low': 2, '3': 2}
+
+END_OF_DAY = 24 * 60 - 1
+
+# ===============================
+# Time Helpers
+# ===============================
+
+def to_minutes(value):
+    """Convert 'HH:MM' (or a 12-hour time such as '3pm') to minutes after midnight; None if invalid."""
+    if not value or not isinstance(value, str):
+        return None
+    value = get_clean_time(value.strip())
+    if 'am' in value.lower() or 'pm' in value.lower():
+        value = convert_to_24h(value)
+    try:
+        hours, minutes = value.split(':')[:2]
+        hours, minutes = int(hours), int(minutes)
+    except (ValueError, AttributeError):
+        return None
+    if not (0 <= hours <= 24 and 0 <= minutes < 60):
+        return None
+    return min(hours * 60 + minutes, END_OF_DAY)
+
+
+def format_minutes(minutes):
+    """Convert minutes after midnight to 'HH:MM'."""
+    minutes = min(max(int(minutes), 0), END_OF_DAY)
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def normalize_day(value):
+    """Return the canonical day name ('mon', 'monday' -> 'Monday') or None."""
+    if not value or not isinstance(value, str):
+        return None
+    value = value.strip().lower()
+    for day in DAYS:
+        if day.lower() == value or (len(value) >= 3 and day.lower().startswith(value[:3])):
+            return day
+    return None
+
+
+def task_duration(task):
+    """Task length in minutes, with the same priority-based default the LLM prompt uses."""
+    duration = task.get('duration_minutes')
+    try:
+        duration = int(duration)
+    except (TypeError, ValueError):
+        duration = 0
+    if duration > 0:
+        return duration
+    priority = str(task.get('priority', 'medium')).lower()
+    return 240 if priority in ['high', '1', 'urgent'] else 180
+
+
+def split_into_sessions(duration, session_length):
+    """Split a duration into sessions of at most session_length minutes."""
+    count = max(1, math.ceil(duration / session_length))
+    sessions = [session_length] * (count - 1) + [duration - session_length * (count - 1)]
+    if len(sessions) > 1 and sessions[-1] < MIN_SESSION_LENGTH:
+        remainder = sessions.pop()
+        sessions[-1] += remainder
+    return sessions
+
+# ===============================
+# Day Plan
+# ===============================
+
+class DayPlan:
+    """Busy intervals and events of one day, bounded by wake and sleep time."""
+
+    def __init__(self, day, start, end):
+        self.day = day
+        self.start = start
+        self.end = end
+        self.busy = []  # sorted, non-overlapping (start, end) intervals
+        self.events = []
+        self.task_minutes = 0
+
+    def is_free(self, start, end):
+        index = bisect.bisect_left(self.busy, (start, start))
+        if index > 0 and self.busy[index - 1][1] > start:
+            return False
+        return index >= len(self.busy) or self.busy[index][0] >= end
+
+    def reserve(self, start, end):
+        """Mark [start, end) busy, merging it with the intervals it overlaps or touches."""
+        index = bisect.bisect_left(self.busy, (start, start))
+        if index > 0 and self.busy[index - 1][1] >= start:
+            index -= 1
+            start = self.busy[index][0]
+        last = index
+        while last < len(self.busy) and self.busy[last][0] <= end:
+            end = max(end, self.busy[last][1])
+            last += 1
+        self.busy[index:last] = [(start, end)]
+
+    def add(self, start, end, event, reserve_until=None):
+        """Add an event occupying [start, end); reserve_until extends the busy time (breaks)."""
+        self.reserve(start, reserve_until or end)
+        event['start_time'] = format_minutes(start)
+        event['end_time'] = format_minutes(end)
+        event['duration'] = end - start
+        self.events.append(event)
+
+    def free_slots(self, not_after=None):
+        """Yield (start, end) gaps between busy intervals inside the day window."""
+        limit = self.end if not_after is None else min(self.end, not_after)
+        cursor = self.start
+        for busy_start, busy_end in self.busy:
+            if busy_start > cursor:
+                yield cursor, min(busy_start, limit)
+            cursor = max(cursor, busy_end)
+            if cursor >= limit:
+                return
+        if cursor < limit:
+            yield cursor, limit
+
+    def find_slot(self, length, preferred=None, not_after=None):
+        """Return the start of the earliest free slot of `length` minutes, inside `preferred` hours if possible."""
+        slots = [(start, end) for start, end in self.free_slots(not_after) if end - start >= length]
+        if preferred:
+            pref_start, pref_end = preferred
+            for start, end in slots:
+                candidate = max(start, pref_start)
+                if candidate + length <= min(end, pref_end):
+                    return candidate
+        return slots[0][0] if slots else None
+
+    def calendar_events(self):
+        return sorted(self.events, key=lambda event: (event['start_time'], event['end_time']))
+
+# ===============================
+# Solver
+# ===============================
+
+def day_window(preferences):
+    """Return (wake, sleep) in minutes after midnight from the preferences."""
+    wake = to_minutes(preferences.get('wake_time'))
+    if wake is None:
+        wake = to_minutes(DEFAULT_WAKE_TIME)
+    sleep = to_minutes(preferences.get('sleep_time'))
+    if sleep is None:
+        sleep = to_minutes(DEFAULT_SLEEP_TIME)
+    if sleep <= wake:
+        # Sleeping after midnight: the day runs to the end of the calendar day
+        sleep = END_OF_DAY
+    return wake, sleep
+
+
+def _is_fixed_task(task):
+    return bool(task.get('is_fixed_time') and task.get('time') and task.get('day'))
+
+
+def _place_fixed(plans, schedule, google_calendar):
+    """Place Google Calendar events and fixed meetings/tasks exactly where they are."""
+    for day, events in (google_calendar or {}).items():
+        plan = plans.get(normalize_day(day))
+        if not plan:
+            continue
+        for event in events or []:
+            start, end = to_minutes(event.get('start_time')), to_minutes(event.get('end_time'))
+            if start is None or end is None or end <= start:
+                continue
+            plan.add(start, end, dict(event, type='google_event'))
+
+    fixed = [(meeting, False) for meeting in schedule.get('meetings', [])]
+    fixed += [(task, True) for task in schedule.get('tasks', []) if _is_fixed_task(task)]
+    for item, is_task in fixed:
+        plan = plans.get(normalize_day(item.get('day')))
+        start = to_minutes(item.get('time'))
+        if not plan or start is None:
+            logger.warning(f"Skipping fixed event without day/time: {item.get('description')}")
+            continue
+        try:
+            duration = int(item.get('duration_minutes') or DEFAULT_MEETING_DURATION)
+        except (TypeError, ValueError):
+            duration = DEFAULT_MEETING_DURATION
+        event = dict(item)
+        event.pop('missing_info', None)
+        if is_task:
+            event['type'] = 'task'
+        plan.add(start, min(start + duration, END_OF_DAY), event)
+
+
+def _place_meals(plans, preferences):
+    meal_times = preferences.get('meal_times') if isinstance(preferences.get('meal_times'), dict) else {}
+    for plan in plans.values():
+        for meal, duration in MEAL_DURATIONS.items():
+            preferred = to_minutes(meal_times.get(meal))
+            if preferred is None:
+                preferred = to_minutes(DEFAULT_MEAL_TIMES[meal])
+            # Try the preferred time, then alternately later and earlier in 15 minute steps
+            for offset in [0] + [sign * step for step in range(15, MEAL_FLEXIBILITY + 1, 15) for sign in (1, -1)]:
+                start = preferred + offset
+                if start < plan.start or start + duration > plan.end:
+                    continue
+                if plan.is_free(start, start + duration):
+                    plan.add(start, start + duration, {
+                        'id': f"meal-{plan.day.lower()}-{meal}",
+                        'type': 'meal',
+                        'description': meal.capitalize()
+                    })
+                    break
+
+
+def _task_deadline(task, meetings_by_key):
+    """Return (day index, minute) of the meeting a task prepares for, or None."""
+    related = task.get('related_event')
+    if not related:
+        return None
+    meeting = meetings_by_key.get(str(related).strip().lower())
+    if not meeting:
+        return None
+    day = normalize_day(meeting.get('day'))
+    start = to_minutes(meeting.get('time'))
+    if day is None:
+        return None
+    return DAYS.index(day), start if start is not None else END_OF_DAY
+
+
+def _candidate_days(task, deadline, preferences, previous_index, blocked):
+    """Days to try for the next session of a task, in order of preference."""
+    weekend = preferences.get('weekend_scheduling')
+    days = list(range(len(DAYS)))
+    if weekend == 'no':
+        days = [index for index in days if DAYS[index] not in WEEKEND]
+    if deadline:
+        days = [index for index in days if index <= deadline[0]]
+
+    task_day = normalize_day(task.get('day'))
+    if previous_index is None:
+        first = DAYS.index(task_day) if task_day else 0
+    else:
+        # Blocked practice keeps sessions together, otherwise spread them over the following days
+        first = previous_index if blocked else previous_index + 1
+    # Rotate so that days from `first` onwards come first, then the earlier ones
+    return [index for index in days if index >= first] + [index for index in days if index < first]
+
+
+def _place_tasks(plans, preferences, schedule):
+    """Pack the flexible tasks into study sessions. Returns the tasks that did not fit."""
+    session_length = SESSION_LENGTHS.get(preferences.get('study_session_length'), DEFAULT_SESSION_LENGTH)
+    break_length = BREAK_LENGTHS.get(preferences.get('break_preference'), DEFAULT_BREAK_LENGTH)
+    preferred_hours = PRODUCTIVE_HOURS.get(preferences.get('productivity_pattern'))
+    blocked = preferences.get('learning_style') == 'blocked'
+    light_weekend = preferences.get('weekend_scheduling') == 'light'
+
+    meetings_by_key = {}
+    for meeting in schedule.get('meetings', []):
+        for key in (meeting.get('id'), meeting.get('description')):
+            if key:
+                meetings_by_key[str(key).strip().lower()] = meeting
+
+    tasks = []
+    for position, task in enumerate(schedule.get('tasks', [])):
+        if _is_fixed_task(task):
+            continue  # already placed as a fixed event
+        deadline = _task_deadline(task, meetings_by_key)
+        priority = PRIORITY_ORDER.get(str(task.get('priority', 'medium')).lower(), 1)
+        # Tasks with an earlier deadline and higher priority get the first choice of slots
+        order = (deadline or (len(DAYS), END_OF_DAY), priority, position)
+        tasks.append((order, position, task, deadline))
+    tasks.sort(key=lambda entry: entry[0])
+
+    unscheduled = []
+    for _, position, task, deadline in tasks:
+        task_id = task.get('id') or f"task-{position + 1}"
+        sessions = split_into_sessions(task_duration(task), session_length)
+        placed = 0
+        previous_index = None
+        for number, length in enumerate(sessions, start=1):
+            slot = None
+            for index in _candidate_days(task, deadline, preferences, previous_index, blocked):
+                plan = plans[DAYS[index]]
+                capacity = LIGHT_WEEKEND_TASK_MINUTES if light_weekend and plan.day in WEEKEND else DAILY_TASK_MINUTES
+                if plan.task_minutes + length > capacity:
+                    continue
+                not_after = deadline[1] if deadline and index == deadline[0] else None
+                start = plan.find_slot(length, preferred_hours, not_after)
+                if start is not None:
+                    slot = (index, plan, start)
+                    break
+            if slot is None:
+                break
+
+            previous_index, plan, start = slot
+            event = {
+                'id': task_id if len(sessions) == 1 else f"{task_id}-part{number}",
+                'type': 'task',
+                'description': task.get('description', 'Untitled Task'),
+                'course_code': task.get('course_code')
+            }
+            if len(sessions) > 1:
+                event['description'] = f"{event['description']} (session {number} of {len(sessions)})"
+            plan.add(start, start + length, event, reserve_until=start + length + break_length)
+            plan.task_minutes += length
+            placed += length
+
+        remaining = task_duration(task) - placed
+        if remaining > 0:
+            unscheduled.append({
+                'id': task_id,
+                'description': task.get('description', 'Untitled Task'),
+                'remaining_minutes': remaining
+            })
+    return unscheduled
+
+
+def solve_schedule(schedule, preferences=None, google_calendar=None):
+    """
+    Build a generated_calendar without the LLM.
+
+    Args:
+        schedule: Cleaned schedule with meetings and tasks
+        preferences: Dictionary containing user preferences
+        google_calendar: Optional Google Calendar events by day (fixed commitments)
+
+    Returns:
+        (generated_calendar, unscheduled) where unscheduled lists the tasks, or
+        remaining minutes of tasks, that did not fit in the week
+    """
+    preferences = preferences or {}
+    start, end = day_window(preferences)
+    plans = {day: DayPlan(day, start, end) for day in DAYS}
+
+    _place_fixed(plans, schedule, google_calendar)
+    _place_meals(plans, preferences)
+    unscheduled = _place_tasks(plans, preferences, schedule)
+
+    if unscheduled:
+        logger.info(f"Local solver could not fit {len(unscheduled)} task(s)")
+    return {day: plans[day].calendar_events() for day in DAYS}, unscheduled
@@ -0,0 +1,128 @@
+"""
+Incremental missing-information analysis.
+
+MissingInfoAnalyzer keeps the clarifying questions of every meeting and task
+of a ScheduleModel. After an answer only the answered items, and the items
+whose questions depend on them, are recomputed: a meeting's course code
+decides whether its related preparation tasks are asked for theirs. The
+ordered question list is cached per analyzer version.
+
+AnalyzerCache keeps one analyzer per user, keyed by a digest of the stored
+schedule, so consecutive answers reuse it instead of rebuilding every question
+from the schedule that was just loaded.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from schedule_model import ScheduleModel, Meeting
+from helpers import item_questions, order_questions
+
+logger = logging.getLogger(__name__)
+
+
+def schedule_version(schedule) -> str:
+    """Digest of a schedule dict; equal schedules have equal versions."""
+    canonical = json.dumps(schedule, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+class MissingInfoAnalyzer:
+    """Per-item question state for one ScheduleModel."""
+
+    def __init__(self, model):
+        self.model = model if isinstance(model, ScheduleModel) else ScheduleModel.from_dict(model)
+        self.version = 0
+        self._cached = None  # (version, ordered questions)
+        self.rebuild()
+
+    def rebuild(self):
+        """Recompute every item; needed after items are added, removed or renamed."""
+        self._items = {id(item): item_questions(self.model, item)
+                       for item in self.model.meetings + self.model.tasks}
+        self.version += 1
+
+    def dependents(self, item):
+        """Items whose questions depend on this item's fields."""
+        return self.model.related_tasks(item) if isinstance(item, Meeting) else []
+
+    def refresh(self, items):
+        """
+        Recompute the questions of the given (changed) items and of their
+        dependents. Returns the IDs of dependent items whose questions changed
+        as a result, i.e. the propagated questions the change resolved or raised.
+        """
+        changed = set()
+        propagated = []
+        for item in items:
+            if item is None:
+                continue
+            for position, target in enumerate([item] + self.dependents(item)):
+                if id(target) in changed:
+                    continue
+                questions = item_questions(self.model, target)
+                if questions != self._items.get(id(target)):
+                    self._items[id(target)] = questions
+                    changed.add(id(target))
+                    if position:
+                        propagated.append(target.get('id'))
+        if changed:
+            self.version += 1
+        return propagated
+
+    def questions(self):
+        """All questions in priority order."""
+        if self._cached is None or self._cached[0] != self.version:
+            per_item = [self._items[id(item)] for item in self.model.meetings + self.model.tasks]
+            self._cached = (self.version, order_questions(per_item))
+        return list(self._cached[1])
+
+
+class AnalyzerCache:
+    """
+    Bounded LRU of analyzers by user. take() removes the entry, so a request
+    owns the analyzer while it mutates its model and put() hands it back
+    under the version of the schedule it saved.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # user_id -> (version, analyzer)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def take(self, user_id, schedule):
+        """Analyzer for this schedule: the cached one if its version matches, else a new one."""
+        version = schedule_version(schedule)
+        with self._lock:
+            entry = self._entries.pop(user_id, None)
+            if entry and entry[0] == version:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        return MissingInfoAnalyzer(ScheduleModel.from_dict(schedule))
+
+    def put(self, user_id, schedule, analyzer):
+        version = schedule_version(schedule)
+        with self._lock:
+            self._entries[user_id] = (version, analyzer)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id=None):
+        """Drop one user's analyzer, or every analyzer if no user is given."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+
+def create_analyzer_cache_from_env():
+    return AnalyzerCache(max_entries=int(os.getenv('MISSING_INFO_CACHE_SIZE', '256')))
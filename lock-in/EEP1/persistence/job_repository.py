@@ -0,0 +1,82 @@
+"""
+Storage for background schedule-generation jobs.
+Job records live in the same kind of backend as schedules (memory, sqlite or
+redis, see schedule_repository) so any gunicorn worker can report a job's
+status, while the job itself runs in the worker that accepted it.
+"""
+
+import os
+import json
+import logging
+
+from persistence.schedule_repository import create_backend_from_env
+
+logger = logging.getLogger(__name__)
+
+JOB_KEY_PREFIX = 'job:'
+
+
+class JobRepository:
+    """Stores job records and the per-user index used to deduplicate submissions."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def _job_key(job_id):
+        return f"{JOB_KEY_PREFIX}{job_id}"
+
+    @staticmethod
+    def _fingerprint_key(user_id, fingerprint):
+        return f"{JOB_KEY_PREFIX}fingerprint:{user_id}:{fingerprint}"
+
+    def save(self, job):
+        self.backend.set(self._job_key(job['job_id']), json.dumps(job))
+
+    def load(self, job_id):
+        """Return the job record, or None if it does not exist."""
+        value = self.backend.get(self._job_key(job_id))
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def update(self, job_id, change):
+        """
+        Apply change(job) to the stored record and write it back only if no
+        other worker wrote it in between; otherwise re-read and re-apply.
+        change returns False to leave the record as it is. Returns the stored
+        job, or None if it does not exist.
+        """
+        key = self._job_key(job_id)
+        while True:
+            value = self.backend.get(key)
+            if value is None:
+                return None
+            job = json.loads(value)
+            if change(job) is False:
+                return job
+            if self.backend.compare_and_set(key, value, json.dumps(job)):
+                return job
+
+    def find_by_fingerprint(self, user_id, fingerprint):
+        """Return the job last submitted by this user with this fingerprint, if any."""
+        job_id = self.backend.get(self._fingerprint_key(user_id, fingerprint))
+        if job_id is None:
+            return None
+        return self.load(job_id)
+
+    def index_fingerprint(self, user_id, fingerprint, job_id):
+        self.backend.set(self._fingerprint_key(user_id, fingerprint), job_id)
+
+    def clear(self):
+        self.backend.clear()
+
+
+def create_job_repository_from_env():
+    """
+    Build the job repository on the backend selected by SCHEDULE_STORE.
+    JOB_STORE_TTL sets how long finished jobs are kept (default 1 day).
+    """
+    ttl_seconds = float(os.getenv('JOB_STORE_TTL', str(24 * 3600))) or None
+    backend = create_backend_from_env(table='jobs', key_prefix=JOB_KEY_PREFIX, ttl_seconds=ttl_seconds)
+    return JobRepository(backend)
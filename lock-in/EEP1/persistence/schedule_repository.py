@@ -0,0 +1,339 @@
+"""
+Per-user schedule storage for EEP1.
+Schedules are keyed by user id and kept in a pluggable backend so several
+gunicorn workers (or replicas) can share them without sticky sessions.
+
+Backends:
+    memory - in-process LRU with TTL (single worker / tests)
+    sqlite - local SQLite file shared by all workers on the host
+    redis  - any server speaking the Redis protocol (GET/SET/DEL/SCAN, EVAL)
+
+Every backend offers compare_and_set, so records updated by several workers
+(jobs) are only written over the value they were read from.
+"""
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'schedule:'
+
+# Sets KEYS[1] to ARGV[2] (expiring after ARGV[3] seconds if given) only if it holds ARGV[1]
+COMPARE_AND_SET_SCRIPT = (
+    "if redis.call('GET', KEYS[1]) ~= ARGV[1] then return 0 end "
+    "if ARGV[3] ~= '' then redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3]) "
+    "else redis.call('SET', KEYS[1], ARGV[2]) end "
+    "return 1"
+)
+
+
+class ScheduleStoreError(Exception):
+    """Raised when a schedule backend cannot be reached or returns an error."""
+
+
+# ===============================
+# Backends
+# ===============================
+
+class MemoryBackend:
+    """In-process LRU store with a per-entry TTL."""
+
+    def __init__(self, ttl_seconds=None, max_entries=1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at or None, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def compare_and_set(self, key, expected, value):
+        """Set key to value only if it still holds expected. Returns True if it was set."""
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] != expected or (entry[0] is not None and entry[0] <= time.time()):
+                return False
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteBackend:
+    """On-disk store in a local SQLite file, safe to share between worker processes."""
+
+    def __init__(self, path, ttl_seconds=None, table='schedules'):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.table = table
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+            self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] <= time.time():
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            return row[0]
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at)
+            )
+            self._conn.commit()
+
+    def compare_and_set(self, key, expected, value):
+        """Set key to value only if it still holds expected (one conditional UPDATE). Returns True if it was set."""
+        now = time.time()
+        expires_at = now + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE {self.table} SET value = ?, expires_at = ? "
+                "WHERE key = ? AND value = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (value, expires_at, key, expected, now)
+            )
+            self._conn.commit()
+            return cursor.rowcount == 1
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+
+
+class RedisBackend:
+    """
+    Minimal Redis protocol (RESP) client covering the commands the store needs.
+    Works against Redis, Valkey, KeyDB or a local stand-in speaking RESP.
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', ttl_seconds=None, timeout=2.0, key_prefix=KEY_PREFIX):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.ttl_seconds = ttl_seconds
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+        self._sock = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._command('GET', key)
+
+    def set(self, key, value):
+        if self.ttl_seconds:
+            self._command('SET', key, value, 'EX', int(self.ttl_seconds))
+        else:
+            self._command('SET', key, value)
+
+    def compare_and_set(self, key, expected, value):
+        """Set key to value only if it still holds expected (one server-side script). Returns True if it was set."""
+        ttl = int(self.ttl_seconds) if self.ttl_seconds else ''
+        return self._command('EVAL', COMPARE_AND_SET_SCRIPT, 1, key, expected, value, ttl) == 1
+
+    def delete(self, key):
+        self._command('DEL', key)
+
+    def clear(self):
+        # Only remove this store's keys, never flush the whole database
+        cursor = '0'
+        while True:
+            cursor, keys = self._command('SCAN', cursor, 'MATCH', f'{self.key_prefix}*', 'COUNT', 100)
+            if keys:
+                self._command('DEL', *keys)
+            if cursor in ('0', b'0'):
+                break
+
+    # -------------------------------
+    # RESP wire protocol
+    # -------------------------------
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._reader = self._sock.makefile('rb')
+        if self.password:
+            self._send_and_read('AUTH', self.password)
+        if self.db:
+            self._send_and_read('SELECT', self.db)
+
+    def _close(self):
+        for resource in (self._reader, self._sock):
+            try:
+                if resource is not None:
+                    resource.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._reader = None
+
+    def _command(self, *args):
+        with self._lock:
+            # Retry once on a stale connection (e.g. the server restarted)
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._send_and_read(*args)
+                except (OSError, ConnectionError) as e:
+                    self._close()
+                    if attempt == 1:
+                        raise ScheduleStoreError(f"Redis backend unavailable: {str(e)}")
+
+    def _send_and_read(self, *args):
+        parts = [f'*{len(args)}\r\n'.encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            parts.append(f'${len(data)}\r\n'.encode() + data + b'\r\n')
+        self._sock.sendall(b''.join(parts))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b'+':
+            return payload.decode('utf-8')
+        if prefix == b'-':
+            raise ScheduleStoreError(payload.decode('utf-8'))
+        if prefix == b':':
+            return int(payload)
+        if prefix == b'$':
+            length = int(payload)
+            if length == -1:
+                return None
+            data = self._reader.read(length + 2)[:-2]
+            return data.decode('utf-8')
+        if prefix == b'*':
+            count = int(payload)
+            if count == -1:
+                return None
+            return [self._read_reply() for _ in range(count)]
+        raise ScheduleStoreError(f"Unexpected reply from Redis backend: {line!r}")
+
+
+# ===============================
+# Repository
+# ===============================
+
+class ScheduleRepository:
+    """Stores the current and final schedule of each user in a backend."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def _key(user_id, is_final):
+        # Every schedule belongs to a user; there is no shared fallback key
+        if not user_id:
+            raise ValueError("A user id is required to store or load a schedule")
+        kind = 'final' if is_final else 'current'
+        return f"{KEY_PREFIX}{user_id}:{kind}"
+
+    def save(self, user_id, schedule, is_final=False):
+        self.backend.set(self._key(user_id, is_final), json.dumps(schedule))
+
+    def load(self, user_id, is_final=False):
+        """Return the stored schedule, or None if the user has none."""
+        value = self.backend.get(self._key(user_id, is_final))
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def reset(self, user_id):
+        """Remove one user's current and final schedules."""
+        self.backend.delete(self._key(user_id, False))
+        self.backend.delete(self._key(user_id, True))
+
+
+def create_backend_from_env(table='schedules', key_prefix=KEY_PREFIX, ttl_seconds=None):
+    """
+    Build the backend selected by SCHEDULE_STORE (memory, sqlite or redis).
+
+    SCHEDULE_STORE_TTL sets the expiry in seconds (default 7 days),
+    SCHEDULE_STORE_PATH the SQLite file and SCHEDULE_STORE_URL the Redis URL.
+    Other stores sharing the same backend pass their own table, key prefix and TTL.
+    The memory store is refused when GUNICORN_WORKERS runs more than one process.
+    """
+    kind = os.getenv('SCHEDULE_STORE', 'memory').lower()
+    if ttl_seconds is None:
+        ttl_seconds = float(os.getenv('SCHEDULE_STORE_TTL', str(7 * 24 * 3600))) or None
+
+    if kind == 'sqlite':
+        default_path = os.path.join(os.getenv('STORAGE_DIR', 'storage'), 'schedules.db')
+        path = os.getenv('SCHEDULE_STORE_PATH', default_path)
+        logger.info(f"Using SQLite schedule store at {path}")
+        return SQLiteBackend(path, ttl_seconds=ttl_seconds, table=table)
+    if kind == 'redis':
+        url = os.getenv('SCHEDULE_STORE_URL', 'redis://localhost:6379/0')
+        logger.info(f"Using Redis schedule store at {url}")
+        return RedisBackend(url, ttl_seconds=ttl_seconds, key_prefix=key_prefix)
+    if kind != 'memory':
+        logger.warning(f"Unknown SCHEDULE_STORE '{kind}', falling back to memory")
+    workers = int(os.getenv('GUNICORN_WORKERS', '1'))
+    if workers > 1:
+        # Each worker would hold its own copy, so a schedule or job saved by one is missing in the others
+        raise ScheduleStoreError(
+            f"SCHEDULE_STORE=memory cannot be shared by {workers} workers; use sqlite or redis")
+    max_entries = int(os.getenv('SCHEDULE_STORE_MAX_ENTRIES', '1000'))
+    return MemoryBackend(ttl_seconds=ttl_seconds, max_entries=max_entries)
@@ -0,0 +1,182 @@
+"""
+Cached, versioned prompt fragments.
+
+A prompt template is split once into static text and named data slots. Each
+data slot (preferences, Google Calendar events, meetings, tasks) is rendered
+by its own function and cached by a hash of the data it renders, so a
+regeneration with unchanged preferences or calendar reuses the text. Every
+fragment carries a version (its content hash) and its size, and the static
+text is the same bytes on every run, which keeps it eligible for
+provider-side prompt caching; split_system() moves it into a system prompt
+ahead of the per-user data.
+"""
+
+import os
+import json
+import string
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(value):
+    """Short, stable hash of JSON-serializable data (or of a string)."""
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()[:16]
+
+
+class PromptFragment:
+    """One rendered piece of a prompt."""
+
+    __slots__ = ('name', 'text', 'version', 'static')
+
+    def __init__(self, name, text, version, static=False):
+        self.name = name
+        self.text = text
+        self.version = version
+        self.static = static
+
+    @property
+    def size(self):
+        return len(self.text)
+
+
+class RenderedPrompt:
+    """Fragments of a prompt in order; text is their concatenation."""
+
+    def __init__(self, fragments):
+        self.fragments = fragments
+        self.text = ''.join(fragment.text for fragment in fragments)
+
+    def sizes(self):
+        return {fragment.name: fragment.size for fragment in self.fragments}
+
+    def versions(self):
+        return {fragment.name: fragment.version for fragment in self.fragments}
+
+    def static_prefix(self):
+        """The leading run of static fragments, identical for every prompt built from the same template."""
+        prefix = []
+        for fragment in self.fragments:
+            if not fragment.static:
+                break
+            prefix.append(fragment.text)
+        return ''.join(prefix)
+
+    def split_system(self):
+        """
+        (system, user) for a request with a separate system prompt. system
+        joins the static fragments that do not introduce a slot (the header
+        and the instructions), which are the same for every prompt built from
+        the template; user keeps the slot headings and data in order.
+        """
+        system = [f.text.strip() for f in self.fragments if f.static and not f.name.endswith('_heading')]
+        user = [f.text for f in self.fragments if not f.static or f.name.endswith('_heading')]
+        return '\n\n'.join(text for text in system if text), ''.join(user).strip()
+
+
+class FragmentCache:
+    """Bounded LRU of rendered fragments keyed by (slot, content hash)."""
+
+    def __init__(self, max_entries=512, metrics_dict=None, service_name=None):
+        self.max_entries = max_entries
+        self.metrics_dict = metrics_dict
+        self.service_name = service_name
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, name, value, renderer):
+        """Return a PromptFragment for value, rendering it only if this content was not seen before."""
+        version = content_hash(value)
+        key = (name, version)
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+        if text is not None:
+            self._record('cache_hits_total')
+            return PromptFragment(name, text, version)
+
+        self._record('cache_misses_total')
+        text = renderer(value)
+        with self._lock:
+            self._entries[key] = text
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            size = len(self._entries)
+        if self.metrics_dict and 'cache_entries' in self.metrics_dict:
+            self.metrics_dict['cache_entries'].labels(service=self.service_name, cache='prompt_fragments').set(size)
+        return PromptFragment(name, text, version)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _record(self, metric):
+        if self.metrics_dict and metric in self.metrics_dict:
+            self.metrics_dict[metric].labels(service=self.service_name, cache='prompt_fragments').inc()
+
+
+class PromptBuilder:
+    """
+    Builds prompts from a str.format template whose fields are data slots.
+
+    Args:
+        template: Template text; {name} marks a slot, {{ and }} are literal braces
+        renderers: {slot name: function(value) -> text}
+        cache: FragmentCache shared by the builds
+    """
+
+    def __init__(self, template, renderers, cache=None):
+        self.renderers = renderers
+        self.cache = cache or FragmentCache()
+        self._parts = []  # (static PromptFragment or None, slot name or None)
+        literal_text = []
+        # parse() also breaks the literal text at every escaped brace, so literals are merged up to the next slot
+        for literal, field, _, _ in list(string.Formatter().parse(template)) + [('', None, None, None)]:
+            literal_text.append(literal)
+            if field is None and literal:
+                continue
+            static = None
+            text = ''.join(literal_text)
+            literal_text = []
+            if text:
+                name = 'header' if not self._parts else f"{field}_heading" if field else 'instructions'
+                static = PromptFragment(name, text, content_hash(text), static=True)
+            if field is not None and field not in renderers:
+                raise ValueError(f"No renderer for prompt slot '{field}'")
+            if static is not None or field is not None:
+                self._parts.append((static, field))
+
+    def build(self, **values):
+        """Render the prompt; slots missing from values are rendered from None."""
+        fragments = []
+        for static, field in self._parts:
+            if static is not None:
+                fragments.append(static)
+            if field is not None:
+                fragments.append(self.cache.render(field, values.get(field), self.renderers[field]))
+        prompt = RenderedPrompt(fragments)
+        self._report(prompt)
+        return prompt
+
+    def _report(self, prompt):
+        metrics_dict = self.cache.metrics_dict
+        if metrics_dict and 'prompt_fragment_bytes' in metrics_dict:
+            for fragment in prompt.fragments:
+                metrics_dict['prompt_fragment_bytes'].labels(
+                    service=self.cache.service_name, fragment=fragment.name
+                ).observe(len(fragment.text.encode('utf-8')))
+        logger.debug(f"Prompt fragments: {prompt.sizes()}")
+
+
+def create_fragment_cache_from_env(metrics_dict=None, service_name=None):
+    return FragmentCache(
+        max_entries=int(os.getenv('PROMPT_FRAGMENT_CACHE_SIZE', '512')),
+        metrics_dict=metrics_dict,
+        service_name=service_name
+    )
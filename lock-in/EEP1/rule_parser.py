@@ -0,0 +1,373 @@
+"""
+Rule-based fast path for schedule parsing.
+
+Most pasted schedules are short, formulaic lines ("EECE503 exam Monday at
+3pm for 2 hours"). Each line runs through a small grammar: course code,
+time or time range, duration, day and location are matched and removed,
+and what is left must be an item keyword (exam, lecture, homework, ...),
+optionally preceded by a few descriptive words, and filler words. Lines
+that match produce the same meeting/task dicts as IEP1, with a confidence
+score; anything else, and every paragraph that depends on context
+(headings such as a bare "Monday", "another one at 5pm", "then") or that
+cancels or moves something ("No class Monday", "Lecture moved to 2pm"),
+is left to the LLM. In hybrid mode only that residue is sent to IEP1.
+"""
+
+import os
+import re
+import logging
+import threading
+
+from helpers import convert_to_24h, convert_answer_value
+from schedule_chunking import split_segments, is_heading
+
+logger = logging.getLogger(__name__)
+
+COURSE_CODE_RE = re.compile(r"\b(?:([A-Z]{2,5})\s?(\d{3}[A-Z]?)|([a-z]{2,5})(\d{3}[a-z]?))\b")
+DAY_RE = re.compile(r"\b(mon|tues?|wed|thu|thurs|fri|sat|sun)(?:day|nesday|rsday|urday)?\b\.?", re.IGNORECASE)
+TIME = r"(?:\d{1,2}(?::\d{2})?\s*(?:am|pm)|\d{1,2}:\d{2}|noon|midnight)"
+TIME_RANGE_RE = re.compile(rf"\b(?:from\s+)?({TIME}|\d{{1,2}})\s*(?:-|to|until)\s*({TIME})(?!\w)", re.IGNORECASE)
+TIME_RE = re.compile(rf"(?:\bat\s+)?\b({TIME}|(?<=at )\d{{1,2}})(?!\w)", re.IGNORECASE)
+DURATION_RE = re.compile(
+    r"\b(?:for\s+)?(an?|one|two|three|\d+(?:\.\d+)?)\s*-?\s*(hours?|hrs?|h|minutes?|mins?)\b", re.IGNORECASE
+)
+LOCATION_RE = re.compile(
+    r"\b(?:in|at)\s+((?:the\s+)?(?:(?i:room|rm|hall|lab|building|bldg|auditorium)\.?\s*[\w-]+"
+    r"|[A-Z][A-Za-z]*(?:\s+[A-Z0-9][\w-]*)*))"
+)
+BULLET_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+
+NUMBER_WORDS = {'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3}
+
+# Item keywords: meeting types as in the parsing prompt, and task categories
+MEETING_TYPES = {
+    'exam': 'exam', 'midterm': 'exam', 'final': 'exam', 'quiz': 'exam', 'test': 'exam',
+    'presentation': 'presentation', 'interview': 'interview', 'deadline': 'project_deadline',
+    'lecture': 'regular', 'class': 'regular', 'lab': 'regular', 'tutorial': 'regular', 'recitation': 'regular',
+    'meeting': 'regular', 'seminar': 'regular', 'session': 'regular', 'workshop': 'regular', 'appointment': 'regular'
+}
+TASK_CATEGORIES = {
+    'homework': 'assignment', 'assignment': 'assignment', 'essay': 'assignment', 'report': 'assignment',
+    'reading': 'reading', 'study': 'preparation', 'review': 'preparation', 'revision': 'preparation'
+}
+HIGH_PRIORITY_TYPES = ('exam', 'presentation', 'interview', 'project_deadline')
+COURSE_REQUIRED_TYPES = ('exam', 'presentation')
+
+# Words that carry no information of their own
+FILLER_WORDS = {
+    'i', 'ive', "i've", 'have', 'has', 'got', 'my', 'a', 'an', 'the', 'on', 'at', 'for', 'is', 'there', 'theres',
+    "there's", 'will', 'be', 'this', 'due', 'we', 'our', 'of', 'in'
+}
+# Words that refer to the lines around them ("another one at 5pm", "it is 2
+# hours"); their paragraph goes to the LLM whole. Other unknown words only
+# leave their own line to the LLM.
+REFERENCE_WORDS = {
+    'another', 'then', 'after', 'before', 'same', 'also', 'it', 'its', "it's", 'next', 'following', 'later',
+    'both', 'second', 'other', 'them', 'they', 'those', 'these', 'previous', 'above', 'below'
+}
+# Words that cancel, move or negate an item ("No class Monday", "Cancelled
+# lecture Wednesday"); the rules would read these lines as new items, so
+# their paragraph goes to the LLM whole, next to the items they change
+NEGATION_WORDS = {
+    'no', 'not', "don't", "won't", "isn't", 'cancel', 'cancels', 'cancelled', 'canceled', 'moved', 'postponed',
+    'rescheduled', 'skip', 'skipped'
+}
+# Descriptive words seen in front of item keywords; other words lower the confidence
+KNOWN_MODIFIERS = {'final', 'midterm', 'team', 'project', 'group', 'lab', 'office', 'hours', 'weekly', 'class', 'oral'}
+
+WORD_RE = re.compile(r"[A-Za-z0-9']+")
+
+
+def _refers_to_other_lines(line):
+    return any(word.lower() in REFERENCE_WORDS or word.lower() in NEGATION_WORDS for word in WORD_RE.findall(line))
+
+
+class RuleMatch:
+    """
+    A line parsed by the rules.
+
+    Attributes:
+        line: The source line
+        kind: 'meetings' or 'tasks'
+        item: The parsed item, shaped like the items of IEP1's schedules
+        confidence: Score from 0 to 1; ambiguous times and unknown descriptive words lower it
+    """
+
+    def __init__(self, line, kind, item, confidence):
+        self.line = line
+        self.kind = kind
+        self.item = item
+        self.confidence = confidence
+
+
+def _take(pattern, text):
+    """Return (matches, text without them); used to peel recognized parts off a line."""
+    matches = list(pattern.finditer(text))
+    for match in reversed(matches):
+        text = text[:match.start()] + ' ' + text[match.end():]
+    return matches, text
+
+
+def _duration_minutes(amount, unit):
+    amount = NUMBER_WORDS.get(amount.lower()) or float(amount)
+    minutes = amount * 60 if unit.lower().startswith('h') else amount
+    return int(round(minutes))
+
+
+def _minutes_between(start, end):
+    """Minutes from start to end (HH:MM strings), or None if either is ambiguous or end is not later."""
+    try:
+        start_h, start_m = map(int, start.split(':'))
+        end_h, end_m = map(int, end.split(':'))
+    except (AttributeError, ValueError):
+        return None
+    minutes = (end_h * 60 + end_m) - (start_h * 60 + start_m)
+    return minutes if minutes > 0 else None
+
+
+def _range_end(start, end):
+    """Complete an end time without AM/PM from its start ("3-5pm", "3pm-5")."""
+    if not re.search(r"am|pm", end, re.IGNORECASE) and re.search(r"am|pm", start, re.IGNORECASE):
+        end = f"{end} {re.search(r'am|pm', start, re.IGNORECASE).group(0)}"
+    if not re.search(r"am|pm", start, re.IGNORECASE) and re.search(r"am|pm", end, re.IGNORECASE):
+        start = f"{start} {re.search(r'am|pm', end, re.IGNORECASE).group(0)}"
+    return start, end
+
+
+def parse_line(line):
+    """
+    Parse one line into a RuleMatch, or return None when some of it is not
+    understood (the line is then left to the LLM).
+    """
+    text = BULLET_RE.sub('', line).strip().rstrip('.!')
+    if not text:
+        return None
+    if _refers_to_other_lines(text):
+        return None
+
+    codes, text = _take(COURSE_CODE_RE, text)
+    if len(codes) > 1:
+        return None
+    course_code = None
+    if codes:
+        letters, digits = (codes[0].group(1), codes[0].group(2)) if codes[0].group(1) else (codes[0].group(3), codes[0].group(4))
+        course_code = f"{letters}{digits}".upper()
+
+    ranges, text = _take(TIME_RANGE_RE, text)
+    times, text = _take(TIME_RE, text)
+    durations, text = _take(DURATION_RE, text)
+    days, text = _take(DAY_RE, text)
+    locations, text = _take(LOCATION_RE, text)
+    if len(ranges) + len(times) > 1 or len(durations) > 1 or len(days) > 1 or len(locations) > 1:
+        return None
+
+    item_time, duration = None, None
+    if ranges:
+        start, end = _range_end(ranges[0].group(1), ranges[0].group(2))
+        item_time = convert_to_24h(start)
+        duration = _minutes_between(item_time, convert_to_24h(end))
+        if duration is None:
+            return None
+    elif times:
+        item_time = convert_to_24h(times[0].group(1).replace(' ', ''))
+    if durations:
+        if duration is not None:
+            return None
+        duration = _duration_minutes(durations[0].group(1), durations[0].group(2))
+    # Day abbreviations ("wed", "Thurs") are expanded like /answer-question day answers
+    day = convert_answer_value('day', days[0].group(1)) if days else None
+    location = re.sub(r"^the\s+", '', locations[0].group(1).strip()) if locations else None
+
+    # What is left: [fillers] [descriptive words] keyword [item number] [fillers]
+    rest = WORD_RE.findall(text)
+    heads = [index for index, word in enumerate(rest) if word.lower() in MEETING_TYPES or word.lower() in TASK_CATEGORIES]
+    if not heads:
+        return None
+    head = heads[-1]
+    keyword = rest[head].lower()
+    if keyword in TASK_CATEGORIES and any(rest[index].lower() in MEETING_TYPES for index in heads[:-1]):
+        return None
+    number = None
+    after = rest[head + 1:]
+    if after and after[0].isdigit():
+        number, after = after[0], after[1:]
+    if any(word.lower() not in FILLER_WORDS for word in after):
+        return None
+    before = rest[:head]
+    while before and before[0].lower() in FILLER_WORDS:
+        before = before[1:]
+    if len(before) > 3 or any(not word.isalpha() or word.lower() in FILLER_WORDS for word in before):
+        return None
+
+    confidence = 1.0
+    confidence -= 0.1 * len([word for word in before if word.lower() not in KNOWN_MODIFIERS])
+    if item_time and item_time.startswith('AMBIGUOUS:'):
+        confidence -= 0.2
+
+    description_words = ([course_code] if course_code else []) + before + [rest[head]] + ([number] if number else [])
+    description = ' '.join(description_words)
+    description = description[0].upper() + description[1:]
+
+    if keyword in MEETING_TYPES:
+        meeting_type = MEETING_TYPES[keyword]
+        missing = [field for field, value in (('day', day), ('time', item_time), ('duration_minutes', duration))
+                   if value is None]
+        if course_code is None and meeting_type in COURSE_REQUIRED_TYPES:
+            missing.append('course_code')
+        item = {
+            'description': description,
+            'day': day,
+            'priority': 'high' if meeting_type in HIGH_PRIORITY_TYPES else 'medium',
+            'time': item_time,
+            'duration_minutes': duration,
+            'type': meeting_type,
+            'location': location,
+            'preparation_tasks': [],
+            'course_code': course_code,
+            'missing_info': missing
+        }
+        return RuleMatch(line, 'meetings', item, round(max(confidence, 0.0), 2))
+
+    item = {
+        'description': description,
+        'day': day,
+        'priority': 'medium',
+        'time': item_time,
+        'duration_minutes': duration,
+        'category': TASK_CATEGORIES[keyword],
+        'is_fixed_time': item_time is not None,
+        'location': location,
+        'prerequisites': [],
+        'course_code': course_code,
+        'related_event': None,
+        'missing_info': []
+    }
+    return RuleMatch(line, 'tasks', item, round(max(confidence, 0.0), 2))
+
+
+class RuleParseResult:
+    """
+    Outcome of the rules on a text.
+
+    Attributes:
+        schedule: {meetings, tasks, course_codes} of the lines parsed locally
+        matches: RuleMatch of every line parsed locally
+        residue: Text of the lines left to the LLM ('' when everything was parsed)
+        lines: Number of non-empty lines in the text
+    """
+
+    def __init__(self, matches, residue, lines):
+        self.matches = matches
+        self.residue = residue
+        self.lines = lines
+        self.schedule = {'meetings': [], 'tasks': [], 'course_codes': []}
+        for match in matches:
+            self.schedule[match.kind].append(match.item)
+            code = match.item.get('course_code')
+            if code and code not in self.schedule['course_codes']:
+                self.schedule['course_codes'].append(code)
+
+    @property
+    def local_share(self):
+        """Share of the lines parsed locally, from 0 to 1."""
+        return len(self.matches) / self.lines if self.lines else 0.0
+
+    @property
+    def confidence(self):
+        """Lowest confidence of the lines parsed locally, or None if there are none."""
+        return min((match.confidence for match in self.matches), default=None)
+
+    def stats(self):
+        return {
+            'lines': self.lines,
+            'local_lines': len(self.matches),
+            'local_share': round(self.local_share, 2),
+            'confidence': self.confidence
+        }
+
+
+class RuleParser:
+    """
+    Parses what it can of a schedule text locally.
+
+    Args:
+        min_confidence: Lowest confidence of a line kept from the rules; other lines go to the LLM
+        metrics_dict: Optional metrics dictionary returned by setup_metrics
+        service_name: Service label for metrics
+    """
+
+    def __init__(self, min_confidence=0.75, metrics_dict=None, service_name=None):
+        self.min_confidence = min_confidence
+        self.metrics_dict = metrics_dict
+        self.service_name = service_name
+        self._llm_seconds_per_line = None  # moving average over recent IEP1 parses
+        self._lock = threading.Lock()
+
+    def parse(self, text):
+        """
+        Return a RuleParseResult. Paragraphs with headings (a line that is
+        only a day name included), references to other lines or negations
+        are left whole to the LLM.
+        """
+        matches = []
+        residue = []
+        lines = 0
+        for segment in split_segments(text):
+            segment_lines = [line for line in segment.splitlines() if line.strip()]
+            lines += len(segment_lines)
+            if any(is_heading(line) or _refers_to_other_lines(line) for line in segment_lines):
+                residue.append(segment)
+                continue
+            parsed = [parse_line(line) for line in segment_lines]
+            left = []
+            for line, match in zip(segment_lines, parsed):
+                if match is not None and match.confidence >= self.min_confidence:
+                    matches.append(match)
+                else:
+                    left.append(line)
+            if left:
+                residue.append('\n'.join(left))
+        result = RuleParseResult(matches, '\n\n'.join(residue), lines)
+        self._count('local', len(matches))
+        self._count('llm', lines - len(matches))
+        return result
+
+    def observe_llm(self, seconds, lines):
+        """Record the duration of an IEP1 parse of a number of lines, for the latency saved estimate."""
+        if lines <= 0:
+            return
+        with self._lock:
+            per_line = seconds / lines
+            previous = self._llm_seconds_per_line
+            self._llm_seconds_per_line = per_line if previous is None else 0.8 * previous + 0.2 * per_line
+
+    def record_saved(self, result, local_seconds):
+        """
+        Observe the estimated IEP1 time saved by the lines parsed locally: their
+        share of a recent IEP1 parse, less the time spent on the rules. Nothing
+        is recorded before the first IEP1 parse has been observed.
+        """
+        with self._lock:
+            per_line = self._llm_seconds_per_line
+        if per_line is None or not result.matches:
+            return None
+        saved = max(per_line * len(result.matches) - local_seconds, 0.0)
+        if self.metrics_dict and 'rule_parse_latency_saved_seconds' in self.metrics_dict:
+            self.metrics_dict['rule_parse_latency_saved_seconds'].labels(service=self.service_name).observe(saved)
+        return saved
+
+    # -------------------------------
+    # Internal helpers
+    # -------------------------------
+
+    def _count(self, outcome, lines):
+        if lines and self.metrics_dict and 'rule_parse_lines_total' in self.metrics_dict:
+            self.metrics_dict['rule_parse_lines_total'].labels(service=self.service_name, outcome=outcome).inc(lines)
+
+
+def create_rule_parser_from_env(metrics_dict=None, service_name=None):
+    return RuleParser(
+        min_confidence=float(os.getenv('RULE_PARSE_MIN_CONFIDENCE', '0.75')),
+        metrics_dict=metrics_dict,
+        service_name=service_name
+    )
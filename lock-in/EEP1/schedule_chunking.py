@@ -0,0 +1,330 @@
+"""
+Chunked parsing of long schedule texts.
+
+A long input (a semester syllabus, a multi-course timetable) is split into
+segments at paragraph breaks and headings (a course code, "Week 3", a day
+name, a line ending with a colon), and the segments are packed into chunks small enough
+for one IEP1 completion. The chunks are parsed concurrently, so the latency
+follows the largest chunk rather than the length of the text. A chunk whose
+answer came back truncated or without a schedule is parsed again in two
+halves. The partial schedules are then merged: repeated meetings and tasks
+are kept once and every item gets an ID derived from its content, so parsing
+the same text twice yields the same IDs.
+"""
+
+import os
+import re
+import json
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+# Lines that start a new segment: markdown headings, "Week 3" / "Module 2",
+# a course code or a day name ("Monday", "Tues.") with an optional title, or
+# a short line ending with a colon ("Assignments:")
+DAY_NAME = r"(?i:(?:mon|tues?|wed|thu|thurs|fri|sat|sun)(?:day|nesday|rsday|urday)?s?\.?)"
+HEADING_TITLE = r"(?:\s*[-:]\s*[^\d]*)?"
+HEADING_RE = re.compile(
+    r"^\s*(?:#+\s*\S.*"
+    rf"|(?:(?i:week|module|unit|part|chapter)\s*\d+|[A-Z]{{2,5}}\s?\d{{3}}[A-Z]?|{DAY_NAME}){HEADING_TITLE}"
+    r"|[^.!?]{1,60}:)\s*$"
+)
+DAY_HEADING_RE = re.compile(rf"^\s*{DAY_NAME}{HEADING_TITLE}\s*$")
+
+ITEM_KINDS = ('meetings', 'tasks')
+
+# Fields merged by hand when two copies of an item are combined
+MERGE_SKIPPED_FIELDS = ('id', 'missing_info')
+
+ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, 'lock-in/schedule-item')
+
+PARSED = 'parsed'
+SPLIT = 'split'
+FAILED = 'failed'
+
+
+def is_heading(line):
+    return bool(HEADING_RE.match(line))
+
+
+def is_day_heading(line):
+    return bool(DAY_HEADING_RE.match(line))
+
+
+def split_segments(text):
+    """
+    Split a schedule text into segments: paragraphs, with a heading line
+    starting a new segment. A heading is kept with the lines that follow it.
+    """
+    segments = []
+    current = []
+    for line in text.replace('\r\n', '\n').split('\n'):
+        if not line.strip():
+            if current:
+                segments.append(current)
+                current = []
+            continue
+        if is_heading(line) and current and not (len(current) == 1 and is_heading(current[0])):
+            segments.append(current)
+            current = []
+        current.append(line.rstrip())
+    if current:
+        segments.append(current)
+
+    # A heading on its own (followed by a blank line) introduces the next paragraph
+    merged = []
+    for segment in segments:
+        if merged and len(merged[-1]) == 1 and is_heading(merged[-1][0]):
+            merged[-1] = merged[-1] + segment
+        else:
+            merged.append(segment)
+    return ['\n'.join(segment) for segment in merged]
+
+
+def count_lines(text):
+    """Non-empty lines of a text, the size of a parse in llm_headers."""
+    return len([line for line in text.splitlines() if line.strip()])
+
+
+def halve(chunk):
+    """
+    Split a chunk into two halves of its lines. The second half starts with
+    the headings its lines belong to: the chunk's own heading and the most
+    recent heading above the split point (e.g. the day of the lines that
+    were split apart), leaving out a first day heading that another day
+    heading replaces. Returns None for a chunk of a single line.
+    """
+    lines = [line for line in chunk.splitlines() if line.strip()]
+    start = 1 if lines and is_heading(lines[0]) else 0
+    if len(lines) - start < 2:
+        return None
+    split = start + (len(lines) - start) // 2
+    # A heading is kept with the lines that follow it
+    while split > start + 1 and is_heading(lines[split - 1]):
+        split -= 1
+    first, second = lines[:split], lines[split:]
+    starts_with_heading = is_heading(second[0])
+    current = second[0] if starts_with_heading else next((line for line in reversed(first) if is_heading(line)), None)
+    headings = []
+    if start and current != lines[0] and not (is_day_heading(lines[0]) and current and is_day_heading(current)):
+        headings.append(lines[0])
+    if current is not None and not starts_with_heading:
+        headings.append(current)
+    second = headings + second
+    return ['\n'.join(first), '\n'.join(second)]
+
+
+# ===============================
+# Merging
+# ===============================
+
+def item_key(item):
+    """Identity of a parsed meeting or task: its normalized description, day, time and course code."""
+    description = ' '.join(str(item.get('description') or '').lower().split())
+    return (
+        description,
+        str(item.get('day') or '').strip().lower(),
+        str(item.get('time') or '').strip(),
+        str(item.get('course_code') or '').strip().upper()
+    )
+
+
+def stable_item_id(kind, item):
+    """ID of an item derived from its kind and identity, equal across parses of the same text."""
+    return str(uuid.uuid5(ID_NAMESPACE, json.dumps([kind, *item_key(item)])))
+
+
+def _is_empty(value):
+    return value is None or value == '' or value == []
+
+
+def _combine(kept, duplicate):
+    """Fill the empty fields of kept from a repeated copy of the same item."""
+    filled = []
+    for field, value in duplicate.items():
+        if field in MERGE_SKIPPED_FIELDS or _is_empty(value) or not _is_empty(kept.get(field)):
+            continue
+        kept[field] = value
+        filled.append(field)
+    # A field stays missing only if no copy of the item had it
+    missing = kept.get('missing_info')
+    if isinstance(missing, list):
+        other = duplicate.get('missing_info')
+        other = other if isinstance(other, list) else []
+        kept['missing_info'] = [field for field in missing if field in other and field not in filled]
+
+
+def merge_schedules(schedules):
+    """
+    Merge the schedules parsed from the chunks of one text, in chunk order.
+    Repeated meetings and tasks (see item_key) are kept once, with the fields
+    of every copy. Items keep an ID given by the parser unless another item
+    already has it; the others get stable_item_id.
+    """
+    merged = {kind: [] for kind in ITEM_KINDS}
+    merged['course_codes'] = []
+    for kind in ITEM_KINDS:
+        seen = {}
+        for schedule in schedules:
+            for item in schedule.get(kind) or []:
+                if not isinstance(item, dict):
+                    continue
+                key = item_key(item)
+                if key in seen:
+                    _combine(seen[key], item)
+                    continue
+                seen[key] = dict(item)
+                merged[kind].append(seen[key])
+
+    used_ids = set()
+    for kind in ITEM_KINDS:
+        for item in merged[kind]:
+            if not item.get('id') or item['id'] in used_ids:
+                item['id'] = stable_item_id(kind, item)
+            used_ids.add(item['id'])
+
+    codes = [code for schedule in schedules for code in schedule.get('course_codes') or []]
+    codes += [item.get('course_code') for kind in ITEM_KINDS for item in merged[kind]]
+    for code in codes:
+        if isinstance(code, str) and code.strip() and code.strip() not in merged['course_codes']:
+            merged['course_codes'].append(code.strip())
+    return merged
+
+
+def is_schedule(value):
+    """Whether a parser answer is a schedule (an object with a meetings or tasks list)."""
+    return isinstance(value, dict) and any(isinstance(value.get(kind), list) for kind in ITEM_KINDS)
+
+
+# ===============================
+# Chunked parsing
+# ===============================
+
+class ChunkedParser:
+    """
+    Parses long schedule texts in concurrent chunks.
+
+    Args:
+        max_chars: Largest chunk in characters (0 sends every text whole)
+        max_lines: Largest chunk in non-empty lines
+        max_workers: Chunks parsed at the same time, across all requests
+        metrics_dict: Optional metrics dictionary returned by setup_metrics
+        service_name: Service label for metrics
+    """
+
+    def __init__(self, max_chars=1500, max_lines=15, max_workers=4, metrics_dict=None, service_name=None):
+        self.max_chars = max_chars
+        self.max_lines = max_lines
+        self.max_workers = max_workers
+        self.metrics_dict = metrics_dict
+        self.service_name = service_name
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def chunks(self, text):
+        """Pack the segments of text into chunks within the size limits, in text order."""
+        if not self.max_chars or self._fits(text):
+            return [text]
+        chunks = []
+        current = []
+        for segment in split_segments(text):
+            pieces = [segment] if self._fits(segment) else self._split_segment(segment)
+            for piece in pieces:
+                if current and not self._fits('\n\n'.join(current + [piece])):
+                    chunks.append('\n\n'.join(current))
+                    current = []
+                current.append(piece)
+        if current:
+            chunks.append('\n\n'.join(current))
+        return chunks
+
+    def parse(self, text, parse_chunk):
+        """
+        Return (schedule, error) for a text. parse_chunk(chunk) runs on the
+        worker threads and returns (schedule, error): an error stops the whole
+        parse and is returned as is, while a None schedule (truncated or not a
+        schedule) sends the chunk again in two halves. Exceptions raised by
+        parse_chunk propagate to the caller.
+        """
+        chunks = self.chunks(text)
+        if len(chunks) > 1:
+            logger.info(f"Parsing schedule text of {len(text)} characters in {len(chunks)} chunks")
+        results = {}
+        pending = {}   # future -> position of its chunk in the text, e.g. (2,) or (2, 1) for a second half
+        chunk_of = {}
+        for index, chunk in enumerate(chunks):
+            future = self._submit(parse_chunk, chunk)
+            pending[future] = (index,)
+            chunk_of[future] = chunk
+        try:
+            while pending:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    position = pending.pop(future)
+                    schedule, error = future.result()
+                    if error is not None:
+                        self._count(FAILED)
+                        return None, error
+                    if is_schedule(schedule):
+                        self._count(PARSED)
+                        results[position] = schedule
+                        continue
+                    halves = halve(chunk_of[future])
+                    if halves is None:
+                        self._count(FAILED)
+                        return None, ('IEP1 returned no schedule for part of the text', 502)
+                    logger.warning(f"Chunk of {count_lines(chunk_of[future])} lines was not parsed completely, "
+                                   f"parsing it in two halves")
+                    self._count(SPLIT)
+                    for half_index, half in enumerate(halves):
+                        half_future = self._submit(parse_chunk, half)
+                        pending[half_future] = position + (half_index,)
+                        chunk_of[half_future] = half
+        finally:
+            for future in pending:
+                future.cancel()
+        return merge_schedules([results[position] for position in sorted(results)]), None
+
+    # -------------------------------
+    # Internal helpers
+    # -------------------------------
+
+    def _fits(self, text):
+        return len(text) <= self.max_chars and count_lines(text) <= self.max_lines
+
+    def _split_segment(self, segment):
+        """Split an oversized segment at line boundaries, repeating its headings in every piece (see halve)."""
+        pieces = [segment]
+        while any(not self._fits(piece) for piece in pieces):
+            split = []
+            for piece in pieces:
+                halves = None if self._fits(piece) else halve(piece)
+                split.extend(halves or [piece])
+            if len(split) == len(pieces):
+                break  # single lines longer than max_chars are sent as they are
+            pieces = split
+        return pieces
+
+    def _submit(self, parse_chunk, chunk):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=max(self.max_workers, 1), thread_name_prefix='parse-chunk')
+        return self._executor.submit(parse_chunk, chunk)
+
+    def _count(self, outcome):
+        if self.metrics_dict and 'parse_chunks_total' in self.metrics_dict:
+            self.metrics_dict['parse_chunks_total'].labels(service=self.service_name, outcome=outcome).inc()
+
+
+def create_chunked_parser_from_env(metrics_dict=None, service_name=None):
+    """ChunkedParser configured by the PARSE_CHUNK_* environment variables."""
+    return ChunkedParser(
+        max_chars=int(os.getenv('PARSE_CHUNK_CHARS', '1500')),
+        max_lines=int(os.getenv('PARSE_CHUNK_LINES', '15')),
+        max_workers=int(os.getenv('PARSE_CHUNK_CONCURRENCY', '4')),
+        metrics_dict=metrics_dict,
+        service_name=service_name
+    )
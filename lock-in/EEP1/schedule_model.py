@@ -0,0 +1,269 @@
+"""
+Typed in-memory model of a parsed schedule.
+
+Meetings, tasks and generated calendar events are slot-based records, and the
+schedule keeps an id index, a description index and the meeting <-> related
+task links, so answering a question about one item or propagating a course
+code to its preparation tasks no longer scans the whole schedule. Fields the
+model does not know about are kept as they are and written back by to_dict().
+"""
+
+import json
+
+# Length of the character n-grams used to find related meetings
+NGRAM = 3
+
+
+class Record:
+    """
+    Base class of schedule records. Known fields are slots and are simply
+    unset when absent from the source dict, so to_dict() returns the same keys;
+    any other field is kept in `extra`.
+    """
+
+    __slots__ = ('extra',)
+    FIELDS = ()
+    _FIELD_SET = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._FIELD_SET = frozenset(cls.FIELDS)
+
+    def __init__(self, **fields):
+        self.extra = {}
+        for field, value in fields.items():
+            self.set(field, value)
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls.__new__(cls)
+        record.extra = {}
+        known = cls._FIELD_SET
+        for field, value in data.items():
+            if field in known:
+                setattr(record, field, list(value) if isinstance(value, list) else value)
+            else:
+                record.extra[field] = value
+        return record
+
+    def to_dict(self):
+        data = {}
+        for field in self.FIELDS:
+            value = getattr(self, field, data)
+            if value is not data:
+                data[field] = list(value) if isinstance(value, list) else value
+        data.update(self.extra)
+        return data
+
+    def get(self, field, default=None):
+        if field in self._FIELD_SET:
+            return getattr(self, field, default)
+        return self.extra.get(field, default)
+
+    def set(self, field, value):
+        if field in self._FIELD_SET:
+            setattr(self, field, value)
+        else:
+            self.extra[field] = value
+
+    def discard(self, field):
+        if field in self._FIELD_SET:
+            if hasattr(self, field):
+                delattr(self, field)
+        else:
+            self.extra.pop(field, None)
+
+    def __contains__(self, field):
+        if field in self._FIELD_SET:
+            return hasattr(self, field)
+        return field in self.extra
+
+    def resolve_missing(self, field):
+        """Remove field from missing_info, dropping the list once it is empty. Returns True if it was listed."""
+        missing = self.get('missing_info')
+        if not missing or field not in missing:
+            return False
+        missing.remove(field)
+        if not missing:
+            self.discard('missing_info')
+        return True
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class Meeting(Record):
+    __slots__ = FIELDS = ('id', 'description', 'day', 'time', 'duration_minutes', 'type',
+                          'course_code', 'missing_info')
+
+
+class Task(Record):
+    __slots__ = FIELDS = ('id', 'description', 'day', 'time', 'duration_minutes', 'priority',
+                          'category', 'related_event', 'course_code', 'is_fixed_time', 'missing_info')
+
+
+class CalendarEvent(Record):
+    __slots__ = FIELDS = ('id', 'description', 'type', 'start_time', 'end_time', 'duration', 'course_code')
+
+
+def _ngrams(text):
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+class ScheduleModel:
+    """
+    A schedule ({"meetings", "tasks", "course_codes", ...}) with its indexes.
+
+    Meetings are linked to the tasks whose related_event contains, or is
+    contained in, the meeting description (the matching rule EEP1 has always
+    used). Candidates are found through a character n-gram index, so linking
+    is close to linear in the size of the schedule rather than tasks x meetings.
+    """
+
+    __slots__ = ('meetings', 'tasks', 'calendar', 'extra',
+                 '_by_id', '_by_description', '_related_tasks', '_related_meetings')
+
+    def __init__(self, meetings=(), tasks=(), calendar=None, extra=None):
+        self.meetings = list(meetings)
+        self.tasks = list(tasks)
+        self.calendar = calendar
+        self.extra = extra or {}
+        self.reindex()
+
+    @classmethod
+    def from_dict(cls, schedule):
+        """Build the model from a schedule dict (or its JSON string). The input is not modified."""
+        if isinstance(schedule, str):
+            schedule = json.loads(schedule)
+        schedule = schedule or {}
+        extra = {key: value for key, value in schedule.items()
+                 if key not in ('meetings', 'tasks', 'generated_calendar')}
+        calendar = schedule.get('generated_calendar')
+        if isinstance(calendar, dict):
+            calendar = {day: [CalendarEvent.from_dict(event) for event in events or []]
+                        for day, events in calendar.items()}
+        model = cls(
+            meetings=[Meeting.from_dict(meeting) for meeting in schedule.get('meetings') or []],
+            tasks=[Task.from_dict(task) for task in schedule.get('tasks') or []],
+            calendar=calendar,
+            extra=extra
+        )
+        if 'generated_calendar' in schedule and calendar is None:
+            model.extra['generated_calendar'] = None
+        return model
+
+    def to_dict(self):
+        schedule = {
+            'meetings': [meeting.to_dict() for meeting in self.meetings],
+            'tasks': [task.to_dict() for task in self.tasks]
+        }
+        for key, value in self.extra.items():
+            schedule[key] = list(value) if isinstance(value, list) else value
+        if self.calendar is not None:
+            schedule['generated_calendar'] = {day: [event.to_dict() for event in events]
+                                              for day, events in self.calendar.items()}
+        return schedule
+
+    # ===============================
+    # Indexes
+    # ===============================
+
+    def reindex(self):
+        """Rebuild every index; only needed after adding or removing items or renaming them."""
+        self._by_id = {}
+        self._by_description = {}
+        for record in self.meetings + self.tasks:
+            # Meetings win when a task reuses a meeting ID
+            if record.get('id'):
+                self._by_id.setdefault(record.get('id'), record)
+            self._by_description.setdefault(record.get('description') or '', []).append(record)
+        self._link_related()
+
+    def _link_related(self):
+        self._related_tasks = {id(meeting): [] for meeting in self.meetings}
+        self._related_meetings = {}
+
+        # Every pair the substring rule links shares an n-gram: a description inside
+        # related_event has all its n-grams there, so each meeting is filed under its
+        # rarest one, and a related_event inside a description has all its n-grams in
+        # that description, so its rarest one is looked up in the full index
+        by_ngram = {}
+        short = []
+        described = []
+        for position, meeting in enumerate(self.meetings):
+            description = meeting.get('description')
+            if not isinstance(description, str) or not description:
+                continue
+            if len(description) < NGRAM:
+                short.append(position)
+                continue
+            ngrams = _ngrams(description)
+            described.append((position, ngrams))
+            for ngram in ngrams:
+                by_ngram.setdefault(ngram, []).append(position)
+        by_rarest_ngram = {}
+        for position, ngrams in described:
+            rarest = min(ngrams, key=lambda ngram: len(by_ngram[ngram]))
+            by_rarest_ngram.setdefault(rarest, []).append(position)
+
+        for task in self.tasks:
+            related_event = task.get('related_event')
+            if not related_event or not isinstance(related_event, str):
+                continue
+            if len(related_event) < NGRAM:
+                candidates = set(range(len(self.meetings)))
+            else:
+                ngrams = _ngrams(related_event)
+                candidates = set(short)
+                for ngram in ngrams:
+                    candidates.update(by_rarest_ngram.get(ngram, ()))
+                candidates.update(by_ngram.get(min(ngrams, key=lambda ngram: len(by_ngram.get(ngram, ()))), ()))
+            linked = []
+            for position in sorted(candidates):
+                meeting = self.meetings[position]
+                description = meeting.get('description')
+                if description and (description in related_event or related_event in description):
+                    linked.append(meeting)
+                    self._related_tasks[id(meeting)].append(task)
+            if linked:
+                self._related_meetings[id(task)] = linked
+
+    def get(self, item_id):
+        """Meeting or task with this ID, or None."""
+        return self._by_id.get(item_id)
+
+    def find(self, description):
+        """Meetings and tasks with exactly this description."""
+        return list(self._by_description.get(description or '', ()))
+
+    def count_meetings(self, description):
+        return sum(1 for record in self._by_description.get(description or '', ()) if isinstance(record, Meeting))
+
+    def related_tasks(self, meeting):
+        """Tasks whose related_event refers to this meeting."""
+        return list(self._related_tasks.get(id(meeting), ()))
+
+    def related_meetings(self, task):
+        """Meetings this task's related_event refers to."""
+        return list(self._related_meetings.get(id(task), ()))
+
+    def resolve(self, item_id=None, description=None):
+        """
+        Records an answer applies to: the item with item_id if there is one,
+        otherwise every meeting and task with this exact description.
+        """
+        record = self.get(item_id) if item_id else None
+        if record is not None:
+            return [record]
+        return self.find(description) if description else []
+
+    def course_codes(self):
+        """Existing course_codes followed by any new codes found on meetings and tasks, without duplicates."""
+        codes = list(dict.fromkeys(self.extra.get('course_codes') or []))
+        seen = set(codes)
+        for record in self.meetings + self.tasks:
+            code = record.get('course_code')
+            if code and code not in seen:
+                seen.add(code)
+                codes.append(code)
+        return codes
@@ -5,155 +5,141 @@ Schedule Generation Prompts and Helpers
 This module contains prompt templates and utility functions for LLM-based schedule generation.
 """
 
-def get_schedule_prompt(schedule_data, preferences=None, google_calendar=None):
-    """
-    Create a detailed prompt for the LLM to generate an optimized schedule.
-    
-    Args:
-        schedule_data: Dictionary containing meetings and tasks
-        preferences: Dictionary containing user preferences
-        google_calendar: Optional Google Calendar data to incorporate
-        
-    Returns:
-        String prompt for the LLM
-    """
-    # Format meetings for prompt
-    meetings_text = ""
-    for meeting in schedule_data.get("meetings", []):
-        meeting_str = f"- {meeting.get('description', 'Untitled Meeting')}\n"
-        meeting_str += f"  Day: {meeting.get('day', 'N/A')}\n"
-        meeting_str += f"  Time: {meeting.get('time', 'N/A')}\n"
-        meeting_str += f"  Duration: {meeting.get('duration_minutes', 'N/A')} minutes\n"
-        meeting_str += f"  Type: {meeting.get('type', 'general')}\n"
-        meeting_str += f"  Course: {meeting.get('course_code', 'N/A')}\n"
-        meeting_str += f"  Priority: {meeting.get('priority', 'medium')}\n"
-        meeting_str += f"  ID: {meeting.get('id', 'unknown')}\n\n"
-        meetings_text += meeting_str
-
-    # Format tasks for prompt
-    tasks_text = ""
-    for task in schedule_data.get("tasks", []):
+import json
+
+from prompt_fragments import PromptBuilder
+
+# ===============================
+# Schedule Generation Prompt
+# ===============================
+
+# Display text for preference values; unknown values are shown as given
+PREFERENCE_LABELS = {
+    'productivity_pattern': ("- Productivity: User is most productive during {}\n", {
+        "morning": "Morning (6am-11am)",
+        "midday": "Midday (11am-3pm)",
+        "afternoon": "Afternoon (3pm-6pm)",
+        "evening": "Evening (6pm-10pm)",
+        "night": "Night (10pm-2am)"
+    }),
+    'break_preference': ("- Break Preferences: User prefers {}\n", {
+        "short_frequent": "short frequent breaks (10-15 min every hour)",
+        "medium": "medium breaks (20-30 min every 2 hours)",
+        "long_infrequent": "longer infrequent breaks (45-60 min every 3-4 hours)"
+    }),
+    'study_session_length': ("- Study Session Length: User prefers {}\n", {
+        "short": "short sessions (30-45 minutes)",
+        "medium": "medium sessions (1-1.5 hours)",
+        "long": "long sessions (2+ hours)"
+    }),
+    'weekend_scheduling': ("- Weekend Scheduling: User prefers {}\n", {
+        "no": "no tasks on weekends",
+        "light": "lighter workload on weekends",
+        "same": "same workload on weekends as weekdays"
+    }),
+    'meal_times': None,  # rendered separately, keeps its place in the order
+    'study_location_preference': ("- Study Location: User prefers to study {}\n", {
+        "home": "at home",
+        "library": "in a library or quiet space",
+        "cafe": "in a cafe or social space",
+        "mixed": "in mixed environments"
+    }),
+    'focus_duration': ("- Focus Duration: User can maintain deep focus for {}\n", {
+        "short": "short periods (15-30 minutes)",
+        "medium": "medium periods (30-60 minutes)",
+        "long": "long periods (60+ minutes)"
+    }),
+    'learning_style': ("- Learning Style: User prefers {}\n", {
+        "spaced": "spaced practice (spread out over time)",
+        "blocked": "blocked practice (concentrated sessions)",
+        "interleaved": "interleaved practice (mixing different subjects)"
+    })
+}
+
+
+def render_meetings(meetings):
+    parts = []
+    for meeting in meetings or []:
+        parts.append(
+            f"- {meeting.get('description', 'Untitled Meeting')}\n"
+            f"  Day: {meeting.get('day', 'N/A')}\n"
+            f"  Time: {meeting.get('time', 'N/A')}\n"
+            f"  Duration: {meeting.get('duration_minutes', 'N/A')} minutes\n"
+            f"  Type: {meeting.get('type', 'general')}\n"
+            f"  Course: {meeting.get('course_code', 'N/A')}\n"
+            f"  Priority: {meeting.get('priority', 'medium')}\n"
+            f"  ID: {meeting.get('id', 'unknown')}\n\n"
+        )
+    return ''.join(parts) or "No fixed meetings."
+
+
+def render_tasks(tasks):
+    parts = []
+    for task in tasks or []:
         # Set a default duration if none provided
         duration = task.get("duration_minutes")
         if duration in [None, "", "null"]:
             priority = task.get("priority", "medium").lower()
             duration = 240 if priority in ["high", "1", "urgent"] else 180
-            
-        task_str = f"- {task.get('description', 'Untitled Task')}\n"
-        task_str += f"  Category: {task.get('category', 'N/A')}\n"
-        task_str += f"  Course: {task.get('course_code', 'N/A')}\n"
-        task_str += f"  Duration: {duration} minutes\n"
-        task_str += f"  Priority: {task.get('priority', 'medium')}\n"
-        task_str += f"  Related Event: {task.get('related_event', 'N/A')}\n"
-        task_str += f"  ID: {task.get('id', 'unknown')}\n\n"
-        tasks_text += task_str
-
-    # Format Google Calendar events if available
-    google_calendar_text = ""
-    if google_calendar:
-        google_calendar_text = "# GOOGLE CALENDAR\nThe user has provided the following events from their Google Calendar that should be treated as fixed commitments:\n\n"
-        for day, events in google_calendar.items():
-            if events:  # Only include days with events
-                google_calendar_text += f"{day}:\n"
-                for event in events:
-                    google_calendar_text += f"- {event.get('description', 'Untitled Event')}\n"
-                    if 'start_time' in event and 'end_time' in event:
-                        google_calendar_text += f"  Time: {event['start_time']} - {event['end_time']}\n"
-                    if 'location' in event and event['location']:
-                        google_calendar_text += f"  Location: {event['location']}\n"
-                    google_calendar_text += "\n"
-        google_calendar_text += "These Google Calendar events are mandatory and must be respected when creating the schedule. Do not schedule any activities that would conflict with these events.\n\n"
-
-    # Format user preferences for the prompt if provided
-    preferences_text = ""
-    if preferences:
-        preferences_text += "- Daily Schedule:\n"
-        if 'wake_time' in preferences:
-            preferences_text += f"  Wake-up time: {preferences['wake_time']}\n"
-        if 'sleep_time' in preferences:
-            preferences_text += f"  Sleep time: {preferences['sleep_time']}\n"
-        
-        if 'productivity_pattern' in preferences:
-            productivity_map = {
-                "morning": "Morning (6am-11am)",
-                "midday": "Midday (11am-3pm)",
-                "afternoon": "Afternoon (3pm-6pm)",
-                "evening": "Evening (6pm-10pm)",
-                "night": "Night (10pm-2am)"
-            }
-            pattern = productivity_map.get(preferences['productivity_pattern'], preferences['productivity_pattern'])
-            preferences_text += f"- Productivity: User is most productive during {pattern}\n"
-        
-        if 'break_preference' in preferences:
-            break_map = {
-                "short_frequent": "short frequent breaks (10-15 min every hour)",
-                "medium": "medium breaks (20-30 min every 2 hours)",
-                "long_infrequent": "longer infrequent breaks (45-60 min every 3-4 hours)"
-            }
-            break_pref = break_map.get(preferences['break_preference'], preferences['break_preference'])
-            preferences_text += f"- Break Preferences: User prefers {break_pref}\n"
-        
-        if 'study_session_length' in preferences:
-            session_map = {
-                "short": "short sessions (30-45 minutes)",
-                "medium": "medium sessions (1-1.5 hours)",
-                "long": "long sessions (2+ hours)"
-            }
-            session_pref = session_map.get(preferences['study_session_length'], preferences['study_session_length'])
-            preferences_text += f"- Study Session Length: User prefers {session_pref}\n"
-        
-        if 'weekend_scheduling' in preferences:
-            weekend_map = {
-                "no": "no tasks on weekends",
-                "light": "lighter workload on weekends",
-                "same": "same workload on weekends as weekdays"
-            }
-            weekend_pref = weekend_map.get(preferences['weekend_scheduling'], preferences['weekend_scheduling'])
-            preferences_text += f"- Weekend Scheduling: User prefers {weekend_pref}\n"
-        
-        if 'meal_times' in preferences:
-            preferences_text += "- Meal Times:\n"
+        parts.append(
+            f"- {task.get('description', 'Untitled Task')}\n"
+            f"  Category: {task.get('category', 'N/A')}\n"
+            f"  Course: {task.get('course_code', 'N/A')}\n"
+            f"  Duration: {duration} minutes\n"
+            f"  Priority: {task.get('priority', 'medium')}\n"
+            f"  Related Event: {task.get('related_event', 'N/A')}\n"
+            f"  ID: {task.get('id', 'unknown')}\n\n"
+        )
+    return ''.join(parts) or "No tasks to schedule."
+
+
+def render_google_calendar(google_calendar):
+    if not google_calendar:
+        return ""
+    parts = ["# GOOGLE CALENDAR\nThe user has provided the following events from their Google Calendar that should be treated as fixed commitments:\n\n"]
+    for day, events in google_calendar.items():
+        if not events:  # Only include days with events
+            continue
+        parts.append(f"{day}:\n")
+        for event in events:
+            parts.append(f"- {event.get('description', 'Untitled Event')}\n")
+            if 'start_time' in event and 'end_time' in event:
+                parts.append(f"  Time: {event['start_time']} - {event['end_time']}\n")
+            if 'location' in event and event['location']:
+                parts.append(f"  Location: {event['location']}\n")
+            parts.append("\n")
+    parts.append("These Google Calendar events are mandatory and must be respected when creating the schedule. Do not schedule any activities that would conflict with these events.\n\n")
+    return ''.join(parts)
+
+
+def render_preferences(preferences):
+    if not preferences:
+        return "No specific preferences provided. Use general best practices for scheduling."
+    parts = ["- Daily Schedule:\n"]
+    if 'wake_time' in preferences:
+        parts.append(f"  Wake-up time: {preferences['wake_time']}\n")
+    if 'sleep_time' in preferences:
+        parts.append(f"  Sleep time: {preferences['sleep_time']}\n")
+
+    for key, label in PREFERENCE_LABELS.items():
+        if key not in preferences:
+            continue
+        if key == 'meal_times':
+            parts.append("- Meal Times:\n")
             meal_times = preferences['meal_times']
             if isinstance(meal_times, dict):
-                if 'breakfast' in meal_times:
-                    preferences_text += f"  Breakfast: {meal_times['breakfast']}\n"
-                if 'lunch' in meal_times:
-                    preferences_text += f"  Lunch: {meal_times['lunch']}\n"
-                if 'dinner' in meal_times:
-                    preferences_text += f"  Dinner: {meal_times['dinner']}\n"
-        
-        if 'study_location_preference' in preferences:
-            location_map = {
-                "home": "at home",
-                "library": "in a library or quiet space",
-                "cafe": "in a cafe or social space",
-                "mixed": "in mixed environments"
-            }
-            location_pref = location_map.get(preferences['study_location_preference'], preferences['study_location_preference'])
-            preferences_text += f"- Study Location: User prefers to study {location_pref}\n"
-        
-        if 'focus_duration' in preferences:
-            focus_map = {
-                "short": "short periods (15-30 minutes)",
-                "medium": "medium periods (30-60 minutes)",
-                "long": "long periods (60+ minutes)"
-            }
-            focus_pref = focus_map.get(preferences['focus_duration'], preferences['focus_duration'])
-            preferences_text += f"- Focus Duration: User can maintain deep focus for {focus_pref}\n"
-        
-        if 'learning_style' in preferences:
-            style_map = {
-                "spaced": "spaced practice (spread out over time)",
-                "blocked": "blocked practice (concentrated sessions)",
-                "interleaved": "interleaved practice (mixing different subjects)"
-            }
-            style_pref = style_map.get(preferences['learning_style'], preferences['learning_style'])
-            preferences_text += f"- Learning Style: User prefers {style_pref}\n"
-
-    # Build the complete prompt
-    prompt = f"""You are an advanced AI scheduling assistant that optimizes weekly schedules. Your task is to generate a balanced, optimized schedule based on the meetings and tasks provided.
-
-{google_calendar_text}
+                for meal in ('breakfast', 'lunch', 'dinner'):
+                    if meal in meal_times:
+                        parts.append(f"  {meal.capitalize()}: {meal_times[meal]}\n")
+            continue
+        line, values = label
+        parts.append(line.format(values.get(preferences[key], preferences[key])))
+    return ''.join(parts)
+
+
+SCHEDULE_PROMPT_TEMPLATE = """You are an advanced AI scheduling assistant that optimizes weekly schedules. Your task is to generate a balanced, optimized schedule based on the meetings and tasks provided.
+
+{google_calendar}
 # =================================================
 # FIXED SECTIONS - DO NOT MODIFY THESE SECTIONS
 # =================================================
@@ -162,12 +148,12 @@ def get_schedule_prompt(schedule_data, preferences=None, google_calendar=None):
 ## FIXED MEETINGS
 The following meetings are fixed and must be included exactly as specified:
 
-{meetings_text if meetings_text else "No fixed meetings."}
+{meetings}
 
 ## TASKS TO SCHEDULE
 The following tasks need to be scheduled:
 
-{tasks_text if tasks_text else "No tasks to schedule."}
+{tasks}
 
 # =================================================
 # CUSTOMIZABLE SECTIONS - THESE CAN BE MODIFIED BASED ON USER PREFERENCES
@@ -176,7 +162,7 @@ The following tasks need to be scheduled:
 # USER PREFERENCES
 These preferences should guide your scheduling decisions:
 
-{preferences_text if preferences_text else "No specific preferences provided. Use general best practices for scheduling."}
+{preferences}
 
 # SCHEDULING STYLE GUIDELINES
 1. Fixed meetings cannot be moved - schedule them exactly as specified.
@@ -292,7 +278,47 @@ For generated preparation events, use type "generated" and include a "related_to
 - Return ONLY the generated_calendar JSON object and nothing else.
 """
 
-    return prompt
+# Fragments are cached by content, so unchanged preferences, calendars and
+# items are rendered once across regenerations
+SCHEDULE_PROMPT_BUILDER = PromptBuilder(SCHEDULE_PROMPT_TEMPLATE, {
+    'google_calendar': render_google_calendar,
+    'meetings': render_meetings,
+    'tasks': render_tasks,
+    'preferences': render_preferences
+})
+
+
+def set_fragment_cache(cache):
+    """Swap the fragment cache used by the schedule prompt (e.g. for one with metrics)."""
+    SCHEDULE_PROMPT_BUILDER.cache = cache
+
+
+def build_schedule_prompt(schedule_data, preferences=None, google_calendar=None):
+    """
+    Build the schedule generation prompt as a RenderedPrompt, whose fragments
+    report their name, version and size.
+    """
+    return SCHEDULE_PROMPT_BUILDER.build(
+        google_calendar=google_calendar,
+        meetings=schedule_data.get("meetings", []),
+        tasks=schedule_data.get("tasks", []),
+        preferences=preferences
+    )
+
+
+def get_schedule_prompt(schedule_data, preferences=None, google_calendar=None):
+    """
+    Create a detailed prompt for the LLM to generate an optimized schedule.
+    
+    Args:
+        schedule_data: Dictionary containing meetings and tasks
+        preferences: Dictionary containing user preferences
+        google_calendar: Optional Google Calendar data to incorporate
+        
+    Returns:
+        String prompt for the LLM
+    """
+    return build_schedule_prompt(schedule_data, preferences, google_calendar).text
 
 def get_response_parsing_prompt(llm_response, original_schedule_data):
     """
@@ -346,4 +372,75 @@ Return a valid JSON object with the following structure:
 Only return valid JSON and nothing else. If you need to make corrections, explain them in the "message" field.
 """
     
-    return prompt 
\ No newline at end of file
+    return prompt 
+
+
+def get_description_polish_prompt(events):
+    """
+    Create a prompt asking the LLM to rewrite the descriptions of locally
+    scheduled sessions without touching their times.
+    
+    Args:
+        events: List of {id, description, course_code} for the sessions to polish
+        
+    Returns:
+        String prompt for the LLM
+    """
+    events_text = "\n".join(
+        f"- {event['id']}: {event['description']}" + (f" ({event['course_code']})" if event.get('course_code') else "")
+        for event in events
+    )
+    
+    prompt = f"""You are a scheduling assistant. The study sessions below have already been placed in the user's week. Rewrite each description so it is short, specific and motivating (for example, say what to focus on in each session of a multi-session task). Do not mention days or times.
+
+# SESSIONS
+{events_text}
+
+# OUTPUT FORMAT
+Return ONLY a JSON object mapping each session id to its new description, for example:
+{{"task-1-part1": "Outline the essay and collect sources"}}
+"""
+
+    return prompt
+
+
+def get_calendar_fix_prompt(days_calendar, issues, fixed_events=None):
+    """
+    Create a prompt asking the LLM to fix only the days of a generated calendar
+    that failed validation, instead of regenerating the whole week.
+    
+    Args:
+        days_calendar: {day: [events]} for the affected days only
+        issues: Validation issues (dicts with day and message) for those days
+        fixed_events: Optional {day: [events]} that must be kept exactly as given
+        
+    Returns:
+        String prompt for the LLM
+    """
+    issues_text = "\n".join(f"- {issue['day']}: {issue['message']}" for issue in issues)
+    fixed_text = ""
+    if fixed_events:
+        fixed_text = f"""
+# FIXED EVENTS
+These events cannot be moved and must appear exactly as given:
+```json
+{json.dumps(fixed_events, indent=2)}
+```
+"""
+    
+    prompt = f"""You are a scheduling assistant. Some days of a generated weekly calendar have problems. Fix ONLY the problems listed below by moving, shortening or removing flexible events (tasks, meals, study sessions). Keep every event's id, type, description and other fields.
+
+# PROBLEMS
+{issues_text}
+{fixed_text}
+# DAYS TO FIX
+```json
+{json.dumps(days_calendar, indent=2)}
+```
+
+# OUTPUT FORMAT
+Return ONLY a JSON object with the same day keys, each holding the corrected list of events.
+Times must be in 24-hour format (HH:MM) and events on the same day must not overlap.
+"""
+
+    return prompt
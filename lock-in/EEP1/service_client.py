@@ -0,0 +1,190 @@
+"""
+Pooled keep-alive HTTP clients for calls between Lock-in services.
+Each downstream service gets its own requests.Session with a bounded
+connection pool, so repeated hops reuse sockets instead of reconnecting.
+"""
+
+import os
+import time
+import random
+import logging
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+RETRYABLE_STATUS_CODES = {502, 503, 504}
+
+
+class ServiceClient:
+    """
+    Keep-alive HTTP client for one downstream service.
+
+    Args:
+        name: Downstream name used as a metrics label (e.g. 'iep1')
+        base_url: Base URL of the downstream service
+        pool_size: Maximum number of pooled connections kept open
+        timeouts: Optional mapping of path -> timeout in seconds
+        default_timeout: Timeout used when neither the caller nor timeouts set one
+        max_retries: Retries for idempotent calls on connection errors and 502/503/504
+        backoff_base: Base delay in seconds for the jittered exponential backoff
+        backoff_max: Upper bound of a single backoff delay
+        metrics_dict: Optional metrics dictionary returned by setup_metrics
+        service_name: Label of the calling service
+    """
+
+    def __init__(self, name, base_url, pool_size=10, timeouts=None, default_timeout=30,
+                 max_retries=2, backoff_base=0.2, backoff_max=2.0, metrics_dict=None,
+                 service_name='eep1'):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.timeouts = timeouts or {}
+        self.default_timeout = default_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.metrics_dict = metrics_dict
+        self.service_name = service_name
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=False)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def request(self, method, url, idempotent=None, timeout=None, **kwargs):
+        """
+        Send a request through the pooled session.
+        Idempotent requests (GET by default, or idempotent=True) are retried
+        with jittered exponential backoff.
+        """
+        method = method.upper()
+        if not url.startswith('http'):
+            url = f"{self.base_url}/{url.lstrip('/')}"
+        path = urlparse(url).path or '/'
+        if timeout is None:
+            timeout = self.timeouts.get(path, self.default_timeout)
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        attempts = 1 + (self.max_retries if idempotent else 0)
+
+        for attempt in range(attempts):
+            connections_before = self._pool_connection_count(url)
+            start_time = time.time()
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self._observe(path, time.time() - start_time)
+                if attempt + 1 >= attempts:
+                    raise
+                logger.warning(f"{self.name} {method} {path} failed ({str(e)}), retrying")
+                self._sleep_before_retry(attempt)
+                continue
+
+            self._observe(path, time.time() - start_time)
+            self._record_connection(connections_before, self._pool_connection_count(url))
+
+            if response.status_code in RETRYABLE_STATUS_CODES and attempt + 1 < attempts:
+                logger.warning(f"{self.name} {method} {path} returned {response.status_code}, retrying")
+                response.close()
+                self._sleep_before_retry(attempt)
+                continue
+            return response
+
+    def close(self):
+        self.session.close()
+
+    # -------------------------------
+    # Internal helpers
+    # -------------------------------
+
+    def _sleep_before_retry(self, attempt):
+        # Full jitter keeps simultaneous retries from hitting the downstream together
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        self._inc('downstream_retries_total')
+        time.sleep(delay)
+
+    def _pool_connection_count(self, url):
+        # Inspect existing pools only; creating one here would evict the real pool
+        try:
+            pools = self.session.get_adapter(url).poolmanager.pools
+            return sum(pools[key].num_connections for key in pools.keys())
+        except Exception:
+            return None
+
+    def _record_connection(self, before, after):
+        if before is None or after is None:
+            return
+        if self.metrics_dict and 'downstream_connections_total' in self.metrics_dict:
+            result = 'new' if after > before else 'reused'
+            self.metrics_dict['downstream_connections_total'].labels(
+                service=self.service_name, downstream=self.name, result=result
+            ).inc()
+
+    def _observe(self, path, duration):
+        if self.metrics_dict and 'downstream_request_duration' in self.metrics_dict:
+            self.metrics_dict['downstream_request_duration'].labels(
+                service=self.service_name, downstream=self.name, endpoint=path
+            ).observe(duration)
+
+    def _inc(self, name):
+        if self.metrics_dict and name in self.metrics_dict:
+            self.metrics_dict[name].labels(service=self.service_name, downstream=self.name).inc()
+
+
+class ServiceClientRegistry:
+    """
+    Routes requests to the ServiceClient whose base URL matches, so call sites
+    can keep passing full URLs (e.g. f"{IEP1_URL}/predict").
+    """
+
+    def __init__(self, metrics_dict=None, service_name='eep1', pool_size=None, max_retries=None):
+        self.metrics_dict = metrics_dict
+        self.service_name = service_name
+        self.pool_size = pool_size or int(os.getenv('HTTP_POOL_SIZE', '10'))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('HTTP_MAX_RETRIES', '2'))
+        self.clients = {}
+        self._fallback = None
+
+    def register(self, name, base_url, timeouts=None, **kwargs):
+        kwargs.setdefault('pool_size', self.pool_size)
+        kwargs.setdefault('max_retries', self.max_retries)
+        client = ServiceClient(
+            name, base_url, timeouts=timeouts, metrics_dict=self.metrics_dict,
+            service_name=self.service_name, **kwargs
+        )
+        self.clients[name] = client
+        return client
+
+    def client_for(self, url):
+        best = None
+        for client in self.clients.values():
+            if url.startswith(client.base_url) and (best is None or len(client.base_url) > len(best.base_url)):
+                best = client
+        if best is None:
+            if self._fallback is None:
+                self._fallback = ServiceClient(
+                    'other', '', pool_size=self.pool_size, max_retries=self.max_retries,
+                    metrics_dict=self.metrics_dict, service_name=self.service_name
+                )
+            best = self._fallback
+        return best
+
+    def get(self, url, **kwargs):
+        return self.client_for(url).get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.client_for(url).post(url, **kwargs)
+
+    def close(self):
+        for client in list(self.clients.values()) + [self._fallback]:
+            if client is not None:
+                client.close()
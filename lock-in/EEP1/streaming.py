@@ -0,0 +1,189 @@
+"""
+Server-sent events helpers for streaming schedule generation.
+Parses the Anthropic SSE stream relayed by IEP2 and incrementally extracts
+each completed day of the generated calendar while the model is still writing.
+"""
+
+import json
+import logging
+
+from json_repair import parse_fragment
+
+logger = logging.getLogger(__name__)
+
+DAY_NAMES = {'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'}
+
+
+def format_sse(event, data):
+    """Format one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def iter_sse_events(lines):
+    """
+    Group an iterable of SSE lines into (event, data) pairs.
+    Data is JSON-decoded when possible; comment lines are ignored.
+    """
+    event = None
+    data_lines = []
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.rstrip('\r')
+        if not line:
+            if data_lines:
+                yield event or 'message', _decode(data_lines)
+            event = None
+            data_lines = []
+            continue
+        if line.startswith(':'):
+            continue
+        field, _, value = line.partition(':')
+        if value.startswith(' '):
+            value = value[1:]
+        if field == 'event':
+            event = value
+        elif field == 'data':
+            data_lines.append(value)
+    if data_lines:
+        yield event or 'message', _decode(data_lines)
+
+
+def _decode(data_lines):
+    data = '\n'.join(data_lines)
+    try:
+        return json.loads(data)
+    except json.JSONDecodeError:
+        return data
+
+
+class IncompleteStreamError(RuntimeError):
+    """Raised when a stream ends before the model finished its answer."""
+
+
+def iter_anthropic_text(events):
+    """
+    Yield the text deltas of an Anthropic Messages stream.
+    Raises RuntimeError if the stream reports an error, and
+    IncompleteStreamError if it ends without message_stop or the answer
+    was cut off at the token limit.
+    """
+    stopped = False
+    stop_reason = None
+    for event, data in events:
+        if not isinstance(data, dict):
+            continue
+        if event == 'error' or data.get('type') == 'error':
+            message = data.get('error', {}).get('message', 'Unknown streaming error')
+            raise RuntimeError(message)
+        if data.get('type') == 'content_block_delta':
+            delta = data.get('delta', {})
+            if delta.get('type') == 'text_delta':
+                yield delta.get('text', '')
+        elif data.get('type') == 'message_delta':
+            stop_reason = (data.get('delta') or {}).get('stop_reason') or stop_reason
+        elif data.get('type') == 'message_stop':
+            stopped = True
+    if not stopped:
+        raise IncompleteStreamError('the stream ended before the answer was complete')
+    if stop_reason == 'max_tokens':
+        raise IncompleteStreamError('the answer was cut off at the token limit')
+
+
+class IncrementalCalendarParser:
+    """
+    Incremental JSON scanner for a generated calendar.
+
+    Text is fed in arbitrary chunks; whenever the array of a day key
+    (e.g. "Monday": [...]) is closed, feed() returns it as (day, events).
+    Works for both {"generated_calendar": {...}} and a bare day object, and
+    ignores any prose or code fences before the first '{'.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.calendar = {}
+        self._pos = 0
+        self._started = False
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None
+        self._current_key = None
+        self._day_start = None  # (day, start index, stack depth)
+
+    def feed(self, text):
+        """Consume a chunk of text and return the days completed by it."""
+        self.buffer += text
+        completed = []
+        buffer = self.buffer
+        for i in range(self._pos, len(buffer)):
+            char = buffer[i]
+
+            if not self._started:
+                if char != '{':
+                    continue
+                self._started = True
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = buffer[self._string_start:i + 1]
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char in '{[':
+                if char == '[' and self._stack and self._stack[-1] == '{' and self._day_start is None:
+                    day = self._key_name()
+                    if day in DAY_NAMES:
+                        self._day_start = (day, i, len(self._stack) + 1)
+                self._stack.append(char)
+                self._current_key = None
+            elif char in '}]':
+                depth = len(self._stack)
+                if self._stack:
+                    self._stack.pop()
+                if char == ']' and self._day_start and self._day_start[2] == depth:
+                    day, start, _ = self._day_start
+                    self._day_start = None
+                    events = self._load(buffer[start:i + 1], day)
+                    if events is not None:
+                        self.calendar[day] = events
+                        completed.append((day, events))
+                self._current_key = None
+            elif char == ':' and self._stack and self._stack[-1] == '{':
+                self._current_key = self._last_string
+            elif char == ',':
+                self._current_key = None
+
+        self._pos = len(buffer)
+        return completed
+
+    @property
+    def text(self):
+        return self.buffer
+
+    def _key_name(self):
+        if self._current_key is None:
+            return None
+        try:
+            return json.loads(self._current_key)
+        except json.JSONDecodeError:
+            return None
+
+    @staticmethod
+    def _load(fragment, day):
+        events, repairs = parse_fragment(fragment)
+        if events is None:
+            logger.warning(f"Could not parse streamed events for {day}")
+            return None
+        if repairs:
+            logger.info(f"Repaired streamed events for {day}: {', '.join(repairs)}")
+        return events if isinstance(events, list) else None
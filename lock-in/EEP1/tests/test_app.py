@@ -8,7 +8,10 @@ from unittest.mock import patch, MagicMock
 # Add parent directory to path to import app module
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import app
-from helpers import reset_schedules, save_schedule, load_schedule, ensure_ids, convert_to_24h, validate_and_fix_times
+from helpers import save_schedule, load_schedule, ensure_ids, convert_to_24h, validate_and_fix_times, get_schedule_repository
+
+# User the tests' requests and stored schedules belong to
+USER_ID = 'test-user'
 
 class TestEEP1App(unittest.TestCase):
     """Unit tests for EEP1 Schedule Management Service."""
@@ -18,9 +21,10 @@ class TestEEP1App(unittest.TestCase):
         # Set up Flask test client
         app.app.testing = True
         self.client = app.app.test_client()
+        self.client.environ_base['HTTP_X_USER_ID'] = USER_ID
         
         # Reset schedules before each test to ensure clean state
-        reset_schedules()
+        get_schedule_repository().backend.clear()
         
         # Disable logging for tests
         logging.disable(logging.CRITICAL)
@@ -110,12 +114,12 @@ class TestEEP1App(unittest.TestCase):
     def tearDown(self):
         """Clean up after each test."""
         # Reset all schedules to clean state
-        reset_schedules()
+        get_schedule_repository().backend.clear()
         
         # Re-enable logging
         logging.disable(logging.NOTSET)
 
-    @patch('app.requests.post')
+    @patch('app.http_client.post')
     def test_parse_schedule_success(self, mock_post):
         """Test parse-schedule endpoint with a successful parsing response."""
         # Configure the mock to return a successful response
@@ -139,11 +143,11 @@ class TestEEP1App(unittest.TestCase):
         self.assertEqual(len(data['schedule']['tasks']), 1)
         
         # Verify that the schedule was saved
-        saved_schedule = load_schedule()
+        saved_schedule = load_schedule(user_id=USER_ID)
         self.assertIsNotNone(saved_schedule)
         self.assertEqual(len(saved_schedule['meetings']), 2)
 
-    @patch('app.requests.post')
+    @patch('app.http_client.post')
     def test_parse_schedule_with_missing_info(self, mock_post):
         """Test parse-schedule endpoint with missing information in the response."""
         # Configure the mock to return a response with missing information
@@ -180,7 +184,7 @@ class TestEEP1App(unittest.TestCase):
         data = json.loads(response.data)
         self.assertIn('error', data)
 
-    @patch('app.requests.post')
+    @patch('app.http_client.post')
     def test_parse_schedule_iep1_error(self, mock_post):
         """Test parse-schedule endpoint when IEP1 returns an error."""
         # Configure the mock to return an error
@@ -201,6 +205,75 @@ class TestEEP1App(unittest.TestCase):
         data = json.loads(response.data)
         self.assertIn('error', data)
 
+    @patch('app.http_client.post')
+    def test_parse_schedule_long_text_in_chunks(self, mock_post):
+        """Test that a long text is parsed in chunks whose schedules are merged without repeated items."""
+        def parse_chunk(url, json=None, headers=None, timeout=None):
+            text = json['prompt'].split('Schedule text:\n', 1)[1]
+            course = text.split(':', 1)[0]
+            response = MagicMock()
+            response.status_code = 200
+            response.json.return_value = {
+                'meetings': [
+                    {'description': f'{course} Lecture', 'day': 'Monday', 'time': '09:00', 'duration_minutes': 60,
+                     'type': 'regular', 'course_code': course, 'missing_info': []},
+                    {'description': 'Department seminar', 'day': 'Friday', 'time': '12:00', 'duration_minutes': 60,
+                     'type': 'regular', 'course_code': None, 'missing_info': []}
+                ],
+                'tasks': [],
+                'course_codes': [course]
+            }
+            return response
+        mock_post.side_effect = parse_chunk
+
+        text = "\n\n".join(f"{course}:\n" + "\n".join(f"Lecture {n} Monday at 9am" for n in range(8))
+                           for course in ('EECE503', 'CMPS303', 'MATH201'))
+        with patch.object(app.chunked_parser, 'max_lines', 10):
+            response = self.client.post('/parse-schedule', json={'text': text}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(mock_post.call_count, 3)
+        self.assertEqual({call.kwargs['headers']['X-LLM-Size'] for call in mock_post.call_args_list}, {'9'})
+        self.assertEqual(data['status'], 'complete')
+        self.assertEqual([meeting['description'] for meeting in data['schedule']['meetings']],
+                         ['EECE503 Lecture', 'Department seminar', 'CMPS303 Lecture', 'MATH201 Lecture'])
+        self.assertEqual(data['schedule']['course_codes'], ['EECE503', 'CMPS303', 'MATH201'])
+
+    @patch('app.http_client.post')
+    def test_parse_schedule_rules_ahead_of_iep1(self, mock_post):
+        """Test that formulaic lines are parsed locally and only the other lines are sent to IEP1."""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {'meetings': [], 'tasks': [
+            {'description': 'Coffee with John', 'day': 'Friday', 'time': '10:00', 'duration_minutes': 30,
+             'category': 'social', 'missing_info': []}
+        ], 'course_codes': []}
+        mock_post.return_value = mock_response
+
+        text = "EECE503 exam Monday at 3pm for 2 hours\nCMPS303 quiz tue 10-11am in Room 204\nCoffee with John Friday morning"
+        response = self.client.post('/parse-schedule', json={'text': text}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        mock_post.assert_called_once()
+        self.assertTrue(mock_post.call_args.kwargs['json']['prompt'].endswith("Schedule text:\nCoffee with John Friday morning"))
+        self.assertEqual(data['status'], 'complete')
+        self.assertEqual([meeting['description'] for meeting in data['schedule']['meetings']], ['EECE503 exam', 'CMPS303 quiz'])
+        self.assertEqual(len(data['schedule']['tasks']), 1)
+        self.assertEqual(data['parse_stats']['local_lines'], 2)
+        self.assertTrue(all(item['id'] for item in data['schedule']['meetings']))
+
+        # Fully understood texts skip IEP1; the LLM parser can still be asked for explicitly
+        mock_post.reset_mock()
+        response = self.client.post('/parse-schedule', json={'text': "EECE503 exam Monday at 3pm for 2 hours"})
+        self.assertEqual(json.loads(response.data)['parse_stats']['local_share'], 1.0)
+        mock_post.assert_not_called()
+        response = self.client.post('/parse-schedule', json={'text': "EECE503 exam Monday at 3pm", 'parser': 'llm'})
+        self.assertNotIn('parse_stats', json.loads(response.data))
+        mock_post.assert_called_once()
+        self.assertEqual(self.client.post('/parse-schedule', json={'text': 'x', 'parser': 'regex'}).status_code, 400)
+
     def test_store_schedule_endpoint(self):
         """Test store-schedule endpoint."""
         # Call the endpoint to store the schedule
@@ -216,7 +289,7 @@ class TestEEP1App(unittest.TestCase):
         self.assertEqual(data['status'], 'success')
         
         # Verify that the schedule was saved
-        saved_schedule = load_schedule()
+        saved_schedule = load_schedule(user_id=USER_ID)
         self.assertIsNotNone(saved_schedule)
         self.assertEqual(len(saved_schedule['meetings']), 2)
         self.assertEqual(len(saved_schedule['tasks']), 1)
@@ -238,7 +311,7 @@ class TestEEP1App(unittest.TestCase):
     def test_get_schedule_endpoint(self):
         """Test get-schedule endpoint."""
         # Store a schedule first
-        save_schedule(self.sample_schedule, is_final=True)
+        save_schedule(self.sample_schedule, is_final=True, user_id=USER_ID)
         
         # Call the endpoint to get the schedule
         response = self.client.get('/get-schedule')
@@ -284,7 +357,7 @@ class TestEEP1App(unittest.TestCase):
     def test_answer_question_invalid_data(self):
         """Test answer-question endpoint with invalid data."""
         # Store a schedule
-        save_schedule(self.schedule_with_missing_info)
+        save_schedule(self.schedule_with_missing_info, user_id=USER_ID)
         
         # Call the endpoint with incomplete data
         response = self.client.post(
@@ -301,12 +374,12 @@ class TestEEP1App(unittest.TestCase):
     def test_reset_stored_schedule(self):
         """Test reset-stored-schedule endpoint."""
         # Store a schedule
-        save_schedule(self.sample_schedule)
-        save_schedule(self.sample_schedule, is_final=True)
+        save_schedule(self.sample_schedule, user_id=USER_ID)
+        save_schedule(self.sample_schedule, is_final=True, user_id=USER_ID)
         
         # Verify schedules are stored
-        self.assertIsNotNone(load_schedule())
-        self.assertIsNotNone(load_schedule(is_final=True))
+        self.assertIsNotNone(load_schedule(user_id=USER_ID))
+        self.assertIsNotNone(load_schedule(is_final=True, user_id=USER_ID))
         
         # Call the endpoint to reset schedules
         response = self.client.post('/reset-stored-schedule')
@@ -317,8 +390,8 @@ class TestEEP1App(unittest.TestCase):
         self.assertEqual(data['status'], 'stored schedule reset')
         
         # Verify schedules are reset
-        self.assertEqual(load_schedule(), {"meetings": [], "tasks": [], "course_codes": []})
-        self.assertEqual(load_schedule(is_final=True), {"meetings": [], "tasks": [], "course_codes": []})
+        self.assertEqual(load_schedule(user_id=USER_ID), {"meetings": [], "tasks": [], "course_codes": []})
+        self.assertEqual(load_schedule(is_final=True, user_id=USER_ID), {"meetings": [], "tasks": [], "course_codes": []})
 
     def test_helpers_convert_to_24h(self):
         """Test convert_to_24h function."""
@@ -394,5 +467,21 @@ class TestEEP1App(unittest.TestCase):
         self.assertIsInstance(schedule_with_ids["meetings"][0]["id"], str)
         self.assertIsInstance(schedule_with_ids["tasks"][0]["id"], str)
 
+    def test_llm_headers_attribute_calls(self):
+        """Test that LLM calls carry the feature, user and tier, inside and outside a request."""
+        with app.app.test_request_context('/chat', headers={'X-User-ID': 'alice'}):
+            self.assertEqual(app.llm_headers('chat'), {'X-LLM-Feature': 'chat', 'X-User-ID': 'alice'})
+        with app.app.test_request_context('/chat', headers={'X-User-ID': 'alice', 'X-User-Tier': 'free'}):
+            self.assertEqual(app.llm_headers('chat', size=3)['X-User-Tier'], 'free')
+        self.assertEqual(app.llm_headers('generate'), {'X-LLM-Feature': 'generate'})
+        token = app.llm_user.set('bob')
+        tier_token = app.llm_tier.set('pro')
+        try:
+            headers = app.llm_headers('regenerate')
+            self.assertEqual((headers['X-User-ID'], headers['X-User-Tier']), ('bob', 'pro'))
+        finally:
+            app.llm_tier.reset(tier_token)
+            app.llm_user.reset(token)
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
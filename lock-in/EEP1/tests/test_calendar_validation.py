@@ -0,0 +1,154 @@
+import unittest
+import json
+import sys
+import os
+import logging
+from unittest.mock import patch, MagicMock
+
+# Add parent directory to path to import app module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app
+from calendar_validation import (
+    validate_calendar, repair_calendar, DayIndex,
+    OVERLAP, OUT_OF_BOUNDS, INVALID_TIME, MISSING_FIXED_EVENT, MOVED_FIXED_EVENT, LOST_ID, DUPLICATE_ID
+)
+
+
+def event(event_id, start, end, event_type='task', description=None):
+    return {'id': event_id, 'type': event_type, 'description': description or event_id,
+            'start_time': start, 'end_time': end}
+
+
+class TestCalendarValidation(unittest.TestCase):
+    """Unit tests for generated calendar validation and repair."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.schedule = {'meetings': [{
+            'id': 'exam-1', 'description': 'CS101 Exam', 'day': 'Tuesday', 'time': '10:00',
+            'duration_minutes': 120, 'type': 'exam'
+        }]}
+        self.google_calendar = {'Monday': [{'id': 'g-1', 'description': 'Dentist', 'start_time': '15:00', 'end_time': '16:00'}]}
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_overlapping_pairs(self):
+        """Test that the sweep reports each overlap against the event ending last."""
+        index = DayIndex([event('a', '09:00', '12:00'), event('b', '10:00', '10:30'),
+                          event('c', '11:00', '11:30'), event('d', '12:00', '13:00')])
+        pairs = [(earlier['id'], later['id']) for earlier, later in index.overlapping_pairs()]
+        self.assertEqual(pairs, [('a', 'b'), ('a', 'c')])
+
+    def test_detects_each_issue_type(self):
+        """Test overlaps, bad times, bounds, duplicates, missing/moved fixed events and lost IDs."""
+        calendar = {
+            'Monday': [event('t-1', '08:00', '09:30'), event('t-2', '09:00', '10:00'),
+                       event('t-3', '23:00', '23:30'), event('t-4', '12:00', '11:00'), event('t-1', '13:00', '14:00')],
+            'Wednesday': [event('exam-1', '10:00', '12:00', 'exam', 'CS101 Exam')]
+        }
+        reference = {'Friday': [event('t-9', '09:00', '10:00')]}
+        report = validate_calendar(calendar, self.schedule, self.google_calendar, reference,
+                                   day_start=7 * 60, day_end=22 * 60)
+        codes = {issue['code'] for issue in report.issues}
+        self.assertEqual(codes, {OVERLAP, INVALID_TIME, OUT_OF_BOUNDS, DUPLICATE_ID,
+                                 MISSING_FIXED_EVENT, MOVED_FIXED_EVENT, LOST_ID})
+        self.assertEqual(report.by_code(MISSING_FIXED_EVENT)[0]['event_id'], 'g-1')
+        self.assertEqual(report.by_code(MOVED_FIXED_EVENT)[0]['expected_day'], 'Tuesday')
+        self.assertEqual(report.days(), ['Monday', 'Wednesday', 'Friday'])
+
+    def test_repair_restores_fixed_events_and_moves_flexible_ones(self):
+        """Test that local repair fixes the calendar without touching fixed events."""
+        calendar = {
+            'Monday': [event('t-1', '15:30', '16:30'), event('lunch', '12:00', '13:00', 'meal')],
+            'Wednesday': [event('exam-1', '10:00', '12:00', 'exam', 'CS101 Exam')],
+            'Tuesday': [event('t-2', '11:00', '12:00')]
+        }
+        repaired, remaining = repair_calendar(calendar, self.schedule, self.google_calendar)
+
+        self.assertTrue(remaining.valid, remaining.issues)
+        monday = {e['id']: e for e in repaired['Monday']}
+        self.assertEqual((monday['g-1']['start_time'], monday['g-1']['type']), ('15:00', 'google_event'))
+        self.assertEqual(monday['t-1']['start_time'], '16:00')
+        tuesday = {e['id']: e for e in repaired['Tuesday']}
+        self.assertEqual(tuesday['exam-1']['start_time'], '10:00')
+        self.assertEqual(tuesday['t-2']['start_time'], '12:00')
+        self.assertEqual(repaired['Wednesday'], [])
+        # The input calendar is left untouched
+        self.assertEqual(calendar['Monday'][0]['start_time'], '15:30')
+
+    def test_repair_does_not_report_removed_events_as_lost(self):
+        """Test that events removed on purpose are neither restored nor reported as dropped."""
+        reference = {'Monday': [event('a', '09:00', '10:00'), event('b', '11:00', '12:00')]}
+        repaired, remaining = repair_calendar({'Monday': []}, reference_calendar=reference, removed_ids={'a'})
+        self.assertEqual([e['id'] for e in repaired['Monday']], ['b'])
+        self.assertTrue(remaining.valid, remaining.issues)
+
+        repaired, remaining = repair_calendar({'Monday': []}, reference_calendar=reference, removed_ids={'a', 'b'})
+        self.assertEqual(repaired['Monday'], [])
+        self.assertEqual(remaining.by_code(LOST_ID), [])
+
+
+class TestCalendarCheckInEEP1(unittest.TestCase):
+    """Tests for validation, repair and selective re-prompting in EEP1."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.schedule = {'meetings': [], 'tasks': []}
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    @patch('app.http_client.post')
+    def test_valid_calendar_makes_no_calls(self, mock_post):
+        """Test that a valid calendar is returned as is without calling IEP2."""
+        calendar = {'Monday': [event('t-1', '09:00', '10:00')]}
+        checked, issues = app.check_generated_calendar(calendar, self.schedule)
+        self.assertIs(checked, calendar)
+        self.assertEqual(issues, [])
+        mock_post.assert_not_called()
+
+    @patch('app.http_client.post')
+    def test_unrepairable_day_is_reprompted_alone(self, mock_post):
+        """Test that only the day that local repair cannot fix is sent back to IEP2."""
+        google_calendar = {'Monday': [{'id': 'g-1', 'description': 'Trip', 'start_time': '07:00', 'end_time': '22:00'}]}
+        calendar = {
+            'Monday': [dict(google_calendar['Monday'][0], type='google_event'), event('t-1', '09:00', '10:00')],
+            'Tuesday': [event('t-2', '09:00', '10:00')]
+        }
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {'content': [{'type': 'text', 'text': json.dumps({
+            'Monday': [dict(google_calendar['Monday'][0], type='google_event')]
+        })}]}
+        mock_post.return_value = mock_response
+
+        checked, issues = app.check_generated_calendar(
+            calendar, self.schedule, {'wake_time': '07:00', 'sleep_time': '22:00'}, google_calendar
+        )
+
+        self.assertEqual(issues, [])
+        self.assertEqual([e['id'] for e in checked['Monday']], ['g-1'])
+        self.assertEqual(checked['Tuesday'][0]['id'], 't-2')
+        prompt = mock_post.call_args[1]['json']['prompt']
+        self.assertIn('"Monday"', prompt)
+        self.assertNotIn('"Tuesday"', prompt)
+
+    @patch('app.http_client.post')
+    def test_fixed_conflicts_are_not_reprompted(self, mock_post):
+        """Test that an overlap between fixed events is reported without calling IEP2."""
+        google_calendar = {'Monday': [{'id': 'g-1', 'description': 'Dentist', 'start_time': '10:00', 'end_time': '11:00'}]}
+        schedule = {'meetings': [{'id': 'm-1', 'description': 'CS101 Lecture', 'day': 'Monday', 'time': '10:30',
+                                  'duration_minutes': 60, 'type': 'class'}]}
+        calendar = {'Monday': [dict(google_calendar['Monday'][0], type='google_event'),
+                               event('m-1', '10:30', '11:30', 'class', 'CS101 Lecture')]}
+
+        checked, issues = app.check_generated_calendar(calendar, schedule, None, google_calendar)
+
+        mock_post.assert_not_called()
+        self.assertEqual([issue['code'] for issue in issues], [OVERLAP])
+        self.assertEqual(len(checked['Monday']), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
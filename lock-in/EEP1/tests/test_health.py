@@ -0,0 +1,116 @@
+import unittest
+import json
+import sys
+import os
+import time
+import logging
+from unittest.mock import patch
+
+# Add parent directory to path to import the health module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from health import CallHealth, HealthProber
+import app
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestHealth(unittest.TestCase):
+    """Unit tests for passive LLM health and the background dependency prober."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_call_health_thresholds(self):
+        """Test status from the success rate and latency of calls in the window."""
+        clock = FakeClock()
+        call_health = CallHealth(window_seconds=60, min_calls=3, slow_seconds=5, clock=clock)
+        self.assertEqual(call_health.snapshot()['status'], 'unknown')
+
+        call_health.record(False, error='HTTP 529')
+        self.assertEqual(call_health.snapshot()['status'], 'healthy')  # too few calls to judge
+        call_health.record(False, error='HTTP 529')
+        call_health.record(True, latency=1.0)
+        snapshot = call_health.snapshot()
+        self.assertEqual((snapshot['status'], snapshot['last_error']), ('unhealthy', 'HTTP 529'))
+
+        clock.now += 61
+        for _ in range(9):
+            call_health.record(True, latency=1.0)
+        call_health.record(False)
+        self.assertEqual(call_health.snapshot()['status'], 'healthy')
+        call_health.record(False)
+        self.assertEqual(call_health.snapshot()['status'], 'degraded')
+
+        clock.now += 61
+        for _ in range(3):
+            call_health.record(True, latency=8.0)
+        self.assertEqual(call_health.snapshot()['status'], 'degraded')
+
+    def test_prober_runs_checks_in_parallel_with_deadline(self):
+        """Test that slow and failing checks are reported without delaying the others."""
+        def failing():
+            raise ConnectionError("refused")
+
+        prober = HealthProber({
+            'fast': lambda: True,
+            'slow': lambda: time.sleep(0.5) or True,
+            'slow2': lambda: time.sleep(0.5) or True,
+            'down': failing,
+            'bad': lambda: (False, 'HTTP 500')
+        }, timeout=0.2)
+        self.addCleanup(prober.stop)
+        start = time.monotonic()
+        prober.refresh()
+        self.assertLess(time.monotonic() - start, 0.45)
+
+        results = prober.results()
+        self.assertEqual({name: result['status'] for name, result in results.items()},
+                         {'fast': 'healthy', 'slow': 'unhealthy', 'slow2': 'unhealthy', 'down': 'unhealthy', 'bad': 'unhealthy'})
+        self.assertIn('no answer within', results['slow']['detail'])
+        self.assertEqual(results['down']['detail'], 'refused')
+        self.assertEqual(results['bad']['detail'], 'HTTP 500')
+
+    def test_prober_cache_expires(self):
+        """Test that results are served from the cache and become unknown after the TTL."""
+        clock = FakeClock()
+        calls = []
+        prober = HealthProber({'iep1': lambda: calls.append(1) or True}, ttl=30, clock=clock)
+        self.addCleanup(prober.stop)
+        self.assertEqual(prober.results()['iep1']['status'], 'unknown')
+        prober.refresh()
+        for _ in range(5):
+            self.assertEqual(prober.results()['iep1']['status'], 'healthy')
+        self.assertEqual(len(calls), 1)
+        clock.now += 31
+        self.assertEqual(prober.results()['iep1']['status'], 'unknown')
+
+    def test_eep1_health_endpoints(self):
+        """Test that EEP1 answers from the cached probes and requires only the configured dependencies."""
+        statuses = {'iep1': True, 'iep2': True, 'iep3': False, 'iep4': True}
+        prober = HealthProber({name: (lambda name=name: statuses[name]) for name in statuses}, interval=3600)
+        self.addCleanup(prober.stop)
+        client = app.app.test_client()
+        with patch('app.health_prober', prober), patch('app.HEALTH_REQUIRED_DEPENDENCIES', ['iep1', 'iep2']):
+            response = client.get('/health/ready')
+            data = json.loads(response.data)
+            self.assertEqual((response.status_code, data['status']), (200, 'partially healthy'))
+            self.assertEqual(data['services']['iep3']['status'], 'unhealthy')
+
+            statuses['iep2'] = False
+            prober.refresh()
+            self.assertEqual(client.get('/health/ready').status_code, 503)
+            self.assertEqual(client.get('/health').status_code, 500)
+            self.assertEqual(client.get('/health/live').status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
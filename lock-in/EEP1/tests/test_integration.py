@@ -9,7 +9,10 @@ import requests
 # Add parent directory to path to import app module
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import app
-from helpers import reset_schedules, save_schedule, load_schedule
+from helpers import save_schedule, load_schedule, get_schedule_repository
+
+# User the tests' requests and stored schedules belong to
+USER_ID = 'test-user'
 
 class TestEEP1Integration(unittest.TestCase):
     """Integration tests for EEP1 Schedule Management Service with other components."""
@@ -31,9 +34,10 @@ class TestEEP1Integration(unittest.TestCase):
         # Set up Flask test client
         app.app.testing = True
         self.client = app.app.test_client()
+        self.client.environ_base['HTTP_X_USER_ID'] = USER_ID
         
         # Reset schedules before each test to ensure clean state
-        reset_schedules()
+        get_schedule_repository().backend.clear()
         
         # Disable logging for tests
         logging.disable(logging.CRITICAL)
@@ -78,12 +82,12 @@ class TestEEP1Integration(unittest.TestCase):
     def tearDown(self):
         """Clean up after each test."""
         # Reset all schedules to clean state
-        reset_schedules()
+        get_schedule_repository().backend.clear()
         
         # Re-enable logging
         logging.disable(logging.NOTSET)
 
-    @patch('app.requests.post')
+    @patch('app.http_client.post')
     def test_parse_schedule_iep1_integration(self, mock_post):
         """Test integration with IEP1 for schedule parsing."""
         # Configure the mock to return a successful response
@@ -115,7 +119,7 @@ class TestEEP1Integration(unittest.TestCase):
         """Test a basic integration flow with mocked responses."""
         if self.mock_mode:
             # Mock all the necessary API calls
-            with patch('app.requests.post') as mock_post:
+            with patch('app.http_client.post') as mock_post:
                 # Configure the mock for IEP1 parsing
                 mock_response = MagicMock()
                 mock_response.status_code = 200
@@ -135,7 +139,7 @@ class TestEEP1Integration(unittest.TestCase):
                 self.assertEqual(parse_data['status'], 'complete')
                 
                 # Verify schedules are stored properly
-                saved_schedule = load_schedule()
+                saved_schedule = load_schedule(user_id=USER_ID)
                 self.assertIsNotNone(saved_schedule)
                 self.assertEqual(len(saved_schedule['meetings']), 1)
                 self.assertEqual(len(saved_schedule['tasks']), 1)
@@ -0,0 +1,211 @@
+import unittest
+import json
+import sys
+import os
+import time
+import logging
+import threading
+from unittest.mock import patch
+
+# Add parent directory to path to import app module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app
+from helpers import load_schedule, get_schedule_repository
+from jobs import JobManager, JobContext, SUCCEEDED, FAILED, CANCELLED, RUNNING
+from persistence.job_repository import JobRepository
+from persistence.schedule_repository import MemoryBackend
+
+# User the tests' requests and stored schedules belong to
+USER_ID = 'test-user'
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class TestJobManager(unittest.TestCase):
+    """Unit tests for the background job manager."""
+
+    def setUp(self):
+        """Create a manager backed by an in-memory repository."""
+        logging.disable(logging.CRITICAL)
+        self.manager = JobManager(JobRepository(MemoryBackend()), max_workers=4, downstream_limits={'iep2': 1})
+
+    def tearDown(self):
+        """Stop the worker pool."""
+        self.manager.shutdown(wait=True)
+        logging.disable(logging.NOTSET)
+
+    def test_job_runs_and_reports_partial_output(self):
+        """Test the queued -> running -> succeeded lifecycle."""
+        def runner(context):
+            context.set_partial('Monday', [{'id': 'e-1'}])
+            return {'done': True}
+
+        job, deduplicated = self.manager.submit('alice', {'schedule': 1}, runner)
+        self.assertFalse(deduplicated)
+        self.assertTrue(wait_for(lambda: self.manager.get(job['job_id'])['status'] == SUCCEEDED))
+
+        finished = self.manager.get(job['job_id'])
+        self.assertEqual(finished['result'], {'done': True})
+        self.assertEqual(finished['partial']['Monday'][0]['id'], 'e-1')
+
+    def test_failure_is_recorded(self):
+        """Test that a raising job is marked failed with its error."""
+        def runner(context):
+            raise ValueError('IEP2 unavailable')
+
+        job, _ = self.manager.submit('alice', {'schedule': 2}, runner)
+        self.assertTrue(wait_for(lambda: self.manager.get(job['job_id'])['status'] == FAILED))
+        self.assertEqual(self.manager.get(job['job_id'])['error'], 'IEP2 unavailable')
+
+    def test_identical_in_flight_submissions_are_deduplicated(self):
+        """Test per-user deduplication of identical in-flight jobs."""
+        release = threading.Event()
+
+        def runner(context):
+            release.wait(5)
+            return {}
+
+        first, _ = self.manager.submit('alice', {'schedule': 3}, runner)
+        second, deduplicated = self.manager.submit('alice', {'schedule': 3}, runner)
+        other_user, other_deduplicated = self.manager.submit('bob', {'schedule': 3}, runner)
+
+        self.assertTrue(deduplicated)
+        self.assertEqual(first['job_id'], second['job_id'])
+        self.assertFalse(other_deduplicated)
+        self.assertNotEqual(first['job_id'], other_user['job_id'])
+
+        release.set()
+        self.assertTrue(wait_for(lambda: self.manager.get(first['job_id'])['status'] == SUCCEEDED))
+        third, deduplicated = self.manager.submit('alice', {'schedule': 3}, runner)
+        self.assertFalse(deduplicated)
+        self.assertNotEqual(third['job_id'], first['job_id'])
+
+    def test_cancel_running_job(self):
+        """Test that cancelling stops a running job and keeps it cancelled."""
+        started = threading.Event()
+
+        def runner(context):
+            started.set()
+            while True:
+                context.check_cancelled()
+                time.sleep(0.01)
+
+        job, _ = self.manager.submit('alice', {'schedule': 4}, runner)
+        self.assertTrue(started.wait(5))
+        self.assertEqual(self.manager.cancel(job['job_id'])['status'], CANCELLED)
+        self.assertTrue(wait_for(lambda: job['job_id'] not in self.manager._local_jobs))
+        self.assertEqual(self.manager.get(job['job_id'])['status'], CANCELLED)
+
+    def test_downstream_concurrency_limit(self):
+        """Test that at most `limit` jobs use a downstream at once."""
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def runner(context):
+            with context.limit('iep2'):
+                with lock:
+                    active.append(1)
+                    peak.append(len(active))
+                time.sleep(0.05)
+                with lock:
+                    active.pop()
+            return {}
+
+        jobs = [self.manager.submit('alice', {'schedule': i}, runner)[0] for i in range(10, 14)]
+        self.assertTrue(wait_for(lambda: all(self.manager.get(j['job_id'])['status'] == SUCCEEDED for j in jobs)))
+        self.assertEqual(max(peak), 1)
+
+    def test_stale_job_from_other_worker_is_failed(self):
+        """Test that an abandoned running job is reported as interrupted."""
+        repository = self.manager.repository
+        repository.save({'job_id': 'orphan', 'user_id': 'alice', 'status': RUNNING,
+                         'created_at': 0, 'updated_at': 0, 'partial': {}, 'result': None, 'error': None})
+        job = self.manager.get('orphan')
+        self.assertEqual(job['status'], FAILED)
+        self.assertEqual(job['error'], 'Job was interrupted')
+
+    def test_progress_does_not_overwrite_a_cancel_from_another_worker(self):
+        """Test that partial output written while another worker cancels leaves the job cancelled."""
+        repository = self.manager.repository
+        backend = repository.backend
+        repository.save({'job_id': 'shared', 'user_id': 'alice', 'status': RUNNING, 'created_at': time.time(),
+                         'updated_at': time.time(), 'partial': {}, 'result': None, 'error': None})
+        compare_and_set = backend.compare_and_set
+
+        def cancel_in_between(key, expected, value):
+            # Another worker cancels between this worker's read and its write
+            backend.compare_and_set = compare_and_set
+            backend.set(key, json.dumps(dict(json.loads(expected), status=CANCELLED)))
+            return compare_and_set(key, expected, value)
+
+        backend.compare_and_set = cancel_in_between
+        JobContext(self.manager, 'shared').set_partial('Monday', [{'id': 'e-1'}])
+
+        job = repository.load('shared')
+        self.assertEqual(job['status'], CANCELLED)
+        self.assertEqual(job['partial'], {})
+
+
+class TestJobEndpoints(unittest.TestCase):
+    """Tests for the /jobs endpoints."""
+
+    def setUp(self):
+        """Set up test client."""
+        logging.disable(logging.CRITICAL)
+        self.client = app.app.test_client()
+        self.client.environ_base['HTTP_X_USER_ID'] = USER_ID
+        self.schedule = {'meetings': [], 'tasks': [{'id': 't-1', 'description': 'Essay'}], 'course_codes': []}
+
+    def tearDown(self):
+        """Clean up after each test."""
+        get_schedule_repository().backend.clear()
+        logging.disable(logging.NOTSET)
+
+    def fake_stream(self, prompt, parser, check=None, feature='generate', system=None, size=None):
+        self.job_headers = app.llm_headers(feature, size=size)
+        parser.calendar['Monday'] = [{'id': 't-1', 'start_time': '09:00', 'end_time': '10:00'}]
+        yield 'Monday', parser.calendar['Monday']
+
+    def test_submit_poll_and_isolation(self):
+        """Test submitting a job, polling it to completion and per-user access, with the user's tier kept in the job."""
+        with patch('app.stream_calendar_days', self.fake_stream), \
+             patch('app.check_missing_info', return_value=[]):
+            response = self.client.post('/jobs/generate-schedule', json={'schedule': self.schedule},
+                                        headers={'X-User-ID': 'alice', 'X-User-Tier': 'free'})
+            self.assertEqual(response.status_code, 202)
+            job_id = json.loads(response.data)['job_id']
+
+            def finished():
+                data = json.loads(self.client.get(f'/jobs/{job_id}', headers={'X-User-ID': 'alice'}).data)
+                return data['status'] == SUCCEEDED
+
+            self.assertTrue(wait_for(finished))
+
+        data = json.loads(self.client.get(f'/jobs/{job_id}', headers={'X-User-ID': 'alice'}).data)
+        self.assertEqual(data['partial']['Monday'][0]['id'], 't-1')
+        self.assertEqual(data['result']['generated_calendar']['Monday'][0]['id'], 't-1')
+        self.assertNotIn('fingerprint', data)
+        self.assertEqual((self.job_headers['X-User-ID'], self.job_headers['X-User-Tier']), ('alice', 'free'))
+        self.assertEqual(load_schedule(is_final=True, user_id='alice')['generated_calendar'], data['result']['generated_calendar'])
+
+        response = self.client.get(f'/jobs/{job_id}', headers={'X-User-ID': 'bob'})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post(f'/jobs/{job_id}/cancel', headers={'X-User-ID': 'bob'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_submit_without_schedule(self):
+        """Test that invalid submissions are rejected before queueing."""
+        response = self.client.post('/jobs/generate-schedule', json={})
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+import json
+import sys
+import os
+import logging
+from unittest.mock import patch, MagicMock
+
+# Add parent directory to path to import app module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app
+from json_repair import (
+    extract_json, repair_json, parse_fragment, JsonScanner,
+    TRAILING_COMMA, COMMENT, CONTROL_CHARACTER, UNTERMINATED_STRING, TRUNCATED_VALUE, AUTO_CLOSED
+)
+
+
+class TestJsonExtraction(unittest.TestCase):
+    """Unit tests for finding and repairing JSON in model output."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_direct_json(self):
+        """Test that plain JSON is parsed without any repair."""
+        result = extract_json('  {"Monday": []}\n')
+        self.assertEqual((result.value, result.strategy, result.repairs), ({'Monday': []}, 'direct', []))
+
+    def test_fenced_and_prose(self):
+        """Test JSON inside a code fence and JSON surrounded by prose."""
+        fenced = extract_json('Here is your schedule:\n```json\n{"Monday": [{"id": "t-1"}]}\n```\nEnjoy!')
+        self.assertEqual((fenced.value, fenced.strategy), ({'Monday': [{'id': 't-1'}]}, 'fenced'))
+        scanned = extract_json('Sure! {"a": "text with } brace"} Hope that helps.')
+        self.assertEqual((scanned.value, scanned.strategy), ({'a': 'text with } brace'}, 'scanned'))
+
+    def test_prefers_object_with_expected_key(self):
+        """Test that the object carrying an expected key wins over a bigger one."""
+        text = 'Notes: {"note": "a long unrelated object with plenty of text"} and {"generated_calendar": {}}'
+        result = extract_json(text, prefer_keys=('generated_calendar',))
+        self.assertEqual(result.value, {'generated_calendar': {}})
+
+    def test_repairs(self):
+        """Test trailing commas, comments and raw control characters inside strings."""
+        value, repairs = parse_fragment('{\n  // the week\n  "Monday": [{"description": "Line one\nline two",},], /* done */\n}')
+        self.assertEqual(value, {'Monday': [{'description': 'Line one\nline two'}]})
+        self.assertEqual(repairs, sorted([TRAILING_COMMA, COMMENT, CONTROL_CHARACTER]))
+
+    def test_truncated_output_is_closed(self):
+        """Test that output cut off mid-string, mid-token or after a key is closed."""
+        value, repairs = parse_fragment('{"Monday": [{"id": "t-1", "description": "Stud')
+        self.assertEqual(value, {'Monday': [{'id': 't-1', 'description': 'Stud'}]})
+        self.assertEqual(repairs, [AUTO_CLOSED, UNTERMINATED_STRING])
+
+        value, repairs = parse_fragment('{"a": 1, "b": tr')
+        self.assertEqual(value, {'a': 1, 'b': None})
+        self.assertIn(TRUNCATED_VALUE, repairs)
+
+        value, _ = parse_fragment('{"a": [1, 2], "b"')
+        self.assertEqual(value, {'a': [1, 2], 'b': None})
+
+    def test_strings_are_left_alone(self):
+        """Test that comment markers and commas inside strings are not treated as syntax."""
+        text, repairs = repair_json('{"url": "http://x.y/*z*/", "s": ",]"}')
+        self.assertEqual(json.loads(text), {'url': 'http://x.y/*z*/', 's': ',]'})
+        self.assertEqual(repairs, [])
+
+    def test_scanner_is_incremental(self):
+        """Test that the scanner reports objects as they complete across chunks."""
+        scanner = JsonScanner()
+        self.assertEqual(scanner.feed('text {"a": {"b"'), [])
+        self.assertEqual(scanner.pending(), '{"a": {"b"')
+        self.assertEqual(scanner.feed(': 1}} more {"c": 2}'), ['{"a": {"b": 1}}', '{"c": 2}'])
+        self.assertIsNone(scanner.pending())
+
+    def test_top_level_arrays(self):
+        """Test that a truncated top-level array is recovered and that objects win over arrays in prose."""
+        result = extract_json('[1, 2')
+        self.assertEqual((result.value, result.repairs), ([1, 2], [AUTO_CLOSED]))
+        self.assertEqual(extract_json('See [1, 2, 3, 4, 5, 6] and {"a": 1}').value, {'a': 1})
+
+    def test_unrecoverable(self):
+        """Test that text without JSON yields None."""
+        self.assertIsNone(extract_json('I could not build a schedule this time.'))
+        self.assertIsNone(extract_json(''))
+
+
+class TestCalendarExtractionInEEP1(unittest.TestCase):
+    """Tests that IEP1 is only used when the calendar cannot be recovered locally."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.schedule = {'meetings': [], 'tasks': []}
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    @patch('app.http_client.post')
+    def test_repairable_output_skips_iep1(self, mock_post):
+        """Test that a fenced calendar with defects is repaired without calling IEP1."""
+        llm_response = 'Here you go:\n```json\n{"generated_calendar": {"Monday": [{"id": "t-1", "start_time": "09:00",}]}}\n```'
+        calendar, error = app.extract_generated_calendar(llm_response, self.schedule)
+        self.assertIsNone(error)
+        self.assertEqual(calendar, {'Monday': [{'id': 't-1', 'start_time': '09:00'}]})
+        mock_post.assert_not_called()
+
+    @patch('app.http_client.post')
+    def test_truncated_output_is_rejected(self, mock_post):
+        """Test that a calendar cut off mid-way is reported instead of being accepted as complete."""
+        llm_response = '{"generated_calendar": {"Monday": [{"id": "t-1", "start_time": "09:00"}], "Tuesday": [{"id": "t-2"'
+        calendar, error = app.extract_generated_calendar(llm_response, self.schedule)
+        self.assertIsNone(calendar)
+        self.assertIn('cut off', error)
+        mock_post.assert_not_called()
+
+    @patch('app.http_client.post')
+    def test_unparseable_output_falls_back_to_iep1(self, mock_post):
+        """Test that IEP1 is asked to parse output with no recoverable JSON."""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {'response': '```json\n{"schedule": {"generated_calendar": {"Friday": []}}}\n```'}
+        mock_post.return_value = mock_response
+
+        calendar, error = app.extract_generated_calendar('Monday: study 9-10, Friday: rest', self.schedule)
+        self.assertIsNone(error)
+        self.assertEqual(calendar, {'Friday': []})
+        self.assertEqual(mock_post.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+import unittest
+import json
+import sys
+import os
+import logging
+from unittest.mock import patch, MagicMock
+
+# Add parent directory to path to import app module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app
+from helpers import get_schedule_repository
+from local_solver import solve_schedule, split_into_sessions, day_window, to_minutes, DAYS
+
+# User the tests' requests and stored schedules belong to
+USER_ID = 'test-user'
+
+
+def overlaps(events):
+    """Return True if any two events of a day overlap."""
+    spans = sorted((to_minutes(e['start_time']), to_minutes(e['end_time'])) for e in events)
+    return any(spans[i][1] > spans[i + 1][0] for i in range(len(spans) - 1))
+
+
+class TestLocalSolver(unittest.TestCase):
+    """Unit tests for the deterministic schedule solver."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.schedule = {
+            'meetings': [{
+                'id': 'm-1', 'description': 'EECE503 Exam', 'day': 'Thursday', 'time': '10:00',
+                'duration_minutes': 120, 'type': 'exam', 'course_code': 'EECE503'
+            }],
+            'tasks': [
+                {'id': 't-1', 'description': 'Study for EECE503', 'duration_minutes': 300,
+                 'priority': 'high', 'related_event': 'EECE503 Exam', 'course_code': 'EECE503'},
+                {'id': 't-2', 'description': 'Essay', 'duration_minutes': 90, 'priority': 'low'}
+            ]
+        }
+        self.preferences = {
+            'wake_time': '08:00', 'sleep_time': '23:00', 'study_session_length': 'medium',
+            'weekend_scheduling': 'no', 'productivity_pattern': 'morning',
+            'meal_times': {'breakfast': '08:30', 'lunch': '13:00', 'dinner': '19:30'}
+        }
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_calendar_shape_and_fixed_events(self):
+        """Test that every day is present, meetings keep their time and nothing overlaps."""
+        google_calendar = {'Monday': [{'id': 'g-1', 'description': 'Gym', 'start_time': '09:00', 'end_time': '10:00'}]}
+        calendar, unscheduled = solve_schedule(self.schedule, self.preferences, google_calendar)
+
+        self.assertEqual(list(calendar), DAYS)
+        self.assertEqual(unscheduled, [])
+        exam = next(e for e in calendar['Thursday'] if e['id'] == 'm-1')
+        self.assertEqual((exam['start_time'], exam['end_time'], exam['type']), ('10:00', '12:00', 'exam'))
+        gym = next(e for e in calendar['Monday'] if e['id'] == 'g-1')
+        self.assertEqual((gym['start_time'], gym['type']), ('09:00', 'google_event'))
+        for day in DAYS:
+            self.assertFalse(overlaps(calendar[day]), day)
+            self.assertEqual(len([e for e in calendar[day] if e['type'] == 'meal']), 3)
+            for event in calendar[day]:
+                self.assertGreaterEqual(event['start_time'], '08:00')
+                self.assertLessEqual(event['end_time'], '23:00')
+
+    def test_tasks_split_into_sessions_before_related_event(self):
+        """Test session splitting, ID format, deadlines and weekend rules."""
+        calendar, _ = solve_schedule(self.schedule, self.preferences)
+        sessions = [(day, e) for day in DAYS for e in calendar[day] if e['id'].startswith('t-1-part')]
+
+        self.assertEqual(sum(e['duration'] for _, e in sessions), 300)
+        self.assertTrue(all(e['duration'] <= 90 for _, e in sessions))
+        for day, event in sessions:
+            self.assertLessEqual(DAYS.index(day), DAYS.index('Thursday'))
+            if day == 'Thursday':
+                self.assertLessEqual(event['end_time'], '10:00')
+        for day in ('Saturday', 'Sunday'):
+            self.assertFalse([e for e in calendar[day] if e['type'] == 'task'])
+
+    def test_unplaceable_work_is_reported(self):
+        """Test that work that does not fit is returned instead of overlapping."""
+        schedule = {'meetings': [], 'tasks': [{'id': 't-9', 'description': 'Thesis', 'duration_minutes': 60 * 60}]}
+        calendar, unscheduled = solve_schedule(schedule, self.preferences)
+        self.assertEqual(unscheduled[0]['id'], 't-9')
+        self.assertGreater(unscheduled[0]['remaining_minutes'], 0)
+        for day in DAYS:
+            self.assertFalse(overlaps(calendar[day]))
+
+    def test_overlapping_fixed_events_stay_busy(self):
+        """Test that nothing is placed inside a long event that a shorter one overlaps."""
+        schedule = {'meetings': [
+            {'id': 'm-1', 'description': 'Workshop', 'day': 'Monday', 'time': '11:00', 'duration_minutes': 240},
+            {'id': 'm-2', 'description': 'Call', 'day': 'Monday', 'time': '11:30', 'duration_minutes': 30}
+        ], 'tasks': []}
+        calendar, _ = solve_schedule(schedule, self.preferences)
+        for event in calendar['Monday']:
+            if event['id'] not in ('m-1', 'm-2'):
+                self.assertTrue(event['end_time'] <= '11:00' or event['start_time'] >= '15:00', event)
+
+    def test_split_into_sessions(self):
+        """Test that short remainders are merged into the previous session."""
+        self.assertEqual(split_into_sessions(300, 90), [90, 90, 90, 30])
+        self.assertEqual(split_into_sessions(190, 90), [90, 100])
+        self.assertEqual(split_into_sessions(45, 90), [45])
+
+    def test_midnight_preferences_are_kept(self):
+        """Test that a wake or meal time of 00:00 is used rather than replaced by the default."""
+        self.assertEqual(day_window({'wake_time': '00:00', 'sleep_time': '16:00'}), (0, 960))
+        calendar = solve_schedule({'meetings': [], 'tasks': []},
+                                  {'wake_time': '00:00', 'meal_times': {'dinner': '00:00'}})[0]
+        self.assertIn('00:00', [event['start_time'] for event in calendar['Monday']])
+
+
+class TestLocalEngineEndpoint(unittest.TestCase):
+    """Tests for engine=local|hybrid on /generate-optimized-schedule."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.client = app.app.test_client()
+        self.client.environ_base['HTTP_X_USER_ID'] = USER_ID
+        self.schedule = {
+            'meetings': [],
+            'tasks': [{'id': 't-1', 'description': 'Essay', 'duration_minutes': 120, 'priority': 'high'}],
+            'course_codes': []
+        }
+
+    def tearDown(self):
+        get_schedule_repository().backend.clear()
+        logging.disable(logging.NOTSET)
+
+    @patch('app.http_client.post')
+    def test_local_engine_skips_llm(self, mock_post):
+        """Test that the local engine answers without calling IEP2."""
+        response = self.client.post('/generate-optimized-schedule',
+                                    json={'schedule': self.schedule, 'engine': 'local'})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['engine'], 'local')
+        self.assertIn('t-1-part1', [e['id'] for e in data['generated_calendar']['Monday']])
+        mock_post.assert_not_called()
+
+    @patch('app.http_client.post')
+    def test_hybrid_engine_polishes_descriptions(self, mock_post):
+        """Test that hybrid mode only takes descriptions from the LLM."""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {'content': [{'type': 'text', 'text': json.dumps({
+            't-1-part1': 'Outline the essay', 't-1-part2': 'Write the first draft', 'm-unknown': 'ignored'
+        })}]}
+        mock_post.return_value = mock_response
+
+        response = self.client.post('/generate-optimized-schedule',
+                                    json={'schedule': self.schedule, 'engine': 'hybrid'})
+        data = json.loads(response.data)
+        monday = {e['id']: e for e in data['generated_calendar']['Monday']}
+        self.assertEqual(monday['t-1-part1']['description'], 'Outline the essay')
+        self.assertEqual(monday['t-1-part1']['duration'], 90)
+        self.assertEqual(mock_post.call_count, 1)
+
+    @patch('app.http_client.post')
+    def test_hybrid_engine_keeps_solver_output_when_llm_fails(self, mock_post):
+        """Test that a failed polish still returns the local calendar."""
+        mock_response = MagicMock()
+        mock_response.status_code = 500
+        mock_post.return_value = mock_response
+
+        response = self.client.post('/generate-optimized-schedule',
+                                    json={'schedule': self.schedule, 'engine': 'hybrid'})
+        self.assertEqual(response.status_code, 200)
+        monday = json.loads(response.data)['generated_calendar']['Monday']
+        self.assertIn('Essay (session 1 of 2)', [e['description'] for e in monday])
+
+    def test_unknown_engine(self):
+        """Test that an unknown engine is rejected."""
+        response = self.client.post('/generate-optimized-schedule',
+                                    json={'schedule': self.schedule, 'engine': 'quantum'})
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
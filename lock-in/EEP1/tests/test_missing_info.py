@@ -0,0 +1,136 @@
+import unittest
+import json
+import sys
+import os
+import logging
+from unittest.mock import patch
+
+# Add parent directory to path to import app module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app
+from helpers import save_schedule, load_schedule, check_missing_info, item_questions, get_schedule_repository
+from missing_info import MissingInfoAnalyzer, AnalyzerCache, schedule_version
+
+# User the tests' requests and stored schedules belong to
+USER_ID = 'test-user'
+
+
+class TestMissingInfoAnalyzer(unittest.TestCase):
+    """Unit tests for incremental missing-info analysis."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.schedule = {
+            'meetings': [
+                {'id': 'm-1', 'description': 'CS101 Exam', 'type': 'exam', 'day': 'Tuesday', 'time': 'AMBIGUOUS:9'},
+                {'id': 'm-2', 'description': 'Team sync', 'type': 'meeting', 'time': '14:00', 'duration_minutes': 30}
+            ],
+            'tasks': [
+                {'id': 't-1', 'description': 'Study', 'category': 'preparation', 'related_event': 'CS101 Exam'},
+                {'id': 't-2', 'description': 'Essay', 'category': 'preparation'}
+            ]
+        }
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_matches_full_analysis(self):
+        """Test that the analyzer returns exactly the questions of check_missing_info."""
+        analyzer = MissingInfoAnalyzer(self.schedule)
+        self.assertEqual(analyzer.questions(), check_missing_info(self.schedule))
+
+    def test_refresh_recomputes_changed_items_and_dependents_only(self):
+        """Test that an answer re-analyses the item and its related tasks, nothing else."""
+        analyzer = MissingInfoAnalyzer(self.schedule)
+        meeting = analyzer.model.get('m-1')
+        meeting.set('course_code', 'CS101')
+
+        with patch('missing_info.item_questions', wraps=item_questions) as mock_questions:
+            propagated = analyzer.refresh([meeting])
+        self.assertEqual([call[0][1].get('id') for call in mock_questions.call_args_list], ['m-1', 't-1'])
+
+        # With the exam's course code known, the related task is asked for its own
+        self.assertEqual(propagated, ['t-1'])
+        questions = analyzer.questions()
+        self.assertIn(('course_code', 't-1'), [(q['type'], q['target_id']) for q in questions])
+        self.assertEqual(questions, check_missing_info(analyzer.model.to_dict()))
+
+    def test_question_list_is_cached_per_version(self):
+        """Test that unchanged analyzers do not rebuild the ordered list."""
+        analyzer = MissingInfoAnalyzer(self.schedule)
+        analyzer.questions()
+        with patch('missing_info.order_questions') as mock_order:
+            analyzer.questions()
+            analyzer.refresh([analyzer.model.get('m-2')])  # nothing changed
+            analyzer.questions()
+        mock_order.assert_not_called()
+
+
+class TestAnalyzerCache(unittest.TestCase):
+    """Unit tests for the per-user analyzer cache."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.schedule = {'meetings': [{'id': 'm-1', 'description': 'Exam', 'type': 'exam'}], 'tasks': []}
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_take_and_put(self):
+        """Test hits for the same schedule version and misses once it changed."""
+        cache = AnalyzerCache(max_entries=2)
+        analyzer = cache.take('alice', self.schedule)
+        cache.put('alice', self.schedule, analyzer)
+        self.assertIs(cache.take('alice', json.loads(json.dumps(self.schedule))), analyzer)
+        # take() hands the analyzer over, so a second request builds its own
+        self.assertIsNot(cache.take('alice', self.schedule), analyzer)
+
+        cache.put('alice', self.schedule, analyzer)
+        changed = dict(self.schedule, course_codes=['X'])
+        self.assertNotEqual(schedule_version(changed), schedule_version(self.schedule))
+        self.assertIsNot(cache.take('alice', changed), analyzer)
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+    def test_lru_bound(self):
+        """Test that the least recently used user is evicted."""
+        cache = AnalyzerCache(max_entries=2)
+        analyzers = {}
+        for user in ('a', 'b', 'c'):
+            analyzers[user] = MissingInfoAnalyzer(self.schedule)
+            cache.put(user, self.schedule, analyzers[user])
+        self.assertIsNot(cache.take('a', self.schedule), analyzers['a'])
+        self.assertIs(cache.take('c', self.schedule), analyzers['c'])
+
+
+class TestIncrementalAnswerFlow(unittest.TestCase):
+    """Tests that consecutive answers reuse the cached analyzer."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.client = app.app.test_client()
+        self.client.environ_base['HTTP_X_USER_ID'] = USER_ID
+        app.missing_info_cache.discard()
+        save_schedule({
+            'meetings': [{'id': 'm-1', 'description': 'CS101 Exam', 'type': 'exam', 'day': 'Tuesday'},
+                         {'id': 'm-2', 'description': 'Lab', 'type': 'meeting', 'day': 'Friday'}],
+            'tasks': [{'id': 't-1', 'description': 'Study', 'category': 'preparation', 'related_event': 'CS101 Exam'}],
+            'course_codes': []
+        }, user_id=USER_ID)
+
+    def tearDown(self):
+        get_schedule_repository().backend.clear()
+        app.missing_info_cache.discard()
+        logging.disable(logging.NOTSET)
+
+    def test_second_answer_hits_the_cache(self):
+        """Test that the analyzer saved with one answer serves the next one."""
+        hits = app.missing_info_cache.hits
+        first = self.client.post('/answer-question', json={'item_id': 'm-1', 'type': 'time', 'answer': '14:00'})
+        second = self.client.post('/answer-question', json={'item_id': 'm-1', 'type': 'duration', 'answer': '120'})
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        self.assertEqual(app.missing_info_cache.hits, hits + 1)
+        self.assertEqual(json.loads(second.data)['questions'], check_missing_info(load_schedule(user_id=USER_ID)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import sys
+import os
+import logging
+from unittest.mock import MagicMock
+
+# Add parent directory to path to import app module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prompt_fragments import PromptBuilder, FragmentCache, content_hash
+from schedule_prompts import build_schedule_prompt, get_schedule_prompt, render_preferences
+
+
+class TestPromptBuilder(unittest.TestCase):
+    """Unit tests for cached, versioned prompt fragments."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.calls = []
+
+        def render_items(items):
+            self.calls.append(items)
+            return ''.join(f"- {item}\n" for item in items or [])
+
+        self.builder = PromptBuilder("Intro {{json}}\n{items}\nRules {{x}}: {notes}", {
+            'items': render_items,
+            'notes': lambda notes: notes or 'none'
+        }, FragmentCache(max_entries=2))
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_build(self):
+        """Test that fragments concatenate to the formatted template."""
+        prompt = self.builder.build(items=['a', 'b'], notes='be brief')
+        self.assertEqual(prompt.text, "Intro {json}\n- a\n- b\n\nRules {x}: be brief")
+        self.assertEqual([fragment.name for fragment in prompt.fragments],
+                         ['header', 'items', 'notes_heading', 'notes'])
+        self.assertEqual(prompt.sizes()['items'], 8)
+        self.assertEqual(prompt.static_prefix(), "Intro {json}\n")
+
+    def test_split_system(self):
+        """Test that the header and instructions move to the system prompt and slot headings stay with the data."""
+        system, user = self.builder.build(items=['a'], notes='be brief').split_system()
+        self.assertEqual(system, "Intro {json}")
+        self.assertEqual(user, "- a\n\nRules {x}: be brief")
+
+    def test_fragments_are_rendered_once_per_content(self):
+        """Test that unchanged data reuses the cached text and keeps its version."""
+        first = self.builder.build(items=['a'], notes='x')
+        second = self.builder.build(items=['a'], notes='y')
+        self.assertEqual(self.calls, [['a']])
+        self.assertEqual(first.versions()['items'], second.versions()['items'])
+        self.assertNotEqual(first.versions()['notes'], second.versions()['notes'])
+        self.assertEqual(first.versions()['items'], content_hash(['a']))
+
+    def test_cache_is_bounded_and_reports_metrics(self):
+        """Test LRU eviction and the hit/miss counters."""
+        metrics_dict = {name: MagicMock() for name in ('cache_hits_total', 'cache_misses_total', 'cache_entries')}
+        cache = FragmentCache(max_entries=1, metrics_dict=metrics_dict, service_name='eep1')
+        render = MagicMock(side_effect=lambda value: str(value))
+        cache.render('slot', 1, render)
+        cache.render('slot', 1, render)
+        cache.render('slot', 2, render)
+        cache.render('slot', 1, render)
+        self.assertEqual(render.call_count, 3)
+        metrics_dict['cache_hits_total'].labels.assert_called_with(service='eep1', cache='prompt_fragments')
+        self.assertEqual(metrics_dict['cache_hits_total'].labels.return_value.inc.call_count, 1)
+        self.assertEqual(metrics_dict['cache_misses_total'].labels.return_value.inc.call_count, 3)
+
+    def test_unknown_slot(self):
+        """Test that a template slot without a renderer is rejected."""
+        with self.assertRaises(ValueError):
+            PromptBuilder("{missing}", {})
+
+
+class TestSchedulePrompt(unittest.TestCase):
+    """Tests for the schedule prompt built from fragments."""
+
+    def test_schedule_prompt_fragments(self):
+        """Test the fragments of the schedule prompt and its stable static text."""
+        schedule = {'meetings': [{'id': 'm-1', 'description': 'Exam'}], 'tasks': []}
+        preferences = {'wake_time': '07:00', 'productivity_pattern': 'morning',
+                       'meal_times': {'lunch': '12:30'}, 'learning_style': 'spaced'}
+        prompt = build_schedule_prompt(schedule, preferences, {'Monday': [{'description': 'Gym'}]})
+
+        self.assertEqual(prompt.text, get_schedule_prompt(schedule, preferences, {'Monday': [{'description': 'Gym'}]}))
+        names = [fragment.name for fragment in prompt.fragments]
+        for name in ('header', 'google_calendar', 'meetings', 'tasks', 'preferences', 'instructions'):
+            self.assertIn(name, names)
+        self.assertIn('ID: m-1', prompt.fragments[names.index('meetings')].text)
+        self.assertEqual(prompt.fragments[names.index('tasks')].text, 'No tasks to schedule.')
+
+        other = build_schedule_prompt({'meetings': [], 'tasks': [{'id': 't-1'}]})
+        static = [fragment.text for fragment in prompt.fragments if fragment.static]
+        self.assertEqual(static, [fragment.text for fragment in other.fragments if fragment.static])
+        self.assertGreater(prompt.sizes()['instructions'], 1000)
+
+        system, user = prompt.split_system()
+        self.assertEqual(system, other.split_system()[0])
+        self.assertIn('# OUTPUT FORMAT', system)
+        self.assertIn('ID: m-1', user)
+        self.assertNotIn('# OUTPUT FORMAT', user)
+
+    def test_render_preferences(self):
+        """Test preference labels, meal times and unknown values."""
+        text = render_preferences({'sleep_time': '23:00', 'productivity_pattern': 'morning',
+                                   'meal_times': {'breakfast': '08:00', 'dinner': '19:00'}, 'focus_duration': 'odd'})
+        self.assertEqual(text, "- Daily Schedule:\n  Sleep time: 23:00\n"
+                               "- Productivity: User is most productive during Morning (6am-11am)\n"
+                               "- Meal Times:\n  Breakfast: 08:00\n  Dinner: 19:00\n"
+                               "- Focus Duration: User can maintain deep focus for odd\n")
+        self.assertIn("No specific preferences", render_preferences(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+import logging
+
+# Add parent directory to path to import the rule parser module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rule_parser import RuleParser, parse_line
+
+
+class TestRuleParser(unittest.TestCase):
+    """Unit tests for the rule-based schedule parser."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_parse_meeting_line(self):
+        """Test that a formulaic line becomes a meeting shaped like IEP1's, with its missing fields listed."""
+        match = parse_line("EECE503 exam Monday at 3pm for 2 hours")
+        self.assertEqual(match.kind, 'meetings')
+        self.assertEqual(match.confidence, 1.0)
+        self.assertEqual(match.item, {
+            'description': 'EECE503 exam', 'day': 'Monday', 'priority': 'high', 'time': '15:00',
+            'duration_minutes': 120, 'type': 'exam', 'location': None, 'preparation_tasks': [],
+            'course_code': 'EECE503', 'missing_info': []
+        })
+
+        match = parse_line("- Team meeting wed 2-3:30pm in Room 204")
+        self.assertEqual((match.item['day'], match.item['time'], match.item['duration_minutes'], match.item['location']),
+                         ('Wednesday', '14:00', 90, 'Room 204'))
+        self.assertEqual(parse_line("I have a CS101 exam on Thurs.").item['missing_info'], ['time', 'duration_minutes'])
+
+    def test_parse_task_line_and_confidence(self):
+        """Test task lines, and that ambiguous times and unknown descriptive words lower the confidence."""
+        match = parse_line("Homework 2 due Friday")
+        self.assertEqual(match.kind, 'tasks')
+        self.assertEqual((match.item['description'], match.item['day'], match.item['category']),
+                         ('Homework 2', 'Friday', 'assignment'))
+
+        match = parse_line("Gym session Tuesday at 6")
+        self.assertEqual(match.item['time'], 'AMBIGUOUS:6')
+        self.assertEqual(match.confidence, 0.7)
+
+    def test_lines_left_to_the_llm(self):
+        """Test that lines with unknown words, several items or context words are not parsed locally."""
+        for line in ("Meet John for coffee on Monday",
+                     "another one at 5pm",
+                     "Exams for EECE503 and CMPS303 on Thursday",
+                     "Study for the EECE503 exam on Monday",
+                     "I have a CS101 lecture on Monday at 9am that lasts 1 hour"):
+            self.assertIsNone(parse_line(line), line)
+
+    def test_negated_lines_are_left_to_the_llm(self):
+        """Test that cancelled, moved or negated items are not read as new items, and their paragraph goes whole."""
+        for line in ("No class Monday",
+                     "Cancelled lecture Wednesday at 10am",
+                     "CS101 lecture canceled on Friday",
+                     "Lab moved to Thursday at 2pm",
+                     "Quiz postponed to Tuesday",
+                     "EECE503 exam rescheduled to Monday at 3pm",
+                     "There is not a seminar on Friday"):
+            self.assertIsNone(parse_line(line), line)
+
+        result = RuleParser().parse("CS101 lecture Monday at 10am\nNo class Monday\n\nHomework 2 due Friday")
+        self.assertEqual([match.item['description'] for match in result.matches], ['Homework 2'])
+        self.assertEqual(result.residue, "CS101 lecture Monday at 10am\nNo class Monday")
+
+    def test_bare_day_line_keeps_its_paragraph_together(self):
+        """Test that a line that is only a day name sends its paragraph whole, so its items keep the day."""
+        result = RuleParser().parse("Monday\nEECE503 lecture at 10am\nCHEM201 lab at 2pm for 2 hours\n\n"
+                                    "Tuesday:\n\nGym session at 6pm\n\nHomework 2 due Friday")
+        self.assertEqual([match.item['description'] for match in result.matches], ['Homework 2'])
+        self.assertEqual(result.residue, "Monday\nEECE503 lecture at 10am\nCHEM201 lab at 2pm for 2 hours\n\n"
+                                         "Tuesday:\nGym session at 6pm")
+
+    def test_hybrid_residue_and_metrics(self):
+        """Test that only unparsed lines, and whole paragraphs depending on context, are left to the LLM."""
+        metrics_dict = {'rule_parse_lines_total': MagicMock(), 'rule_parse_latency_saved_seconds': MagicMock()}
+        parser = RuleParser(metrics_dict=metrics_dict, service_name='eep1')
+        result = parser.parse("EECE503 exam Monday at 3pm\nMeet John for coffee\nGym session Tuesday at 6\n\n"
+                              "CS101 exam on Thursday at 1pm\nanother one at 5pm")
+
+        self.assertEqual([match.item['description'] for match in result.matches], ['EECE503 exam'])
+        self.assertEqual(result.residue, "Meet John for coffee\nGym session Tuesday at 6\n\n"
+                                         "CS101 exam on Thursday at 1pm\nanother one at 5pm")
+        self.assertEqual(result.stats(), {'lines': 5, 'local_lines': 1, 'local_share': 0.2, 'confidence': 1.0})
+        metrics_dict['rule_parse_lines_total'].labels.assert_any_call(service='eep1', outcome='llm')
+        metrics_dict['rule_parse_lines_total'].labels.return_value.inc.assert_any_call(4)
+
+        self.assertIsNone(parser.record_saved(result, 0.001))
+        parser.observe_llm(6.0, 3)
+        self.assertAlmostEqual(parser.record_saved(result, 0.001), 1.999)
+        metrics_dict['rule_parse_latency_saved_seconds'].labels.return_value.observe.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+import logging
+import threading
+
+# Add parent directory to path to import the chunking module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from schedule_chunking import ChunkedParser, split_segments, merge_schedules, stable_item_id, halve
+
+SYLLABUS = """EECE503 - Computer Networks
+Lecture Monday at 9am for 75 minutes
+Lab Wednesday at 2pm
+
+CMPS303:
+Quiz Tuesday at 11am
+Homework 2 due Friday
+
+Week 3
+MATH201 midterm Thursday at 5pm for 2 hours"""
+
+
+def meeting(description, day='Monday', time='09:00', course_code=None, **fields):
+    return dict({'description': description, 'day': day, 'time': time, 'course_code': course_code}, **fields)
+
+
+class TestScheduleChunking(unittest.TestCase):
+    """Unit tests for splitting, parsing and merging long schedule texts."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_split_segments_at_paragraphs_and_headings(self):
+        """Test that segments start at paragraph breaks and headings, keeping each heading with its lines."""
+        segments = split_segments(SYLLABUS)
+        self.assertEqual([segment.splitlines()[0] for segment in segments],
+                         ['EECE503 - Computer Networks', 'CMPS303:', 'Week 3'])
+        self.assertEqual(split_segments("Monday:\n\nLecture at 9am\nLab at 2pm"), ["Monday:\nLecture at 9am\nLab at 2pm"])
+
+    def test_chunks_respect_limits_and_keep_headings(self):
+        """Test that short texts are sent whole and long ones are packed into chunks with their headings."""
+        parser = ChunkedParser(max_chars=2000, max_lines=4)
+        self.assertEqual(parser.chunks("Exam Monday at 3pm"), ["Exam Monday at 3pm"])
+        chunks = parser.chunks(SYLLABUS)
+        self.assertEqual(len(chunks), 3)
+        self.assertTrue(all(len(chunk.splitlines()) <= 4 for chunk in chunks))
+        self.assertIn('Lab Wednesday at 2pm', chunks[0])
+
+        long_course = "CMPS303:\n" + "\n".join(f"Homework {n} due Friday" for n in range(1, 7))
+        pieces = ChunkedParser(max_chars=2000, max_lines=4).chunks(long_course)
+        self.assertGreater(len(pieces), 1)
+        self.assertTrue(all(piece.startswith('CMPS303:') for piece in pieces))
+        self.assertIsNone(halve("Homework 1 due Friday"))
+
+    def test_day_names_are_headings_repeated_in_every_piece(self):
+        """Test that a bare day name starts a segment and stays above every piece of a long day."""
+        week = ("Monday\n" + "\n".join(f"EECE{n} lecture at 10am" for n in range(500, 514)) +
+                "\nTuesday\n" + "\n".join(f"CHEM{n} lab at 2pm" for n in range(201, 205)))
+        self.assertEqual([segment.splitlines()[0] for segment in split_segments(week)], ['Monday', 'Tuesday'])
+        chunks = ChunkedParser(max_chars=2000, max_lines=5).chunks(week)
+        for chunk in chunks:
+            day = 'Monday' if 'EECE' in chunk else 'Tuesday'
+            self.assertEqual(chunk.splitlines()[0], day, chunk)
+        self.assertTrue(any('EECE513' in chunk for chunk in chunks))
+
+        # A chunk split inside its second day repeats that day, not only the chunk's first heading
+        self.assertEqual(halve("EECE503:\nMonday\nLecture at 9am\nTuesday\nLab at 2pm\nQuiz at 4pm\nEssay due\nReading due\nProject due"),
+                         ["EECE503:\nMonday\nLecture at 9am\nTuesday\nLab at 2pm",
+                          "EECE503:\nTuesday\nQuiz at 4pm\nEssay due\nReading due\nProject due"])
+        self.assertEqual(halve("Monday\nLecture at 9am\nTuesday\nLab at 2pm"), ["Monday\nLecture at 9am", "Tuesday\nLab at 2pm"])
+
+    def test_merge_deduplicates_and_assigns_stable_ids(self):
+        """Test that repeated items are kept once with the fields of every copy, under content-derived IDs."""
+        first = {'meetings': [meeting('EECE503 Lecture', course_code='EECE503', duration_minutes=None,
+                                      missing_info=['duration_minutes'])],
+                 'tasks': [{'description': 'Homework 2', 'day': 'Friday', 'id': '1'}],
+                 'course_codes': ['EECE503']}
+        second = {'meetings': [meeting('eece503  lecture', course_code='EECE503', duration_minutes=75,
+                                       missing_info=[]),
+                               meeting('CMPS303 Quiz', day='Tuesday', time='11:00', course_code='CMPS303')],
+                  'tasks': [{'description': 'Homework 3', 'day': 'Friday', 'id': '1'}]}
+
+        merged = merge_schedules([first, second])
+        self.assertEqual([item['description'] for item in merged['meetings']], ['EECE503 Lecture', 'CMPS303 Quiz'])
+        self.assertEqual(merged['meetings'][0]['duration_minutes'], 75)
+        self.assertEqual(merged['meetings'][0]['missing_info'], [])
+        self.assertEqual(merged['course_codes'], ['EECE503', 'CMPS303'])
+        self.assertEqual(merged['tasks'][0]['id'], '1')
+        self.assertEqual(merged['tasks'][1]['id'], stable_item_id('tasks', merged['tasks'][1]))
+        self.assertEqual(merged['meetings'][0]['id'], merge_schedules([second, first])['meetings'][0]['id'])
+
+    def test_parse_runs_chunks_concurrently_and_splits_truncated_ones(self):
+        """Test that chunks are parsed in parallel, a truncated chunk is re-sent in halves and results keep text order."""
+        metrics_dict = {'parse_chunks_total': MagicMock()}
+        parser = ChunkedParser(max_chars=2000, max_lines=4, max_workers=3, metrics_dict=metrics_dict, service_name='eep1')
+        first_wave = parser.chunks(SYLLABUS)
+        all_running = threading.Barrier(len(first_wave), timeout=5)
+
+        def parse_chunk(chunk):
+            lines = chunk.splitlines()
+            if chunk in first_wave:
+                all_running.wait()
+            if lines[0] == 'EECE503 - Computer Networks' and len(lines) > 2:
+                return None, None
+            return {'meetings': [meeting(line) for line in lines[1:]], 'tasks': []}, None
+
+        schedule, error = parser.parse(SYLLABUS, parse_chunk)
+        self.assertIsNone(error)
+        self.assertEqual([item['description'] for item in schedule['meetings']],
+                         ['Lecture Monday at 9am for 75 minutes', 'Lab Wednesday at 2pm', 'Quiz Tuesday at 11am',
+                          'Homework 2 due Friday', 'MATH201 midterm Thursday at 5pm for 2 hours'])
+        metrics_dict['parse_chunks_total'].labels.assert_any_call(service='eep1', outcome='split')
+
+    def test_parse_stops_at_first_error(self):
+        """Test that an error from one chunk is returned for the whole text."""
+        parser = ChunkedParser(max_chars=2000, max_lines=4)
+        error = ('IEP1 error: overloaded', 503)
+        self.assertEqual(parser.parse(SYLLABUS, lambda chunk: (None, error)), (None, error))
+        self.assertEqual(parser.parse("Exam", lambda chunk: ({'response': 'text'}, None))[1][1], 502)
+
+
+if __name__ == '__main__':
+    unittest.main()
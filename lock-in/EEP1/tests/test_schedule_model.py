@@ -0,0 +1,210 @@
+import unittest
+import json
+import sys
+import os
+import logging
+
+# Add parent directory to path to import app module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app
+from helpers import save_schedule, load_schedule, check_missing_info, update_schedule_with_answers, get_schedule_repository
+from schedule_model import ScheduleModel, Meeting, Task, CalendarEvent
+
+# User the tests' requests and stored schedules belong to
+USER_ID = 'test-user'
+
+
+class TestScheduleModel(unittest.TestCase):
+    """Unit tests for the typed, indexed schedule model."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.schedule = {
+            'meetings': [
+                {'id': 'm-1', 'description': 'CS101 Exam', 'type': 'exam', 'day': 'Tuesday', 'time': None,
+                 'missing_info': ['time'], 'location': 'Hall B'},
+                {'id': 'm-2', 'description': 'Team sync', 'type': 'meeting'}
+            ],
+            'tasks': [
+                {'id': 't-1', 'description': 'Study for the exam', 'category': 'preparation',
+                 'related_event': 'Final CS101 Exam review'},
+                {'id': 't-2', 'description': 'Slides', 'category': 'preparation', 'related_event': 'Exam'},
+                {'id': 't-3', 'description': 'Team sync', 'related_event': 'Lunch'}
+            ],
+            'course_codes': ['CS101'],
+            'generated_calendar': {'Monday': [{'id': 't-1-part1', 'start_time': '09:00', 'end_time': '10:00'}]}
+        }
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_round_trip(self):
+        """Test that to_dict returns exactly the input, keeping unset and unknown fields apart."""
+        model = ScheduleModel.from_dict(json.dumps(self.schedule))
+        self.assertEqual(model.to_dict(), self.schedule)
+        meeting = model.get('m-1')
+        self.assertIsInstance(meeting, Meeting)
+        self.assertIn('time', meeting)
+        self.assertNotIn('duration_minutes', meeting)
+        self.assertEqual(meeting.extra, {'location': 'Hall B'})
+        self.assertIsInstance(model.calendar['Monday'][0], CalendarEvent)
+
+    def test_input_is_not_modified(self):
+        """Test that changes to the model never reach the source dict."""
+        model = ScheduleModel.from_dict(self.schedule)
+        model.get('m-1').set('time', '10:00')
+        model.get('m-1').resolve_missing('time')
+        self.assertEqual(self.schedule['meetings'][0]['missing_info'], ['time'])
+        self.assertIsNone(self.schedule['meetings'][0]['time'])
+        self.assertNotIn('missing_info', model.to_dict()['meetings'][0])
+
+    def test_indexes(self):
+        """Test the id, description and meeting <-> related task indexes."""
+        model = ScheduleModel.from_dict(self.schedule)
+        self.assertIsInstance(model.get('t-3'), Task)
+        self.assertIsNone(model.get('missing'))
+        self.assertEqual([record.get('id') for record in model.find('Team sync')], ['m-2', 't-3'])
+        self.assertEqual(model.count_meetings('Team sync'), 1)
+        # related_event contains the meeting description, or is contained in it
+        self.assertEqual([task.get('id') for task in model.related_tasks(model.get('m-1'))], ['t-1', 't-2'])
+        self.assertEqual(model.related_tasks(model.get('m-2')), [])
+        self.assertEqual([meeting.get('id') for meeting in model.related_meetings(model.get('t-2'))], ['m-1'])
+
+    def test_links_match_the_substring_rule(self):
+        """Test links where the description and related_event share only part of a word."""
+        model = ScheduleModel.from_dict({
+            'meetings': [{'id': 'm-1', 'description': 'Midterm'}, {'id': 'm-2', 'description': '503'},
+                         {'id': 'm-3', 'description': 'EECE503 Lecture'}],
+            'tasks': [{'id': 't-1', 'related_event': 'Midterms prep'}, {'id': 't-2', 'related_event': 'EECE503 Final'},
+                      {'id': 't-3', 'related_event': 'Lec'}]
+        })
+        self.assertEqual([meeting.get('id') for meeting in model.related_meetings(model.get('t-1'))], ['m-1'])
+        self.assertEqual([meeting.get('id') for meeting in model.related_meetings(model.get('t-2'))], ['m-2'])
+        self.assertEqual([meeting.get('id') for meeting in model.related_meetings(model.get('t-3'))], ['m-3'])
+
+    def test_update_with_answers(self):
+        """Test answers by ID, by description fallback and the course code list."""
+        updated = update_schedule_with_answers(self.schedule, [
+            {'field': 'time', 'value': '10:00', 'type': 'time', 'target_id': 'm-1'},
+            {'field': 'course_code', 'value': 'MGT200', 'type': 'course_code', 'target': 'Team sync'}
+        ])
+        self.assertEqual(updated['meetings'][0]['time'], '10:00')
+        self.assertNotIn('missing_info', updated['meetings'][0])
+        self.assertEqual(updated['meetings'][1]['course_code'], 'MGT200')
+        self.assertEqual(updated['tasks'][2]['course_code'], 'MGT200')
+        self.assertEqual(updated['course_codes'], ['CS101', 'MGT200'])
+
+    def test_large_schedule(self):
+        """Test that a semester-sized schedule links every task to its own meeting."""
+        schedule = {
+            'meetings': [{'id': f'm-{i}', 'description': f'Course {i} Exam', 'type': 'exam'} for i in range(400)],
+            'tasks': [{'id': f't-{i}', 'description': f'Prepare {i}', 'category': 'preparation',
+                       'related_event': f'Course {i} Exam'} for i in range(400)]
+        }
+        model = ScheduleModel.from_dict(schedule)
+        self.assertEqual([task.get('id') for task in model.related_tasks(model.get('m-250'))], ['t-250'])
+        # Tasks whose exam is already asked about get no question of their own
+        questions = check_missing_info(model)
+        course_questions = [q for q in questions if q['type'] == 'course_code']
+        self.assertEqual({q['target_type'] for q in course_questions}, {'meeting'})
+        self.assertEqual(len(course_questions), 400)
+
+
+class TestAnswerQuestionEndpoint(unittest.TestCase):
+    """Tests for /answer-question and /answer-questions on top of the schedule model."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.client = app.app.test_client()
+        self.client.environ_base['HTTP_X_USER_ID'] = USER_ID
+        save_schedule({
+            'meetings': [{'id': 'm-1', 'description': 'CS101 Exam', 'type': 'exam', 'day': 'Tuesday',
+                          'time': '10:00', 'duration_minutes': 120, 'missing_info': ['course_code']}],
+            'tasks': [{'id': 't-1', 'description': 'Study', 'category': 'preparation',
+                       'related_event': 'CS101 Exam', 'missing_info': ['course_code']}],
+            'course_codes': []
+        }, user_id=USER_ID)
+
+    def tearDown(self):
+        get_schedule_repository().backend.clear()
+        logging.disable(logging.NOTSET)
+
+    def test_course_code_propagates_to_related_tasks(self):
+        """Test that a meeting's course code answers its preparation tasks too."""
+        response = self.client.post('/answer-question',
+                                    json={'item_id': 'm-1', 'type': 'course_code', 'answer': 'CS101'})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(data['ready_for_optimization'])
+        task = load_schedule(user_id=USER_ID)['tasks'][0]
+        self.assertEqual(task['course_code'], 'CS101')
+        self.assertNotIn('missing_info', task)
+
+    def test_unknown_item_and_invalid_duration(self):
+        """Test the 404 and 400 responses."""
+        response = self.client.post('/answer-question', json={'item_id': 'x', 'type': 'time', 'answer': '10'})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post('/answer-question', json={'item_id': 'm-1', 'type': 'duration', 'answer': 'long'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_answers_of_the_wrong_type(self):
+        """Test that a non-text day answer or an unknown answer type is a 400, not a server error."""
+        for answer in ({'type': 'day', 'answer': 3}, {'type': 'day', 'answer': ['Monday']},
+                       {'type': 'weather', 'answer': 'sunny'}):
+            response = self.client.post('/answer-question', json=dict(answer, item_id='m-1'))
+            self.assertEqual(response.status_code, 400, answer)
+        response = self.client.post('/answer-questions', json={'answers': [{'item_id': 'm-1', 'type': 'day', 'answer': 3}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Answer 0: Invalid day value', json.loads(response.data)['error'])
+
+    def test_batch_answers_are_applied_together(self):
+        """Test that /answer-questions applies every answer and recomputes questions once."""
+        save_schedule({
+            'meetings': [{'id': 'm-1', 'description': 'CS101 Exam', 'type': 'exam', 'time': 'AMBIGUOUS:9',
+                          'missing_info': ['day', 'duration_minutes', 'course_code']}],
+            'tasks': [{'id': 't-1', 'description': 'Study', 'category': 'preparation', 'related_event': 'CS101 Exam'}],
+            'course_codes': []
+        }, user_id=USER_ID)
+        response = self.client.post('/answer-questions', json={'answers': [
+            {'item_id': 'm-1', 'type': 'day', 'answer': 'tuesday'},
+            {'item_id': 'm-1', 'type': 'ampm', 'answer': 'am', 'original_time': '9'},
+            {'item_id': 'm-1', 'type': 'duration', 'answer': '120'},
+            {'item_id': 'm-1', 'type': 'course_code', 'answer': 'CS101'}
+        ]})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['answered'], 4)
+        self.assertTrue(data['ready_for_optimization'])
+        stored = load_schedule(user_id=USER_ID)
+        meeting = stored['meetings'][0]
+        self.assertEqual((meeting['day'], meeting['time'], meeting['duration_minutes']), ('Tuesday', '09:00', 120))
+        self.assertEqual(stored['tasks'][0]['course_code'], 'CS101')
+        self.assertEqual(stored['course_codes'], ['CS101'])
+
+    def test_batch_answers_are_atomic(self):
+        """Test that one bad answer rejects the batch and leaves the stored schedule unchanged."""
+        before = load_schedule(user_id=USER_ID)
+        response = self.client.post('/answer-questions', json={'answers': [
+            {'item_id': 'm-1', 'type': 'course_code', 'answer': 'CS101'},
+            {'item_id': 'm-1', 'type': 'duration', 'answer': 'two hours'}
+        ]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Answer 1', json.loads(response.data)['error'])
+        self.assertEqual(load_schedule(user_id=USER_ID), before)
+        response = self.client.post('/answer-questions', json={'answers': []})
+        self.assertEqual(response.status_code, 400)
+
+    def test_answers_without_a_stored_schedule(self):
+        """Test that both answer endpoints return 404 when the user has no schedule to answer for."""
+        get_schedule_repository().backend.clear()
+        response = self.client.post('/answer-question', json={'item_id': 'm-1', 'type': 'time', 'answer': '10:00'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(json.loads(response.data)['error'], 'No schedule to answer for')
+        response = self.client.post('/answer-questions', json={'answers': [
+            {'item_id': 'm-1', 'type': 'time', 'answer': '10:00'}
+        ]})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(json.loads(response.data)['error'], 'No schedule to answer for')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,213 @@
+import unittest
+import json
+import sys
+import os
+import time
+import logging
+import tempfile
+import threading
+import socketserver
+from unittest.mock import patch
+
+# Add parent directory to path to import app module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app
+from helpers import save_schedule, load_schedule, get_schedule_repository
+from persistence.schedule_repository import (
+    ScheduleRepository, MemoryBackend, SQLiteBackend, RedisBackend, ScheduleStoreError,
+    create_backend_from_env
+)
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    """Serves the subset of the Redis protocol used by RedisBackend from a dict."""
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2].decode('utf-8'))
+        return args
+
+    def write_bulk(self, value):
+        if value is None:
+            self.wfile.write(b'$-1\r\n')
+        else:
+            data = value.encode('utf-8')
+            self.wfile.write(f'${len(data)}\r\n'.encode() + data + b'\r\n')
+
+    def handle(self):
+        store = self.server.store
+        while True:
+            args = self.read_command()
+            if args is None:
+                break
+            command = args[0].upper()
+            if command == 'SET':
+                store[args[1]] = args[2]
+                self.wfile.write(b'+OK\r\n')
+            elif command == 'GET':
+                self.write_bulk(store.get(args[1]))
+            elif command == 'EVAL':
+                # Only the compare-and-set script is sent
+                key, expected, value = args[3:6]
+                swapped = store.get(key) == expected
+                if swapped:
+                    store[key] = value
+                self.wfile.write(f':{int(swapped)}\r\n'.encode())
+            elif command == 'DEL':
+                removed = sum(1 for key in args[1:] if store.pop(key, None) is not None)
+                self.wfile.write(f':{removed}\r\n'.encode())
+            elif command == 'SCAN':
+                prefix = args[3].rstrip('*')
+                keys = [key for key in store if key.startswith(prefix)]
+                self.wfile.write(f'*2\r\n'.encode())
+                self.write_bulk('0')
+                self.wfile.write(f'*{len(keys)}\r\n'.encode())
+                for key in keys:
+                    self.write_bulk(key)
+            else:
+                self.wfile.write(f'-ERR unknown command {command}\r\n'.encode())
+
+
+class TestScheduleRepository(unittest.TestCase):
+    """Unit tests for the per-user schedule repository and its backends."""
+
+    def setUp(self):
+        """Set up test environment before each test."""
+        logging.disable(logging.CRITICAL)
+        self.schedule_a = {"meetings": [{"id": "m-1", "description": "CS101 Lecture"}], "tasks": [], "course_codes": []}
+        self.schedule_b = {"meetings": [], "tasks": [{"id": "t-1", "description": "Essay"}], "course_codes": []}
+
+    def tearDown(self):
+        """Clean up after each test."""
+        get_schedule_repository().backend.clear()
+        logging.disable(logging.NOTSET)
+
+    def assert_backend_isolates_users(self, backend):
+        repository = ScheduleRepository(backend)
+        repository.save('alice', self.schedule_a)
+        repository.save('bob', self.schedule_b)
+        repository.save('alice', self.schedule_b, is_final=True)
+
+        self.assertEqual(repository.load('alice'), self.schedule_a)
+        self.assertEqual(repository.load('bob'), self.schedule_b)
+        self.assertEqual(repository.load('alice', is_final=True), self.schedule_b)
+        self.assertIsNone(repository.load('bob', is_final=True))
+
+        repository.reset('alice')
+        self.assertIsNone(repository.load('alice'))
+        self.assertIsNone(repository.load('alice', is_final=True))
+        self.assertEqual(repository.load('bob'), self.schedule_b)
+
+        with self.assertRaises(ValueError):
+            repository.save(None, self.schedule_a)
+
+        # compare_and_set only writes over the expected value
+        backend.set('job:1', 'queued')
+        self.assertFalse(backend.compare_and_set('job:1', 'running', 'failed'))
+        self.assertTrue(backend.compare_and_set('job:1', 'queued', 'running'))
+        self.assertEqual(backend.get('job:1'), 'running')
+        self.assertFalse(backend.compare_and_set('job:missing', 'queued', 'running'))
+        self.assertIsNone(backend.get('job:missing'))
+
+    def test_memory_backend(self):
+        """Test per-user isolation with the in-memory backend."""
+        self.assert_backend_isolates_users(MemoryBackend())
+
+    def test_memory_backend_ttl_and_lru(self):
+        """Test TTL expiry and LRU bound of the in-memory backend."""
+        backend = MemoryBackend(ttl_seconds=0.01)
+        backend.set('key', 'value')
+        time.sleep(0.03)
+        self.assertIsNone(backend.get('key'))
+
+        backend = MemoryBackend(max_entries=2)
+        backend.set('a', '1')
+        backend.set('b', '2')
+        backend.get('a')
+        backend.set('c', '3')
+        self.assertEqual(backend.get('a'), '1')
+        self.assertIsNone(backend.get('b'))
+
+    def test_memory_backend_refused_with_several_workers(self):
+        """Test that the memory store is refused when gunicorn runs more than one worker."""
+        with patch.dict(os.environ, {'SCHEDULE_STORE': 'memory', 'GUNICORN_WORKERS': '2'}):
+            with self.assertRaises(ScheduleStoreError):
+                create_backend_from_env()
+        with patch.dict(os.environ, {'SCHEDULE_STORE': 'memory', 'GUNICORN_WORKERS': '1'}):
+            self.assertIsInstance(create_backend_from_env(), MemoryBackend)
+
+    def test_sqlite_backend(self):
+        """Test per-user isolation and cross-instance sharing with the SQLite backend."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'schedules.db')
+            self.assert_backend_isolates_users(SQLiteBackend(path))
+
+            # A second instance (e.g. another worker) sees the same data
+            ScheduleRepository(SQLiteBackend(path)).save('carol', self.schedule_a)
+            self.assertEqual(ScheduleRepository(SQLiteBackend(path)).load('carol'), self.schedule_a)
+
+            expiring = SQLiteBackend(path, ttl_seconds=0.01)
+            expiring.set('key', 'value')
+            time.sleep(0.03)
+            self.assertIsNone(expiring.get('key'))
+
+    def test_redis_backend(self):
+        """Test the Redis protocol adapter against a local stand-in server."""
+        server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), FakeRedisHandler)
+        server.daemon_threads = True
+        server.store = {}
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            port = server.server_address[1]
+            self.assert_backend_isolates_users(RedisBackend(f'redis://127.0.0.1:{port}/0'))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_redis_backend_unavailable(self):
+        """Test that an unreachable Redis server raises ScheduleStoreError."""
+        backend = RedisBackend('redis://127.0.0.1:1/0', timeout=0.2)
+        with self.assertRaises(ScheduleStoreError):
+            backend.get('key')
+
+    def test_helpers_keep_users_separate(self):
+        """Test that save_schedule/load_schedule are keyed by user."""
+        save_schedule(self.schedule_a, user_id='alice')
+        save_schedule(self.schedule_b, user_id='bob')
+        self.assertEqual(load_schedule(user_id='alice')['meetings'][0]['id'], 'm-1')
+        self.assertEqual(load_schedule(user_id='bob')['tasks'][0]['id'], 't-1')
+        self.assertEqual(load_schedule(user_id='carol'), {"meetings": [], "tasks": [], "course_codes": []})
+
+    def test_endpoints_use_user_header(self):
+        """Test that store/get endpoints do not leak schedules between users and require a user id."""
+        client = app.app.test_client()
+        client.post('/store-schedule', json={'schedule': self.schedule_a}, headers={'X-User-ID': 'alice'})
+        save_schedule(self.schedule_a, is_final=True, user_id='alice')
+
+        response = client.get('/get-schedule', headers={'X-User-ID': 'bob'})
+        data = json.loads(response.data)
+        self.assertEqual(data['schedule']['meetings'], [])
+
+        response = client.get('/get-schedule', headers={'X-User-ID': 'alice'})
+        data = json.loads(response.data)
+        self.assertEqual(data['schedule']['meetings'][0]['id'], 'm-1')
+
+        client.post('/reset-stored-schedule', headers={'X-User-ID': 'bob'})
+        self.assertEqual(load_schedule(user_id='alice')['meetings'][0]['id'], 'm-1')
+
+        # Requests that do not identify a user neither share a schedule nor reset anyone's
+        self.assertEqual(client.get('/get-schedule').status_code, 400)
+        self.assertEqual(client.post('/store-schedule', json={'schedule': self.schedule_b}).status_code, 400)
+        self.assertEqual(client.post('/reset-stored-schedule').status_code, 400)
+        self.assertEqual(load_schedule(user_id='alice')['meetings'][0]['id'], 'm-1')
+
+
+if __name__ == '__main__':
+    unittest.main()
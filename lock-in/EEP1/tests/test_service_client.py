@@ -0,0 +1,127 @@
+import unittest
+import json
+import sys
+import os
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock
+
+import requests
+
+# Add parent directory to path to import the client module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from service_client import ServiceClient, ServiceClientRegistry
+
+
+class StubServiceHandler(BaseHTTPRequestHandler):
+    """Keep-alive HTTP handler that fails the first `failures` requests with a 503."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_any(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        with server.lock:
+            server.requests_seen += 1
+            server.ports.add(self.client_address[1])
+            fail = server.failures > 0
+            if fail:
+                server.failures -= 1
+        if fail:
+            self.reply(503, {'error': 'unavailable'})
+        else:
+            self.reply(200, {'path': self.path})
+
+    do_GET = handle_any
+    do_POST = handle_any
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestServiceClient(unittest.TestCase):
+    """Unit tests for the pooled inter-service HTTP client."""
+
+    def setUp(self):
+        """Start a local keep-alive server."""
+        logging.disable(logging.CRITICAL)
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubServiceHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.requests_seen = 0
+        self.server.ports = set()
+        self.server.failures = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def tearDown(self):
+        """Stop the server."""
+        self.server.shutdown()
+        self.server.server_close()
+        logging.disable(logging.NOTSET)
+
+    def test_connection_is_reused(self):
+        """Test that sequential calls share one keep-alive connection."""
+        metrics_dict = {'downstream_connections_total': MagicMock(), 'downstream_request_duration': MagicMock()}
+        client = ServiceClient('iep1', self.base_url, metrics_dict=metrics_dict)
+        for _ in range(5):
+            response = client.post(f'{self.base_url}/predict', json={'prompt': 'hi'})
+            self.assertEqual(response.json()['path'], '/predict')
+        client.close()
+
+        self.assertEqual(len(self.server.ports), 1)
+        results = [c.kwargs['result'] for c in metrics_dict['downstream_connections_total'].labels.call_args_list]
+        self.assertEqual(results, ['new', 'reused', 'reused', 'reused', 'reused'])
+        metrics_dict['downstream_request_duration'].labels.assert_called_with(
+            service='eep1', downstream='iep1', endpoint='/predict'
+        )
+
+    def test_idempotent_request_is_retried(self):
+        """Test that GET requests are retried on 503 responses."""
+        self.server.failures = 2
+        client = ServiceClient('iep3', self.base_url, max_retries=2, backoff_base=0.001)
+        response = client.get('/health')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.server.requests_seen, 3)
+
+    def test_post_is_not_retried_by_default(self):
+        """Test that non-idempotent POSTs are sent only once."""
+        self.server.failures = 1
+        client = ServiceClient('iep2', self.base_url, max_retries=2, backoff_base=0.001)
+        response = client.post('/api/generate', json={})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.server.requests_seen, 1)
+
+        self.server.failures = 1
+        response = client.post('/fetch-calendar', json={}, idempotent=True)
+        self.assertEqual(response.status_code, 200)
+
+    def test_connection_errors_raise_after_retries(self):
+        """Test that an unreachable service surfaces a requests ConnectionError."""
+        client = ServiceClient('iep4', 'http://127.0.0.1:1', max_retries=1, backoff_base=0.001)
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            client.get('/health', timeout=0.5)
+
+    def test_registry_routes_by_base_url(self):
+        """Test that the registry picks the client registered for a URL."""
+        registry = ServiceClientRegistry(pool_size=2, max_retries=0)
+        registry.register('iep1', self.base_url, timeouts={'/health': 5})
+        self.assertEqual(registry.client_for(f'{self.base_url}/predict').name, 'iep1')
+        self.assertEqual(registry.client_for('http://example.invalid/x').name, 'other')
+        self.assertEqual(registry.get(f'{self.base_url}/health').status_code, 200)
+        registry.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+import unittest
+import json
+import sys
+import os
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+# Add parent directory to path to import app module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app
+from helpers import load_schedule, get_schedule_repository
+from streaming import IncrementalCalendarParser, IncompleteStreamError, iter_sse_events, iter_anthropic_text, format_sse
+
+CALENDAR_TEXT = (
+    'Here is your schedule:\n```json\n{"generated_calendar": {'
+    '"Monday": [{"id": "m-1", "type": "meeting", "description": "CS101 [Lecture]", '
+    '"start_time": "09:00", "end_time": "10:00", "notes": "bring \\"notes\\" {draft}"}], '
+    '"Tuesday": [], '
+    '"Wednesday": [{"id": "t-1", "type": "task", "description": "Essay", '
+    '"start_time": "13:00", "end_time": "15:00", "duration": 120}]}}\n```'
+)
+
+
+def anthropic_sse_body(text, chunk_size=17):
+    """Build an Anthropic Messages SSE stream that delivers text in small deltas."""
+    events = [format_sse('message_start', {'type': 'message_start', 'message': {'usage': {'input_tokens': 10}}})]
+    for i in range(0, len(text), chunk_size):
+        events.append(format_sse('content_block_delta', {
+            'type': 'content_block_delta', 'index': 0,
+            'delta': {'type': 'text_delta', 'text': text[i:i + chunk_size]}
+        }))
+    events.append(format_sse('message_delta', {'type': 'message_delta', 'usage': {'output_tokens': 42}}))
+    events.append(format_sse('message_stop', {'type': 'message_stop'}))
+    return ''.join(events)
+
+
+class FakeSSEHandler(BaseHTTPRequestHandler):
+    """Stands in for IEP2 and streams a canned Anthropic SSE body."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.server.last_request = json.loads(self.rfile.read(length) or b'{}')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for line in self.server.body.splitlines(keepends=True):
+            self.wfile.write(line.encode('utf-8'))
+            self.wfile.flush()
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestStreaming(unittest.TestCase):
+    """Unit tests for SSE parsing, the incremental calendar parser and the streaming endpoint."""
+
+    def setUp(self):
+        """Set up test environment before each test."""
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        """Clean up after each test."""
+        get_schedule_repository().backend.clear()
+        logging.disable(logging.NOTSET)
+
+    def test_parser_emits_each_day_once_complete(self):
+        """Test that days are emitted as soon as their arrays close, regardless of chunking."""
+        for chunk_size in (1, 7, len(CALENDAR_TEXT)):
+            parser = IncrementalCalendarParser()
+            completed = []
+            for i in range(0, len(CALENDAR_TEXT), chunk_size):
+                completed.extend(parser.feed(CALENDAR_TEXT[i:i + chunk_size]))
+
+            self.assertEqual([day for day, _ in completed], ['Monday', 'Tuesday', 'Wednesday'])
+            self.assertEqual(parser.calendar['Monday'][0]['notes'], 'bring "notes" {draft}')
+            self.assertEqual(parser.calendar['Tuesday'], [])
+
+    def test_parser_emits_before_end_of_text(self):
+        """Test that Monday is available before the rest of the calendar arrives."""
+        parser = IncrementalCalendarParser()
+        cut = CALENDAR_TEXT.index('"Tuesday"')
+        completed = parser.feed(CALENDAR_TEXT[:cut])
+        self.assertEqual([day for day, _ in completed], ['Monday'])
+
+    def test_parser_handles_bare_day_object(self):
+        """Test a response without the generated_calendar wrapper."""
+        parser = IncrementalCalendarParser()
+        parser.feed('{"Friday": [{"id": "x", "tags": ["a", "b"]}]}')
+        self.assertEqual(parser.calendar['Friday'][0]['tags'], ['a', 'b'])
+
+    def test_sse_event_parsing(self):
+        """Test grouping of SSE lines and extraction of Anthropic text deltas."""
+        lines = anthropic_sse_body('{"a": 1}', chunk_size=3).splitlines()
+        events = list(iter_sse_events(lines))
+        self.assertEqual(events[0][0], 'message_start')
+        self.assertEqual(''.join(iter_anthropic_text(events)), '{"a": 1}')
+
+        with self.assertRaises(RuntimeError):
+            list(iter_anthropic_text([('error', {'type': 'error', 'error': {'message': 'overloaded'}})]))
+
+    def stream_schedule(self, body, schedule):
+        """POST a streamed generation against a fake IEP2 serving body; returns (server, events)."""
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FakeSSEHandler)
+        server.daemon_threads = True
+        server.body = body
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            with patch('app.IEP2_URL', f'http://127.0.0.1:{server.server_address[1]}'), \
+                 patch('app.check_missing_info', return_value=[]):
+                client = app.app.test_client()
+                response = client.post('/generate-optimized-schedule',
+                                       json={'schedule': schedule, 'stream': True},
+                                       headers={'X-User-ID': 'alice'})
+                self.assertEqual(response.mimetype, 'text/event-stream')
+                events = list(iter_sse_events(response.get_data(as_text=True).splitlines()))
+        finally:
+            server.shutdown()
+            server.server_close()
+        return server, events
+
+    def test_generate_optimized_schedule_stream(self):
+        """Test the streaming endpoint end to end against a fake SSE server."""
+        schedule = {
+            'meetings': [{'id': 'm-1', 'type': 'meeting', 'description': 'CS101 Lecture',
+                          'day': 'Monday', 'start_time': '09:00', 'end_time': '10:00'}],
+            'tasks': [],
+            'course_codes': []
+        }
+        server, events = self.stream_schedule(anthropic_sse_body(CALENDAR_TEXT), schedule)
+
+        self.assertTrue(server.last_request['stream'])
+        # The template instructions go in the system prompt, the user's data in the prompt
+        self.assertIn('# OUTPUT FORMAT', server.last_request['system'])
+        self.assertIn('CS101 Lecture', server.last_request['prompt'])
+        self.assertNotIn('# OUTPUT FORMAT', server.last_request['prompt'])
+        names = [event for event, _ in events]
+        self.assertEqual(names, ['status', 'day', 'day', 'day', 'complete'])
+        self.assertEqual(events[1][1]['day'], 'Monday')
+        final = events[-1][1]
+        self.assertEqual(set(final['generated_calendar']), {'Monday', 'Tuesday', 'Wednesday'})
+        self.assertEqual(load_schedule(is_final=True, user_id='alice')['generated_calendar'], final['generated_calendar'])
+
+    def test_incomplete_stream_is_not_saved(self):
+        """Test that a stream cut short, or missing a day with a fixed meeting, ends with an error event."""
+        body = anthropic_sse_body(CALENDAR_TEXT)
+        truncated = body[:body.index('event: message_stop')]
+        schedule = {
+            'meetings': [{'id': 'f-1', 'type': 'meeting', 'description': 'CS101 Lab',
+                          'day': 'Friday', 'time': '14:00', 'duration_minutes': 60}],
+            'tasks': [],
+            'course_codes': []
+        }
+        for stream_body in (truncated, body):
+            _, events = self.stream_schedule(stream_body, schedule)
+            self.assertEqual(events[-1][0], 'error')
+            self.assertNotIn('generated_calendar', load_schedule(is_final=True, user_id='alice'))
+        self.assertIn('Friday', events[-1][1]['error'])
+
+        with self.assertRaises(IncompleteStreamError):
+            list(iter_anthropic_text(iter_sse_events(truncated.splitlines())))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,251 @@
+"""
+Content-addressed cache for LLM responses in IEP1.
+Responses are keyed on a hash of (model, system message, prompt, temperature)
+and kept in a bounded in-memory LRU, optionally backed by a SQLite file so
+entries survive restarts and are shared between gunicorn workers.
+"""
+
+import os
+import time
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAME = 'llm_response'
+
+
+def make_cache_key(model, system_message, prompt, temperature):
+    """Return a stable SHA-256 key for one chat completion request."""
+    payload = json.dumps(
+        {'model': model, 'system': system_message, 'prompt': prompt, 'temperature': temperature},
+        sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def cache_bypassed(headers):
+    """
+    Return True when the caller opted out of the cache with
+    `Cache-Control: no-cache` / `no-store` or `X-LLM-Cache: bypass`.
+    """
+    cache_control = headers.get('Cache-Control', '').lower()
+    if 'no-cache' in cache_control or 'no-store' in cache_control:
+        return True
+    return headers.get('X-LLM-Cache', '').lower() == 'bypass'
+
+
+class LLMResponseCache:
+    """
+    Two-tier response cache: an in-memory LRU bounded by entry count and total
+    bytes, plus an optional SQLite tier bounded by entry count.
+
+    Args:
+        max_entries: Maximum number of responses kept in memory
+        max_bytes: Maximum total size of the in-memory responses
+        ttl_seconds: Time after which an entry expires (None for no expiry)
+        disk_path: Path of the SQLite file for the on-disk tier (None to disable)
+        max_disk_entries: Maximum number of responses kept on disk
+        metrics_dict: Optional metrics dictionary returned by setup_metrics
+        service_name: Service label for metrics
+    """
+
+    def __init__(self, max_entries=512, max_bytes=16 * 1024 * 1024, ttl_seconds=24 * 3600,
+                 disk_path=None, max_disk_entries=10000, metrics_dict=None, service_name='iep1'):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self.metrics_dict = metrics_dict
+        self.service_name = service_name
+        self._entries = OrderedDict()  # key -> (expires_at or None, value)
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+        self._disk = None
+        if disk_path:
+            self._open_disk(disk_path)
+
+    def get(self, key):
+        """Return the cached response text, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is not None and entry[0] <= now:
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._record(hit=True, value=entry[1])
+                return entry[1]
+
+            value = self._disk_get(key, now)
+            if value is not None:
+                # Promote to memory so the next lookup skips SQLite
+                self._store(key, value, self._expiry(now))
+                self._record(hit=True, value=value)
+                return value
+
+            self._record(hit=False)
+            return None
+
+    def set(self, key, value):
+        expires_at = self._expiry(time.time())
+        with self._lock:
+            self._store(key, value, expires_at)
+            self._disk_set(key, value, expires_at)
+            self._update_entries_gauge()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM llm_cache")
+                self._disk.commit()
+            self._update_entries_gauge()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': self._hits / lookups if lookups else 0.0
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+    # -------------------------------
+    # Memory tier
+    # -------------------------------
+
+    def _expiry(self, now):
+        return now + self.ttl_seconds if self.ttl_seconds else None
+
+    def _store(self, key, value, expires_at):
+        if key in self._entries:
+            self._remove(key)
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (expires_at, value)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    def _remove(self, key):
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value.encode('utf-8'))
+
+    # -------------------------------
+    # Disk tier
+    # -------------------------------
+
+    def _open_disk(self, path):
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._disk = sqlite3.connect(path, check_same_thread=False, timeout=10)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, last_access REAL NOT NULL)"
+            )
+            self._disk.commit()
+            logger.info(f"LLM response cache persisted to {path}")
+        except sqlite3.Error as e:
+            logger.warning(f"Could not open LLM cache file {path}, using memory only: {str(e)}")
+            self._disk = None
+
+    def _disk_get(self, key, now):
+        if self._disk is None:
+            return None
+        try:
+            row = self._disk.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] <= now:
+                self._disk.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._disk.commit()
+                return None
+            self._disk.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._disk.commit()
+            return row[0]
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache read failed: {str(e)}")
+            return None
+
+    def _disk_set(self, key, value, expires_at):
+        if self._disk is None:
+            return
+        try:
+            self._disk.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, time.time())
+            )
+            self._disk.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,)
+            )
+            self._disk.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache write failed: {str(e)}")
+
+    # -------------------------------
+    # Metrics
+    # -------------------------------
+
+    def _record(self, hit, value=None):
+        if hit:
+            self._hits += 1
+        else:
+            self._misses += 1
+        if not self.metrics_dict:
+            return
+        labels = {'service': self.service_name, 'cache': CACHE_NAME}
+        if hit:
+            self.metrics_dict['cache_hits_total'].labels(**labels).inc()
+            if 'cache_bytes_saved_total' in self.metrics_dict:
+                self.metrics_dict['cache_bytes_saved_total'].labels(**labels).inc(len(value.encode('utf-8')))
+        else:
+            self.metrics_dict['cache_misses_total'].labels(**labels).inc()
+        if 'cache_hit_ratio' in self.metrics_dict:
+            self.metrics_dict['cache_hit_ratio'].labels(**labels).set(self._hits / (self._hits + self._misses))
+
+    def _update_entries_gauge(self):
+        if self.metrics_dict:
+            self.metrics_dict['cache_entries'].labels(service=self.service_name, cache=CACHE_NAME).set(len(self._entries))
+
+
+def create_cache_from_env(metrics_dict=None, service_name='iep1'):
+    """
+    Build the response cache from LLM_CACHE_* environment variables.
+    Returns None when LLM_CACHE_ENABLED is false.
+    """
+    if os.getenv('LLM_CACHE_ENABLED', 'true').lower() in ('0', 'false', 'no'):
+        logger.info("LLM response cache disabled")
+        return None
+    ttl_seconds = float(os.getenv('LLM_CACHE_TTL', str(24 * 3600))) or None
+    return LLMResponseCache(
+        max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', '512')),
+        max_bytes=int(os.getenv('LLM_CACHE_MAX_BYTES', str(16 * 1024 * 1024))),
+        ttl_seconds=ttl_seconds,
+        disk_path=os.getenv('LLM_CACHE_PATH') or None,
+        max_disk_entries=int(os.getenv('LLM_CACHE_MAX_DISK_ENTRIES', '10000')),
+        metrics_dict=metrics_dict,
+        service_name=service_name
+    )
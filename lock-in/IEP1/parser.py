@@ -9,10 +9,18 @@ import traceback
 import sys
 import psutil
 import time
+from types import SimpleNamespace
 
 # Add metrics helper to path
 sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from metrics_helper import setup_metrics, track_llm_request
+from llm_cache import create_cache_from_env, make_cache_key, cache_bypassed
+from json_repair import extract_json, AUTO_CLOSED
+from llm_usage import create_usage_recorder_from_env, usage_attribution, usage_summary
+from health import create_call_health_from_env, llm_service_health, is_upstream_failure
+from single_flight import create_single_flight_from_env
+from model_router import create_router_from_env, routing_hints
+from hedging import create_hedger_from_env
 
 # ----------------------------------------------
 # Initialization and Setup
@@ -42,6 +50,110 @@ else:
 client = OpenAI(api_key=api_key)
 logger.debug("OpenAI client configured")
 
+# Model settings for /predict; all of them are part of the cache key. MODEL is
+# the strong model; small parses go to FAST_MODEL (see model_router.py)
+MODEL = os.getenv('LLM_MODEL', 'gpt-3.5-turbo')
+FAST_MODEL = os.getenv('LLM_FAST_MODEL', 'gpt-4o-mini')
+SYSTEM_MESSAGE = "You are a helpful assistant that outputs only valid JSON."
+TEMPERATURE = 0.7
+
+# Content-addressed cache of OpenAI responses (None when disabled)
+response_cache = create_cache_from_env(metrics_dict, 'iep1')
+
+# Token and cost accounting from the OpenAI usage blocks
+usage_recorder = create_usage_recorder_from_env('iep1', metrics_dict)
+
+# OpenAI health derived from the outcome of real /predict calls
+llm_health = create_call_health_from_env()
+
+# Identical concurrent /predict calls share one OpenAI completion (None when disabled)
+predict_flights = create_single_flight_from_env('predict', metrics_dict, 'iep1')
+
+# Picks the model of each /predict call from its size, the user tier and recent latencies
+model_router = create_router_from_env('iep1', MODEL, FAST_MODEL, metrics_dict)
+logger.info(f"Using models: {model_router.describe()}")
+
+# Optional backup completion when /predict is slower than its recent tail latency
+llm_hedger = create_hedger_from_env('iep1', metrics_dict)
+
+def routing_task(feature):
+    """Routing task of a /predict call: EEP1's fallback parse of an LLM response, or a schedule parse."""
+    return 'parse_fallback' if feature == 'parse_fallback' else 'parse'
+
+def request_completion(prompt, user_id=None, feature=None, model=None, cancelled=None):
+    """
+    Call OpenAI for /predict and return the message content, or None when there are no choices.
+    cancelled is the cancel event of a hedged call: the completion is then
+    streamed and closed (returning None) as soon as the other call won.
+    """
+    model = model or MODEL
+    logger.debug(f"Calling OpenAI API with model {model}...")
+    llm_start = time.time()
+    try:
+        with track_llm_request(metrics_dict, 'openai', model):
+            messages = [
+                {"role": "system", "content": SYSTEM_MESSAGE},
+                {"role": "user", "content": prompt}
+            ]
+            if cancelled is None:
+                response = client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=TEMPERATURE,
+                    max_tokens=2000
+                )
+            else:
+                response = read_completion_stream(client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=TEMPERATURE,
+                    max_tokens=2000,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                ), cancelled)
+                if response is None:
+                    logger.info(f"Stopped a hedged {model} completion that lost")
+                    return None
+    except Exception as e:
+        # OpenAI API errors carry the HTTP status; a rejected request (e.g. a 400)
+        # says nothing about the provider, while errors without one are connection failures
+        status_code = getattr(e, 'status_code', None)
+        llm_health.record(isinstance(status_code, int) and not is_upstream_failure(status_code),
+                          time.time() - llm_start, e)
+        raise
+    llm_health.record(True, time.time() - llm_start)
+    model_router.observe(routing_task(feature), model, time.time() - llm_start)
+    usage_recorder.record('openai', model, getattr(response, 'usage', None), endpoint='/predict',
+                          user_id=user_id, feature=feature, latency=time.time() - llm_start)
+
+    logger.debug(f"OpenAI response type: {type(response)}")
+    logger.debug(f"OpenAI response: {response}")
+    if not response.choices or len(response.choices) == 0:
+        return None
+    return response.choices[0].message.content
+
+def read_completion_stream(stream, cancelled):
+    """
+    Read a streamed chat completion into an object shaped like the
+    non-streamed one (choices[0].message.content and usage). Closes the
+    stream and returns None once cancelled is set.
+    """
+    parts = []
+    usage = None
+    has_choices = False
+    try:
+        for chunk in stream:
+            if cancelled.is_set():
+                return None
+            usage = getattr(chunk, 'usage', None) or usage
+            if chunk.choices:
+                has_choices = True
+                parts.append(chunk.choices[0].delta.content or '')
+    finally:
+        stream.close()
+    message = SimpleNamespace(content=''.join(parts))
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)] if has_choices else [], usage=usage)
+
 # Periodically update system metrics
 @app.before_request
 def update_system_metrics():
@@ -72,49 +184,69 @@ def predict():
             metrics_dict['api_errors_total'].labels(method='POST', endpoint='/predict', error_type='api_key_missing').inc()
             return jsonify({"error": "OpenAI API key is not configured"}), status_code
             
-        # Call OpenAI API
-        logger.debug("Calling OpenAI API...")
+        # Small parses go to the fast model
+        user_id, feature = usage_attribution(request.headers)
+        size, tier = routing_hints(request.headers)
+        model, _ = model_router.route(routing_task(feature), size=size, tier=tier)
+
+        # Serve repeated prompts from the cache unless the caller opted out
+        use_cache = response_cache is not None and not cache_bypassed(request.headers)
+        cache_key = make_cache_key(model, SYSTEM_MESSAGE, data['prompt'], TEMPERATURE)
+        content = response_cache.get(cache_key) if use_cache else None
+        cache_status = 'HIT' if content is not None else ('MISS' if use_cache else 'BYPASS')
+
         try:
-            model = "gpt-3.5-turbo"
-            with track_llm_request(metrics_dict, 'openai', model) as tracker:
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=[
-                        {"role": "system", "content": "You are a helpful assistant that outputs only valid JSON."},
-                        {"role": "user", "content": data['prompt']}
-                    ],
-                    temperature=0.7,
-                    max_tokens=2000
-                )
-                
-                # Estimate token usage
-                prompt_tokens = len(data['prompt']) / 4  # Rough estimate
-                response_tokens = len(response.choices[0].message.content) / 4  # Rough estimate
-                tracker.record_tokens(input_tokens=prompt_tokens, output_tokens=response_tokens)
-                
-            logger.debug(f"OpenAI response type: {type(response)}")
-            logger.debug(f"OpenAI response: {response}")
-            
-            if not response.choices or len(response.choices) == 0:
-                logger.error("No choices in OpenAI response")
-                status_code = 500
-                metrics_dict['api_errors_total'].labels(method='POST', endpoint='/predict', error_type='empty_response').inc()
-                return jsonify({"error": "No response from OpenAI"}), status_code
-                
-            # Return the raw response from OpenAI
-            content = response.choices[0].message.content
-            logger.debug(f"Response content: {content}")
+            flight_role = None
+            if content is None:
+                # Call OpenAI API, sharing the completion with identical requests in flight
+                complete = lambda: llm_hedger.call(
+                    routing_task(feature), model,
+                    lambda hedge_model, cancelled: request_completion(data['prompt'], user_id, feature, hedge_model,
+                                                                      cancelled),
+                    valid=lambda content: content is not None,
+                    size=size
+                )[0]
+                if predict_flights is not None and not cache_bypassed(request.headers):
+                    # Only valid JSON stays shareable after the call, so a bad completion can be retried
+                    content, flight_role = predict_flights.do(
+                        cache_key, complete, shareable=lambda content: content is not None and extract_json(content) is not None
+                    )
+                else:
+                    content = complete()
+
+                if content is None:
+                    logger.error("No choices in OpenAI response")
+                    status_code = 500
+                    metrics_dict['api_errors_total'].labels(method='POST', endpoint='/predict', error_type='empty_response').inc()
+                    return jsonify({"error": "No response from OpenAI"}), status_code
+                logger.debug(f"Response content: {content}")
+            else:
+                logger.debug("Serving /predict response from cache")
             
-            # Try to parse the content as JSON to validate it
-            try:
-                parsed_json = json.loads(content)
-                # If it's valid JSON, return it as an object
-                return jsonify(parsed_json)
-            except json.JSONDecodeError as e:
-                logger.warning(f"OpenAI response is not valid JSON: {e}")
+            # Parse the content as JSON, repairing fences, trailing commas and truncation locally
+            extraction = extract_json(content, metrics_dict=metrics_dict, service_name='iep1')
+            if extraction is None:
+                logger.warning("OpenAI response is not valid JSON")
                 metrics_dict['api_errors_total'].labels(method='POST', endpoint='/predict', error_type='invalid_json').inc()
-                # If it's not valid JSON, wrap it in a response object
+                # If it's not valid JSON, wrap it in a response object (not cached)
                 return jsonify({"response": content, "warning": "Response was not valid JSON"})
+            parsed_json = extraction.value
+            # Closing brackets left open means the completion ran out of tokens
+            truncated = AUTO_CLOSED in extraction.repairs
+            if truncated:
+                logger.warning("OpenAI response was truncated")
+
+            # Only valid, complete JSON is cached (in its repaired form), so a bad completion can be retried
+            if use_cache and cache_status == 'MISS' and not truncated:
+                response_cache.set(cache_key, content if not extraction.repaired else json.dumps(parsed_json))
+            result = jsonify(parsed_json)
+            result.headers['X-Cache'] = cache_status
+            result.headers['X-LLM-Model'] = model
+            if truncated:
+                result.headers['X-LLM-Truncated'] = 'true'
+            if flight_role:
+                result.headers['X-Single-Flight'] = flight_role
+            return result
             
         except Exception as e:
             error_stack = traceback.format_exc()
@@ -138,43 +270,50 @@ def predict():
         metrics_dict['api_requests_total'].labels(method='POST', endpoint='/predict', status=status_code).inc()
 
 # ----------------------------------------------
-# Health Check Endpoint
+# Health Check Endpoints
 # ----------------------------------------------
 
+def evaluate_health():
+    """Health from the configuration and recent /predict calls; never calls OpenAI."""
+    config_error = None if api_key else "OPENAI_API_KEY environment variable not set"
+    return llm_service_health(llm_health, config_error, model=MODEL, routing=model_router.describe())
+
+@app.route('/health/live', methods=['GET'])
+def liveness_endpoint():
+    return jsonify({"status": "alive"}), 200
+
+@app.route('/health/ready', methods=['GET'])
+def readiness_endpoint():
+    body, healthy = evaluate_health()
+    return jsonify(body), 200 if healthy else 503
+
 @app.route('/health', methods=['GET'])
 def health_endpoint():
     start_time = time.time()
     status_code = 200
     try:
-        if not api_key:
+        body, healthy = evaluate_health()
+        if not healthy:
             status_code = 500
-            metrics_dict['api_errors_total'].labels(method='GET', endpoint='/health', error_type='api_key_missing').inc()
-            return jsonify({"status": "unhealthy", "error": "OPENAI_API_KEY environment variable not set"}), status_code
-            
-        # Simple test completion to check API connectivity
-        with track_llm_request(metrics_dict, 'openai', 'gpt-3.5-turbo') as tracker:
-            client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": "test"}],
-                max_tokens=1
-            )
-            # Estimate token usage (minimal for health check)
-            tracker.record_tokens(input_tokens=1, output_tokens=1)
-            
-        return jsonify({"status": "healthy", "model": "gpt-3.5-turbo", "openai_status": "connected"}), status_code
-    except Exception as e:
-        error_stack = traceback.format_exc()
-        logger.error(f"OpenAI connection error: {str(e)}")
-        logger.error(f"Stack trace: {error_stack}")
-        status_code = 500
-        metrics_dict['api_errors_total'].labels(method='GET', endpoint='/health', error_type='openai_connection_error').inc()
-        return jsonify({"status": "unhealthy", "error": f"OpenAI connection error: {str(e)}", "openai_status": "disconnected"}), status_code
+            error_type = 'api_key_missing' if not api_key else 'openai_unhealthy'
+            metrics_dict['api_errors_total'].labels(method='GET', endpoint='/health', error_type=error_type).inc()
+        return jsonify(body), status_code
     finally:
         # Record request metrics
         duration = time.time() - start_time
         metrics_dict['api_request_duration'].labels(method='GET', endpoint='/health').observe(duration)
         metrics_dict['api_requests_total'].labels(method='GET', endpoint='/health', status=status_code).inc()
 
+# ----------------------------------------------
+# Usage Ledger Endpoint
+# ----------------------------------------------
+
+@app.route('/usage', methods=['GET'])
+def usage_endpoint():
+    """Token and cost totals of OpenAI calls, grouped by user_id, feature, endpoint or model."""
+    body, status_code = usage_summary(usage_recorder, request.args)
+    return jsonify(body), status_code
+
 # ----------------------------------------------
 # Metrics Endpoint (automatically added by PrometheusMetrics)
 # ----------------------------------------------
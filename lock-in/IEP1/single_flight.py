@@ -0,0 +1,385 @@
+"""
+Single-flight coalescing of identical concurrent LLM calls.
+
+Requests are keyed on a hash of the normalized request. The first caller
+(the leader) makes the upstream call; identical callers arriving while it is
+in flight (followers) wait for it and share its result, and successful
+results stay shareable for a short coalescing window after the call ends.
+Streamed calls are shared chunk by chunk as the leader relays them.
+
+Coalescing is per process. With a shared store (FileFlightStore on a volume
+mounted into every replica), replicas also elect a single leader per key for
+non-streamed calls and share completed results within the window.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+LEADER = 'leader'
+FOLLOWER = 'follower'
+SHARED = 'shared'      # served from a result completed within the window
+REMOTE = 'remote'      # served from the result of another replica
+FALLBACK = 'fallback'  # waited too long for the leader and made its own call
+
+
+def request_fingerprint(**request):
+    """SHA-256 of a request, with prompt line endings and surrounding whitespace normalized."""
+    normalized = {
+        name: value.replace('\r\n', '\n').strip() if isinstance(value, str) else value
+        for name, value in request.items()
+    }
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def flight_bypassed(headers):
+    """Return True when the caller asked for its own upstream call with `Cache-Control: no-cache` / `no-store`."""
+    cache_control = headers.get('Cache-Control', '').lower()
+    return 'no-cache' in cache_control or 'no-store' in cache_control
+
+
+class FlightError(Exception):
+    """The leader of a shared call failed or disconnected before finishing."""
+
+
+class Flight:
+    """One upstream call shared by its leader and followers."""
+
+    def __init__(self, key):
+        self.key = key
+        self.value = None
+        self.error = None
+        self.chunks = []
+        self.done = False
+        self.shareable = False
+        self.finished_at = None
+        self._cond = threading.Condition()
+
+    def publish(self, chunk):
+        """Append a chunk of a streamed result and wake the followers."""
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, value=None, error=None, shareable=True):
+        with self._cond:
+            self.value = value
+            self.error = error
+            self.shareable = shareable and error is None
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._cond.notify_all()
+
+    def wait(self, timeout):
+        """Wait for the leader to finish; False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.done, timeout=timeout)
+
+    def follow(self, timeout):
+        """
+        Yield the streamed chunks as the leader publishes them. Raises
+        FlightError if the leader fails or publishes nothing for timeout seconds.
+        """
+        index = 0
+        while True:
+            with self._cond:
+                if not self._cond.wait_for(lambda: index < len(self.chunks) or self.done, timeout=timeout):
+                    raise FlightError("Timed out waiting for the shared call")
+                chunks = self.chunks[index:]
+                done, error = self.done, self.error
+            index += len(chunks)
+            for chunk in chunks:
+                yield chunk
+            if done and index >= len(self.chunks):
+                if error is not None:
+                    raise FlightError(str(error))
+                return
+
+
+# ===============================
+# Shared store
+# ===============================
+
+class FileFlightStore:
+    """
+    Shared store stand-in on a directory visible to every replica. Leases are
+    created atomically (O_EXCL) and results are written with an atomic rename,
+    so a store speaking SET NX with expiry (e.g. Redis) can replace it behind
+    the same methods.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def claim(self, key, ttl):
+        """Take the lease on key for ttl seconds; False while another caller holds it."""
+        path = self._path(key, 'lease')
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not self._expired(path, ttl):
+                    return False
+                self._remove(path)  # the leader died without releasing the lease
+                continue
+            os.close(fd)
+            return True
+        return False
+
+    def release(self, key):
+        self._remove(self._path(key, 'lease'))
+
+    def get_result(self, key):
+        path = self._path(key, 'result')
+        try:
+            with open(path, encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('expires_at', 0) <= time.time():
+            self._remove(path)
+            return None
+        return entry.get('value')
+
+    def set_result(self, key, value, ttl):
+        path = self._path(key, 'result')
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'expires_at': time.time() + ttl, 'value': value}, f)
+        os.replace(temp_path, path)
+
+    def _path(self, key, kind):
+        return os.path.join(self.directory, f"{key}.{kind}")
+
+    @staticmethod
+    def _expired(path, ttl):
+        try:
+            return time.time() - os.path.getmtime(path) > ttl
+        except OSError:
+            return False
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# ===============================
+# Coalescing
+# ===============================
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls.
+
+    Args:
+        name: Label of the coalesced call in metrics (e.g. 'predict')
+        window: Seconds a successful result stays shareable after the call ends
+        wait_timeout: Longest time a follower waits for the leader before making its own call
+        store: Optional shared store (see FileFlightStore) for coalescing across replicas
+        poll_interval: Seconds between two store lookups while another replica leads
+        metrics_dict: Optional metrics dictionary returned by setup_metrics
+        service_name: Service label for metrics
+    """
+
+    def __init__(self, name, window=10.0, wait_timeout=120.0, store=None, poll_interval=0.25,
+                 metrics_dict=None, service_name=None):
+        self.name = name
+        self.window = window
+        self.wait_timeout = wait_timeout
+        self.store = store
+        self.poll_interval = poll_interval
+        self.metrics_dict = metrics_dict
+        self.service_name = service_name
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, shareable=lambda result: True):
+        """
+        Return (result, role): the result of fn(), called once for all
+        concurrent callers with this key. Results must be JSON-serializable
+        when a store is used; an exception raised by the leader is raised in
+        its followers too.
+        """
+        flight, role = self._join(key)
+        if role == SHARED:
+            self._record(role)
+            return self._result(flight), role
+        if role == FOLLOWER:
+            wait_start = time.monotonic()
+            finished = flight.wait(self.wait_timeout)
+            self._observe_wait(time.monotonic() - wait_start)
+            if finished:
+                self._record(role)
+                return self._result(flight), role
+            logger.warning(f"Leader of {self.name} call {key[:12]} still running, calling upstream")
+            self._record(FALLBACK)
+            return fn(), FALLBACK
+
+        # Leader in this process; with a store, another replica may already lead
+        claimed = False
+        try:
+            if self.store is not None:
+                remote, claimed = self._from_store(key)
+                if remote is not None:
+                    value = remote[0]
+                    flight.finish(value, shareable=False)
+                    self._record(REMOTE)
+                    return value, REMOTE
+            self._record(LEADER)
+            try:
+                value = fn()
+            except Exception as e:
+                flight.finish(error=e)
+                raise
+            share = bool(shareable(value))
+            flight.finish(value, shareable=share)
+            if share and self.store is not None:
+                self._save_to_store(key, value)
+            return value, LEADER
+        finally:
+            if claimed:
+                self.store.release(key)
+            self._expire(key, flight)
+
+    def stream(self, key):
+        """
+        Return (flight, role) for a streamed call. The leader publishes each
+        chunk on the flight and finishes it; followers (or callers within the
+        window) iterate flight.follow(wait_timeout).
+        """
+        flight, role = self._join(key)
+        if role == SHARED:
+            self._record(role)
+            return flight, role
+        if role == FOLLOWER:
+            self._record(role)
+            return flight, role
+        if self.store is not None:
+            chunks = self.store.get_result(key)
+            if chunks is not None:
+                flight.chunks = list(chunks)
+                flight.finish(shareable=False)
+                self._expire(key, flight)
+                self._record(REMOTE)
+                return flight, REMOTE
+        self._record(LEADER)
+        return flight, LEADER
+
+    def finish_stream(self, flight, error=None, shareable=True):
+        """Finish a streamed flight as its leader, sharing it for the window if it completed."""
+        flight.finish(error=error, shareable=shareable)
+        if flight.shareable and self.store is not None:
+            self._save_to_store(flight.key, flight.chunks)
+        self._expire(flight.key, flight)
+
+    def clear(self):
+        """Forget the results kept for the window (calls in flight are not affected)."""
+        with self._lock:
+            self._flights = {key: flight for key, flight in self._flights.items() if not flight.done}
+
+    # -------------------------------
+    # Internal helpers
+    # -------------------------------
+
+    def _join(self, key):
+        """Return (flight, role) where role is LEADER for a new flight."""
+        now = time.monotonic()
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                if not flight.done:
+                    return flight, FOLLOWER
+                if flight.shareable and now - flight.finished_at <= self.window:
+                    return flight, SHARED
+            flight = Flight(key)
+            self._flights[key] = flight
+            return flight, LEADER
+
+    def _expire(self, key, flight):
+        """Forget finished flights that can no longer be shared."""
+        now = time.monotonic()
+        with self._lock:
+            for other_key, other in list(self._flights.items()):
+                if other.done and (not other.shareable or now - other.finished_at > self.window):
+                    if other_key != key or other is flight:
+                        del self._flights[other_key]
+
+    @staticmethod
+    def _result(flight):
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def _from_store(self, key):
+        """
+        Return ((value,), False) with the result of another replica's call,
+        waiting while it is in flight, or (None, claimed) when this process
+        should make the call itself.
+        """
+        wait_start = time.monotonic()
+        deadline = wait_start + self.wait_timeout
+        while True:
+            value = self.store.get_result(key)
+            if value is not None:
+                self._observe_wait(time.monotonic() - wait_start)
+                return (value,), False
+            if self.store.claim(key, self.wait_timeout):
+                return None, True
+            if time.monotonic() >= deadline:
+                return None, False
+            time.sleep(self.poll_interval)
+
+    def _save_to_store(self, key, value):
+        if self.window <= 0:
+            return
+        try:
+            self.store.set_result(key, value, self.window)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not share {self.name} result: {str(e)}")
+
+    def _record(self, role):
+        if self.metrics_dict and 'singleflight_requests_total' in self.metrics_dict:
+            self.metrics_dict['singleflight_requests_total'].labels(
+                service=self.service_name, flight=self.name, role=role
+            ).inc()
+
+    def _observe_wait(self, duration):
+        if self.metrics_dict and 'singleflight_wait_seconds' in self.metrics_dict:
+            self.metrics_dict['singleflight_wait_seconds'].labels(
+                service=self.service_name, flight=self.name
+            ).observe(duration)
+
+
+def create_single_flight_from_env(name, metrics_dict=None, service_name=None):
+    """
+    Build the coalescer from SINGLE_FLIGHT_* environment variables. Returns
+    None when SINGLE_FLIGHT_ENABLED is false. SINGLE_FLIGHT_STORE_PATH
+    enables coalescing across replicas through a shared directory.
+    """
+    if os.getenv('SINGLE_FLIGHT_ENABLED', 'true').lower() in ('0', 'false', 'no'):
+        return None
+    store = None
+    store_path = os.getenv('SINGLE_FLIGHT_STORE_PATH')
+    if store_path:
+        try:
+            store = FileFlightStore(os.path.join(store_path, name))
+        except OSError as e:
+            logger.warning(f"Could not open single-flight store {store_path}, coalescing per process: {str(e)}")
+    return SingleFlight(
+        name,
+        window=float(os.getenv('SINGLE_FLIGHT_WINDOW', '10')),
+        wait_timeout=float(os.getenv('SINGLE_FLIGHT_WAIT_TIMEOUT', '120')),
+        store=store,
+        metrics_dict=metrics_dict,
+        service_name=service_name
+    )
@@ -7,6 +7,9 @@ import argparse
 # Add parent directory to path to find the modules to test
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# Unit test modules run by --test-type unit
+UNIT_TEST_PATTERNS = ['test_parser.py', 'test_llm_cache.py']
+
 def run_tests(test_type="all", verbosity=2):
     """
     Run the specified type of tests.
@@ -23,11 +26,12 @@ def run_tests(test_type="all", verbosity=2):
     
     if test_type == "unit" or test_type == "all":
         print("Running unit tests...")
-        unit_tests = loader.discover(
-            os.path.dirname(os.path.abspath(__file__)), 
-            pattern='test_parser.py'
-        )
-        suite.addTests(unit_tests)
+        for pattern in UNIT_TEST_PATTERNS:
+            unit_tests = loader.discover(
+                os.path.dirname(os.path.abspath(__file__)), 
+                pattern=pattern
+            )
+            suite.addTests(unit_tests)
     
     if test_type == "integration" or test_type == "all":
         print("Running integration tests...")
@@ -32,6 +32,9 @@ class TestIEP1Integration(unittest.TestCase):
         
         # Create a test client for direct testing
         parser.app.testing = True
+        # Start every test with an empty response cache
+        if parser.response_cache is not None:
+            parser.response_cache.clear()
         self.client = parser.app.test_client()
 
     def tearDown(self):
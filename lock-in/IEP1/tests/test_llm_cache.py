@@ -0,0 +1,103 @@
+import unittest
+import os
+import sys
+import time
+import logging
+import tempfile
+from unittest.mock import MagicMock
+
+# Add parent directory to path to import the cache module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_cache import LLMResponseCache, make_cache_key, cache_bypassed
+
+
+class TestLLMResponseCache(unittest.TestCase):
+    """Unit tests for the content-addressed LLM response cache."""
+
+    def setUp(self):
+        """Disable logging for tests."""
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        """Re-enable logging."""
+        logging.disable(logging.NOTSET)
+
+    def test_cache_key_covers_all_inputs(self):
+        """Test that every input changes the key and equal inputs share one."""
+        base = make_cache_key('gpt-3.5-turbo', 'system', 'prompt', 0.7)
+        self.assertEqual(base, make_cache_key('gpt-3.5-turbo', 'system', 'prompt', 0.7))
+        self.assertNotEqual(base, make_cache_key('gpt-4', 'system', 'prompt', 0.7))
+        self.assertNotEqual(base, make_cache_key('gpt-3.5-turbo', 'other', 'prompt', 0.7))
+        self.assertNotEqual(base, make_cache_key('gpt-3.5-turbo', 'system', 'prompt 2', 0.7))
+        self.assertNotEqual(base, make_cache_key('gpt-3.5-turbo', 'system', 'prompt', 0.0))
+
+    def test_cache_bypassed(self):
+        """Test the opt-out headers."""
+        self.assertTrue(cache_bypassed({'Cache-Control': 'no-cache'}))
+        self.assertTrue(cache_bypassed({'Cache-Control': 'private, no-store'}))
+        self.assertTrue(cache_bypassed({'X-LLM-Cache': 'bypass'}))
+        self.assertFalse(cache_bypassed({}))
+
+    def test_ttl_expiry(self):
+        """Test that entries expire after the TTL."""
+        cache = LLMResponseCache(ttl_seconds=0.01)
+        cache.set('key', '{"a": 1}')
+        time.sleep(0.03)
+        self.assertIsNone(cache.get('key'))
+
+    def test_size_bounds(self):
+        """Test eviction by entry count and by total bytes."""
+        cache = LLMResponseCache(max_entries=2)
+        cache.set('a', '1')
+        cache.set('b', '2')
+        cache.get('a')
+        cache.set('c', '3')
+        self.assertEqual(cache.get('a'), '1')
+        self.assertIsNone(cache.get('b'))
+
+        cache = LLMResponseCache(max_bytes=10)
+        cache.set('a', '12345')
+        cache.set('b', '12345')
+        cache.set('c', '12345')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['bytes'], 10)
+
+        # A single response larger than the budget is not cached
+        cache.set('huge', 'x' * 11)
+        self.assertIsNone(cache.get('huge'))
+
+    def test_disk_tier_survives_restart(self):
+        """Test that the SQLite tier serves entries to a new cache instance."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'llm_cache.db')
+            LLMResponseCache(disk_path=path).set('key', '{"a": 1}')
+
+            restarted = LLMResponseCache(disk_path=path)
+            self.assertEqual(restarted.get('key'), '{"a": 1}')
+            self.assertEqual(len(restarted), 1)
+
+            bounded = LLMResponseCache(disk_path=path, max_disk_entries=1)
+            bounded.set('other', '{}')
+            self.assertIsNone(LLMResponseCache(disk_path=path).get('key'))
+
+    def test_metrics(self):
+        """Test hit ratio and bytes-saved metrics."""
+        metrics_dict = {
+            'cache_hits_total': MagicMock(),
+            'cache_misses_total': MagicMock(),
+            'cache_entries': MagicMock(),
+            'cache_hit_ratio': MagicMock(),
+            'cache_bytes_saved_total': MagicMock()
+        }
+        cache = LLMResponseCache(metrics_dict=metrics_dict)
+        cache.get('key')
+        cache.set('key', 'abcd')
+        cache.get('key')
+
+        metrics_dict['cache_bytes_saved_total'].labels.return_value.inc.assert_called_once_with(4)
+        metrics_dict['cache_hit_ratio'].labels.return_value.set.assert_called_with(0.5)
+        self.assertEqual(cache.stats()['hit_ratio'], 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
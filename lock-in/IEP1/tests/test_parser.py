@@ -4,10 +4,17 @@ from unittest.mock import patch, MagicMock
 import sys
 import os
 import logging
+import threading
+import time
+from types import SimpleNamespace
 
 # Add parent directory to path to import parser module
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import parser
+from llm_usage import UsageRecorder, UsageLedger
+from health import CallHealth
+from hedging import Hedger
+from model_router import LatencyTracker
 
 class TestIEP1Parser(unittest.TestCase):
     """Unit tests for IEP1 parser module."""
@@ -16,6 +23,11 @@ class TestIEP1Parser(unittest.TestCase):
         """Set up test client and resources."""
         parser.app.testing = True
         self.client = parser.app.test_client()
+        # Start every test with an empty response cache
+        if parser.response_cache is not None:
+            parser.response_cache.clear()
+        if parser.predict_flights is not None:
+            parser.predict_flights.clear()
         # Disable logging for tests
         logging.disable(logging.CRITICAL)
 
@@ -25,24 +37,18 @@ class TestIEP1Parser(unittest.TestCase):
         logging.disable(logging.NOTSET)
 
     def test_health_endpoint_with_api_key(self):
-        """Test health endpoint with valid API key."""
-        with patch('parser.api_key', 'test_api_key'):
+        """Test that the health endpoints answer without calling OpenAI."""
+        with patch('parser.api_key', 'test_api_key'), patch('parser.llm_health', CallHealth()):
             with patch('parser.client.chat.completions.create') as mock_create:
-                # Mock the OpenAI API call
-                mock_response = MagicMock()
-                mock_create.return_value = mock_response
-                
-                # Call the health endpoint
                 response = self.client.get('/health')
-                
-                # Check that the API was called correctly
-                mock_create.assert_called_once()
-                
-                # Validate the response
+                mock_create.assert_not_called()
+
                 self.assertEqual(response.status_code, 200)
                 response_data = json.loads(response.data)
                 self.assertEqual(response_data['status'], 'healthy')
-                self.assertEqual(response_data['openai_status'], 'connected')
+                self.assertEqual(response_data['llm']['status'], 'unknown')
+                self.assertEqual(self.client.get('/health/live').status_code, 200)
+                self.assertEqual(self.client.get('/health/ready').status_code, 200)
 
     def test_health_endpoint_without_api_key(self):
         """Test health endpoint without API key."""
@@ -54,21 +60,44 @@ class TestIEP1Parser(unittest.TestCase):
             self.assertIn('OPENAI_API_KEY', response_data['error'])
 
     def test_health_endpoint_api_error(self):
-        """Test health endpoint with API error."""
-        with patch('parser.api_key', 'test_api_key'):
+        """Test that failing /predict calls make the service unhealthy and not ready."""
+        with patch('parser.api_key', 'test_api_key'), patch('parser.llm_health', CallHealth()), \
+                patch('parser.response_cache', None):
             with patch('parser.client.chat.completions.create') as mock_create:
                 # Simulate an error from the OpenAI API
                 mock_create.side_effect = Exception("API connection error")
-                
-                # Call the health endpoint
+                for _ in range(3):
+                    self.client.post('/predict', json={'prompt': 'Test prompt'})
+
                 response = self.client.get('/health')
-                
-                # Check response
+                self.assertEqual(mock_create.call_count, 3)
                 self.assertEqual(response.status_code, 500)
                 response_data = json.loads(response.data)
                 self.assertEqual(response_data['status'], 'unhealthy')
-                self.assertEqual(response_data['openai_status'], 'disconnected')
-                self.assertIn('API connection error', response_data['error'])
+                self.assertEqual(response_data['llm']['success_rate'], 0.0)
+                self.assertIn('API connection error', response_data['llm']['last_error'])
+                self.assertEqual(self.client.get('/health/ready').status_code, 503)
+                self.assertEqual(self.client.get('/health/live').status_code, 200)
+
+    def test_client_errors_do_not_count_against_health(self):
+        """Test that a rejected request is not recorded as a provider failure, unlike a 503."""
+        class APIStatusError(Exception):
+            def __init__(self, status_code):
+                super().__init__(f"Error code: {status_code}")
+                self.status_code = status_code
+
+        with patch('parser.api_key', 'test_api_key'), patch('parser.llm_health', CallHealth()), \
+                patch('parser.response_cache', None):
+            with patch('parser.client.chat.completions.create') as mock_create:
+                mock_create.side_effect = APIStatusError(400)
+                for _ in range(3):
+                    self.client.post('/predict', json={'prompt': 'Test prompt'})
+                self.assertEqual(json.loads(self.client.get('/health').data)['status'], 'healthy')
+
+                mock_create.side_effect = APIStatusError(503)
+                for _ in range(6):
+                    self.client.post('/predict', json={'prompt': 'Test prompt'})
+                self.assertEqual(self.client.get('/health').status_code, 500)
 
     def test_predict_endpoint_with_valid_input(self):
         """Test predict endpoint with valid input."""
@@ -116,6 +145,40 @@ class TestIEP1Parser(unittest.TestCase):
                 self.assertEqual(response_data['response'], 'This is not valid JSON')
                 self.assertIn('warning', response_data)
 
+    def test_predict_endpoint_repairs_fenced_json(self):
+        """Test that fenced JSON with a trailing comma is extracted and repaired."""
+        with patch('parser.api_key', 'test_api_key'):
+            with patch('parser.client.chat.completions.create') as mock_create:
+                mock_response = MagicMock()
+                mock_response.choices = [MagicMock()]
+                mock_response.choices[0].message.content = 'Here it is:\n```json\n{"result": "ok",}\n```'
+                mock_create.return_value = mock_response
+
+                response = self.client.post('/predict',
+                                           json={'prompt': 'fenced prompt'},
+                                           content_type='application/json')
+
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(json.loads(response.data), {'result': 'ok'})
+
+    def test_predict_endpoint_flags_truncated_json(self):
+        """Test that a completion cut off mid-object is flagged as truncated and not cached."""
+        with patch('parser.api_key', 'test_api_key'):
+            with patch('parser.client.chat.completions.create') as mock_create:
+                mock_response = MagicMock()
+                mock_response.choices = [MagicMock()]
+                mock_response.choices[0].message.content = '{"meetings": [{"description": "Lab", "day": "Mon'
+                mock_create.return_value = mock_response
+
+                for _ in range(2):
+                    response = self.client.post('/predict',
+                                               json={'prompt': 'long schedule prompt'},
+                                               content_type='application/json')
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.headers.get('X-LLM-Truncated'), 'true')
+                    self.assertNotEqual(response.headers.get('X-Cache'), 'HIT')
+                self.assertIn('meetings', json.loads(response.data))
+
     def test_predict_endpoint_with_missing_prompt(self):
         """Test predict endpoint with missing prompt parameter."""
         response = self.client.post('/predict', 
@@ -145,5 +208,151 @@ class TestIEP1Parser(unittest.TestCase):
                 self.assertIn('error', response_data)
                 self.assertIn('API error', response_data['error'])
 
+    def test_predict_endpoint_serves_repeated_prompt_from_cache(self):
+        """Test that a repeated prompt is answered without calling OpenAI again."""
+        with patch('parser.api_key', 'test_api_key'):
+            with patch('parser.client.chat.completions.create') as mock_create:
+                mock_response = MagicMock()
+                mock_response.choices = [MagicMock()]
+                mock_response.choices[0].message.content = '{"result": "cached result"}'
+                mock_create.return_value = mock_response
+
+                first = self.client.post('/predict', json={'prompt': 'same prompt'})
+                second = self.client.post('/predict', json={'prompt': 'same prompt'})
+
+                mock_create.assert_called_once()
+                self.assertEqual(first.headers['X-Cache'], 'MISS')
+                self.assertEqual(second.headers['X-Cache'], 'HIT')
+                self.assertEqual(json.loads(second.data)['result'], 'cached result')
+
+    def test_predict_endpoint_cache_opt_out(self):
+        """Test that Cache-Control: no-cache forces a fresh OpenAI call."""
+        with patch('parser.api_key', 'test_api_key'):
+            with patch('parser.client.chat.completions.create') as mock_create:
+                mock_response = MagicMock()
+                mock_response.choices = [MagicMock()]
+                mock_response.choices[0].message.content = '{"result": "fresh"}'
+                mock_create.return_value = mock_response
+
+                self.client.post('/predict', json={'prompt': 'opt-out prompt'})
+                response = self.client.post('/predict', json={'prompt': 'opt-out prompt'},
+                                            headers={'Cache-Control': 'no-cache'})
+
+                self.assertEqual(mock_create.call_count, 2)
+                self.assertEqual(response.headers['X-Cache'], 'BYPASS')
+
+    def test_predict_endpoint_coalesces_concurrent_requests(self):
+        """Test that identical concurrent requests share one OpenAI completion."""
+        release = threading.Event()
+
+        def slow_create(**kwargs):
+            release.wait(5)
+            response = MagicMock()
+            response.choices = [MagicMock()]
+            response.choices[0].message.content = '{"result": "shared"}'
+            return response
+
+        results = []
+
+        def post():
+            response = parser.app.test_client().post('/predict', json={'prompt': 'same prompt'})
+            results.append((response.status_code, response.headers.get('X-Single-Flight'), json.loads(response.data)))
+
+        with patch('parser.api_key', 'test_api_key'), patch('parser.response_cache', None), \
+                patch('parser.client.chat.completions.create', side_effect=slow_create) as mock_create:
+            threads = [threading.Thread(target=post) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            while mock_create.call_count == 0:
+                time.sleep(0.01)
+            time.sleep(0.1)  # let the other requests join the leader
+            release.set()
+            for thread in threads:
+                thread.join(5)
+
+            self.assertEqual(mock_create.call_count, 1)
+            self.assertEqual(sorted(role for _, role, _ in results), ['follower', 'follower', 'leader'])
+            self.assertTrue(all(status == 200 and body == {'result': 'shared'} for status, _, body in results))
+
+            # A retry within the coalescing window reuses the result
+            response = self.client.post('/predict', json={'prompt': 'same prompt'})
+            self.assertEqual((mock_create.call_count, response.headers['X-Single-Flight']), (1, 'shared'))
+
+    def test_predict_endpoint_records_usage(self):
+        """Test that token counts come from the OpenAI usage block and are attributed to the caller."""
+        recorder = UsageRecorder('iep1', ledger=UsageLedger())
+        with patch('parser.api_key', 'test_api_key'), patch('parser.usage_recorder', recorder):
+            with patch('parser.client.chat.completions.create') as mock_create:
+                mock_response = MagicMock()
+                mock_response.choices = [MagicMock()]
+                mock_response.choices[0].message.content = '{"result": "ok"}'
+                mock_response.usage = {'prompt_tokens': 900, 'completion_tokens': 40,
+                                       'prompt_tokens_details': {'cached_tokens': 512}}
+                mock_create.return_value = mock_response
+
+                self.client.post('/predict', json={'prompt': 'usage prompt'},
+                                 headers={'X-User-ID': 'alice', 'X-LLM-Feature': 'parse_fallback'})
+                response = self.client.get('/usage?group_by=feature')
+
+        totals = json.loads(response.data)['totals']
+        self.assertEqual([(row['feature'], row['input_tokens'], row['output_tokens'], row['cache_read_tokens'])
+                          for row in totals], [('parse_fallback', 388, 40, 512)])
+        self.assertEqual(recorder.ledger.by_user()[0]['user_id'], 'alice')
+
+    def test_predict_endpoint_routes_small_parses_to_fast_model(self):
+        """Test that a parse with a small size hint uses the fast model and one without a hint the strong model."""
+        with patch('parser.api_key', 'test_api_key'), patch('parser.response_cache', None), \
+                patch('parser.predict_flights', None):
+            with patch('parser.client.chat.completions.create') as mock_create:
+                mock_response = MagicMock()
+                mock_response.choices = [MagicMock()]
+                mock_response.choices[0].message.content = '{"result": "ok"}'
+                mock_create.return_value = mock_response
+
+                small = self.client.post('/predict', json={'prompt': 'CS101 Monday 9-10'},
+                                         headers={'X-LLM-Feature': 'parse', 'X-LLM-Size': '3'})
+                unknown = self.client.post('/predict', json={'prompt': 'CS101 Monday 9-10'})
+
+        self.assertEqual(mock_create.call_args_list[0][1]['model'], parser.FAST_MODEL)
+        self.assertEqual(small.headers['X-LLM-Model'], parser.FAST_MODEL)
+        self.assertEqual(mock_create.call_args_list[1][1]['model'], parser.MODEL)
+        self.assertEqual(unknown.headers['X-LLM-Model'], parser.MODEL)
+
+    def test_predict_endpoint_hedges_slow_completion(self):
+        """Test that a slow completion gets a streamed backup whose result is served, and the slow stream is closed."""
+        hedger = Hedger(percentile=0.5, min_delay=0.05, budget=1.0, latency=LatencyTracker(min_samples=1))
+        hedger.latency.observe('parse:32-63', parser.MODEL, 0.05)
+        release = threading.Event()
+        models = []
+        streams = []
+
+        def create(**kwargs):
+            models.append(kwargs['model'])
+            self.assertTrue(kwargs['stream'])
+            text = '{"result": "slow"}' if len(models) == 1 else '{"result": "backup"}'
+            stream = MagicMock()
+            stream.__iter__.return_value = iter([
+                SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None),
+                SimpleNamespace(choices=[], usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5))
+            ])
+            streams.append(stream)
+            if len(models) == 1:
+                release.wait(5)
+            return stream
+
+        with patch('parser.api_key', 'test_api_key'), patch('parser.response_cache', None), \
+                patch('parser.predict_flights', None), patch('parser.llm_hedger', hedger), \
+                patch('parser.client.chat.completions.create', side_effect=create):
+            response = self.client.post('/predict', json={'prompt': 'Hedged prompt'}, headers={'X-LLM-Size': '40'})
+            release.set()
+            for _ in range(50):
+                if streams[0].close.called:
+                    break
+                time.sleep(0.05)
+
+        self.assertEqual(json.loads(response.data), {'result': 'backup'})
+        self.assertEqual(models, [parser.MODEL, parser.MODEL])
+        self.assertTrue(streams[0].close.called)
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -1,16 +1,22 @@
 import json
 import logging
+import itertools
 import os
-import requests
 import sys
 import psutil
 import time
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 
 # Add metrics helper to path
 sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from metrics_helper import setup_metrics, track_llm_request
+from llm_usage import create_usage_recorder_from_env, usage_attribution, usage_summary
+from health import create_call_health_from_env, llm_service_health, is_upstream_failure
+from llm_gateway import create_gateway_from_env, GatewayError, system_blocks, read_message_stream, STOP_CANCELLED
+from model_router import create_router_from_env, routing_hints
+from hedging import create_hedger_from_env
+from single_flight import create_single_flight_from_env, request_fingerprint, flight_bypassed, FlightError, LEADER
 
 # Set up logging
 logging.basicConfig(
@@ -26,23 +32,53 @@ CORS(app)  # Enable CORS for all routes
 # Setup Prometheus metrics
 metrics_dict = setup_metrics(app, 'iep2')
 
+# Token and cost accounting from the Anthropic usage blocks
+usage_recorder = create_usage_recorder_from_env('iep2', metrics_dict)
+
+# Anthropic health derived from the outcome of real /api/generate calls
+llm_health = create_call_health_from_env()
+
 # Load environment variables for Anthropic API
 ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY')
 DEFAULT_MODEL = os.getenv('LLM_MODEL', 'claude-3-7-sonnet-20250219')  # Default to Claude 3.7 Sonnet
+FAST_MODEL = os.getenv('LLM_FAST_MODEL', 'claude-3-5-haiku-20241022')  # Small requests (see model_router.py)
+ANTHROPIC_API_URL = os.getenv('ANTHROPIC_API_URL', 'https://api.anthropic.com/v1/messages')
+# Mark the system prompt of each request as cacheable (Anthropic prompt caching)
+PROMPT_CACHE_ENABLED = os.getenv('ANTHROPIC_PROMPT_CACHE', 'true').lower() not in ('0', 'false', 'no')
 
 # Log the configuration
 logger.info(f"Using default model: {DEFAULT_MODEL}")
 
+# Rate limits, retries and circuit breaking shared by every Anthropic call
+llm_gateway = create_gateway_from_env('iep2', metrics_dict)
+
+# Identical concurrent /api/generate calls share one Anthropic call (None when disabled)
+generate_flights = create_single_flight_from_env('generate', metrics_dict, 'iep2')
+
+# Picks the model of each call without an explicit model from its task, size, user tier and recent latencies
+model_router = create_router_from_env('iep2', DEFAULT_MODEL, FAST_MODEL, metrics_dict)
+
+# Optional backup call when a completion (or the first token of a stream) is slower than its recent tail latency
+llm_hedger = create_hedger_from_env('iep2', metrics_dict)
+
+def routing_task(feature):
+    """Routing task of a call: the feature EEP1 attributes it to (generate, calendar_reprompt, ...)."""
+    return feature or 'generate'
+
 # Periodically update system metrics
 @app.before_request
 def update_system_metrics():
     process = psutil.Process(os.getpid())
     metrics_dict['system_memory_usage'].labels(service='iep2').set(process.memory_info().rss)
 
-def call_anthropic_api(prompt, model=None, temperature=0.2, max_tokens=4000):
+def call_anthropic_api(prompt, model=None, temperature=0.2, max_tokens=4000, user_id=None, feature=None, system=None,
+                       cancelled=None):
     """
     Pure function to call Anthropic API with a prompt.
-    Returns the raw API response.
+    Returns the raw API response. user_id and feature attribute the call in the usage ledger.
+    system: Optional stable instructions (text or text blocks), sent as the cached system prompt.
+    cancelled: Cancel event of a hedged call; the response is then streamed, so a
+    call that lost can be closed before it is generated (and billed) in full.
     """
     start_time = time.time()
     try:
@@ -69,37 +105,213 @@ def call_anthropic_api(prompt, model=None, temperature=0.2, max_tokens=4000):
             "max_tokens": max_tokens,
             "temperature": temperature
         }
+        if system:
+            payload["system"] = system_blocks(system, cache=PROMPT_CACHE_ENABLED)
+        if cancelled is not None:
+            payload["stream"] = True
         
         # Track LLM request metrics
-        with track_llm_request(metrics_dict, 'anthropic', model_to_use) as tracker:
-            response = requests.post(
-                "https://api.anthropic.com/v1/messages",
-                headers=headers,
-                json=payload,
-                timeout=60  # Longer timeout for complex requests
-            )
+        llm_start = time.time()
+        try:
+            with track_llm_request(metrics_dict, 'anthropic', model_to_use):
+                response = llm_gateway.post(ANTHROPIC_API_URL, payload, headers, stream=cancelled is not None)
+        except GatewayError as e:
+            logger.warning(f"Anthropic call refused by the gateway: {str(e)}")
+            if e.reason == 'circuit_open':
+                llm_health.record(False, None, e)
+            metrics_dict['api_errors_total'].labels(method='POST', endpoint='/api/generate', error_type='gateway_rejected').inc()
+            return {"error": str(e), "retry_after": e.retry_after}, e.status_code
+        except Exception as e:
+            llm_health.record(False, time.time() - llm_start, e)
+            raise
+        llm_health.record(not is_upstream_failure(response.status_code), time.time() - llm_start,
+                          f"HTTP {response.status_code}")
             
-            # Estimate token usage
-            prompt_tokens = len(prompt) / 4  # Rough estimate
-            if response.status_code == 200:
-                response_data = response.json()
-                response_content = response_data.get('content', [{}])[0].get('text', '')
-                response_tokens = len(response_content) / 4  # Rough estimate
-                tracker.record_tokens(input_tokens=prompt_tokens, output_tokens=response_tokens)
-        
         if response.status_code != 200:
-            logger.error(f"Anthropic API error: {response.status_code} - {response.text}")
+            error_text = response.text
+            response.close()
+            logger.error(f"Anthropic API error: {response.status_code} - {error_text}")
             metrics_dict['api_errors_total'].labels(method='POST', endpoint='/api/generate', error_type='anthropic_api_error').inc()
-            return {"error": f"Anthropic API returned error: {response.status_code} - {response.text}"}, response.status_code
+            return {"error": f"Anthropic API returned error: {response.status_code} - {error_text}"}, response.status_code
+
+        response_data = response.json() if cancelled is None else read_message_stream(response, cancelled)
+        # A hedged call that lost is recorded too: its tokens up to the cancel are billed
+        usage_recorder.record('anthropic', model_to_use, response_data.get('usage'), endpoint='/api/generate',
+                              user_id=user_id, feature=feature, latency=time.time() - llm_start)
+        if response_data.get('stop_reason') == STOP_CANCELLED:
+            logger.info(f"Stopped a hedged {model_to_use} call that lost")
+            return {"error": "Call stopped: the hedged call answered first"}, 499
+        model_router.observe(routing_task(feature), model_to_use, time.time() - llm_start)
         
         # Return the raw API response
-        return response.json(), 200
+        return response_data, 200
             
     except Exception as e:
         logger.error(f"Error calling Anthropic API: {str(e)}")
         metrics_dict['api_errors_total'].labels(method='POST', endpoint='/api/generate', error_type='exception').inc()
         return {"error": str(e)}, 500
 
+def stream_anthropic_api(prompt, model=None, temperature=0.2, max_tokens=4000, system=None):
+    """
+    Open a streaming (SSE) call to the Anthropic Messages API, with system as
+    the cached system prompt.
+    Returns (response, model, None) with the open streaming response,
+    or (None, model, (error, status_code)) if the stream could not be started.
+    """
+    model_to_use = model or DEFAULT_MODEL
+    try:
+        if not ANTHROPIC_API_KEY:
+            metrics_dict['api_errors_total'].labels(method='POST', endpoint='/api/generate', error_type='api_key_missing').inc()
+            raise ValueError("ANTHROPIC_API_KEY environment variable not set")
+
+        logger.info(f"Calling Anthropic API (streaming) with model: {model_to_use}")
+
+        headers = {
+            "x-api-key": ANTHROPIC_API_KEY,
+            "anthropic-version": "2023-06-01",
+            "content-type": "application/json",
+            "accept": "text/event-stream"
+        }
+        payload = {
+            "model": model_to_use,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True
+        }
+        if system:
+            payload["system"] = system_blocks(system, cache=PROMPT_CACHE_ENABLED)
+
+        # The gateway read timeout bounds the gap between events, not the whole stream
+        try:
+            response = llm_gateway.post(ANTHROPIC_API_URL, payload, headers, stream=True)
+        except GatewayError as e:
+            logger.warning(f"Anthropic stream refused by the gateway: {str(e)}")
+            if e.reason == 'circuit_open':
+                llm_health.record(False, None, e)
+            metrics_dict['api_errors_total'].labels(method='POST', endpoint='/api/generate', error_type='gateway_rejected').inc()
+            return None, model_to_use, ({"error": str(e), "retry_after": e.retry_after}, e.status_code)
+        except Exception as e:
+            llm_health.record(False, None, e)
+            raise
+
+        if response.status_code != 200:
+            if is_upstream_failure(response.status_code):
+                llm_health.record(False, None, f"HTTP {response.status_code}")
+            error_text = response.text
+            response.close()
+            logger.error(f"Anthropic API error: {response.status_code} - {error_text}")
+            metrics_dict['api_errors_total'].labels(method='POST', endpoint='/api/generate', error_type='anthropic_api_error').inc()
+            return None, model_to_use, ({"error": f"Anthropic API returned error: {response.status_code} - {error_text}"}, response.status_code)
+
+        return response, model_to_use, None
+
+    except Exception as e:
+        logger.error(f"Error calling Anthropic API: {str(e)}")
+        metrics_dict['api_errors_total'].labels(method='POST', endpoint='/api/generate', error_type='exception').inc()
+        return None, model_to_use, ({"error": str(e)}, 500)
+
+def open_stream_to_first_token(prompt, model, temperature, max_tokens, system):
+    """
+    Open a stream and read it up to its first text delta, so a hedged stream
+    is judged by its time to first token. Returns (response, model, lines,
+    None) where lines yields every line, the ones already read included, or
+    (None, model, None, (error, status_code)).
+    """
+    response, model_used, error = stream_anthropic_api(prompt=prompt, model=model, temperature=temperature,
+                                                       max_tokens=max_tokens, system=system)
+    if error:
+        return None, model_used, None, error
+    lines = response.iter_lines(decode_unicode=True)
+    head = []
+    event = None
+    try:
+        for line in lines:
+            head.append(line)
+            if line and line.startswith('event:'):
+                event = line[6:].strip()
+            elif line and line.startswith('data:') and event in ('content_block_delta', 'error'):
+                break
+    except Exception as e:
+        response.close()
+        return None, model_used, None, ({"error": f"Anthropic stream failed: {str(e)}"}, 502)
+    if event == 'error':
+        response.close()
+        return None, model_used, None, ({"error": f"Anthropic stream failed: {head[-1][5:].strip()}"}, 502)
+    return response, model_used, itertools.chain(head, lines), None
+
+def relay_anthropic_stream(response, model, user_id=None, feature=None, lines=None):
+    """
+    Relay the Anthropic SSE stream line by line, unchanged, so EEP1 can parse
+    the raw events. Token usage is read from the message_start/message_delta
+    events and recorded once the stream ends. lines, if given, replaces the
+    lines read from response (e.g. with the ones read to the first token).
+    """
+    start_time = time.time()
+    usage = {}
+    metrics_dict['llm_requests_total'].labels(service='anthropic', model=model).inc()
+    try:
+        for line in lines if lines is not None else response.iter_lines(decode_unicode=True):
+            if line is None:
+                continue
+            if line.startswith('data:') and '"usage"' in line:
+                merge_stream_usage(usage, line[5:].strip())
+            yield f"{line}\n"
+        llm_health.record(True, time.time() - start_time)
+        model_router.observe(routing_task(feature), model, time.time() - start_time)
+    except Exception as e:
+        logger.error(f"Error relaying Anthropic stream: {str(e)}")
+        llm_health.record(False, time.time() - start_time, e)
+        metrics_dict['api_errors_total'].labels(method='POST', endpoint='/api/generate', error_type='stream_error').inc()
+        yield f"event: error\ndata: {json.dumps({'type': 'error', 'error': {'message': str(e)}})}\n\n"
+    finally:
+        response.close()
+        duration = time.time() - start_time
+        metrics_dict['llm_request_duration'].labels(service='anthropic', model=model).observe(duration)
+        if usage:
+            usage_recorder.record('anthropic', model, usage, endpoint='/api/generate',
+                                  user_id=user_id, feature=feature, latency=duration)
+
+def share_stream(flight, lines):
+    """
+    Relay lines while publishing them to the followers of a coalesced stream.
+    Streams that carry an error event are not kept for the coalescing window.
+    """
+    completed = False
+    failed = False
+    try:
+        for line in lines:
+            failed = failed or line.startswith('event: error')
+            flight.publish(line)
+            yield line
+        completed = True
+    finally:
+        lines.close()
+        error = None if completed else FlightError("The shared stream ended before completing")
+        generate_flights.finish_stream(flight, error=error, shareable=not failed)
+
+def follow_stream(flight):
+    """Stream the lines of a coalesced call relayed by its leader."""
+    try:
+        for line in flight.follow(generate_flights.wait_timeout):
+            yield line
+    except FlightError as e:
+        yield f"event: error\ndata: {json.dumps({'type': 'error', 'error': {'message': str(e)}})}\n\n"
+
+def merge_stream_usage(usage, data):
+    """
+    Merge the usage of a streamed event into usage. message_start carries the
+    input and cache counts, message_delta the cumulative output count.
+    """
+    try:
+        event = json.loads(data)
+    except json.JSONDecodeError:
+        return
+    event_usage = event.get('usage') or event.get('message', {}).get('usage') or {}
+    usage.update({key: value for key, value in event_usage.items() if value is not None})
+
 @app.route('/')
 def index():
     """Health check endpoint."""
@@ -110,7 +322,8 @@ def index():
             "service": "IEP2 - Anthropic API Bridge",
             "status": "active",
             "version": "1.0.0",
-            "default_model": DEFAULT_MODEL
+            "default_model": DEFAULT_MODEL,
+            "fast_model": FAST_MODEL
         }
         return jsonify(response)
     finally:
@@ -118,11 +331,36 @@ def index():
         metrics_dict['api_request_duration'].labels(method='GET', endpoint='/').observe(duration)
         metrics_dict['api_requests_total'].labels(method='GET', endpoint='/', status=status_code).inc()
 
+def evaluate_health():
+    """Health from the configuration and recent Anthropic calls; never calls Anthropic."""
+    config_error = None if ANTHROPIC_API_KEY else "ANTHROPIC_API_KEY environment variable not set"
+    return llm_service_health(llm_health, config_error, model=DEFAULT_MODEL, routing=model_router.describe())
+
+@app.route('/health/live', methods=['GET'])
+def liveness():
+    return jsonify({"status": "alive"}), 200
+
+@app.route('/health/ready', methods=['GET'])
+def readiness():
+    body, healthy = evaluate_health()
+    return jsonify(body), 200 if healthy else 503
+
+@app.route('/health', methods=['GET'])
+def health():
+    start_time = time.time()
+    body, healthy = evaluate_health()
+    status_code = 200 if healthy else 500
+    duration = time.time() - start_time
+    metrics_dict['api_request_duration'].labels(method='GET', endpoint='/health').observe(duration)
+    metrics_dict['api_requests_total'].labels(method='GET', endpoint='/health', status=status_code).inc()
+    return jsonify(body), status_code
+
 @app.route('/api/generate', methods=['POST'])
 def create_schedule():
     """
     Simple API bridge to Anthropic.
-    Takes a prompt and returns the raw API response.
+    Takes a prompt (and optionally the stable instructions as `system`, sent
+    with a prompt-cache breakpoint) and returns the raw API response.
     All business logic is handled by EEP1.
     """
     start_time = time.time()
@@ -136,19 +374,85 @@ def create_schedule():
         
         # Extract parameters
         prompt = data['prompt']
-        model = data.get('model', DEFAULT_MODEL)
+        system = data.get('system')
         temperature = data.get('temperature', 0.2)
         max_tokens = data.get('max_tokens', 4000)
+        user_id, feature = usage_attribution(request.headers)
+        # An explicit model wins; otherwise small tasks go to the fast model
+        size, tier = routing_hints(request.headers)
+        model, _ = model_router.route(routing_task(feature), size=size, tier=tier, requested=data.get('model'))
         
-        logger.info(f"Received prompt for Anthropic API (length: {len(prompt)} chars)")
+        logger.info(f"Received prompt for Anthropic API (length: {len(prompt)} chars, "
+                    f"system: {len(json.dumps(system)) if system else 0} chars)")
         
-        # Make the API call and return the raw response
-        response, status_code = call_anthropic_api(
-            prompt=prompt,
-            model=model,
-            temperature=temperature,
-            max_tokens=max_tokens
-        )
+        # Identical requests in flight share one Anthropic call unless the caller opted out
+        coalesce = generate_flights is not None and not flight_bypassed(request.headers)
+        flight_key = request_fingerprint(model=model, prompt=prompt, system=system, temperature=temperature,
+                                         max_tokens=max_tokens, stream=bool(data.get('stream')))
+
+        # Streaming mode: relay the Anthropic SSE stream as it arrives
+        if data.get('stream'):
+            stream_headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            flight = None
+            if coalesce:
+                flight, flight_role = generate_flights.stream(flight_key)
+                stream_headers['X-Single-Flight'] = flight_role
+                if flight_role != LEADER:
+                    return Response(stream_with_context(follow_stream(flight)), mimetype='text/event-stream',
+                                    headers=stream_headers)
+
+            stream_lines = None
+            if llm_hedger.enabled:
+                # A backup stream is opened when the first token is slower than usual; the loser is closed
+                (stream_response, model_used, stream_lines, error), _ = llm_hedger.call(
+                    f"{routing_task(feature)}_first_token", model,
+                    lambda hedge_model, cancelled: open_stream_to_first_token(prompt, hedge_model, temperature,
+                                                                              max_tokens, system),
+                    valid=lambda result: result[3] is None,
+                    release=lambda result: result[0] is not None and result[0].close(),
+                    size=size
+                )
+            else:
+                stream_response, model_used, error = stream_anthropic_api(
+                    prompt=prompt,
+                    model=model,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    system=system
+                )
+            if error:
+                response, status_code = error
+                if flight is not None:
+                    generate_flights.finish_stream(flight, error=FlightError(response.get('error', 'Anthropic API error')))
+                return jsonify(response), status_code
+            lines = relay_anthropic_stream(stream_response, model_used, user_id, feature, stream_lines)
+            if flight is not None:
+                lines = share_stream(flight, lines)
+            return Response(stream_with_context(lines), mimetype='text/event-stream', headers=stream_headers)
+        
+        # Make the API call and return the raw response (streamed when hedged, so the loser can be stopped)
+        call = lambda: llm_hedger.call(
+            routing_task(feature), model,
+            lambda hedge_model, cancelled: call_anthropic_api(
+                prompt=prompt,
+                model=hedge_model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                user_id=user_id,
+                feature=feature,
+                system=system,
+                cancelled=cancelled
+            ),
+            valid=lambda result: result[1] == 200,
+            size=size
+        )[0]
+        flight_role = None
+        if coalesce:
+            (response, status_code), flight_role = generate_flights.do(
+                flight_key, call, shareable=lambda result: result[1] == 200
+            )
+        else:
+            response, status_code = call()
         
         # If there was an error, return it directly
         if status_code != 200:
@@ -157,7 +461,10 @@ def create_schedule():
         logger.info(f"Successfully called Anthropic API, returning raw response")
         
         # Return the raw API response - let EEP1 handle the parsing
-        return jsonify(response)
+        result = jsonify(response)
+        if flight_role:
+            result.headers['X-Single-Flight'] = flight_role
+        return result
         
     except Exception as e:
         logger.error(f"Error in API bridge: {str(e)}")
@@ -170,6 +477,12 @@ def create_schedule():
         metrics_dict['api_request_duration'].labels(method='POST', endpoint='/api/generate').observe(duration)
         metrics_dict['api_requests_total'].labels(method='POST', endpoint='/api/generate', status=status_code).inc()
 
+@app.route('/usage', methods=['GET'])
+def usage():
+    """Token and cost totals of Anthropic calls, grouped by user_id, feature, endpoint or model."""
+    body, status_code = usage_summary(usage_recorder, request.args)
+    return jsonify(body), status_code
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5004))
     app.run(host='0.0.0.0', port=port, debug=True)
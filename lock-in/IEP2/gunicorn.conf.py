@@ -0,0 +1,29 @@
+"""
+Gunicorn settings for the LLM-bound services (EEP1, IEP1, IEP2, IEP4).
+Workers use gevent, so a request waiting on an LLM or a downstream service
+yields to other requests instead of holding a whole worker process. Socket
+I/O from requests and httpx (OpenAI client) is made cooperative by gevent's
+monkey patching, which the gevent worker applies at startup. sqlite3 calls
+run in C and are not patched: they block the worker while they run, so keep
+them to short local reads and writes.
+
+One worker process by default: EEP1's schedule and job stores default to
+process memory, which a second worker would not see. Only raise
+GUNICORN_WORKERS with a shared store (SCHEDULE_STORE=sqlite or redis);
+EEP1 refuses the memory store when GUNICORN_WORKERS is above 1.
+
+Set GUNICORN_WORKER_CLASS=sync to go back to one request per worker.
+"""
+
+import os
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+workers = int(os.getenv('GUNICORN_WORKERS', '1'))
+
+# Concurrent requests per gevent worker
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+
+# Long LLM calls (schedule generation, chat) can take several minutes
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '350'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
@@ -53,7 +53,70 @@ def setup_metrics(app, service_name):
     llm_tokens_total = Counter(
         'llm_tokens_total', 
         'Total number of tokens processed',
-        ['service', 'model', 'type']  # type can be 'input' or 'output'
+        ['service', 'model', 'type']  # type can be 'input', 'output', 'cache_read' or 'cache_write'
+    )
+
+    llm_cost_usd_total = Counter(
+        'llm_cost_usd_total',
+        'Estimated cost of LLM calls in USD',
+        ['service', 'model', 'feature']
+    )
+
+    # LLM gateway metrics (rate limiting, retries and circuit breaking of provider calls)
+    llm_gateway_attempts_total = Counter(
+        'llm_gateway_attempts_total',
+        'LLM provider calls by outcome of each attempt',
+        ['service', 'model', 'outcome']  # outcome can be 'ok', 'http_error', 'retry', 'connection_error', 'rate_limited', 'busy' or 'circuit_open'
+    )
+
+    llm_gateway_attempt_duration = Histogram(
+        'llm_gateway_attempt_duration_seconds',
+        'Duration of single LLM provider call attempts',
+        ['service', 'model', 'status']
+    )
+
+    llm_gateway_queue_seconds = Histogram(
+        'llm_gateway_queue_seconds',
+        'Time LLM calls waited for the rate limits and a concurrency slot',
+        ['service', 'model']
+    )
+
+    llm_circuit_state = Gauge(
+        'llm_circuit_state',
+        'LLM provider circuit breaker state (0 closed, 1 half-open, 2 open)',
+        ['service', 'upstream']
+    )
+
+    # Model routing metrics (which model each LLM call was sent to, and why)
+    llm_routing_decisions_total = Counter(
+        'llm_routing_decisions_total',
+        'LLM calls by task, routed model and reason of the decision',
+        ['service', 'task', 'model', 'reason']  # reason can be 'requested', 'disabled', 'tier', 'small', 'large', 'default' or 'slo'
+    )
+
+    llm_routing_latency_seconds = Gauge(
+        'llm_routing_latency_seconds',
+        'Recent latency percentile of LLM calls per task and model, as seen by the router',
+        ['service', 'task', 'model']
+    )
+
+    # Hedged LLM call metrics (backup requests sent past the tail-latency cutoff)
+    llm_hedged_calls_total = Counter(
+        'llm_hedged_calls_total',
+        'Hedgeable LLM calls by whether a backup request was sent',
+        ['service', 'task', 'hedge']  # hedge can be 'none', 'fired' or 'over_budget'
+    )
+
+    llm_hedge_wins_total = Counter(
+        'llm_hedge_wins_total',
+        'Hedged LLM calls by the request that returned the first valid result',
+        ['service', 'task', 'winner']  # winner can be 'primary' or 'backup'
+    )
+
+    llm_hedge_latency_saved_seconds = Histogram(
+        'llm_hedge_latency_saved_seconds',
+        'Time between the winning backup result and the later primary result',
+        ['service', 'task']
     )
     
     # System metrics
@@ -63,6 +126,167 @@ def setup_metrics(app, service_name):
         ['service']
     )
     
+    # Database connection pool metrics
+    db_pool_checkouts_total = Counter(
+        'db_pool_checkouts_total',
+        'Total number of connections checked out from the pool',
+        ['service']
+    )
+
+    db_pool_wait_seconds = Histogram(
+        'db_pool_wait_seconds',
+        'Time spent waiting to check out a pooled connection',
+        ['service']
+    )
+
+    db_pool_exhausted_total = Counter(
+        'db_pool_exhausted_total',
+        'Number of checkouts that found the pool exhausted and had to wait',
+        ['service']
+    )
+
+    db_pool_connections = Gauge(
+        'db_pool_connections',
+        'Current number of pooled connections',
+        ['service', 'state']  # state can be 'idle' or 'in_use'
+    )
+
+    # In-process cache metrics
+    cache_hits_total = Counter(
+        'cache_hits_total',
+        'Total number of cache hits',
+        ['service', 'cache']
+    )
+
+    cache_misses_total = Counter(
+        'cache_misses_total',
+        'Total number of cache misses',
+        ['service', 'cache']
+    )
+
+    cache_entries = Gauge(
+        'cache_entries',
+        'Current number of entries held in a cache',
+        ['service', 'cache']
+    )
+
+    cache_hit_ratio = Gauge(
+        'cache_hit_ratio',
+        'Fraction of cache lookups served from the cache',
+        ['service', 'cache']
+    )
+
+    cache_bytes_saved_total = Counter(
+        'cache_bytes_saved_total',
+        'Total size of responses served from a cache instead of the upstream',
+        ['service', 'cache']
+    )
+
+    # Single-flight coalescing metrics
+    singleflight_requests_total = Counter(
+        'singleflight_requests_total',
+        'Coalesced LLM calls by role',
+        ['service', 'flight', 'role']  # role can be 'leader', 'follower', 'shared', 'remote' or 'fallback'
+    )
+
+    singleflight_wait_seconds = Histogram(
+        'singleflight_wait_seconds',
+        'Time followers waited for the leader of a coalesced LLM call',
+        ['service', 'flight']
+    )
+
+    # Inter-service HTTP client metrics
+    downstream_request_duration = Histogram(
+        'downstream_request_duration_seconds',
+        'Duration of HTTP calls to downstream services',
+        ['service', 'downstream', 'endpoint']
+    )
+
+    downstream_connections_total = Counter(
+        'downstream_connections_total',
+        'Downstream requests by whether a pooled connection was reused',
+        ['service', 'downstream', 'result']  # result can be 'new' or 'reused'
+    )
+
+    downstream_retries_total = Counter(
+        'downstream_retries_total',
+        'Total number of retried downstream requests',
+        ['service', 'downstream']
+    )
+
+    dependency_up = Gauge(
+        'dependency_up',
+        'Whether the last background health probe of a dependency succeeded (1) or not (0)',
+        ['service', 'dependency']
+    )
+
+    # Background job metrics
+    jobs_total = Counter(
+        'jobs_total',
+        'Background jobs by lifecycle status',
+        ['service', 'status']
+    )
+
+    jobs_active = Gauge(
+        'jobs_active',
+        'Background jobs queued or running in this process',
+        ['service']
+    )
+
+    # Generated calendar validation metrics
+    calendar_issues_total = Counter(
+        'calendar_issues_total',
+        'Problems found when validating generated calendars',
+        ['service', 'code']  # code is the validation issue code, e.g. 'overlap'
+    )
+
+    calendar_repairs_total = Counter(
+        'calendar_repairs_total',
+        'Invalid generated calendars by how they were fixed',
+        ['service', 'method']  # method can be 'local', 'reprompt' or 'unresolved'
+    )
+
+    # LLM output JSON extraction metrics
+    json_extractions_total = Counter(
+        'json_extractions_total',
+        'JSON extractions from LLM output by outcome',
+        ['service', 'result']  # result can be 'direct', 'extracted', 'repaired', 'failed' or 'llm_fallback'
+    )
+
+    json_repairs_total = Counter(
+        'json_repairs_total',
+        'Local repairs applied to JSON in LLM output',
+        ['service', 'repair']
+    )
+
+    # Prompt construction metrics
+    prompt_fragment_bytes = Histogram(
+        'prompt_fragment_bytes',
+        'Size of each fragment of a built prompt',
+        ['service', 'fragment'],
+        buckets=(0, 100, 500, 1000, 2500, 5000, 10000, 25000, 50000)
+    )
+
+    # Chunked schedule parsing metrics
+    parse_chunks_total = Counter(
+        'parse_chunks_total',
+        'Chunks of schedule texts parsed by IEP1, by outcome',
+        ['service', 'outcome']  # outcome can be 'parsed', 'split' (re-sent in halves) or 'failed'
+    )
+
+    # Rule-based schedule parsing metrics
+    rule_parse_lines_total = Counter(
+        'rule_parse_lines_total',
+        'Lines of schedule texts by where they were parsed',
+        ['service', 'outcome']  # outcome can be 'local' (rules) or 'llm' (left to IEP1)
+    )
+
+    rule_parse_latency_saved_seconds = Histogram(
+        'rule_parse_latency_saved_seconds',
+        'Estimated IEP1 time saved by the lines parsed locally',
+        ['service']
+    )
+
     # Return all metrics for use in the application
     return {
         'metrics': metrics,
@@ -72,7 +296,42 @@ def setup_metrics(app, service_name):
         'llm_requests_total': llm_requests_total,
         'llm_request_duration': llm_request_duration,
         'llm_tokens_total': llm_tokens_total,
-        'system_memory_usage': system_memory_usage
+        'llm_cost_usd_total': llm_cost_usd_total,
+        'llm_gateway_attempts_total': llm_gateway_attempts_total,
+        'llm_gateway_attempt_duration': llm_gateway_attempt_duration,
+        'llm_gateway_queue_seconds': llm_gateway_queue_seconds,
+        'llm_circuit_state': llm_circuit_state,
+        'llm_routing_decisions_total': llm_routing_decisions_total,
+        'llm_routing_latency_seconds': llm_routing_latency_seconds,
+        'llm_hedged_calls_total': llm_hedged_calls_total,
+        'llm_hedge_wins_total': llm_hedge_wins_total,
+        'llm_hedge_latency_saved_seconds': llm_hedge_latency_saved_seconds,
+        'system_memory_usage': system_memory_usage,
+        'db_pool_checkouts_total': db_pool_checkouts_total,
+        'db_pool_wait_seconds': db_pool_wait_seconds,
+        'db_pool_exhausted_total': db_pool_exhausted_total,
+        'db_pool_connections': db_pool_connections,
+        'cache_hits_total': cache_hits_total,
+        'cache_misses_total': cache_misses_total,
+        'cache_entries': cache_entries,
+        'cache_hit_ratio': cache_hit_ratio,
+        'cache_bytes_saved_total': cache_bytes_saved_total,
+        'singleflight_requests_total': singleflight_requests_total,
+        'singleflight_wait_seconds': singleflight_wait_seconds,
+        'downstream_request_duration': downstream_request_duration,
+        'downstream_connections_total': downstream_connections_total,
+        'downstream_retries_total': downstream_retries_total,
+        'dependency_up': dependency_up,
+        'jobs_total': jobs_total,
+        'jobs_active': jobs_active,
+        'calendar_issues_total': calendar_issues_total,
+        'calendar_repairs_total': calendar_repairs_total,
+        'json_extractions_total': json_extractions_total,
+        'json_repairs_total': json_repairs_total,
+        'prompt_fragment_bytes': prompt_fragment_bytes,
+        'parse_chunks_total': parse_chunks_total,
+        'rule_parse_lines_total': rule_parse_lines_total,
+        'rule_parse_latency_saved_seconds': rule_parse_latency_saved_seconds
     }
 
 def track_llm_request(metrics_dict, service, model, start_time=None):
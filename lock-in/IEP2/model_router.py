@@ -0,0 +1,202 @@
+"""
+Per-request model routing between a fast and a strong LLM.
+
+Each call names its task (parse, generate, chat_edit, update_prompt, ...)
+and, when the caller knows it, its size in items (events, tasks, lines of
+text or chat turns). The policy of the task sends small inputs to the fast
+model and the rest to the strong one; a per-user tier can pin a model class,
+and when the recent latency percentile of the strong model breaks the
+task's SLO, medium-sized inputs move to the fast model until it recovers.
+Every decision is counted in llm_routing_decisions_total.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+FAST = 'fast'
+STRONG = 'strong'
+
+# Policy keys per task:
+#   default: model class when the size is unknown
+#   max_fast_size: largest input sent to the fast model
+#   slo_seconds: latency target of the task (None for no target)
+#   slo_max_size: largest input moved to the fast model while the strong one misses the SLO
+DEFAULT_POLICIES = {
+    '*': {'default': STRONG, 'max_fast_size': 0},
+    'parse': {'default': STRONG, 'max_fast_size': 15, 'slo_seconds': 10, 'slo_max_size': 40},
+    'parse_fallback': {'default': STRONG, 'max_fast_size': 0},
+    'generate': {'default': STRONG, 'max_fast_size': 0, 'slo_seconds': 90, 'slo_max_size': 6},
+    'regenerate': {'default': STRONG, 'max_fast_size': 0, 'slo_seconds': 90, 'slo_max_size': 6},
+    'calendar_reprompt': {'default': STRONG, 'max_fast_size': 2},
+    'description_polish': {'default': FAST, 'max_fast_size': 30},
+    'chat_edit': {'default': STRONG, 'max_fast_size': 40, 'slo_seconds': 8, 'slo_max_size': 80},
+    'chat_full': {'default': STRONG, 'max_fast_size': 0},
+    'update_prompt': {'default': STRONG, 'max_fast_size': 10, 'slo_seconds': 15, 'slo_max_size': 30},
+}
+
+
+def routing_hints(headers):
+    """(size, tier) of an LLM call from the X-LLM-Size and X-User-Tier request headers."""
+    try:
+        size = int(headers.get('X-LLM-Size'))
+    except (TypeError, ValueError):
+        size = None
+    return size, headers.get('X-User-Tier') or None
+
+
+class LatencyTracker:
+    """Recent call latencies per (task, model) and their percentile."""
+
+    def __init__(self, window_seconds=300, max_samples=200, min_samples=5, clock=time.monotonic):
+        self.window_seconds = window_seconds
+        self.max_samples = max_samples
+        self.min_samples = min_samples
+        self._clock = clock
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def observe(self, task, model, latency):
+        with self._lock:
+            samples = self._samples.setdefault((task, model), deque(maxlen=self.max_samples))
+            samples.append((self._clock(), latency))
+
+    def percentile(self, task, model, q):
+        """The q-th quantile (0-1) of the latencies in the window, or None with too few samples."""
+        cutoff = self._clock() - self.window_seconds
+        with self._lock:
+            latencies = sorted(latency for at, latency in self._samples.get((task, model), ()) if at >= cutoff)
+        if len(latencies) < self.min_samples:
+            return None
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+
+class ModelRouter:
+    """
+    Picks the model of each LLM call.
+
+    Args:
+        models: {FAST: model, STRONG: model}
+        policies: {task: policy} merged over DEFAULT_POLICIES ('*' applies to unknown tasks)
+        tiers: {user tier: FAST or STRONG} pinning the model class of a tier
+        enabled: When False every call goes to the strong model
+        percentile: Latency quantile compared with the SLO of a task
+        latency: LatencyTracker fed by observe()
+        metrics_dict: Optional metrics dictionary returned by setup_metrics
+        service_name: Service label for metrics
+    """
+
+    def __init__(self, models, policies=None, tiers=None, enabled=True, percentile=0.95, latency=None,
+                 metrics_dict=None, service_name=None):
+        self.models = dict(models)
+        self.policies = {task: dict(policy) for task, policy in DEFAULT_POLICIES.items()}
+        for task, policy in (policies or {}).items():
+            if not isinstance(policy, dict):
+                logger.error(f"Ignoring routing policy of {task}: expected an object")
+                continue
+            self.policies.setdefault(task, dict(self.policies['*'])).update(policy)
+        self.tiers = dict(tiers or {})
+        self.enabled = enabled
+        self.percentile = percentile
+        self.latency = latency or LatencyTracker()
+        self.metrics_dict = metrics_dict
+        self.service_name = service_name
+
+    def route(self, task, size=None, tier=None, requested=None):
+        """
+        Return (model, reason) for a call. reason is 'requested' (the caller
+        named a model), 'disabled', 'tier', 'small', 'large', 'default' or
+        'slo' (moved to the fast model while the strong one misses the SLO).
+        """
+        if requested:
+            return self._decide(task, requested, 'requested')
+        if not self.enabled:
+            return self._decide(task, self.models[STRONG], 'disabled')
+        policy = self.policies.get(task, self.policies['*'])
+        if tier in self.tiers:
+            return self._decide(task, self.models[self.tiers[tier]], 'tier')
+        if size is None:
+            choice, reason = policy.get('default', STRONG), 'default'
+        elif size <= policy.get('max_fast_size', 0):
+            choice, reason = FAST, 'small'
+        else:
+            choice, reason = STRONG, 'large'
+        if choice == STRONG and self._slo_missed(task, policy, size):
+            choice, reason = FAST, 'slo'
+        return self._decide(task, self.models[choice], reason)
+
+    def observe(self, task, model, latency):
+        """Record the latency of a completed call."""
+        self.latency.observe(task, model, latency)
+        if self.metrics_dict and 'llm_routing_latency_seconds' in self.metrics_dict:
+            value = self.latency.percentile(task, model, self.percentile)
+            if value is not None:
+                self.metrics_dict['llm_routing_latency_seconds'].labels(
+                    service=self.service_name, task=task, model=model
+                ).set(value)
+
+    def describe(self):
+        """Models and state of the policy, for health endpoints."""
+        return {'enabled': self.enabled, 'models': self.models}
+
+    # -------------------------------
+    # Internal helpers
+    # -------------------------------
+
+    def _slo_missed(self, task, policy, size):
+        """Whether this call should leave the strong model because it is slower than the task's SLO."""
+        slo = policy.get('slo_seconds')
+        if not slo or size is None or size > policy.get('slo_max_size', 0):
+            return False
+        if self.models[FAST] == self.models[STRONG]:
+            return False
+        strong = self.latency.percentile(task, self.models[STRONG], self.percentile)
+        if strong is None or strong <= slo:
+            return False
+        fast = self.latency.percentile(task, self.models[FAST], self.percentile)
+        return fast is None or fast < strong
+
+    def _decide(self, task, model, reason):
+        if self.metrics_dict and 'llm_routing_decisions_total' in self.metrics_dict:
+            self.metrics_dict['llm_routing_decisions_total'].labels(
+                service=self.service_name, task=task, model=model, reason=reason
+            ).inc()
+        logger.debug(f"Routed {task} call to {model} ({reason})")
+        return model, reason
+
+
+def _load_json_env(name):
+    value = os.getenv(name)
+    if not value:
+        return {}
+    try:
+        loaded = json.loads(value)
+        if not isinstance(loaded, dict):
+            raise ValueError("expected a JSON object")
+        return loaded
+    except ValueError as e:
+        logger.error(f"Ignoring invalid {name}: {str(e)}")
+        return {}
+
+
+def create_router_from_env(service_name, strong_model, fast_model, metrics_dict=None):
+    """
+    Router configured by the LLM_ROUTING_* environment variables. LLM_MODEL
+    and LLM_FAST_MODEL, read by the service, give the strong and fast models.
+    """
+    tiers = {tier: choice for tier, choice in _load_json_env('LLM_ROUTING_TIERS').items() if choice in (FAST, STRONG)}
+    return ModelRouter(
+        {FAST: fast_model or strong_model, STRONG: strong_model},
+        policies=_load_json_env('LLM_ROUTING_POLICY'),
+        tiers=tiers,
+        enabled=os.getenv('LLM_ROUTING_ENABLED', 'true').lower() not in ('0', 'false', 'no'),
+        percentile=float(os.getenv('LLM_ROUTING_PERCENTILE', '0.95')),
+        latency=LatencyTracker(window_seconds=float(os.getenv('LLM_ROUTING_WINDOW', '300'))),
+        metrics_dict=metrics_dict,
+        service_name=service_name
+    )
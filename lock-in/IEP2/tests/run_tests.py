@@ -7,6 +7,8 @@ import argparse
 # Add parent directory to path to find the modules to test
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+UNIT_TEST_PATTERNS = ['test_app.py', 'test_llm_usage.py', 'test_llm_gateway.py', 'test_single_flight.py', 'test_model_router.py', 'test_hedging.py']
+
 def run_tests(test_type="all", verbosity=2):
     """
     Run the specified type of tests.
@@ -23,11 +25,12 @@ def run_tests(test_type="all", verbosity=2):
     
     if test_type == "unit" or test_type == "all":
         print("Running unit tests...")
-        unit_tests = loader.discover(
-            os.path.dirname(os.path.abspath(__file__)), 
-            pattern='test_app.py'
-        )
-        suite.addTests(unit_tests)
+        for pattern in UNIT_TEST_PATTERNS:
+            unit_tests = loader.discover(
+                os.path.dirname(os.path.abspath(__file__)), 
+                pattern=pattern
+            )
+            suite.addTests(unit_tests)
     
     if test_type == "integration" or test_type == "all":
         print("Running integration tests...")
@@ -4,10 +4,59 @@ from unittest.mock import patch, MagicMock
 import sys
 import os
 import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 # Add parent directory to path to import app module
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import app
+from llm_usage import UsageRecorder, UsageLedger
+from health import CallHealth
+from llm_gateway import LLMGateway
+from single_flight import SingleFlight
+from model_router import ModelRouter, FAST, STRONG, LatencyTracker
+from hedging import Hedger
+
+STREAM_EVENTS = [
+    ('message_start', {"type": "message_start", "message": {"usage": {"input_tokens": 12}}}),
+    ('content_block_delta', {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "{\"Monday\": "}}),
+    ('content_block_delta', {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "[]}"}}),
+    ('message_delta', {"type": "message_delta", "usage": {"output_tokens": 5}}),
+    ('message_stop', {"type": "message_stop"}),
+]
+
+class FakeAnthropicSSEHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the Anthropic Messages API in streaming mode."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.server.last_request = json.loads(self.rfile.read(length))
+        self.server.requests = getattr(self.server, 'requests', 0) + 1
+        if self.server.status != 200:
+            body = b'{"error": {"message": "overloaded"}}'
+            self.send_response(self.server.status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        delays = getattr(self.server, 'first_token_delays', None)
+        if delays:
+            time.sleep(delays.pop(0))
+        for event, data in getattr(self.server, 'events', STREAM_EVENTS):
+            self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
 
 class TestIEP2App(unittest.TestCase):
     """Unit tests for IEP2 Anthropic API bridge."""
@@ -16,6 +65,13 @@ class TestIEP2App(unittest.TestCase):
         """Set up test client and resources."""
         app.app.testing = True
         self.client = app.app.test_client()
+        # Fresh gateway for every test, retrying without backoff delays
+        gateway_patch = patch('app.llm_gateway', LLMGateway(sleep=lambda seconds: None))
+        gateway_patch.start()
+        self.addCleanup(gateway_patch.stop)
+        flights_patch = patch('app.generate_flights', SingleFlight('generate'))
+        flights_patch.start()
+        self.addCleanup(flights_patch.stop)
         # Disable logging for tests
         logging.disable(logging.CRITICAL)
 
@@ -59,7 +115,7 @@ class TestIEP2App(unittest.TestCase):
         self.assertEqual(response_data['error'], 'No prompt provided')
 
     @patch('app.ANTHROPIC_API_KEY', 'mock_api_key')
-    @patch('app.requests.post')
+    @patch('app.llm_gateway.session.post')
     def test_generate_endpoint_successful_call(self, mock_post):
         """Test the generate endpoint with a successful API call."""
         # Mock the response from Anthropic API
@@ -115,7 +171,7 @@ class TestIEP2App(unittest.TestCase):
         self.assertEqual(response_data["content"][0]["text"], "This is a test response from Claude.")
 
     @patch('app.ANTHROPIC_API_KEY', 'mock_api_key')
-    @patch('app.requests.post')
+    @patch('app.llm_gateway.session.post')
     def test_generate_endpoint_with_custom_parameters(self, mock_post):
         """Test the generate endpoint with custom parameters."""
         # Mock the response from Anthropic API
@@ -148,7 +204,28 @@ class TestIEP2App(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
 
     @patch('app.ANTHROPIC_API_KEY', 'mock_api_key')
-    @patch('app.requests.post')
+    @patch('app.llm_gateway.session.post')
+    def test_generate_endpoint_routes_by_task_and_size(self, mock_post):
+        """Test that small tasks without an explicit model go to the fast model and decisions are counted."""
+        mock_post.return_value = MagicMock(status_code=200)
+        mock_post.return_value.json.return_value = {"content": [{"type": "text", "text": "{}"}]}
+        metrics_dict = {'llm_routing_decisions_total': MagicMock()}
+        router = ModelRouter({FAST: 'claude-fast', STRONG: 'claude-strong'}, metrics_dict=metrics_dict, service_name='iep2')
+        with patch('app.model_router', router):
+            self.client.post('/api/generate', json={'prompt': 'Polish these'},
+                             headers={'X-LLM-Feature': 'description_polish', 'X-LLM-Size': '4'})
+            self.client.post('/api/generate', json={'prompt': 'Plan my week'},
+                             headers={'X-LLM-Feature': 'generate', 'X-LLM-Size': '25'})
+
+        models = [call[1]['json']['model'] for call in mock_post.call_args_list]
+        self.assertEqual(models, ['claude-fast', 'claude-strong'])
+        metrics_dict['llm_routing_decisions_total'].labels.assert_any_call(
+            service='iep2', task='description_polish', model='claude-fast', reason='small')
+        metrics_dict['llm_routing_decisions_total'].labels.assert_any_call(
+            service='iep2', task='generate', model='claude-strong', reason='large')
+
+    @patch('app.ANTHROPIC_API_KEY', 'mock_api_key')
+    @patch('app.llm_gateway.session.post')
     def test_generate_endpoint_anthropic_api_error(self, mock_post):
         """Test the generate endpoint when Anthropic API returns an error."""
         # Mock an error response from Anthropic API
@@ -183,7 +260,7 @@ class TestIEP2App(unittest.TestCase):
         self.assertIn('ANTHROPIC_API_KEY environment variable not set', response_data['error'])
 
     @patch('app.ANTHROPIC_API_KEY', 'mock_api_key')
-    @patch('app.requests.post')
+    @patch('app.llm_gateway.session.post')
     def test_generate_endpoint_request_exception(self, mock_post):
         """Test the generate endpoint when requests raises an exception."""
         # Mock requests.post to raise an exception
@@ -200,5 +277,194 @@ class TestIEP2App(unittest.TestCase):
         self.assertIn('error', response_data)
         self.assertEqual(response_data['error'], 'Connection error')
 
+    def start_fake_anthropic(self, status=200):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FakeAnthropicSSEHandler)
+        server.daemon_threads = True
+        server.status = status
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, f"http://127.0.0.1:{server.server_address[1]}/v1/messages"
+
+    @patch('app.ANTHROPIC_API_KEY', 'mock_api_key')
+    def test_generate_endpoint_streaming(self):
+        """Test that stream=true relays the Anthropic SSE stream unchanged."""
+        server, url = self.start_fake_anthropic()
+        with patch('app.ANTHROPIC_API_URL', url):
+            response = self.client.post('/api/generate', json={'prompt': 'Test prompt', 'stream': True})
+            body = response.get_data(as_text=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        self.assertTrue(server.last_request['stream'])
+        self.assertIn('event: content_block_delta', body)
+        self.assertIn('"text": "[]}"', body)
+        self.assertIn('event: message_stop', body)
+
+    @patch('app.ANTHROPIC_API_KEY', 'mock_api_key')
+    @patch('app.llm_gateway.session.post')
+    def test_generate_endpoint_records_usage(self, mock_post):
+        """Test that the usage block of the response is written to the ledger with its attribution."""
+        mock_post.return_value = MagicMock(status_code=200)
+        mock_post.return_value.json.return_value = {
+            "content": [{"type": "text", "text": "{}"}],
+            "usage": {"input_tokens": 1200, "output_tokens": 300, "cache_read_input_tokens": 800}
+        }
+        recorder = UsageRecorder('iep2', ledger=UsageLedger())
+        with patch('app.usage_recorder', recorder):
+            self.client.post('/api/generate', json={'prompt': 'Test prompt'},
+                             headers={'X-User-ID': 'alice', 'X-LLM-Feature': 'regenerate'})
+            response = self.client.get('/usage?group_by=feature')
+
+        totals = json.loads(response.data)['totals']
+        self.assertEqual(len(totals), 1)
+        self.assertEqual((totals[0]['feature'], totals[0]['input_tokens'], totals[0]['output_tokens'],
+                          totals[0]['cache_read_tokens']), ('regenerate', 1200, 300, 800))
+        self.assertEqual(recorder.ledger.by_user()[0]['user_id'], 'alice')
+
+    @patch('app.ANTHROPIC_API_KEY', 'mock_api_key')
+    def test_generate_endpoint_streaming_records_usage(self):
+        """Test that usage spread over the streamed events is recorded once, when the stream ends."""
+        server, url = self.start_fake_anthropic()
+        recorder = UsageRecorder('iep2', ledger=UsageLedger())
+        with patch('app.ANTHROPIC_API_URL', url), patch('app.usage_recorder', recorder):
+            response = self.client.post('/api/generate', json={'prompt': 'Test prompt', 'stream': True},
+                                        headers={'X-LLM-Feature': 'generate'})
+            response.get_data()
+
+        totals = recorder.ledger.by_feature()
+        self.assertEqual([(row['feature'], row['calls'], row['input_tokens'], row['output_tokens']) for row in totals],
+                         [('generate', 1, 12, 5)])
+
+    @patch('app.ANTHROPIC_API_KEY', 'mock_api_key')
+    def test_generate_endpoint_caches_system_prompt(self):
+        """Test that the stable instructions go in a cached system block and the cache tokens are recorded."""
+        server, url = self.start_fake_anthropic()
+        server.events = [('message_start', {"type": "message_start", "message": {"usage": {
+            "input_tokens": 40, "cache_read_input_tokens": 3000, "cache_creation_input_tokens": 0}}})] + STREAM_EVENTS[1:]
+        metrics_dict = {'llm_tokens_total': MagicMock()}
+        recorder = UsageRecorder('iep2', ledger=UsageLedger(), metrics_dict=metrics_dict)
+        with patch('app.ANTHROPIC_API_URL', url), patch('app.usage_recorder', recorder):
+            response = self.client.post('/api/generate', json={
+                'prompt': 'MEETINGS: m-1', 'system': 'Scheduling instructions', 'stream': True
+            })
+            response.get_data()
+
+        payload = server.last_request
+        self.assertEqual(payload['system'], [{'type': 'text', 'text': 'Scheduling instructions',
+                                              'cache_control': {'type': 'ephemeral'}}])
+        self.assertEqual(payload['messages'], [{'role': 'user', 'content': 'MEETINGS: m-1'}])
+        totals = recorder.ledger.by_feature()[0]
+        self.assertEqual((totals['input_tokens'], totals['cache_read_tokens']), (40, 3000))
+        metrics_dict['llm_tokens_total'].labels.assert_any_call(service='anthropic', model=app.DEFAULT_MODEL,
+                                                                type='cache_read')
+
+        # Caller-placed breakpoints are kept, and requests without system send none
+        blocks = [{'type': 'text', 'text': 'Rules', 'cache_control': {'type': 'ephemeral'}}, {'type': 'text', 'text': 'Today'}]
+        with patch('app.ANTHROPIC_API_URL', url), patch('app.PROMPT_CACHE_ENABLED', True):
+            self.client.post('/api/generate', json={'prompt': 'p', 'system': blocks, 'stream': True}).get_data()
+            self.assertEqual(server.last_request['system'], blocks)
+            self.client.post('/api/generate', json={'prompt': 'p', 'stream': True}).get_data()
+            self.assertNotIn('system', server.last_request)
+
+    @patch('app.ANTHROPIC_API_KEY', 'mock_api_key')
+    def test_generate_endpoint_hedges_slow_first_token(self):
+        """Test that a stream without a first token by the cutoff gets a backup stream, which is relayed."""
+        server, url = self.start_fake_anthropic()
+        server.first_token_delays = [2.0, 0.0]
+        metrics_dict = {'llm_hedged_calls_total': MagicMock(), 'llm_hedge_wins_total': MagicMock()}
+        hedger = Hedger(percentile=0.5, min_delay=0.1, budget=1.0, latency=LatencyTracker(min_samples=1),
+                        metrics_dict=metrics_dict, service_name='iep2')
+        hedger.latency.observe('generate_first_token', app.DEFAULT_MODEL, 0.1)
+        with patch('app.ANTHROPIC_API_URL', url), patch('app.llm_hedger', hedger):
+            start = time.time()
+            response = self.client.post('/api/generate', json={'prompt': 'Test prompt', 'stream': True})
+            body = response.get_data(as_text=True)
+            elapsed = time.time() - start
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('event: message_stop', body)
+        self.assertLess(elapsed, 1.5)
+        self.assertEqual(server.requests, 2)
+        metrics_dict['llm_hedged_calls_total'].labels.assert_called_with(
+            service='iep2', task='generate_first_token', hedge='fired')
+        metrics_dict['llm_hedge_wins_total'].labels.assert_called_with(
+            service='iep2', task='generate_first_token', winner='backup')
+
+    @patch('app.ANTHROPIC_API_KEY', 'mock_api_key')
+    def test_generate_endpoint_hedges_by_streaming_and_stops_the_loser(self):
+        """Test that hedged non-streamed calls are streamed, so the losing call is stopped instead of read in full."""
+        server, url = self.start_fake_anthropic()
+        server.first_token_delays = [0.5, 0.0]
+        server.events = [STREAM_EVENTS[0],
+                         ('content_block_start', {"type": "content_block_start", "index": 0,
+                                                  "content_block": {"type": "text", "text": ""}})] + STREAM_EVENTS[1:]
+        hedger = Hedger(percentile=0.5, min_delay=0.1, budget=1.0, latency=LatencyTracker(min_samples=1))
+        hedger.latency.observe('generate:16-31', app.DEFAULT_MODEL, 0.1)
+        results = []
+        real_call = app.call_anthropic_api
+        call = lambda **kwargs: results.append(real_call(**kwargs)) or results[-1]
+        with patch('app.ANTHROPIC_API_URL', url), patch('app.llm_hedger', hedger), \
+                patch('app.call_anthropic_api', side_effect=call), \
+                patch.object(app.usage_recorder, 'record') as record:
+            response = self.client.post('/api/generate', json={'prompt': 'Test prompt'}, headers={'X-LLM-Size': '20'})
+            for _ in range(50):
+                if len(results) == 2:
+                    break
+                time.sleep(0.05)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['content'], [{'type': 'text', 'text': '{"Monday": []}'}])
+        self.assertEqual(json.loads(response.data)['usage'], {'input_tokens': 12, 'output_tokens': 5})
+        self.assertTrue(server.last_request['stream'])
+        self.assertEqual(sorted(status for _, status in results), [200, 499])
+        # The stopped call's usage still reaches the ledger
+        self.assertEqual(record.call_count, 2)
+
+    @patch('app.ANTHROPIC_API_KEY', 'mock_api_key')
+    def test_generate_endpoint_streaming_upstream_error(self):
+        """Test that an upstream error is returned as JSON before streaming starts."""
+        server, url = self.start_fake_anthropic(status=529)
+        with patch('app.ANTHROPIC_API_URL', url):
+            response = self.client.post('/api/generate', json={'prompt': 'Test prompt', 'stream': True})
+
+        self.assertEqual(response.status_code, 529)
+        self.assertIn('overloaded', json.loads(response.data)['error'])
+
+    @patch('app.ANTHROPIC_API_KEY', 'mock_api_key')
+    def test_generate_endpoint_coalesces_identical_streams(self):
+        """Test that identical streamed requests share one Anthropic call unless the caller opts out."""
+        server, url = self.start_fake_anthropic()
+        with patch('app.ANTHROPIC_API_URL', url):
+            first = self.client.post('/api/generate', json={'prompt': 'Test prompt', 'stream': True})
+            first_body = first.get_data(as_text=True)
+            second = self.client.post('/api/generate', json={'prompt': 'Test prompt ', 'stream': True})
+            self.assertEqual(second.get_data(as_text=True), first_body)
+            self.assertEqual((first.headers['X-Single-Flight'], second.headers['X-Single-Flight']), ('leader', 'shared'))
+            self.assertEqual(server.requests, 1)
+
+            bypass = self.client.post('/api/generate', json={'prompt': 'Test prompt', 'stream': True},
+                                      headers={'Cache-Control': 'no-cache'})
+            bypass.get_data()
+            self.assertEqual(server.requests, 2)
+
+    @patch('app.ANTHROPIC_API_KEY', 'mock_api_key')
+    def test_health_endpoints_follow_recent_calls(self):
+        """Test that health is derived from real calls and never calls Anthropic itself."""
+        server, url = self.start_fake_anthropic(status=529)
+        server.last_request = None
+        with patch('app.ANTHROPIC_API_URL', url), patch('app.llm_health', CallHealth()):
+            response = self.client.get('/health')
+            self.assertEqual((response.status_code, json.loads(response.data)['llm']['status']), (200, 'unknown'))
+            self.assertIsNone(server.last_request)
+
+            for _ in range(3):
+                self.client.post('/api/generate', json={'prompt': 'Test prompt', 'stream': True})
+            response = self.client.get('/health')
+            self.assertEqual(response.status_code, 500)
+            self.assertIn('circuit open', json.loads(response.data)['llm']['last_error'])
+            self.assertEqual(self.client.get('/health/ready').status_code, 503)
+            self.assertEqual(self.client.get('/health/live').status_code, 200)
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
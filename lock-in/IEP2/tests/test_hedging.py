@@ -0,0 +1,118 @@
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+import logging
+import threading
+
+# Add parent directory to path to import the hedging module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from hedging import Hedger, PRIMARY, BACKUP, size_bucket
+from model_router import LatencyTracker
+
+
+class TestHedger(unittest.TestCase):
+    """Unit tests for hedged LLM calls."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.metrics_dict = {'llm_hedged_calls_total': MagicMock(), 'llm_hedge_wins_total': MagicMock(),
+                             'llm_hedge_latency_saved_seconds': MagicMock()}
+        self.hedger = Hedger(percentile=0.5, min_delay=0.05, budget=0.5, latency=LatencyTracker(min_samples=2),
+                             metrics_dict=self.metrics_dict, service_name='iep2')
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def warm_up(self, latency=0.05):
+        for _ in range(2):
+            self.hedger.latency.observe('chat_edit', 'model-a', latency)
+
+    def test_no_backup_without_history_or_before_cutoff(self):
+        """Test that calls run once while latencies are unknown or when they answer before the cutoff."""
+        models = []
+        request = lambda model, cancelled: models.append(model) or 'ok'
+        self.assertEqual(self.hedger.call('chat_edit', 'model-a', request), ('ok', PRIMARY))
+        self.assertIsNone(self.hedger.delay('chat_edit', 'model-a'))
+        self.warm_up(latency=1.0)
+        self.assertEqual(self.hedger.call('chat_edit', 'model-a', request), ('ok', PRIMARY))
+        self.assertEqual(models, ['model-a', 'model-a'])
+        self.metrics_dict['llm_hedged_calls_total'].labels.assert_called_with(service='iep2', task='chat_edit', hedge='none')
+
+    def test_backup_wins_and_loser_is_released(self):
+        """Test that a slow primary gets a backup on the alternate model, is told to stop and its late result is released."""
+        self.warm_up()
+        self.hedger.backup_model = 'model-b'
+        self.hedger._count('chat_edit', 'none')
+        slow = threading.Event()
+        released = threading.Event()
+        events = {}
+
+        def request(model, cancelled):
+            events[model] = cancelled
+            if model == 'model-a':
+                slow.wait(5)
+                return 'late'
+            return 'fast'
+
+        release = lambda result: result == 'late' and released.set()
+        self.assertEqual(self.hedger.call('chat_edit', 'model-a', request, release=release), ('fast', BACKUP))
+        self.assertTrue(events['model-a'].is_set())
+        self.assertFalse(events['model-b'].is_set())
+        slow.set()
+        self.assertTrue(released.wait(5))
+        self.metrics_dict['llm_hedge_wins_total'].labels.assert_called_with(service='iep2', task='chat_edit', winner='backup')
+        self.metrics_dict['llm_hedge_latency_saved_seconds'].labels.return_value.observe.assert_called_once()
+
+    def test_invalid_backup_falls_back_to_primary(self):
+        """Test that an invalid backup result does not win over a later valid primary."""
+        self.warm_up()
+        self.hedger._count('chat_edit', 'none')
+        calls = []
+
+        def request(model, cancelled):
+            calls.append(model)
+            if len(calls) == 1:
+                threading.Event().wait(0.2)
+                return ({'content': []}, 200)
+            return ({'error': 'overloaded'}, 529)
+
+        result, winner = self.hedger.call('chat_edit', 'model-a', request, valid=lambda result: result[1] == 200)
+        self.assertEqual((result[1], winner), (200, PRIMARY))
+
+    def test_budget_caps_backups(self):
+        """Test that no backup is sent once backups would exceed the budget share of calls."""
+        self.warm_up()
+        self.hedger.budget = 0.0
+        gate = threading.Event()
+        calls = []
+
+        def request(model, cancelled):
+            calls.append(model)
+            gate.wait(0.2)
+            return 'slow'
+
+        self.assertEqual(self.hedger.call('chat_edit', 'model-a', request), ('slow', PRIMARY))
+        self.assertEqual(calls, ['model-a'])
+        self.metrics_dict['llm_hedged_calls_total'].labels.assert_called_with(
+            service='iep2', task='chat_edit', hedge='over_budget')
+
+    def test_cutoff_depends_on_the_input_size(self):
+        """Test that latencies are kept per size bucket, so large calls are not hedged by the cutoff of small ones."""
+        self.assertEqual([size_bucket(size) for size in (0, 1, 3, 10, 40)], ['0', '1', '2-3', '8-15', '32-63'])
+        for _ in range(2):
+            self.hedger.latency.observe('chat_edit:2-3', 'model-a', 0.5)
+            self.hedger.latency.observe('chat_edit:32-63', 'model-a', 8.0)
+        self.assertEqual(self.hedger.delay('chat_edit', 'model-a', size=3), 0.5)
+        self.assertEqual(self.hedger.delay('chat_edit', 'model-a', size=40), 8.0)
+        self.assertIsNone(self.hedger.delay('chat_edit', 'model-a', size=10))
+        self.assertIsNone(self.hedger.delay('chat_edit', 'model-a'))
+
+        self.hedger.call('chat_edit', 'model-a', lambda model, cancelled: 'ok', size=10)
+        self.assertIsNone(self.hedger.delay('chat_edit', 'model-a', size=10))
+        self.hedger.call('chat_edit', 'model-a', lambda model, cancelled: 'ok', size=10)
+        self.assertIsNotNone(self.hedger.delay('chat_edit', 'model-a', size=10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+import logging
+import json
+import threading
+
+import requests
+
+# Add parent directory to path to import the gateway module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_gateway import LLMGateway, GatewayError, CircuitBreaker, read_message_stream, STOP_CANCELLED
+
+URL = 'https://anthropic.test/v1/messages'
+PAYLOAD = {'model': 'claude-3-7-sonnet-20250219', 'messages': [{'role': 'user', 'content': 'Hi'}], 'max_tokens': 100}
+
+
+class FakeClock:
+    """Clock advanced by the gateway's sleeps."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def reply(status, headers=None, usage=None):
+    response = MagicMock(status_code=status, headers=headers or {})
+    response.json.return_value = {'usage': usage or {'input_tokens': 10, 'output_tokens': 5}}
+    return response
+
+
+class TestLLMGateway(unittest.TestCase):
+    """Unit tests for rate limiting, retries and circuit breaking of Anthropic calls."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def gateway(self, **kwargs):
+        gateway = LLMGateway(sleep=self.clock.sleep, clock=self.clock, **kwargs)
+        self.addCleanup(gateway.close)
+        return gateway
+
+    def test_retries_honour_retry_after(self):
+        """Test that 429/529 responses are retried, waiting retry-after when the provider sends it."""
+        gateway = self.gateway()
+        with patch.object(gateway.session, 'post', side_effect=[reply(429, {'retry-after': '7'}), reply(529), reply(200)]) as post:
+            response = gateway.post(URL, PAYLOAD, {'x-api-key': 'key'})
+        self.assertEqual((response.status_code, post.call_count), (200, 3))
+        self.assertEqual(self.clock.sleeps[0], 7.0)
+        self.assertLessEqual(self.clock.sleeps[1], 2.0)  # jittered backoff of the second attempt
+        self.assertEqual(post.call_args[1]['timeout'], (10, 300))
+
+        with patch.object(gateway.session, 'post', side_effect=[reply(400)]) as post:
+            self.assertEqual(gateway.post(URL, PAYLOAD, {}).status_code, 400)
+        self.assertEqual(post.call_count, 1)
+
+    def test_read_timeouts_are_not_retried_and_retries_stop_at_the_deadline(self):
+        """Test that a read timeout is raised at once, and that no retry is scheduled past the call deadline."""
+        gateway = self.gateway()
+        with patch.object(gateway.session, 'post', side_effect=requests.exceptions.ReadTimeout('read timed out')) as post:
+            with self.assertRaises(requests.exceptions.ReadTimeout):
+                gateway.post(URL, PAYLOAD, {})
+        self.assertEqual((post.call_count, self.clock.sleeps), (1, []))
+
+        gateway = self.gateway(deadline=20, read_timeout=300)
+        with patch.object(gateway.session, 'post', side_effect=[reply(529, {'retry-after': '15'}), reply(529, {'retry-after': '15'})]) as post:
+            self.assertEqual(gateway.post(URL, PAYLOAD, {}).status_code, 529)
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(self.clock.sleeps, [15.0])
+        self.assertEqual(post.call_args[1]['timeout'], (10, 10))  # what is left of the deadline, at least the connect timeout
+
+    def test_circuit_breaker(self):
+        """Test that repeated failures open the circuit and a trial call closes it again."""
+        gateway = self.gateway(max_retries=1, failure_threshold=3, reset_timeout=30)
+        with patch.object(gateway.session, 'post', side_effect=requests.exceptions.ConnectionError('refused')):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                gateway.post(URL, PAYLOAD, {})
+        with patch.object(gateway.session, 'post', return_value=reply(503)) as post:
+            # The third failure opens the circuit, so the retry is not sent
+            with self.assertRaises(GatewayError) as context:
+                gateway.post(URL, PAYLOAD, {})
+            self.assertEqual((context.exception.reason, context.exception.status_code), ('circuit_open', 503))
+            self.assertEqual(post.call_count, 1)
+            with self.assertRaises(GatewayError):
+                gateway.post(URL, PAYLOAD, {})
+            self.assertEqual(post.call_count, 1)
+
+        self.clock.now += 31
+        self.assertEqual(gateway.breaker.state, CircuitBreaker.HALF_OPEN)
+        with patch.object(gateway.session, 'post', return_value=reply(200)):
+            self.assertEqual(gateway.post(URL, PAYLOAD, {}).status_code, 200)
+        self.assertEqual(gateway.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_rate_limits_queue_callers(self):
+        """Test that simultaneous calls over the per-model limits queue, and are refused past the queue timeout."""
+        sleeps = []
+        # The clock does not move, as if every call arrived at the same moment
+        gateway = LLMGateway(requests_per_minute=2, queue_timeout=40, model_limits={'claude-3-5-haiku': (100, 1000)},
+                             sleep=sleeps.append, clock=self.clock)
+        self.addCleanup(gateway.close)
+        with patch.object(gateway.session, 'post', return_value=reply(200)) as post:
+            for _ in range(3):
+                gateway.post(URL, PAYLOAD, {})
+            self.assertEqual(sleeps, [30.0])  # the third call waited for the refill
+            with self.assertRaises(GatewayError) as context:
+                gateway.post(URL, PAYLOAD, {})
+            self.assertEqual((context.exception.reason, context.exception.status_code), ('rate_limited', 429))
+
+            # Other models have their own buckets; the second large request waits for the token limit
+            haiku = dict(PAYLOAD, model='claude-3-5-haiku-20241022', max_tokens=600)
+            post.return_value = reply(200, usage={'input_tokens': 15, 'output_tokens': 600})
+            gateway.post(URL, haiku, {})
+            gateway.post(URL, haiku, {})
+        self.assertEqual(len(sleeps), 2)
+        self.assertTrue(0 < sleeps[1] < 40)
+
+    def test_streams_hold_a_concurrency_slot_until_closed(self):
+        """Test bounded concurrency: a second call waits for an open stream and is refused (and refunded) when it times out."""
+        gateway = LLMGateway(max_concurrency=1, queue_timeout=0.05, requests_per_minute=2)
+        self.addCleanup(gateway.close)
+        with patch.object(gateway.session, 'post', side_effect=lambda *args, **kwargs: reply(200)):
+            stream = gateway.post(URL, PAYLOAD, {}, stream=True)
+            with self.assertRaises(GatewayError) as context:
+                gateway.post(URL, PAYLOAD, {})
+            self.assertEqual(context.exception.reason, 'busy')
+            stream.close()
+            # The refused call gave its request back, so the limit of two per minute still allows this one
+            stream.close()
+            self.assertEqual(gateway.post(URL, PAYLOAD, {}).status_code, 200)
+
+    def test_cancelled_stream_keeps_the_usage_seen_so_far(self):
+        """Test that a stream stopped by its cancel event returns the usage read before the cancel."""
+        cancelled = threading.Event()
+        start = {'type': 'message_start', 'message': {'id': 'msg_1', 'role': 'assistant',
+                                                       'usage': {'input_tokens': 12, 'output_tokens': 1}}}
+
+        def lines():
+            yield 'event: message_start'
+            yield f'data: {json.dumps(start)}'
+            cancelled.set()
+            yield ''
+            yield 'event: message_stop'
+
+        response = MagicMock()
+        response.iter_lines.return_value = lines()
+        message = read_message_stream(response, cancelled)
+
+        self.assertEqual(message['stop_reason'], STOP_CANCELLED)
+        self.assertEqual(message['usage'], {'input_tokens': 12, 'output_tokens': 1})
+        response.close.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
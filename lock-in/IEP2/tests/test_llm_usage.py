@@ -0,0 +1,77 @@
+import unittest
+from unittest.mock import MagicMock
+from types import SimpleNamespace
+import sys
+import os
+import logging
+
+# Add parent directory to path to import app module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_usage import normalize_usage, estimate_cost, UsageLedger, UsageRecorder, usage_summary
+
+
+class TestLLMUsage(unittest.TestCase):
+    """Unit tests for token and cost accounting."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_normalize_anthropic_usage(self):
+        """Test Anthropic usage, where input excludes the prompt-cache tokens."""
+        tokens = normalize_usage({'input_tokens': 100, 'output_tokens': 20,
+                                  'cache_read_input_tokens': 900, 'cache_creation_input_tokens': 50})
+        self.assertEqual(tokens, {'input': 100, 'output': 20, 'cache_read': 900, 'cache_write': 50})
+        self.assertEqual(normalize_usage(None), {'input': 0, 'output': 0, 'cache_read': 0, 'cache_write': 0})
+
+    def test_normalize_openai_usage(self):
+        """Test OpenAI usage objects, where prompt_tokens includes the cached tokens."""
+        usage = SimpleNamespace(prompt_tokens=1000, completion_tokens=200,
+                                prompt_tokens_details=SimpleNamespace(cached_tokens=768))
+        self.assertEqual(normalize_usage(usage), {'input': 232, 'output': 200, 'cache_read': 768, 'cache_write': 0})
+
+    def test_estimate_cost(self):
+        """Test pricing by the longest matching model prefix."""
+        tokens = {'input': 1_000_000, 'output': 100_000, 'cache_read': 1_000_000, 'cache_write': 0}
+        self.assertAlmostEqual(estimate_cost('claude-3-7-sonnet-20250219', tokens), 3.0 + 1.5 + 0.3)
+        self.assertAlmostEqual(estimate_cost('gpt-4o-mini-2024-07-18', tokens), 0.15 + 0.06 + 0.075)
+        self.assertEqual(estimate_cost('unknown-model', tokens), 0.0)
+
+    def test_ledger_aggregation(self):
+        """Test per-user and per-feature totals, most expensive first."""
+        metrics_dict = {'llm_tokens_total': MagicMock(), 'llm_cost_usd_total': MagicMock()}
+        recorder = UsageRecorder('iep2', ledger=UsageLedger(), metrics_dict=metrics_dict)
+        model = 'claude-3-7-sonnet-20250219'
+        recorder.record('anthropic', model, {'input_tokens': 1000, 'output_tokens': 3000}, endpoint='/api/generate',
+                        user_id='alice', feature='generate', latency=2.0)
+        recorder.record('anthropic', model, {'input_tokens': 500, 'output_tokens': 50}, endpoint='/api/generate',
+                        user_id='alice', feature='chat', latency=1.0)
+        result = recorder.record('anthropic', model, {'input_tokens': 200, 'output_tokens': 20},
+                                 user_id='bob', feature='chat')
+        self.assertAlmostEqual(result['cost_usd'], (200 * 3 + 20 * 15) / 1_000_000)
+
+        by_user = recorder.ledger.by_user()
+        self.assertEqual([(row['user_id'], row['calls'], row['output_tokens']) for row in by_user],
+                         [('alice', 2, 3050), ('bob', 1, 20)])
+        self.assertEqual(by_user[0]['avg_latency_ms'], 1500.0)
+        by_feature = {row['feature']: row for row in recorder.ledger.by_feature()}
+        self.assertEqual(by_feature['chat']['input_tokens'], 700)
+        self.assertEqual(recorder.ledger.summary('feature', since=4102444800), [])
+
+        metrics_dict['llm_tokens_total'].labels.assert_any_call(service='anthropic', model=model, type='output')
+        metrics_dict['llm_cost_usd_total'].labels.assert_any_call(service='iep2', model=model, feature='chat')
+
+    def test_usage_summary(self):
+        """Test the /usage response for valid and invalid groupings."""
+        recorder = UsageRecorder('iep2', ledger=UsageLedger())
+        recorder.record('anthropic', 'claude-3-5-haiku', {'input_tokens': 10}, feature='parse')
+        body, status = usage_summary(recorder, {'group_by': 'feature'})
+        self.assertEqual((status, body['totals'][0]['feature']), (200, 'parse'))
+        self.assertEqual(usage_summary(recorder, {'group_by': 'prompt'})[1], 400)
+        self.assertEqual(usage_summary(UsageRecorder('iep2'), {})[1], 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
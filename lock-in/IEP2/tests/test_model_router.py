@@ -0,0 +1,78 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+import logging
+
+# Add parent directory to path to import the model router module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from model_router import ModelRouter, LatencyTracker, FAST, STRONG, routing_hints, create_router_from_env
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestModelRouter(unittest.TestCase):
+    """Unit tests for routing LLM calls between the fast and strong models."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.clock = FakeClock()
+        self.router = ModelRouter({FAST: 'fast-model', STRONG: 'strong-model'},
+                                  latency=LatencyTracker(window_seconds=60, min_samples=3, clock=self.clock))
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_route_by_size(self):
+        """Test that the task policy sends small inputs to the fast model and unknown sizes to its default."""
+        self.assertEqual(self.router.route('chat_edit', size=12), ('fast-model', 'small'))
+        self.assertEqual(self.router.route('chat_edit', size=120), ('strong-model', 'large'))
+        self.assertEqual(self.router.route('chat_edit'), ('strong-model', 'default'))
+        self.assertEqual(self.router.route('description_polish'), ('fast-model', 'default'))
+        self.assertEqual(self.router.route('unknown_task', size=1), ('strong-model', 'large'))
+
+    def test_requested_tier_and_disabled(self):
+        """Test that an explicit model wins, tiers pin a model class and a disabled router always picks the strong model."""
+        router = ModelRouter({FAST: 'fast-model', STRONG: 'strong-model'}, tiers={'premium': STRONG})
+        self.assertEqual(router.route('parse', size=1, requested='other-model'), ('other-model', 'requested'))
+        self.assertEqual(router.route('parse', size=1, tier='premium'), ('strong-model', 'tier'))
+        self.assertEqual(router.route('parse', size=1, tier='free'), ('fast-model', 'small'))
+        router.enabled = False
+        self.assertEqual(router.route('parse', size=1), ('strong-model', 'disabled'))
+
+    def test_slo_moves_medium_inputs_to_fast_model(self):
+        """Test that medium inputs leave the strong model while its recent p95 misses the SLO, until the samples expire."""
+        for latency in (4, 12, 14):
+            self.router.observe('chat_edit', 'strong-model', latency)
+        self.assertEqual(self.router.route('chat_edit', size=60), ('fast-model', 'slo'))
+        self.assertEqual(self.router.route('chat_edit', size=200), ('strong-model', 'large'))
+
+        self.clock.now = 120
+        self.assertEqual(self.router.route('chat_edit', size=60), ('strong-model', 'large'))
+
+    def test_policies_and_hints_from_env(self):
+        """Test policy and tier overrides from the environment and the routing request headers."""
+        env = {'LLM_ROUTING_POLICY': '{"chat_edit": {"max_fast_size": 5}, "summary": {"default": "fast"}}',
+               'LLM_ROUTING_TIERS': '{"free": "fast", "gold": "platinum"}'}
+        metrics_dict = {'llm_routing_decisions_total': MagicMock()}
+        with patch.dict(os.environ, env):
+            router = create_router_from_env('iep4', 'strong-model', 'fast-model', metrics_dict)
+        self.assertEqual(router.route('chat_edit', size=12)[0], 'strong-model')
+        self.assertEqual(router.policies['chat_edit']['slo_seconds'], 8)
+        self.assertEqual(router.route('summary')[0], 'fast-model')
+        self.assertEqual(router.tiers, {'free': FAST})
+        metrics_dict['llm_routing_decisions_total'].labels.assert_any_call(
+            service='iep4', task='summary', model='fast-model', reason='default')
+
+        self.assertEqual(routing_hints({'X-LLM-Size': '7', 'X-User-Tier': 'free'}), (7, 'free'))
+        self.assertEqual(routing_hints({'X-LLM-Size': 'many'}), (None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+import sys
+import os
+import time
+import logging
+import tempfile
+import threading
+
+# Add parent directory to path to import the single-flight module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from single_flight import SingleFlight, FileFlightStore, FlightError, request_fingerprint
+
+
+def run_concurrently(count, target):
+    results = [None] * count
+
+    def run(index):
+        try:
+            results[index] = target()
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Unit tests for coalescing identical concurrent LLM calls."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_request_fingerprint(self):
+        """Test that the key ignores line endings and surrounding whitespace of the prompt only."""
+        key = request_fingerprint(model='m', prompt='Plan my week\n', temperature=0.2)
+        self.assertEqual(key, request_fingerprint(temperature=0.2, prompt='  Plan my week', model='m'))
+        self.assertNotEqual(key, request_fingerprint(model='m', prompt='Plan my week', temperature=0.7))
+
+    def test_concurrent_calls_share_one_result(self):
+        """Test that followers wait for the leader and reuse its result within the window."""
+        flights = SingleFlight('generate', window=10)
+        release = threading.Event()
+        calls = []
+
+        def call():
+            calls.append(1)
+            release.wait(5)
+            return {'content': 'calendar'}, 200
+
+        threads, results = run_concurrently(3, lambda: flights.do('key', call))
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(role for _, role in results), ['follower', 'follower', 'leader'])
+        self.assertTrue(all(result == ({'content': 'calendar'}, 200) for result, _ in results))
+
+        self.assertEqual(flights.do('key', call), (({'content': 'calendar'}, 200), 'shared'))
+        self.assertEqual(flights.do('other', call)[1], 'leader')
+        self.assertEqual(len(calls), 2)
+
+    def test_failures_are_shared_but_not_kept(self):
+        """Test that followers see the leader's error and a later call runs again."""
+        flights = SingleFlight('generate', window=10)
+        release = threading.Event()
+
+        def failing_call():
+            release.wait(5)
+            raise ConnectionError("upstream down")
+
+        threads, results = run_concurrently(2, lambda: flights.do('key', failing_call))
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertTrue(all(isinstance(result, ConnectionError) for result in results))
+
+        _, role = flights.do('key', lambda: ({'error': 'overloaded'}, 529), shareable=lambda result: result[1] == 200)
+        self.assertEqual(role, 'leader')
+        self.assertEqual(flights.do('key', lambda: ({}, 200))[1], 'leader')
+
+    def test_streams_are_relayed_to_followers(self):
+        """Test that followers receive the leader's chunks as they are published."""
+        flights = SingleFlight('generate', window=10)
+        flight, role = flights.stream('key')
+        self.assertEqual(role, 'leader')
+        follower, follower_role = flights.stream('key')
+        self.assertEqual((follower, follower_role), (flight, 'follower'))
+
+        received = []
+        reader = threading.Thread(target=lambda: received.extend(follower.follow(5)))
+        reader.start()
+        flight.publish('event: message_start\n')
+        flight.publish('event: message_stop\n')
+        flights.finish_stream(flight)
+        reader.join(5)
+        self.assertEqual(received, ['event: message_start\n', 'event: message_stop\n'])
+        self.assertEqual(list(flights.stream('key')[0].follow(1)), received)
+
+        failed, _ = flights.stream('failed')
+        failed.publish('event: message_start\n')
+        flights.finish_stream(failed, error=FlightError("leader disconnected"))
+        with self.assertRaises(FlightError):
+            list(failed.follow(1))
+        self.assertEqual(flights.stream('failed')[1], 'leader')
+
+    def test_replicas_share_through_the_store(self):
+        """Test that a second replica waits for the leader's result in the shared store."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        replica_a = SingleFlight('generate', store=FileFlightStore(directory.name), poll_interval=0.01)
+        replica_b = SingleFlight('generate', store=FileFlightStore(directory.name), poll_interval=0.01)
+        release = threading.Event()
+        calls = []
+
+        def call():
+            calls.append(1)
+            release.wait(5)
+            return {'content': 'calendar'}, 200
+
+        threads, results = run_concurrently(1, lambda: replica_a.do('key', call))
+        while not calls:
+            time.sleep(0.01)
+        follower_threads, follower_results = run_concurrently(1, lambda: replica_b.do('key', call))
+        time.sleep(0.1)
+        release.set()
+        for thread in threads + follower_threads:
+            thread.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results[0][1], 'leader')
+        self.assertEqual(follower_results[0], ([{'content': 'calendar'}, 200], 'remote'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,9 +3,18 @@ from flask_cors import CORS
 import os
 import json
 import logging
-import requests  # Changed from anthropic to requests
 from dotenv import load_dotenv
+import time
 import traceback
+from metrics_helper import setup_metrics, track_llm_request
+from llm_usage import create_usage_recorder_from_env, usage_attribution, usage_summary
+from health import create_call_health_from_env, llm_service_health, is_upstream_failure
+from llm_gateway import create_gateway_from_env, GatewayError, system_blocks, read_message_stream, STOP_CANCELLED
+from model_router import create_router_from_env, routing_hints
+from hedging import create_hedger_from_env
+from calendar_validation import repair_calendar
+from json_repair import extract_json, AUTO_CLOSED
+from calendar_patch import apply_edits, assign_event_ids
 
 # Configure logging
 logging.basicConfig(
@@ -21,6 +30,9 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)
 
+# Setup Prometheus metrics
+metrics_dict = setup_metrics(app, 'iep4')
+
 # Get Anthropic API key
 ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY')
 if not ANTHROPIC_API_KEY:
@@ -30,13 +42,45 @@ else:
 
 # Set the LLM model to use
 LLM_MODEL = os.getenv('LLM_MODEL', 'claude-3-7-sonnet-20250219')
+LLM_FAST_MODEL = os.getenv('LLM_FAST_MODEL', 'claude-3-5-haiku-20241022')  # Small edits (see model_router.py)
+ANTHROPIC_API_URL = os.getenv('ANTHROPIC_API_URL', 'https://api.anthropic.com/v1/messages')
 logger.info(f"Using LLM model: {LLM_MODEL}")
 
+# Mark the system prompt of each request as cacheable (Anthropic prompt caching)
+PROMPT_CACHE_ENABLED = os.getenv('ANTHROPIC_PROMPT_CACHE', 'true').lower() not in ('0', 'false', 'no')
+
+# Rate limits, retries and circuit breaking shared by every Anthropic call
+llm_gateway = create_gateway_from_env('iep4', metrics_dict)
+
+# Token and cost accounting from the Anthropic usage blocks
+usage_recorder = create_usage_recorder_from_env('iep4', metrics_dict)
+
+# Anthropic health derived from the outcome of real chat calls
+llm_health = create_call_health_from_env()
+
+# Picks the model of each call from its task (chat_edit, chat_full, update_prompt),
+# its size, the user tier and recent latencies
+model_router = create_router_from_env('iep4', LLM_MODEL, LLM_FAST_MODEL, metrics_dict)
+
+# Optional backup call when a chat completion is slower than its recent tail latency
+llm_hedger = create_hedger_from_env('iep4', metrics_dict)
+
+# "patch": the model returns edit operations that are applied locally (see calendar_patch.py)
+# "full": the model returns the whole regenerated calendar
+CHAT_EDIT_MODE = os.getenv('CHAT_EDIT_MODE', 'patch').lower()
+CHAT_PATCH_MAX_TOKENS = int(os.getenv('CHAT_PATCH_MAX_TOKENS', '1024'))
+
 # Function to call Anthropic API directly instead of using the client library
-def call_anthropic_api(prompt, model=None, temperature=0.7, max_tokens=4000):
+def call_anthropic_api(prompt, model=None, temperature=0.7, max_tokens=4000, endpoint=None, user_id=None, feature=None,
+                       system=None, task=None, cancelled=None):
     """
     Pure function to call Anthropic API with a prompt.
-    Returns the raw API response.
+    Returns the raw API response. endpoint, user_id and feature attribute the
+    call in the usage ledger. system holds the stable instructions, sent as a
+    cached system prompt so only the per-user prompt is processed on every turn.
+    task, if given, reports the latency of the call to the model router.
+    cancelled is the cancel event of a hedged call: the response is then
+    streamed, so a call that lost is closed instead of generated in full.
     """
     try:
         if not ANTHROPIC_API_KEY:
@@ -61,58 +105,136 @@ def call_anthropic_api(prompt, model=None, temperature=0.7, max_tokens=4000):
             "max_tokens": max_tokens,
             "temperature": temperature
         }
+        if system:
+            payload["system"] = system_blocks(system, cache=PROMPT_CACHE_ENABLED)
+        if cancelled is not None:
+            payload["stream"] = True
         
-        response = requests.post(
-            "https://api.anthropic.com/v1/messages",
-            headers=headers,
-            json=payload,
-            timeout=300  # Increased timeout from 60 to 300 seconds (5 minutes)
-        )
+        llm_start = time.time()
+        try:
+            with track_llm_request(metrics_dict, 'anthropic', model_to_use):
+                response = llm_gateway.post(ANTHROPIC_API_URL, payload, headers, stream=cancelled is not None)
+        except GatewayError as e:
+            logger.warning(f"Anthropic call refused by the gateway: {str(e)}")
+            if e.reason == 'circuit_open':
+                llm_health.record(False, None, e)
+            return {"error": str(e), "retry_after": e.retry_after}, e.status_code
+        except Exception as e:
+            llm_health.record(False, time.time() - llm_start, e)
+            raise
+        llm_health.record(not is_upstream_failure(response.status_code), time.time() - llm_start,
+                          f"HTTP {response.status_code}")
         
         if response.status_code != 200:
-            logger.error(f"Anthropic API error: {response.status_code} - {response.text}")
-            return {"error": f"Anthropic API returned error: {response.status_code} - {response.text}"}, response.status_code
+            error_text = response.text
+            response.close()
+            logger.error(f"Anthropic API error: {response.status_code} - {error_text}")
+            return {"error": f"Anthropic API returned error: {response.status_code} - {error_text}"}, response.status_code
+        
+        response_data = response.json() if cancelled is None else read_message_stream(response, cancelled)
+        # A hedged call that lost is recorded too: its tokens up to the cancel are billed
+        usage_recorder.record('anthropic', model_to_use, response_data.get('usage'), endpoint=endpoint,
+                              user_id=user_id, feature=feature, latency=time.time() - llm_start)
+        if response_data.get('stop_reason') == STOP_CANCELLED:
+            logger.info(f"Stopped a hedged {model_to_use} call that lost")
+            return {"error": "Call stopped: the hedged call answered first"}, 499
+        if task:
+            model_router.observe(task, model_to_use, time.time() - llm_start)
         
         # Return the raw API response
-        return response.json(), 200
+        return response_data, 200
             
     except Exception as e:
         logger.error(f"Error calling Anthropic API: {str(e)}")
         return {"error": str(e)}, 500
 
+def evaluate_health():
+    """Health from the configuration and recent chat calls; never calls Anthropic."""
+    config_error = None if ANTHROPIC_API_KEY else "ANTHROPIC_API_KEY not set"
+    return llm_service_health(llm_health, config_error, model=LLM_MODEL, routing=model_router.describe())
+
+@app.route('/health/live', methods=['GET'])
+def liveness():
+    """Liveness probe: the process is up and serving requests."""
+    return jsonify({"status": "alive"}), 200
+
+@app.route('/health/ready', methods=['GET'])
+def readiness():
+    """Readiness probe: 503 while the Anthropic API is failing or not configured."""
+    body, healthy = evaluate_health()
+    return jsonify(body), 200 if healthy else 503
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint."""
-    try:
-        if not ANTHROPIC_API_KEY:
-            return jsonify({
-                "status": "unhealthy", 
-                "error": "ANTHROPIC_API_KEY not set"
-            }), 500
-            
-        # Test connection to Anthropic API
-        response, status_code = call_anthropic_api(
-            prompt="Hello",
-            max_tokens=10
-        )
-        
-        if status_code != 200:
-            return jsonify({
-                "status": "unhealthy", 
-                "error": response.get("error", "Unknown error")
-            }), 500
-            
-        return jsonify({
-            "status": "healthy", 
-            "model": LLM_MODEL
-        }), 200
-        
-    except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
-        return jsonify({
-            "status": "unhealthy", 
-            "error": str(e)
-        }), 500
+    body, healthy = evaluate_health()
+    return jsonify(body), 200 if healthy else 500
+
+PATCH_SYSTEM_PROMPT = """You are an intelligent scheduling assistant integrated with the user's calendar system. Your task is to help users modify their existing weekly calendar based on their natural language requests.
+
+You do NOT return the calendar. You return only the edits needed to carry out the request; they are applied to the calendar for you and every event you do not mention stays exactly as it is.
+
+EDIT OPERATIONS (reference existing events by their "id"):
+- {"op": "add", "day": "Wednesday", "event": {"type": "personal", "description": "Gym", "start_time": "18:00", "duration": 60}}
+- {"op": "remove", "id": "event-id"}
+- {"op": "move", "id": "event-id", "day": "Thursday", "start_time": "18:00"}  // day or start_time may be omitted; the duration is kept
+- {"op": "resize", "id": "event-id", "duration": 90}  // or "end_time": "19:30"; the start time is kept
+- {"op": "update", "id": "event-id", "fields": {"description": "Swimming", "priority": "high"}}  // any field except id, day and times
+
+DATA FORMAT REQUIREMENTS:
+1. All times must be in 24-hour format (e.g., "14:00" not "2:00 PM")
+2. Durations are integers in minutes
+3. Day names must be capitalized (e.g., "Monday")
+4. Event types: "task", "exam" (with course_code), "meal", "personal" for sports and free time, "generated" for preparation sessions (with a "related_to" field holding the ID of the event it prepares for)
+5. Events of type "google_event" come from Google Calendar and cannot be edited
+
+RESPONSE REQUIREMENTS:
+1. "response" is your conversational message: explain the changes, ask for clarification if the request is ambiguous, or explain a conflict and suggest alternatives
+2. Only remove events the user asked to remove
+3. Use an empty "edits" list if nothing should change
+
+Your response MUST be a single raw JSON object, without markdown or code blocks:
+{"response": "...", "edits": [ ... ]}
+"""
+
+
+def intended_removals(parsed_response, edits=None):
+    """
+    IDs of reference events the model removed on purpose: the targets of
+    "remove" edits and the "removed" list of a full-calendar answer. The reply
+    text is not trusted ("I moved your lunch" is no removal), so any other
+    event missing from the answer was dropped by mistake and is restored.
+    """
+    removed = {edit.get('id') for edit in edits or [] if edit.get('op') == 'remove'}
+    if isinstance(parsed_response.get('removed'), list):
+        removed.update(event_id for event_id in parsed_response['removed'] if isinstance(event_id, str))
+    return removed
+
+
+def count_events(calendar):
+    """Number of events in a calendar, or None without one."""
+    if not isinstance(calendar, dict):
+        return None
+    return sum(len(events) for events in calendar.values() if isinstance(events, list))
+
+
+def build_patch_prompt(user_message, calendar, chat_history_text):
+    """
+    Per-user prompt asking for edit operations (PATCH_SYSTEM_PROMPT is sent as
+    the system prompt); the calendar is sent once, as compact JSON per day.
+    """
+    calendar_lines = "\n".join(
+        f"{day}: {json.dumps(events, separators=(',', ':'))}" for day, events in (calendar or {}).items()
+    )
+    return f"""CHAT HISTORY:
+{chat_history_text}
+
+CURRENT CALENDAR:
+{calendar_lines}
+
+USER: {user_message}
+"""
+
 
 @app.route('/chat', methods=['POST'])
 def chat():
@@ -131,6 +253,10 @@ def chat():
             return jsonify({"error": "No message provided"}), 400
         if not current_schedule:
             return jsonify({"error": "No schedule provided"}), 400
+
+        # Edits are only possible against an existing calendar
+        edit_mode = (data.get('edit_mode') or CHAT_EDIT_MODE).lower()
+        use_patch = edit_mode == 'patch' and isinstance(current_schedule.get('generated_calendar'), dict)
             
         # Log the incoming data in detail
         logger.info(f"Processing chat request with message: {user_message}")
@@ -211,6 +337,7 @@ Your response MUST be in valid JSON format with these properties:
 - "response": Your conversational message to the user
 - "schedule": Must include the original schedule structure with ONLY the generated_calendar modified
 - "generated_calendar": The complete calendar organized by days of the week as described above
+- "removed": The IDs of the events you removed at the user's request (an empty list if none)
 
 DO NOT include any markdown formatting or code blocks in your JSON response. The response should be raw, valid JSON without any additional formatting.
 """
@@ -227,6 +354,9 @@ DO NOT include any markdown formatting or code blocks in your JSON response. The
         
         if 'generated_calendar' in current_schedule:
             reference_calendar = current_schedule['generated_calendar']
+            # Edits reference events by ID, so meals and sessions without one get a stable ID first
+            if use_patch:
+                reference_calendar = assign_event_ids(reference_calendar)
             reference_calendar_text = f"""
 REFERENCE CALENDAR: 
 This is the existing calendar that MUST be preserved and extended with your changes.
@@ -238,9 +368,15 @@ DO NOT remove ANY events from this calendar unless specifically asked to:
 """
         
         # Format the complete prompt
-        prompt = f"""SYSTEM: {system_prompt}
-
-CHAT HISTORY:
+        # The instructions are the same on every turn and go in the cached system prompt
+        if use_patch:
+            system = PATCH_SYSTEM_PROMPT
+            prompt = build_patch_prompt(user_message, reference_calendar, chat_history_text)
+            max_tokens = CHAT_PATCH_MAX_TOKENS
+        else:
+            system = system_prompt
+            max_tokens = 4000
+            prompt = f"""CHAT HISTORY:
 {chat_history_text}
 
 CURRENT SCHEDULE:
@@ -262,13 +398,33 @@ IMPORTANT INSTRUCTION:
 USER: {user_message}
 """
         
-        logger.info("Sending request to Anthropic API")
+        logger.info(f"Sending request to Anthropic API ({'patch' if use_patch else 'full'} mode, prompt length: {len(prompt)} chars, "
+                    f"system: {len(system)} chars)")
         
-        # Make API call to Claude
-        response, status_code = call_anthropic_api(
-            prompt=prompt,
-            max_tokens=4000
-        )
+        # Small edits go to the fast model; sizes are events in the calendar
+        user_id, feature = usage_attribution(request.headers)
+        task = 'chat_edit' if use_patch else 'chat_full'
+        _, tier = routing_hints(request.headers)
+        size = count_events(reference_calendar)
+        model, _ = model_router.route(task, size=size, tier=tier)
+        
+        # Make API call to Claude, with a backup call if it is slower than usual (streamed, so the loser can be stopped)
+        response, status_code = llm_hedger.call(
+            task, model,
+            lambda hedge_model, cancelled: call_anthropic_api(
+                prompt=prompt,
+                system=system,
+                model=hedge_model,
+                max_tokens=max_tokens,
+                endpoint='/chat',
+                user_id=user_id,
+                feature=feature or 'chat',
+                task=task,
+                cancelled=cancelled
+            ),
+            valid=lambda result: result[1] == 200,
+            size=size
+        )[0]
         
         if status_code != 200:
             logger.error(f"API call failed: {response.get('error', 'Unknown error')}")
@@ -279,41 +435,36 @@ USER: {user_message}
             
         # Extract the model's response
         model_response = response["content"][0]["text"]
-        logger.info(f"Received response from Anthropic API (length: {len(model_response)} chars)")
+        logger.info(f"Received response from Anthropic API (length: {len(model_response)} chars, "
+                    f"output tokens: {(response.get('usage') or {}).get('output_tokens', 'unknown')})")
         
         # Try to parse the response as JSON
         try:
-            # Clean up the response text to handle markdown formatting if present
-            # First, check if the response is wrapped in ```json or ``` blocks
-            if "```json" in model_response:
-                # Extract the JSON from inside the code block
-                json_str = model_response.split("```json", 1)[1].split("```", 1)[0].strip()
-                logger.info("Extracted JSON from markdown code block (started with ```json)")
-            elif "```" in model_response:
-                # It's a regular code block
-                json_str = model_response.split("```", 1)[1].split("```", 1)[0].strip()
-                logger.info("Extracted JSON from markdown code block")
-            else:
-                # Just use the raw text, assuming it's already JSON
-                json_str = model_response.strip()
-                logger.info("Using raw text as JSON")
-                
-            # Handle potential "Extra data" errors by ensuring we have a balanced JSON object
-            # Find the position of the last balanced curly brace
-            try:
-                json_decoder = json.JSONDecoder()
-                json_decoder.decode(json_str)
-            except json.JSONDecodeError as e:
-                if "Extra data" in str(e):
-                    logger.warning(f"Extra data detected in JSON, truncating to position: {e.pos}")
-                    json_str = json_str[:e.pos]
-                    logger.info(f"Truncated JSON string length: {len(json_str)}")
-            
-            parsed_response = json.loads(json_str)
+            # Finds the JSON in code fences or prose and repairs trailing commas,
+            # raw newlines and truncated output
+            extraction = extract_json(model_response, prefer_keys=('response', 'edits', 'generated_calendar'))
+            if extraction is None or not isinstance(extraction.value, dict):
+                raise ValueError("No JSON object found in model response")
+            # Edits or a calendar closed by the repair were cut off, so part of the answer is missing
+            if AUTO_CLOSED in extraction.repairs:
+                raise ValueError("Model response was cut off before it was complete")
+            parsed_response = extraction.value
             
             # Log the entire parsed response structure
             logger.info(f"Parsed response structure keys: {list(parsed_response.keys())}")
                 
+            # Apply edit operations to the current calendar; a model that answered
+            # with a whole calendar instead is handled like full mode
+            patched = use_patch and isinstance(parsed_response.get("edits"), list)
+            if patched:
+                calendar, applied, rejected = apply_edits(reference_calendar, parsed_response["edits"])
+                logger.info(f"Applied {len(applied)} edit(s), rejected {len(rejected)}")
+                parsed_response["schedule"] = dict(current_schedule)
+                parsed_response["generated_calendar"] = calendar
+                parsed_response["edits"] = applied
+                if rejected:
+                    parsed_response["rejected_edits"] = rejected
+            
             # Validate the response structure
             if "response" not in parsed_response:
                 raise ValueError("Response missing required field: 'response'")
@@ -341,33 +492,26 @@ USER: {user_message}
             day_counts = {day: len(calendar.get(day, [])) for day in calendar}
             logger.info(f"Events per day: {day_counts}")
             
-            # Fallback: If we have a reference calendar and the new calendar has fewer events, use the reference
+            # Validate against the reference calendar: events the model dropped are restored
+            # unless it removed them on purpose (see intended_removals),
+            # Google Calendar events are kept in place and flexible events are moved out of conflicts
+            validation_issues = []
             if reference_calendar:
-                reference_event_count = sum(len(events) for day, events in reference_calendar.items())
-                new_event_count = sum(len(events) for day, events in calendar.items())
-                
-                logger.info(f"Reference calendar has {reference_event_count} events, new calendar has {new_event_count} events")
-                
-                if new_event_count < reference_event_count - 2:  # Allow for removing one or two events if requested
-                    logger.warning(f"New calendar has significantly fewer events than reference! Reference: {reference_event_count}, New: {new_event_count}")
-                    
-                    # Try to merge the calendars, keeping all reference events and adding the new ones
-                    merged_calendar = {day: [] for day in expected_days}
-                    
-                    # First add all reference events
-                    for day, events in reference_calendar.items():
-                        if day in merged_calendar:
-                            merged_calendar[day].extend(events)
-                    
-                    # Then add new events that don't already exist (by ID)
-                    for day, events in calendar.items():
-                        reference_ids = [event.get('id') for event in merged_calendar.get(day, [])]
-                        for event in events:
-                            if event.get('id') not in reference_ids:
-                                merged_calendar[day].append(event)
-                    
-                    logger.info(f"Merged calendar now has {sum(len(events) for day, events in merged_calendar.items())} total events")
-                    calendar = merged_calendar
+                removed_ids = intended_removals(parsed_response,
+                                                parsed_response.get("edits") if patched else None)
+                google_events = {
+                    day: [event for event in events if event.get('type') == 'google_event']
+                    for day, events in reference_calendar.items()
+                }
+                calendar, report = repair_calendar(
+                    calendar,
+                    google_calendar=google_events,
+                    reference_calendar=reference_calendar,
+                    removed_ids=removed_ids
+                )
+                validation_issues = report.issues
+                if validation_issues:
+                    logger.warning(f"Calendar still has {len(validation_issues)} validation issue(s): {[issue['message'] for issue in validation_issues]}")
             
             for day in expected_days:
                 if day not in calendar:
@@ -431,60 +575,17 @@ USER: {user_message}
             parsed_response["schedule"] = new_schedule
             logger.info("Added generated_calendar to schedule object for completeness")
             
+            if validation_issues:
+                parsed_response["validation_issues"] = validation_issues
+            
             logger.info("Returning successful response to client")
             return jsonify(parsed_response), 200
             
-        except (json.JSONDecodeError, ValueError) as e:
+        except ValueError as e:
             logger.error(f"Failed to parse response as JSON: {str(e)}")
             # Log a portion of the raw response for debugging
             logger.error(f"Raw response excerpt (first 500 chars): {model_response[:500]}")
             
-            # Attempt a more aggressive JSON extraction as a fallback
-            try:
-                # Look for anything that looks like JSON
-                import re
-                
-                # If we have an "Extra data" error, try to extract the valid JSON part
-                if "Extra data" in str(e) and isinstance(e, json.JSONDecodeError):
-                    pos = e.pos
-                    logger.info(f"Attempting to extract valid JSON up to position {pos}")
-                    potential_json = model_response[:pos]
-                    try:
-                        fallback_parsed = json.loads(potential_json)
-                        logger.info("Successfully parsed JSON by truncating at error position")
-                    except json.JSONDecodeError:
-                        # If that fails, try to find the last valid JSON object
-                        logger.info("Truncation failed, trying regex pattern matching")
-                        json_pattern = r'\{.*\}'
-                        match = re.search(json_pattern, model_response, re.DOTALL)
-                        if match:
-                            potential_json = match.group(0)
-                            fallback_parsed = json.loads(potential_json)
-                            logger.info("Successfully parsed JSON with regex pattern matching")
-                else:
-                    # If it's not an "Extra data" error, use regex
-                    json_pattern = r'\{.*\}'
-                    match = re.search(json_pattern, model_response, re.DOTALL)
-                    if match:
-                        potential_json = match.group(0)
-                        logger.info(f"Attempting to parse extracted JSON-like text: {potential_json[:100]}...")
-                        fallback_parsed = json.loads(potential_json)
-                        logger.info("Successfully parsed JSON with fallback method")
-                
-                # Validate and process this JSON similar to above
-                if "response" in fallback_parsed and ("generated_calendar" in fallback_parsed or 
-                                                     ("schedule" in fallback_parsed and "generated_calendar" in fallback_parsed["schedule"])):
-                    logger.info("Fallback JSON has required fields")
-                    
-                    # Extract or create necessary components
-                    if "generated_calendar" not in fallback_parsed and "schedule" in fallback_parsed and "generated_calendar" in fallback_parsed["schedule"]:
-                        fallback_parsed["generated_calendar"] = fallback_parsed["schedule"]["generated_calendar"]
-                        
-                    # Return the successfully parsed fallback
-                    return jsonify(fallback_parsed), 200
-            except Exception as fallback_error:
-                logger.error(f"Fallback JSON parsing also failed: {str(fallback_error)}")
-            
             # If all else fails, return the original schedule
             return jsonify({
                 "response": f"I processed your request but encountered an issue formatting the response. Here's what I understand: {model_response[:500]}...",
@@ -555,10 +656,8 @@ OUTPUT REQUIREMENTS:
         # Format the chat history as a string
         chat_history_text = json.dumps(chat_history, indent=2)
         
-        # Create the complete prompt
-        prompt = f"""SYSTEM: {system_prompt}
-
-ORIGINAL PROMPT:
+        # Create the per-user prompt; the instructions go in the cached system prompt
+        prompt = f"""ORIGINAL PROMPT:
 ```
 {original_prompt}
 ```
@@ -573,10 +672,21 @@ Based on this chat history, please CREATE or UPDATE ONLY the user-specific style
 Look for patterns in how the user wants their schedule arranged based on their chat interactions with the scheduling assistant. Incorporate these preferences into the style section of the prompt.
 """
         
+        # Short chat histories go to the fast model
+        user_id, feature = usage_attribution(request.headers)
+        _, tier = routing_hints(request.headers)
+        model, _ = model_router.route('update_prompt', size=len(chat_history), tier=tier)
+        
         # Make API call to Claude
         response, status_code = call_anthropic_api(
             prompt=prompt,
-            max_tokens=4000
+            system=system_prompt,
+            model=model,
+            max_tokens=4000,
+            endpoint='/update-prompt',
+            user_id=user_id,
+            feature=feature or 'update_prompt',
+            task='update_prompt'
         )
         
         if status_code != 200:
@@ -615,5 +725,11 @@ Look for patterns in how the user wants their schedule arranged based on their c
             "custom_prompt": data.get('original_prompt', '') if data else ''
         }), 500
 
+@app.route('/usage', methods=['GET'])
+def usage():
+    """Token and cost totals of Anthropic calls, grouped by user_id, feature, endpoint or model."""
+    body, status_code = usage_summary(usage_recorder, request.args)
+    return jsonify(body), status_code
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5005, debug=True) 
\ No newline at end of file
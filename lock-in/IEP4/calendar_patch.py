@@ -0,0 +1,208 @@
+"""
+Edit operations on a generated calendar.
+
+Instead of echoing the whole calendar back, the chat model returns a short
+list of edits that reference events by ID:
+
+    {"op": "add", "day": "Wednesday", "event": {"description": "Gym", "type": "personal",
+                                               "start_time": "18:00", "duration": 60}}
+    {"op": "remove", "id": "gym-1"}
+    {"op": "move", "id": "gym-1", "day": "Thursday", "start_time": "18:00"}
+    {"op": "resize", "id": "gym-1", "duration": 90}
+    {"op": "update", "id": "gym-1", "fields": {"description": "Swimming"}}
+
+The edits are applied locally to a copy of the current calendar, so events
+the model did not mention can never be lost or truncated away. Events without
+an ID (meals, preparation sessions) are given one with assign_event_ids before
+the calendar is shown to the model.
+"""
+
+import re
+import uuid
+import logging
+
+from calendar_validation import DAYS, END_OF_DAY, to_minutes, format_minutes
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = ('add', 'remove', 'move', 'resize', 'update')
+
+# Fields the "update" operation may not touch; days and times change through move/resize
+PROTECTED_FIELDS = {'id', 'day', 'start_time', 'end_time', 'duration'}
+
+# Events synced from Google Calendar are not edited from the chat
+READ_ONLY_TYPES = {'google_event'}
+
+
+def assign_event_ids(calendar):
+    """
+    Return a copy of calendar in which every event has an ID, so the model can
+    reference it. A missing ID is derived from the event's type, day and start
+    time (e.g. "meal-mon-1230"), so the same event gets the same ID every turn.
+    """
+    used = {event.get('id') for events in (calendar or {}).values() for event in events or [] if event.get('id')}
+    assigned = {}
+    for day, events in (calendar or {}).items():
+        assigned[day] = []
+        for event in events or []:
+            event = dict(event)
+            if not event.get('id'):
+                slug = re.sub(r'[^a-z0-9]+', '-', str(event.get('type') or 'event').lower()).strip('-') or 'event'
+                base = f"{slug}-{str(day)[:3].lower()}-{str(event.get('start_time') or '').replace(':', '')}".rstrip('-')
+                event_id, suffix = base, 2
+                while event_id in used:
+                    event_id, suffix = f"{base}-{suffix}", suffix + 1
+                event['id'] = event_id
+                used.add(event_id)
+            assigned[day].append(event)
+    return assigned
+
+
+class EditError(ValueError):
+    """An edit operation that cannot be applied."""
+
+
+def _normalize_day(day):
+    if isinstance(day, str) and day.strip().capitalize() in DAYS:
+        return day.strip().capitalize()
+    raise EditError(f"Unknown day '{day}'")
+
+
+def _duration(value):
+    try:
+        duration = int(value)
+    except (TypeError, ValueError):
+        raise EditError(f"Invalid duration '{value}'")
+    if duration <= 0:
+        raise EditError(f"Invalid duration '{value}'")
+    return duration
+
+
+def _set_times(event, start, duration):
+    if start is None:
+        raise EditError(f"Invalid start time '{event.get('start_time')}'")
+    if start + duration > END_OF_DAY:
+        raise EditError(f"{event.get('description')} would end after midnight")
+    event['start_time'] = format_minutes(start)
+    event['end_time'] = format_minutes(start + duration)
+    event['duration'] = duration
+
+
+def _event_duration(event):
+    start, end = to_minutes(event.get('start_time')), to_minutes(event.get('end_time'))
+    if start is not None and end is not None and end > start:
+        return end - start
+    return _duration(event.get('duration') or 60)
+
+
+class CalendarEditor:
+    """Applies edit operations to a copy of a calendar, locating events by ID."""
+
+    def __init__(self, calendar):
+        self.calendar = {day: [dict(event) for event in (calendar or {}).get(day) or []] for day in DAYS}
+        for day, events in (calendar or {}).items():
+            if day not in self.calendar:
+                self.calendar[day] = [dict(event) for event in events or []]
+        self._locations = {}
+        for day, events in self.calendar.items():
+            for event in events:
+                if event.get('id'):
+                    self._locations[event['id']] = day
+
+    def _find(self, event_id):
+        day = self._locations.get(event_id)
+        if day is None:
+            raise EditError(f"No event with id '{event_id}'")
+        event = next(event for event in self.calendar[day] if event.get('id') == event_id)
+        if event.get('type') in READ_ONLY_TYPES:
+            raise EditError(f"{event.get('description')} comes from Google Calendar and cannot be edited here")
+        return day, event
+
+    def apply(self, edit):
+        """Apply one edit; raises EditError if it is malformed or references an unknown event."""
+        if not isinstance(edit, dict) or edit.get('op') not in OPERATIONS:
+            raise EditError(f"Unknown operation {edit.get('op') if isinstance(edit, dict) else edit!r}")
+        getattr(self, f"_{edit['op']}")(edit)
+
+    def _add(self, edit):
+        event = dict(edit.get('event') or {})
+        day = _normalize_day(edit.get('day') or event.get('day'))
+        event.pop('day', None)
+        if not event.get('description'):
+            raise EditError("Added event has no description")
+        event.setdefault('type', 'personal')
+        if not event.get('id') or event['id'] in self._locations:
+            event['id'] = f"chat-{uuid.uuid4().hex[:8]}"
+        start, end = to_minutes(event.get('start_time')), to_minutes(event.get('end_time'))
+        if event.get('duration') is not None or end is None or start is None or end <= start:
+            duration = _duration(event.get('duration') or 60)
+        else:
+            duration = end - start
+        _set_times(event, start, duration)
+        self.calendar[day].append(event)
+        self._locations[event['id']] = day
+
+    def _remove(self, edit):
+        day, event = self._find(edit.get('id'))
+        self.calendar[day].remove(event)
+        del self._locations[event['id']]
+
+    def _move(self, edit):
+        day, event = self._find(edit.get('id'))
+        new_day = _normalize_day(edit['day']) if edit.get('day') else day
+        start = to_minutes(edit['start_time']) if edit.get('start_time') else to_minutes(event.get('start_time'))
+        if start is None:
+            raise EditError(f"Invalid start time '{edit.get('start_time')}'")
+        moved = dict(event)
+        _set_times(moved, start, _event_duration(event))
+        self.calendar[day].remove(event)
+        self.calendar[new_day].append(moved)
+        self._locations[event['id']] = new_day
+
+    def _resize(self, edit):
+        day, event = self._find(edit.get('id'))
+        start = to_minutes(event.get('start_time'))
+        if edit.get('duration') is not None:
+            duration = _duration(edit['duration'])
+        else:
+            end = to_minutes(edit.get('end_time'))
+            if end is None or start is None or end <= start:
+                raise EditError(f"Invalid end time '{edit.get('end_time')}'")
+            duration = end - start
+        resized = dict(event)
+        _set_times(resized, start, duration)
+        event.update(resized)
+
+    def _update(self, edit):
+        _, event = self._find(edit.get('id'))
+        fields = edit.get('fields')
+        if not isinstance(fields, dict) or not fields:
+            raise EditError("Update has no fields")
+        protected = PROTECTED_FIELDS.intersection(fields)
+        if protected:
+            raise EditError(f"Use move or resize to change {', '.join(sorted(protected))}")
+        event.update(fields)
+
+
+def apply_edits(calendar, edits):
+    """
+    Apply edit operations to a copy of calendar.
+
+    Edits that cannot be applied are skipped; the others still apply.
+
+    Returns:
+        (edited calendar with every day present and events sorted by start time,
+         list of applied edits, list of {index, edit, error} for rejected edits)
+    """
+    editor = CalendarEditor(calendar)
+    applied, rejected = [], []
+    for index, edit in enumerate(edits or []):
+        try:
+            editor.apply(edit)
+            applied.append(edit)
+        except EditError as e:
+            logger.warning(f"Rejected edit {index}: {e}")
+            rejected.append({'index': index, 'edit': edit, 'error': str(e)})
+    for events in editor.calendar.values():
+        events.sort(key=lambda event: (event.get('start_time') or '', event.get('end_time') or ''))
+    return editor.calendar, applied, rejected
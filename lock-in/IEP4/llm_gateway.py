@@ -0,0 +1,477 @@
+"""
+Shared gateway for calls to the Anthropic Messages API.
+
+Every call goes through one keep-alive session and is admitted by per-model
+token buckets (requests and tokens per minute) and a bound on concurrent
+calls. Callers over the limits wait in line for up to LLM_QUEUE_TIMEOUT
+seconds instead of failing. Overloaded and rate-limited responses
+(429/5xx/529) and failed connections are retried with jittered backoff that
+honours retry-after, within an overall deadline per call. Read timeouts are
+not retried: the provider may still be generating (and billing) the first
+answer. A circuit breaker stops sending calls for a while after repeated
+upstream failures.
+
+Limits are enforced per process; with several gunicorn workers, divide the
+provider limits by the number of workers.
+
+system_blocks() builds the system prompt of a request with a prompt-cache
+breakpoint after its stable part, and read_message_stream() rebuilds the
+response body of a streamed call, for calls that are streamed only so they
+can be stopped early.
+"""
+
+import os
+import json
+import time
+import random
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504, 529}
+
+# stop_reason of a streamed message that was closed because its hedged call lost
+STOP_CANCELLED = 'cancelled'
+
+
+class GatewayError(Exception):
+    """
+    A call the gateway refused to send. reason is 'rate_limited' (rate limit
+    queue full), 'busy' (no concurrency slot in time) or 'circuit_open'.
+    """
+
+    def __init__(self, message, reason, status_code=503, retry_after=None):
+        super().__init__(message)
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at rate_per_minute, holding at most
+    capacity tokens (one minute of tokens by default). Reservations may take
+    the balance negative; the deficit is the time the caller has to wait.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None, clock=time.monotonic):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+
+    def wait_time(self, amount):
+        """Seconds until amount tokens are available (0 if they are now)."""
+        self._refill()
+        deficit = min(amount, self.capacity) - self._tokens
+        return max(deficit / self.rate, 0.0)
+
+    def reserve(self, amount):
+        self._refill()
+        self._tokens -= min(amount, self.capacity)
+
+    def refund(self, amount):
+        self._refill()
+        self._tokens = min(self._tokens + amount, self.capacity)
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive upstream failures and rejects
+    calls for reset_timeout seconds, then lets one trial call through
+    (half-open) that closes it again on success.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def retry_after(self):
+        """Seconds until an open circuit lets a trial call through."""
+        with self._lock:
+            if self._opened_at is None:
+                return 0
+            return max(self.reset_timeout - (self._clock() - self._opened_at), 0)
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._trial_running = False
+
+    def _state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if self._clock() - self._opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+
+class LLMGateway:
+    """
+    Rate-limited, retrying client for one LLM provider.
+
+    Args:
+        name: Provider name used as a metrics label (e.g. 'anthropic')
+        requests_per_minute: Default request limit per model
+        tokens_per_minute: Default token limit per model (prompt estimate plus max_tokens)
+        model_limits: {model prefix: (requests per minute, tokens per minute)} overriding the defaults
+        max_concurrency: Maximum number of calls in flight (streams count until closed)
+        queue_timeout: Longest time in seconds a call waits for the limits before it is refused
+        max_retries: Retries on connection errors and 429/5xx/529 responses
+        backoff_base: Base delay in seconds for the jittered exponential backoff
+        backoff_max: Upper bound of a single backoff or retry-after delay
+        connect_timeout: Connect timeout in seconds
+        read_timeout: Read timeout in seconds (between two stream events when streaming)
+        deadline: Longest time in seconds spent on the attempts and backoff of one call
+        failure_threshold: Consecutive upstream failures that open the circuit
+        reset_timeout: Seconds the circuit stays open
+        pool_size: Maximum number of pooled connections kept open
+        metrics_dict: Optional metrics dictionary returned by setup_metrics
+        service_name: Label of the calling service
+    """
+
+    def __init__(self, name='anthropic', requests_per_minute=50, tokens_per_minute=100000, model_limits=None,
+                 max_concurrency=8, queue_timeout=30.0, max_retries=3, backoff_base=1.0, backoff_max=30.0,
+                 connect_timeout=10, read_timeout=300, deadline=330, failure_threshold=5, reset_timeout=30, pool_size=10,
+                 metrics_dict=None, service_name=None, sleep=time.sleep, clock=time.monotonic):
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.model_limits = model_limits or {}
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = (connect_timeout, read_timeout)
+        self.deadline = deadline
+        self.metrics_dict = metrics_dict
+        self.service_name = service_name
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, clock=clock)
+        self._sleep = sleep
+        self._clock = clock
+        self._buckets = {}  # model -> (request bucket, token bucket)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, pool_block=False)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def post(self, url, payload, headers, stream=False):
+        """
+        Send a Messages API request once the limits admit it, retrying
+        transient failures. Returns the final requests.Response (streamed
+        responses hold a concurrency slot until they are closed).
+        Raises GatewayError when the call is refused locally, the last
+        requests exception when every attempt failed to connect, and
+        requests.exceptions.ReadTimeout (not retried) when the provider
+        stopped answering.
+        """
+        model = payload.get('model', 'unknown')
+        if self.breaker.state == CircuitBreaker.OPEN:
+            self._reject_open_circuit(model)
+
+        tokens = estimate_request_tokens(payload)
+        queue_start = self._clock()
+        self._wait_for_rate_limit(model, tokens)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            # Nothing was sent, so the reserved request and tokens go back to the buckets
+            self._refund(model, 1, tokens)
+            self._attempt(model, 'busy')
+            raise GatewayError(f"Too many concurrent {self.name} calls", 'busy', 503, retry_after=self.queue_timeout)
+        self._observe_queue(model, self._clock() - queue_start)
+
+        try:
+            response = self._send(url, payload, headers, stream, model)
+        except BaseException:
+            self._slots.release()
+            raise
+        if stream and response.status_code == 200:
+            self._release_on_close(response)
+        else:
+            self._slots.release()
+            if response.status_code == 200:
+                self._refund_unused_tokens(model, tokens, response)
+        return response
+
+    def close(self):
+        self.session.close()
+
+    # -------------------------------
+    # Internal helpers
+    # -------------------------------
+
+    def _send(self, url, payload, headers, stream, model):
+        attempts = 1 + self.max_retries
+        deadline = self._clock() + self.deadline
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                self._reject_open_circuit(model)
+            start_time = time.time()
+            # The last attempt may only wait for what is left of the deadline
+            timeout = (self.timeout[0], max(min(self.timeout[1], deadline - self._clock()), self.timeout[0]))
+            try:
+                response = self.session.post(url, headers=headers, json=payload, stream=stream, timeout=timeout)
+            except requests.exceptions.ReadTimeout:
+                # The request was sent and may still be generating, so it is not sent again
+                self._observe_attempt(model, 'timeout', time.time() - start_time)
+                self.breaker.record_failure()
+                self._attempt(model, 'timeout')
+                raise
+            except requests.exceptions.ConnectionError as e:
+                self._observe_attempt(model, 'connection_error', time.time() - start_time)
+                self.breaker.record_failure()
+                delay = self._backoff(attempt)
+                if attempt + 1 >= attempts or self._clock() + delay >= deadline:
+                    self._attempt(model, 'connection_error')
+                    raise
+                logger.warning(f"{self.name} call failed ({str(e)}), retrying")
+                self._attempt(model, 'retry')
+                self._sleep(delay)
+                continue
+
+            status = response.status_code
+            self._observe_attempt(model, str(status), time.time() - start_time)
+            if status >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+
+            delay = self._retry_after(response) or self._backoff(attempt)
+            if status in RETRYABLE_STATUS_CODES and attempt + 1 < attempts and self._clock() + delay < deadline:
+                logger.warning(f"{self.name} returned {status}, retrying in {delay:.1f}s")
+                response.close()
+                self._attempt(model, 'retry')
+                self._sleep(delay)
+                continue
+            self._attempt(model, 'ok' if status == 200 else 'http_error')
+            return response
+
+    def _reject_open_circuit(self, model):
+        self._attempt(model, 'circuit_open')
+        raise GatewayError(f"{self.name} circuit open after repeated failures", 'circuit_open', 503,
+                           retry_after=self.breaker.retry_after())
+
+    def _wait_for_rate_limit(self, model, tokens):
+        with self._lock:
+            request_bucket, token_bucket = self._buckets_for(model)
+            wait = max(request_bucket.wait_time(1), token_bucket.wait_time(tokens))
+            if wait > self.queue_timeout:
+                self._attempt(model, 'rate_limited')
+                raise GatewayError(f"{self.name} rate limit for {model} exceeded", 'rate_limited', 429, retry_after=wait)
+            request_bucket.reserve(1)
+            token_bucket.reserve(tokens)
+        if wait > 0:
+            logger.info(f"Waiting {wait:.1f}s for the {model} rate limit")
+            self._sleep(wait)
+
+    def _buckets_for(self, model):
+        if model not in self._buckets:
+            matches = [prefix for prefix in self.model_limits if model.startswith(prefix)]
+            rpm, tpm = self.model_limits[max(matches, key=len)] if matches else (self.requests_per_minute, self.tokens_per_minute)
+            self._buckets[model] = (TokenBucket(rpm, clock=self._clock), TokenBucket(tpm, clock=self._clock))
+        return self._buckets[model]
+
+    def _refund(self, model, requests_count, tokens):
+        with self._lock:
+            request_bucket, token_bucket = self._buckets_for(model)
+            request_bucket.refund(requests_count)
+            token_bucket.refund(tokens)
+
+    def _refund_unused_tokens(self, model, estimated, response):
+        try:
+            usage = response.json().get('usage') or {}
+            used = sum(int(usage.get(key) or 0) for key in ('input_tokens', 'output_tokens', 'cache_creation_input_tokens'))
+        except (ValueError, TypeError, AttributeError):
+            return
+        if used and used < estimated:
+            with self._lock:
+                self._buckets_for(model)[1].refund(estimated - used)
+
+    def _release_on_close(self, response):
+        close = response.close
+        released = threading.Event()
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                if not released.is_set():
+                    released.set()
+                    self._slots.release()
+        response.close = close_and_release
+
+    def _retry_after(self, response):
+        try:
+            return min(float(response.headers.get('retry-after')), self.backoff_max)
+        except (TypeError, ValueError):
+            return None
+
+    def _backoff(self, attempt):
+        # Full jitter keeps simultaneous retries from hitting the provider together
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _attempt(self, model, outcome):
+        if self.metrics_dict and 'llm_gateway_attempts_total' in self.metrics_dict:
+            self.metrics_dict['llm_gateway_attempts_total'].labels(
+                service=self.service_name, model=model, outcome=outcome
+            ).inc()
+        if self.metrics_dict and 'llm_circuit_state' in self.metrics_dict:
+            state = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}[self.breaker.state]
+            self.metrics_dict['llm_circuit_state'].labels(service=self.service_name, upstream=self.name).set(state)
+
+    def _observe_attempt(self, model, status, duration):
+        if self.metrics_dict and 'llm_gateway_attempt_duration' in self.metrics_dict:
+            self.metrics_dict['llm_gateway_attempt_duration'].labels(
+                service=self.service_name, model=model, status=status
+            ).observe(duration)
+
+    def _observe_queue(self, model, duration):
+        if self.metrics_dict and 'llm_gateway_queue_seconds' in self.metrics_dict:
+            self.metrics_dict['llm_gateway_queue_seconds'].labels(service=self.service_name, model=model).observe(duration)
+
+
+def estimate_request_tokens(payload):
+    """Tokens a Messages API request may use: about 4 characters per prompt token plus max_tokens."""
+    prompt_chars = len(json.dumps(payload.get('messages', []))) + len(json.dumps(payload.get('system', '')))
+    return prompt_chars // 4 + int(payload.get('max_tokens') or 0)
+
+
+def system_blocks(system, cache=True):
+    """
+    The Messages API `system` field for a system prompt given as text or as
+    text blocks, or None when it is empty. With cache, the last block gets an
+    ephemeral cache_control breakpoint (unless the caller placed its own), so
+    later calls with the same prefix read it from Anthropic's prompt cache.
+    """
+    if not system:
+        return None
+    blocks = [{'type': 'text', 'text': system}] if isinstance(system, str) else [dict(block) for block in system]
+    if cache and not any('cache_control' in block for block in blocks):
+        blocks[-1]['cache_control'] = {'type': 'ephemeral'}
+    return blocks
+
+
+def read_message_stream(response, cancelled=None):
+    """
+    Read a streamed Messages API response into the body the same call would
+    have returned without streaming (content blocks, stop_reason, usage).
+    Stops reading as soon as cancelled (a threading.Event) is set and
+    returns the message read so far with stop_reason STOP_CANCELLED, so the
+    tokens already billed can still be recorded. Raises ValueError on an
+    error event or a stream that ended before message_stop. The response is
+    always closed.
+    """
+    message = None
+    partial_json = {}
+    event = None
+    try:
+        for line in response.iter_lines(decode_unicode=True):
+            if cancelled is not None and cancelled.is_set():
+                return dict(message or {'content': [], 'usage': None}, stop_reason=STOP_CANCELLED)
+            if not line:
+                continue
+            if line.startswith('event:'):
+                event = line[6:].strip()
+                continue
+            if not line.startswith('data:'):
+                continue
+            data = json.loads(line[5:].strip())
+            if event == 'error':
+                raise ValueError(f"Anthropic stream failed: {(data.get('error') or {}).get('message', data)}")
+            if event == 'message_start':
+                message = dict(data['message'], content=[])
+            elif event == 'content_block_start':
+                message['content'].append(dict(data['content_block']))
+            elif event == 'content_block_delta':
+                block, delta = message['content'][data['index']], data['delta']
+                if delta.get('type') == 'text_delta':
+                    block['text'] = block.get('text', '') + delta['text']
+                elif delta.get('type') == 'input_json_delta':
+                    partial_json[data['index']] = partial_json.get(data['index'], '') + delta['partial_json']
+            elif event == 'content_block_stop' and data['index'] in partial_json:
+                message['content'][data['index']]['input'] = json.loads(partial_json.pop(data['index']) or '{}')
+            elif event == 'message_delta':
+                message.update(data.get('delta') or {})
+                message['usage'] = dict(message.get('usage') or {}, **(data.get('usage') or {}))
+            elif event == 'message_stop':
+                return message
+        raise ValueError("Anthropic stream ended before the message was complete")
+    finally:
+        response.close()
+
+
+def load_model_limits():
+    """Per-model limits from LLM_RATE_LIMITS ({model prefix: [requests per minute, tokens per minute]})."""
+    override = os.getenv('LLM_RATE_LIMITS')
+    if not override:
+        return {}
+    try:
+        return {model: (float(values[0]), float(values[1])) for model, values in json.loads(override).items()}
+    except (ValueError, TypeError, AttributeError, IndexError) as e:
+        logger.error(f"Ignoring invalid LLM_RATE_LIMITS: {str(e)}")
+        return {}
+
+
+def create_gateway_from_env(service_name, metrics_dict=None):
+    """Anthropic gateway configured by the LLM_* environment variables."""
+    return LLMGateway(
+        'anthropic',
+        requests_per_minute=float(os.getenv('LLM_REQUESTS_PER_MINUTE', '50')),
+        tokens_per_minute=float(os.getenv('LLM_TOKENS_PER_MINUTE', '100000')),
+        model_limits=load_model_limits(),
+        max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', '8')),
+        queue_timeout=float(os.getenv('LLM_QUEUE_TIMEOUT', '30')),
+        max_retries=int(os.getenv('LLM_MAX_RETRIES', '3')),
+        connect_timeout=float(os.getenv('LLM_CONNECT_TIMEOUT', '10')),
+        read_timeout=float(os.getenv('LLM_READ_TIMEOUT', '300')),
+        deadline=float(os.getenv('LLM_CALL_DEADLINE', '330')),
+        failure_threshold=int(os.getenv('LLM_CIRCUIT_FAILURES', '5')),
+        reset_timeout=float(os.getenv('LLM_CIRCUIT_RESET', '30')),
+        metrics_dict=metrics_dict,
+        service_name=service_name
+    )
@@ -4,10 +4,37 @@ from unittest.mock import patch, MagicMock
 import sys
 import os
 import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 # Add parent directory to path to import app module
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import app
+from llm_usage import UsageRecorder, UsageLedger
+from health import CallHealth
+from llm_gateway import LLMGateway
+from hedging import Hedger, latency_key
+from model_router import LatencyTracker
+
+class FakeMessagesHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the Anthropic Messages API that records each request payload."""
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.server.payloads.append(json.loads(self.rfile.read(length)))
+        body = json.dumps({
+            "content": [{"type": "text", "text": json.dumps({"response": "Nothing to change.", "edits": []})}],
+            "usage": {"input_tokens": 300, "output_tokens": 20, "cache_read_input_tokens": 0,
+                      "cache_creation_input_tokens": 0}
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
 
 class TestIEP4App(unittest.TestCase):
     """Unit tests for IEP4 Schedule Chat Interface."""
@@ -16,6 +43,10 @@ class TestIEP4App(unittest.TestCase):
         """Set up test client and resources."""
         app.app.testing = True
         self.client = app.app.test_client()
+        # Fresh gateway for every test, retrying without backoff delays
+        gateway_patch = patch('app.llm_gateway', LLMGateway(sleep=lambda seconds: None))
+        gateway_patch.start()
+        self.addCleanup(gateway_patch.stop)
         # Disable logging for tests
         logging.disable(logging.CRITICAL)
         
@@ -76,26 +107,20 @@ class TestIEP4App(unittest.TestCase):
         logging.disable(logging.NOTSET)
 
     @patch.object(app, 'ANTHROPIC_API_KEY', 'mock_api_key')
-    @patch('app.call_anthropic_api')
-    def test_health_endpoint_successful(self, mock_call_anthropic_api):
-        """Test the health check endpoint with successful API response."""
-        # Configure the mock
-        mock_call_anthropic_api.return_value = ({"content": "Test response"}, 200)
-        
-        # Make request to the health endpoint
-        response = self.client.get('/health')
-        
+    @patch('app.llm_gateway.session.post')
+    def test_health_endpoint_successful(self, mock_post):
+        """Test that the health endpoints answer without calling Anthropic."""
+        with patch('app.llm_health', CallHealth()):
+            response = self.client.get('/health')
+            self.assertEqual(self.client.get('/health/ready').status_code, 200)
+            self.assertEqual(self.client.get('/health/live').status_code, 200)
+
         # Check response
         self.assertEqual(response.status_code, 200)
         response_data = json.loads(response.data)
         self.assertEqual(response_data['status'], 'healthy')
         self.assertEqual(response_data['model'], app.LLM_MODEL)
-        
-        # Verify the mock was called correctly
-        mock_call_anthropic_api.assert_called_once()
-        args, kwargs = mock_call_anthropic_api.call_args
-        self.assertEqual(kwargs['prompt'], 'Hello')
-        self.assertEqual(kwargs['max_tokens'], 10)
+        mock_post.assert_not_called()
 
     @patch.object(app, 'ANTHROPIC_API_KEY', None)
     def test_health_endpoint_no_api_key(self):
@@ -110,20 +135,22 @@ class TestIEP4App(unittest.TestCase):
         self.assertEqual(response_data['error'], 'ANTHROPIC_API_KEY not set')
 
     @patch.object(app, 'ANTHROPIC_API_KEY', 'mock_api_key')
-    @patch('app.call_anthropic_api')
-    def test_health_endpoint_api_error(self, mock_call_anthropic_api):
-        """Test the health check endpoint with API error."""
-        # Configure the mock
-        mock_call_anthropic_api.return_value = ({"error": "API error"}, 500)
-        
-        # Make request to the health endpoint
-        response = self.client.get('/health')
-        
+    @patch('app.llm_gateway.session.post')
+    def test_health_endpoint_api_error(self, mock_post):
+        """Test that failing chat calls make the service unhealthy and not ready."""
+        mock_post.return_value = MagicMock(status_code=529, text="overloaded")
+        with patch('app.llm_health', CallHealth()), patch.object(app.llm_gateway, 'max_retries', 0):
+            for _ in range(3):
+                app.call_anthropic_api("Hello", endpoint='/chat')
+            response = self.client.get('/health')
+            self.assertEqual(self.client.get('/health/ready').status_code, 503)
+
         # Check response
         self.assertEqual(response.status_code, 500)
         response_data = json.loads(response.data)
         self.assertEqual(response_data['status'], 'unhealthy')
-        self.assertEqual(response_data['error'], 'API error')
+        self.assertEqual(response_data['llm']['success_rate'], 0.0)
+        self.assertEqual(mock_post.call_count, 3)
 
     def test_chat_endpoint_no_message(self):
         """Test the chat endpoint with no message provided."""
@@ -242,6 +269,202 @@ class TestIEP4App(unittest.TestCase):
         args, kwargs = mock_call_anthropic_api.call_args
         self.assertIn("Add a study session on Wednesday morning", kwargs['prompt'])
 
+    def chat_reply(self, calendar, response="Done.", **fields):
+        """Build an Anthropic response whose JSON contains the given calendar."""
+        return ({"content": [{"text": json.dumps(dict({
+            "response": response,
+            "schedule": self.sample_schedule,
+            "generated_calendar": calendar
+        }, **fields))}]}, 200)
+
+    @patch.object(app, 'ANTHROPIC_API_KEY', 'mock_api_key')
+    @patch('app.call_anthropic_api')
+    def test_chat_endpoint_restores_dropped_events(self, mock_call_anthropic_api):
+        """Test that events the model silently dropped are restored and conflicts moved."""
+        calendar = {
+            "Monday": [
+                {"id": "meeting-1", "type": "meeting", "description": "Team Meeting",
+                 "start_time": "09:00", "end_time": "10:00", "duration": 60},
+                {"id": "gym-1", "type": "personal", "description": "Gym",
+                 "start_time": "09:30", "end_time": "10:30", "duration": 60}
+            ],
+            "Tuesday": []
+        }
+        mock_call_anthropic_api.return_value = self.chat_reply(calendar)
+
+        response = self.client.post('/chat', json={"message": "Add gym on Monday morning", "schedule": self.sample_schedule})
+        data = json.loads(response.data)
+
+        monday = {event['id']: event for event in data['generated_calendar']['Monday']}
+        self.assertIn('class-1', monday)
+        self.assertEqual(data['generated_calendar']['Tuesday'][0]['id'], 'task-1')
+        self.assertEqual(monday['meeting-1']['start_time'], '09:00')
+        self.assertEqual(monday['gym-1']['start_time'], '10:00')
+        self.assertNotIn('validation_issues', data)
+
+    @patch.object(app, 'ANTHROPIC_API_KEY', 'mock_api_key')
+    @patch('app.call_anthropic_api')
+    def test_chat_endpoint_allows_requested_removal(self, mock_call_anthropic_api):
+        """Test that an event the model removed on purpose stays removed, and only that event."""
+        calendar = dict(self.sample_schedule['generated_calendar'], Tuesday=[])
+        mock_call_anthropic_api.return_value = self.chat_reply(calendar, "I removed Complete Assignment.", removed=["task-1"])
+
+        response = self.client.post('/chat', json={"message": "Remove the assignment on Tuesday", "schedule": self.sample_schedule})
+        data = json.loads(response.data)
+        self.assertEqual(data['generated_calendar']['Tuesday'], [])
+
+    @patch.object(app, 'ANTHROPIC_API_KEY', 'mock_api_key')
+    @patch('app.call_anthropic_api')
+    def test_chat_endpoint_restores_events_not_targeted(self, mock_call_anthropic_api):
+        """Test that events named only in the reply or the message are restored, not treated as removed."""
+        calendar = dict(self.sample_schedule['generated_calendar'], Tuesday=[],
+                        Monday=[self.sample_schedule['generated_calendar']['Monday'][0]])
+        mock_call_anthropic_api.return_value = self.chat_reply(calendar, "I removed the CS101 Lecture.")
+
+        response = self.client.post('/chat', json={"message": "Skip the lecture and clear my Monday evening",
+                                                   "schedule": self.sample_schedule})
+        data = json.loads(response.data)
+        self.assertEqual(sorted(event['id'] for event in data['generated_calendar']['Monday']), ['class-1', 'meeting-1'])
+        self.assertEqual(data['generated_calendar']['Tuesday'][0]['id'], 'task-1')
+
+    @patch.object(app, 'ANTHROPIC_API_KEY', 'mock_api_key')
+    @patch('app.call_anthropic_api')
+    def test_chat_endpoint_rejects_truncated_response(self, mock_call_anthropic_api):
+        """Test that edits cut off mid-way are not applied and the calendar is returned unchanged."""
+        mock_call_anthropic_api.return_value = ({"content": [{"text":
+            '{"response": "Removed both.", "edits": [{"op": "remove", "id": "class-1"}, {"op": "remove", "id": "task'
+        }]}, 200)
+
+        response = self.client.post('/chat', json={"message": "Drop the lecture", "schedule": self.sample_schedule,
+                                                   "edit_mode": "patch"})
+        data = json.loads(response.data)
+        self.assertEqual(data['error'], 'Failed to parse LLM response')
+        self.assertEqual(data['generated_calendar'], self.sample_schedule['generated_calendar'])
+
+    @patch.object(app, 'ANTHROPIC_API_KEY', 'mock_api_key')
+    @patch('app.call_anthropic_api')
+    def test_chat_endpoint_applies_edits(self, mock_call_anthropic_api):
+        """Test that edit operations from the model are applied to the current calendar."""
+        mock_call_anthropic_api.return_value = ({"content": [{"text": json.dumps({
+            "response": "Moved the assignment and removed the lecture.",
+            "edits": [
+                {"op": "move", "id": "task-1", "day": "Wednesday", "start_time": "10:00"},
+                {"op": "remove", "id": "class-1"},
+                {"op": "remove", "id": "unknown-1"}
+            ]
+        })}], "usage": {"output_tokens": 60}}, 200)
+
+        response = self.client.post('/chat', json={"message": "Move the assignment to Wednesday 10am and drop the lecture",
+                                                   "schedule": self.sample_schedule, "edit_mode": "patch"})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        calendar = data['generated_calendar']
+        self.assertEqual([event['id'] for event in calendar['Monday']], ['meeting-1'])
+        self.assertEqual(calendar['Tuesday'], [])
+        self.assertEqual((calendar['Wednesday'][0]['id'], calendar['Wednesday'][0]['end_time']), ('task-1', '12:00'))
+        self.assertEqual(data['schedule']['generated_calendar'], calendar)
+        self.assertEqual(len(data['edits']), 2)
+        self.assertEqual(data['rejected_edits'][0]['index'], 2)
+
+        # Only the compact calendar is sent and a short answer is requested
+        kwargs = mock_call_anthropic_api.call_args[1]
+        self.assertEqual(kwargs['max_tokens'], app.CHAT_PATCH_MAX_TOKENS)
+        self.assertNotIn('REFERENCE CALENDAR', kwargs['prompt'])
+        self.assertEqual(kwargs['system'], app.PATCH_SYSTEM_PROMPT)
+        # A small edit goes to the fast model
+        self.assertEqual((kwargs['model'], kwargs['task']), (app.model_router.models['fast'], 'chat_edit'))
+        self.assertIn('"op": "move"', kwargs['system'])
+
+    @patch.object(app, 'ANTHROPIC_API_KEY', 'mock_api_key')
+    @patch('app.llm_gateway.session.post')
+    def test_chat_endpoint_records_usage(self, mock_post):
+        """Test that the chat call's usage is recorded for the requesting user."""
+        mock_post.return_value = MagicMock(status_code=200)
+        mock_post.return_value.json.return_value = {
+            "content": [{"type": "text", "text": json.dumps({"response": "Nothing to change.", "edits": []})}],
+            "usage": {"input_tokens": 1500, "output_tokens": 25}
+        }
+        recorder = UsageRecorder('iep4', ledger=UsageLedger())
+        with patch.object(app, 'usage_recorder', recorder):
+            self.client.post('/chat', json={"message": "Thanks", "schedule": self.sample_schedule},
+                             headers={'X-User-ID': 'alice'})
+            response = self.client.get('/usage')
+
+        totals = json.loads(response.data)['totals']
+        self.assertEqual([(row['user_id'], row['input_tokens'], row['output_tokens']) for row in totals],
+                         [('alice', 1500, 25)])
+        self.assertEqual(recorder.ledger.by_feature()[0]['feature'], 'chat')
+
+    @patch.object(app, 'ANTHROPIC_API_KEY', 'mock_api_key')
+    def test_chat_requests_cache_the_instructions(self):
+        """Test that chat turns send the instructions as one cached system block and only per-user data as the message."""
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FakeMessagesHandler)
+        server.daemon_threads = True
+        server.payloads = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        with patch.object(app, 'ANTHROPIC_API_URL', f"http://127.0.0.1:{server.server_address[1]}/v1/messages"):
+            for message in ("Move my lecture", "Add a run on Friday"):
+                response = self.client.post('/chat', json={"message": message, "schedule": self.sample_schedule})
+                self.assertEqual(response.status_code, 200)
+            self.client.post('/update-prompt', json={"original_prompt": "Optimize my week",
+                                                     "chat_history": [{"role": "user", "content": "More breaks"}]})
+
+        first, second, update = server.payloads
+        self.assertEqual(first['system'], [{'type': 'text', 'text': app.PATCH_SYSTEM_PROMPT,
+                                            'cache_control': {'type': 'ephemeral'}}])
+        self.assertEqual(second['system'], first['system'])
+        for payload, message in ((first, "Move my lecture"), (second, "Add a run on Friday")):
+            self.assertEqual([m['role'] for m in payload['messages']], ['user'])
+            self.assertTrue(payload['messages'][0]['content'].startswith('CHAT HISTORY:'))
+            self.assertIn(f"USER: {message}", payload['messages'][0]['content'])
+            self.assertNotIn('EDIT OPERATIONS', payload['messages'][0]['content'])
+        self.assertIn('improving prompt instructions', update['system'][0]['text'])
+        self.assertEqual(update['system'][0]['cache_control'], {'type': 'ephemeral'})
+        self.assertIn('Optimize my week', update['messages'][0]['content'])
+
+    @patch.object(app, 'ANTHROPIC_API_KEY', 'mock_api_key')
+    def test_chat_endpoint_hedges_slow_edit(self):
+        """Test that a chat edit slower than the recent tail latency of its size gets a backup call and is told to stop."""
+        hedger = Hedger(percentile=0.5, min_delay=0.05, budget=1.0, latency=LatencyTracker(min_samples=1))
+        size = app.count_events(self.sample_schedule['generated_calendar'])
+        hedger.latency.observe(latency_key('chat_edit', size), app.model_router.models['fast'], 0.05)
+        release = threading.Event()
+        replies = []
+        cancel_events = []
+
+        def call(**kwargs):
+            replies.append(kwargs['model'])
+            cancel_events.append(kwargs['cancelled'])
+            if len(replies) == 1:
+                release.wait(5)
+                return {"content": [{"text": json.dumps({"response": "Late", "edits": []})}]}, 200
+            return {"content": [{"text": json.dumps({"response": "Backup", "edits": []})}]}, 200
+
+        with patch('app.call_anthropic_api', side_effect=call), patch('app.llm_hedger', hedger):
+            response = self.client.post('/chat', json={"message": "Thanks", "schedule": self.sample_schedule})
+            release.set()
+
+        self.assertEqual(json.loads(response.data)['response'], 'Backup')
+        self.assertEqual(len(replies), 2)
+        self.assertEqual([event.is_set() for event in cancel_events], [True, False])
+
+    @patch.object(app, 'ANTHROPIC_API_KEY', 'mock_api_key')
+    @patch('app.call_anthropic_api')
+    def test_chat_endpoint_full_mode(self, mock_call_anthropic_api):
+        """Test that full mode still asks for the whole calendar."""
+        mock_call_anthropic_api.return_value = self.chat_reply(self.sample_schedule['generated_calendar'])
+        response = self.client.post('/chat', json={"message": "Looks good", "schedule": self.sample_schedule,
+                                                   "edit_mode": "full"})
+        self.assertEqual(response.status_code, 200)
+        kwargs = mock_call_anthropic_api.call_args[1]
+        self.assertEqual(kwargs['max_tokens'], 4000)
+        self.assertIn('REFERENCE CALENDAR', kwargs['prompt'])
+        self.assertEqual((kwargs['model'], kwargs['task']), (app.model_router.models['strong'], 'chat_full'))
+
     @patch.object(app, 'ANTHROPIC_API_KEY', 'mock_api_key')
     @patch('app.call_anthropic_api')
     def test_chat_endpoint_api_error(self, mock_call_anthropic_api):
@@ -416,7 +639,7 @@ class TestIEP4App(unittest.TestCase):
         self.assertEqual(response_data['custom_prompt'], original_prompt)
 
     @patch.object(app, 'ANTHROPIC_API_KEY', 'mock_api_key')
-    @patch('requests.post')
+    @patch('app.llm_gateway.session.post')
     def test_call_anthropic_api_function(self, mock_post):
         """Test the call_anthropic_api function directly."""
         # Configure the mock
@@ -458,11 +681,11 @@ class TestIEP4App(unittest.TestCase):
         self.assertEqual(payload["temperature"], 0.5)
         self.assertEqual(payload["max_tokens"], 100)
         
-        # Check timeout
-        self.assertEqual(kwargs['timeout'], 300)
+        # Check timeout (connect, read) from the gateway
+        self.assertEqual(kwargs['timeout'], (10, 300))
 
     @patch.object(app, 'ANTHROPIC_API_KEY', 'mock_api_key')
-    @patch('requests.post')
+    @patch('app.llm_gateway.session.post')
     def test_call_anthropic_api_error_handling(self, mock_post):
         """Test error handling in the call_anthropic_api function."""
         # Configure the mock to raise an exception
@@ -0,0 +1,90 @@
+import unittest
+import sys
+import os
+import logging
+
+# Add parent directory to path to import app module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from calendar_patch import apply_edits, assign_event_ids
+
+
+class TestCalendarPatch(unittest.TestCase):
+    """Unit tests for applying chat edit operations to a calendar."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.calendar = {
+            "Monday": [
+                {"id": "meeting-1", "type": "meeting", "description": "Team Meeting",
+                 "start_time": "09:00", "end_time": "10:00", "duration": 60},
+                {"id": "gym-1", "type": "personal", "description": "Gym",
+                 "start_time": "17:00", "end_time": "18:00", "duration": 60}
+            ],
+            "Tuesday": [
+                {"id": "g-1", "type": "google_event", "description": "Dentist",
+                 "start_time": "08:00", "end_time": "08:30", "duration": 30}
+            ]
+        }
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_operations(self):
+        """Test add, move, resize, update and remove by event ID."""
+        calendar, applied, rejected = apply_edits(self.calendar, [
+            {"op": "move", "id": "gym-1", "day": "wednesday", "start_time": "18:00"},
+            {"op": "resize", "id": "gym-1", "end_time": "19:30"},
+            {"op": "update", "id": "meeting-1", "fields": {"description": "Team Sync"}},
+            {"op": "add", "day": "Friday", "event": {"description": "Lunch", "type": "meal", "start_time": "12:00"}},
+            {"op": "remove", "id": "meeting-1"}
+        ])
+        self.assertEqual((len(applied), rejected), (5, []))
+        self.assertEqual(calendar["Monday"], [])
+        self.assertEqual(calendar["Wednesday"], [{"id": "gym-1", "type": "personal", "description": "Gym",
+                                                  "start_time": "18:00", "end_time": "19:30", "duration": 90}])
+        lunch = calendar["Friday"][0]
+        self.assertEqual((lunch["start_time"], lunch["end_time"], lunch["duration"]), ("12:00", "13:00", 60))
+        self.assertTrue(lunch["id"].startswith("chat-"))
+        self.assertEqual(set(calendar), {"Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"})
+        # The input calendar is not modified
+        self.assertEqual(self.calendar["Monday"][1]["start_time"], "17:00")
+
+    def test_invalid_edits_are_rejected(self):
+        """Test that bad edits are reported and skipped while the valid ones apply."""
+        calendar, applied, rejected = apply_edits(self.calendar, [
+            {"op": "remove", "id": "missing"},
+            {"op": "move", "id": "g-1", "start_time": "10:00"},
+            {"op": "update", "id": "gym-1", "fields": {"start_time": "06:00"}},
+            {"op": "update", "id": "gym-1", "fields": {"day": "Friday"}},
+            {"op": "resize", "id": "gym-1", "duration": "long"},
+            {"op": "add", "day": "Someday", "event": {"description": "Nap"}},
+            {"op": "rename", "id": "gym-1"},
+            {"op": "move", "id": "gym-1", "start_time": "23:30"},
+            {"op": "move", "id": "gym-1", "start_time": "06:00"}
+        ])
+        self.assertEqual([entry["index"] for entry in rejected], [0, 1, 2, 3, 4, 5, 6, 7])
+        self.assertEqual(applied, [{"op": "move", "id": "gym-1", "start_time": "06:00"}])
+        self.assertEqual([event["id"] for event in calendar["Monday"]], ["gym-1", "meeting-1"])
+        self.assertEqual(calendar["Tuesday"][0]["start_time"], "08:00")
+
+    def test_events_without_ids_can_be_edited(self):
+        """Test that meals and sessions without an ID get a stable one that edits can reference."""
+        calendar = {"Monday": [{"type": "meal", "description": "Lunch", "start_time": "12:30", "end_time": "13:00"},
+                               {"type": "generated", "description": "Review", "start_time": "12:30", "end_time": "13:30"}],
+                    "Tuesday": [{"id": "meal-mon-1230", "type": "meal", "description": "Dinner",
+                                 "start_time": "19:00", "end_time": "20:00"}]}
+        with_ids = assign_event_ids(calendar)
+        self.assertEqual([event["id"] for event in with_ids["Monday"]], ["meal-mon-1230-2", "generated-mon-1230"])
+        self.assertEqual(assign_event_ids(calendar), with_ids)
+        self.assertNotIn("id", calendar["Monday"][0])
+
+        edited, applied, rejected = apply_edits(with_ids, [
+            {"op": "move", "id": "meal-mon-1230-2", "start_time": "13:30"},
+            {"op": "remove", "id": "generated-mon-1230"}
+        ])
+        self.assertEqual((len(applied), rejected), (2, []))
+        self.assertEqual([(event["description"], event["start_time"]) for event in edited["Monday"]], [("Lunch", "13:30")])
+
+
+if __name__ == '__main__':
+    unittest.main()
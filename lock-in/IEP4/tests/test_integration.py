@@ -295,7 +295,7 @@ class TestIEP4Integration(unittest.TestCase):
             except requests.RequestException as e:
                 self.fail(f"Update-prompt endpoint request failed: {str(e)}")
 
-    @patch('requests.post')
+    @patch('app.llm_gateway.session.post')
     def test_direct_anthropic_api_call(self, mock_post):
         """Test direct call to Anthropic API."""
         if self.mock_mode:
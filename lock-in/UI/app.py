@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, render_template, session, redirect, url_for, flash
+from flask import Flask, request, jsonify, render_template, session, redirect, url_for, flash, g, has_app_context, Response, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -12,6 +12,12 @@ import json
 from datetime import datetime, timedelta
 from preference_questions import PREFERENCE_QUESTIONS, get_default_preferences
 import sqlitecloud
+import sqlite3
+from metrics_helper import setup_metrics
+from db_pool import ConnectionPool, get_pool_size_from_env
+from profile_cache import ProfileCache, PROFILE_QUERY, profile_from_row
+from service_client import ServiceClientRegistry
+from streaming import format_sse, iter_sse_events
 
 # Configure logging
 logging.basicConfig(
@@ -27,21 +33,90 @@ load_dotenv()
 app = Flask(__name__)
 app.secret_key = "supersecretkey"
 
+# Setup Prometheus metrics
+metrics_dict = setup_metrics(app, 'ui')
+
 # Database configuration
 # Using SQLite Cloud
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///users.db'  # Keep for compatibility with Flask-SQLAlchemy
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-# SQLite Cloud connection
-SQLITE_CLOUD_URL = "sqlitecloud://cbqkimyjnk.g3.sqlite.cloud:8860/chinook.sqlite?apikey=NC5QKK2m7shqgXow0sb2MMhNyh8uwQVHcJMAh7H0DQI" 
+# SQLite Cloud connection (a plain file path can be used for local development and tests)
+SQLITE_CLOUD_URL = os.getenv('SQLITE_CLOUD_URL', "sqlitecloud://cbqkimyjnk.g3.sqlite.cloud:8860/chinook.sqlite?apikey=NC5QKK2m7shqgXow0sb2MMhNyh8uwQVHcJMAh7H0DQI")
 app.config['SQLITE_CLOUD_ADMIN_KEY'] = 'admin_apikey'
 
 # Initialize database with SQLAlchemy for model definitions
 db = SQLAlchemy(app)
 
+def open_cloud_connection():
+    """Open a brand-new connection to the user database (used by the pool)."""
+    if SQLITE_CLOUD_URL.startswith('sqlitecloud://'):
+        return sqlitecloud.connect(SQLITE_CLOUD_URL)
+    return sqlite3.connect(SQLITE_CLOUD_URL.replace('sqlite:///', '', 1), check_same_thread=False)
+
+# One pool per worker process, sized from DB_POOL_SIZE / GUNICORN_THREADS
+db_pool = ConnectionPool(
+    open_cloud_connection,
+    max_size=get_pool_size_from_env(),
+    acquire_timeout=float(os.getenv('DB_POOL_TIMEOUT', '10')),
+    max_idle_seconds=float(os.getenv('DB_POOL_MAX_IDLE', '300')),
+    metrics_dict=metrics_dict,
+    service_name='ui'
+)
+
 # Helper function to get SQLite Cloud connection
 def get_cloud_connection():
-    return sqlitecloud.connect(SQLITE_CLOUD_URL)
+    """Check out a pooled connection. Calling close() hands it back to the pool."""
+    conn = db_pool.connection()
+    if has_app_context():
+        g.setdefault('_db_connections', []).append(conn)
+    return conn
+
+@app.teardown_appcontext
+def release_db_connections(exception=None):
+    # Safety net for code paths that return early without closing their connection;
+    # their uncommitted work is rolled back so it cannot leak into the next request
+    for conn in g.pop('_db_connections', []):
+        if not conn.released:
+            conn.close(rollback=True)
+
+# Cache of per-user profile fields so the login/preferences checks don't hit the database
+profile_cache = ProfileCache(
+    ttl_seconds=float(os.getenv('PROFILE_CACHE_TTL', '300')),
+    max_size=int(os.getenv('PROFILE_CACHE_SIZE', '1024')),
+    metrics_dict=metrics_dict,
+    service_name='ui'
+)
+
+def get_user_profile(email, refresh=False):
+    """Return the cached profile for a user, loading it from the database on a miss."""
+    if not refresh:
+        profile = profile_cache.get(email)
+        if profile is not None:
+            return profile
+
+    conn = get_cloud_connection()
+    cursor = conn.cursor()
+    cursor.execute(PROFILE_QUERY, (email,))
+    user_row = cursor.fetchone()
+    conn.close()
+
+    if not user_row:
+        return None
+    profile = profile_from_row(user_row)
+    profile_cache.set(email, profile)
+    return profile
+
+def is_schedule_recent(profile):
+    """Check whether the profile has a schedule updated within the last 7 days."""
+    if not profile or not profile['has_latest_schedule'] or not profile['schedule_timestamp']:
+        return False
+    try:
+        schedule_timestamp = datetime.fromisoformat(profile['schedule_timestamp'])
+        return datetime.utcnow() - schedule_timestamp < timedelta(days=7)
+    except (ValueError, TypeError) as e:
+        logger.error(f"Error parsing schedule timestamp: {str(e)}")
+        return False
 
 # Define User model (still used for type hints and structure)
 class User(db.Model):
@@ -59,6 +134,7 @@ class User(db.Model):
     google_calendar = db.Column(db.Text, nullable=True)  # Store Google Calendar data
     google_calendar_timestamp = db.Column(db.DateTime, nullable=True)  # When the Google Calendar was imported
     custom_prompt = db.Column(db.Text, nullable=True)  # Store personalized prompt versions for schedule generation
+    tier = db.Column(db.String(32), nullable=True)  # Account tier, used by the IEPs to pick the LLM of a call
     
     def __repr__(self):
         return f'<User {self.email}>'
@@ -85,9 +161,14 @@ with app.app_context():
             parsed_json_timestamp TEXT,
             google_calendar TEXT,
             google_calendar_timestamp TEXT,
-            custom_prompt TEXT
+            custom_prompt TEXT,
+            tier TEXT
         )
         ''')
+        # Databases created before the tier column get it added
+        cursor.execute("PRAGMA table_info(user)")
+        if 'tier' not in [column[1] for column in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE user ADD COLUMN tier TEXT")
         conn.commit()
         conn.close()
         logger.info("Database tables have been initialized")
@@ -110,6 +191,23 @@ current_schedule = None
 
 logger.debug(f"Using EEP1_URL: {EEP1_URL}")
 
+# Keep-alive connection pool for calls to EEP1
+http_client = ServiceClientRegistry(metrics_dict=metrics_dict, service_name='ui')
+http_client.register('eep1', EEP1_URL)
+
+def eep1_headers():
+    """
+    Headers identifying the logged-in user to EEP1's per-user schedule store,
+    with the user's tier for the model routing of the LLM calls it makes.
+    """
+    if 'user' not in session:
+        return {}
+    headers = {'X-User-ID': session['user']}
+    profile = get_user_profile(session['user'])
+    if profile and profile.get('tier'):
+        headers['X-User-Tier'] = profile['tier']
+    return headers
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -121,7 +219,7 @@ def login_required(f):
 @app.before_request
 def require_login():
     # List of allowed endpoint prefixes that don't require login
-    allowed = ['login', 'register', 'static']
+    allowed = ['login', 'register', 'static', 'prometheus_metrics']
     # If no endpoint is set, return (could be 404)
     if not request.endpoint:
         return
@@ -135,15 +233,16 @@ def require_login():
     exempt_endpoints = ['preferences', 'save_preferences', 'logout', 'static']
     if 'user' in session and request.endpoint and not any(request.endpoint.startswith(ep) for ep in exempt_endpoints):
         try:
-            # Check preferences completion status in SQLite Cloud
-            conn = get_cloud_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT preferences_completed FROM user WHERE email = ?", (session['user'],))
-            user_row = cursor.fetchone()
-            conn.close()
+            # Check preferences completion status from the cached profile.
+            # Completion never reverts, so only a cached "not completed" needs re-checking
+            # (another worker may have saved the preferences since it was cached);
+            # a cache miss loads the profile once, which is fresh already
+            profile = profile_cache.get(session['user'])
+            if profile is None or not profile['preferences_completed']:
+                profile = get_user_profile(session['user'], refresh=True)
             
             # If preferences not completed, redirect to preferences page
-            if user_row and not user_row[0]:
+            if profile and not profile['preferences_completed']:
                 return redirect(url_for('preferences'))
         except Exception as e:
             logger.error(f"Error checking preferences status: {str(e)}")
@@ -151,34 +250,19 @@ def require_login():
 @app.route('/')
 @login_required
 def index():
-    # Connect to SQLite Cloud
-    conn = get_cloud_connection()
-    cursor = conn.cursor()
-    
-    # Query user by email
-    cursor.execute("SELECT preferences_completed, latest_schedule, schedule_timestamp FROM user WHERE email = ?", (session['user'],))
-    user_row = cursor.fetchone()
-    conn.close()
+    # Load the user's profile (served from cache on the hot path)
+    profile = get_user_profile(session['user'])
     
-    if not user_row:
+    if not profile:
         logger.error(f"User not found in database: {session['user']}")
         return redirect(url_for('logout'))
     
     # Redirect to preferences if not completed
-    if not user_row[0]:  # preferences_completed
+    if not profile['preferences_completed']:
         return redirect(url_for('preferences'))
         
     # Check if user has a recent schedule
-    has_recent_schedule = False
-    if user_row[1] and user_row[2]:  # latest_schedule and schedule_timestamp
-        try:
-            schedule_timestamp = datetime.fromisoformat(user_row[2])
-            if datetime.utcnow() - schedule_timestamp < timedelta(days=7):
-                has_recent_schedule = True
-        except (ValueError, TypeError) as e:
-            logger.error(f"Error parsing schedule timestamp: {str(e)}")
-    
-    if has_recent_schedule:
+    if is_schedule_recent(profile):
         return render_template('schedule-only.html')
     else:
         return render_template('index.html')
@@ -186,26 +270,10 @@ def index():
 @app.route('/schedule-only')
 @login_required
 def schedule_only():
-    # Connect to SQLite Cloud
-    conn = get_cloud_connection()
-    cursor = conn.cursor()
+    # Check if user has a recent schedule using the cached profile
+    profile = get_user_profile(session['user'])
     
-    # Query user by email
-    cursor.execute("SELECT latest_schedule, schedule_timestamp FROM user WHERE email = ?", (session['user'],))
-    user_row = cursor.fetchone()
-    conn.close()
-    
-    # Check if user has a recent schedule
-    has_recent_schedule = False
-    if user_row and user_row[0] and user_row[1]:  # latest_schedule and schedule_timestamp exist
-        try:
-            schedule_timestamp = datetime.fromisoformat(user_row[1])
-            if datetime.utcnow() - schedule_timestamp < timedelta(days=7):
-                has_recent_schedule = True
-        except (ValueError, TypeError) as e:
-            logger.error(f"Error parsing schedule timestamp: {str(e)}")
-    
-    if not has_recent_schedule:
+    if not is_schedule_recent(profile):
         return redirect(url_for('index'))
     return render_template('schedule-only.html')
 
@@ -221,7 +289,7 @@ def parse_schedule():
         logger.info(f"Sending parse request to EEP1 with text: {data['text'][:100]}...")
         
         # Send to EEP1 for parsing
-        response = requests.post(f'{EEP1_URL}/parse-schedule', json=data, timeout=30)
+        response = http_client.post(f'{EEP1_URL}/parse-schedule', json=data, headers=eep1_headers(), timeout=30)
         response.raise_for_status()
         response_data = response.json()
         
@@ -240,7 +308,7 @@ def parse_schedule():
             logger.debug(f"Current schedule: {current_schedule}")
 
             # Store the schedule in EEP1
-            store_response = requests.post(f'{EEP1_URL}/store-schedule', json={'schedule': current_schedule}, timeout=30)
+            store_response = http_client.post(f'{EEP1_URL}/store-schedule', json={'schedule': current_schedule}, headers=eep1_headers(), timeout=30)
             if store_response.ok:
                 logger.info("Successfully stored schedule in EEP1")
             else:
@@ -271,6 +339,7 @@ def parse_schedule():
                 
                 conn.commit()
                 conn.close()
+                profile_cache.invalidate(session['user'])
             except Exception as e:
                 logger.error(f"Error updating user record: {str(e)}")
         else:
@@ -298,7 +367,7 @@ def get_schedule():
         if user and user.latest_schedule:
             schedule = json.loads(user.latest_schedule)
             return jsonify({'schedule': schedule})
-        response = requests.get(f'{EEP1_URL}/get-schedule', timeout=30)
+        response = http_client.get(f'{EEP1_URL}/get-schedule', headers=eep1_headers(), timeout=30)
         response.raise_for_status()
         return jsonify(response.json())
 
@@ -323,7 +392,7 @@ def answer_question():
 
         # First, try to get the current schedule from EEP1
         try:
-            schedule_response = requests.get(f'{EEP1_URL}/get-schedule', timeout=10)
+            schedule_response = http_client.get(f'{EEP1_URL}/get-schedule', headers=eep1_headers(), timeout=10)
             if schedule_response.ok:
                 current_schedule = schedule_response.json().get('schedule')
                 logger.info("Retrieved current schedule from EEP1")
@@ -355,9 +424,10 @@ def answer_question():
         logger.debug(f"Sending request to EEP1: {request_data}")
 
         # Send request to EEP1
-        response = requests.post(
+        response = http_client.post(
             f'{EEP1_URL}/answer-question',
             json=request_data,
+            headers=eep1_headers(),
             timeout=10
         )
 
@@ -399,7 +469,7 @@ def answer_question():
             
             # Store the updated schedule in EEP1
             try:
-                store_response = requests.post(f'{EEP1_URL}/store-schedule', json={'schedule': current_schedule}, timeout=10)
+                store_response = http_client.post(f'{EEP1_URL}/store-schedule', json={'schedule': current_schedule}, headers=eep1_headers(), timeout=10)
                 if store_response.ok:
                     logger.info("Successfully stored updated schedule in EEP1")
                 else:
@@ -424,6 +494,7 @@ def answer_question():
                 
                 conn.commit()
                 conn.close()
+                profile_cache.invalidate(session['user'])
             except Exception as e:
                 logger.error(f"Error updating user record: {str(e)}")
 
@@ -458,6 +529,7 @@ def answer_question():
                 
                 conn.commit()
                 conn.close()
+                profile_cache.invalidate(session['user'])
                 logger.info(f"Saved parsed JSON to user record for {session['user']}")
             except Exception as e:
                 logger.error(f"Error saving parsed JSON: {str(e)}")
@@ -475,6 +547,85 @@ def answer_question():
         logger.error(f"Unexpected error: {str(e)}")
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+@app.route('/answer-questions', methods=['POST'])
+@login_required
+def answer_questions():
+    """
+    Submit every answer of the question form in one call. EEP1 applies and
+    stores them together, so this is a single EEP1 round-trip and a single
+    database update.
+    """
+    global current_schedule
+    try:
+        data = request.get_json()
+        answers = data.get('answers') if data else None
+        if not answers:
+            return jsonify({"error": "No answers provided"}), 400
+
+        logger.info(f"Submitting {len(answers)} answers")
+        response = http_client.post(
+            f'{EEP1_URL}/answer-questions',
+            json={'answers': answers},
+            headers=eep1_headers(),
+            timeout=10
+        )
+
+        if not response.ok:
+            try:
+                error_msg = response.json().get('error', 'Error from EEP1')
+            except ValueError:
+                error_msg = response.text or 'Error from EEP1'
+            logger.error(f"EEP1 error: {error_msg}")
+            return jsonify({"error": error_msg}), response.status_code
+
+        response_data = response.json()
+        schedule = response_data.get('schedule')
+        ready_for_optimization = response_data.get('ready_for_optimization', False)
+        has_more_questions = response_data.get('has_more_questions', True)
+
+        if schedule is not None:
+            current_schedule = schedule
+            # Save the latest schedule, and the parsed JSON once nothing is missing, in one update
+            try:
+                conn = get_cloud_connection()
+                cursor = conn.cursor()
+                current_time = datetime.utcnow().isoformat()
+                schedule_json = json.dumps(schedule)
+                if ready_for_optimization and not has_more_questions:
+                    cursor.execute(
+                        "UPDATE user SET latest_schedule = ?, schedule_timestamp = ?, parsed_json = ?, parsed_json_timestamp = ? WHERE email = ?",
+                        (schedule_json, current_time, schedule_json, current_time, session['user'])
+                    )
+                else:
+                    cursor.execute(
+                        "UPDATE user SET latest_schedule = ?, schedule_timestamp = ? WHERE email = ?",
+                        (schedule_json, current_time, session['user'])
+                    )
+                conn.commit()
+                conn.close()
+                profile_cache.invalidate(session['user'])
+            except Exception as e:
+                logger.error(f"Error updating user record: {str(e)}")
+
+        return jsonify({
+            "success": True,
+            "schedule": schedule,
+            "message": f"{response_data.get('answered', len(answers))} answers submitted successfully",
+            "ready_for_optimization": ready_for_optimization,
+            "has_more_questions": has_more_questions,
+            "questions": response_data.get('questions')
+        })
+
+    except requests.Timeout:
+        logger.error("Timeout while connecting to EEP1")
+        return jsonify({"error": "Timeout while connecting to EEP1"}), 504
+    except requests.RequestException as e:
+        logger.error(f"Request error: {str(e)}")
+        return jsonify({"error": f"Request failed: {str(e)}"}), 500
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
 def check_missing_info(schedule: dict) -> list:
     questions = []
     
@@ -571,6 +722,156 @@ def check_missing_info(schedule: dict) -> list:
     
     return questions
 
+def save_latest_schedule(email, schedule):
+    """Store a generated schedule as the user's latest schedule."""
+    try:
+        # Connect to SQLite Cloud
+        conn = get_cloud_connection()
+        cursor = conn.cursor()
+        
+        # Update the latest_schedule
+        current_time = datetime.utcnow().isoformat()
+        schedule_json = json.dumps(schedule)
+        
+        cursor.execute(
+            "UPDATE user SET latest_schedule = ?, schedule_timestamp = ? WHERE email = ?",
+            (schedule_json, current_time, email)
+        )
+        
+        conn.commit()
+        conn.close()
+        profile_cache.invalidate(email)
+    except Exception as e:
+        logger.error(f"Error updating user record: {str(e)}")
+
+def stream_generated_schedule(request_data, email):
+    """
+    Relay EEP1's server-sent events for schedule generation to the browser.
+    The final schedule is stored when the 'complete' event arrives.
+    """
+    headers = eep1_headers()
+
+    def generate():
+        global current_schedule
+        try:
+            response = http_client.post(
+                f'{EEP1_URL}/generate-optimized-schedule',
+                json=request_data,
+                headers=headers,
+                stream=True,
+                timeout=(10, 350)
+            )
+            if not response.ok:
+                try:
+                    error_msg = response.json().get('error', 'Error from EEP1')
+                except ValueError:
+                    error_msg = response.text or 'Error from EEP1'
+                logger.error(f"EEP1 error: {error_msg}")
+                yield format_sse('error', {'error': error_msg})
+                return
+            try:
+                for event, payload in iter_sse_events(response.iter_lines(decode_unicode=True)):
+                    if event == 'complete':
+                        current_schedule = payload
+                        save_latest_schedule(email, payload)
+                        logger.info("Updated current schedule with streamed schedule")
+                    yield format_sse(event, payload)
+            finally:
+                response.close()
+        except requests.RequestException as e:
+            logger.error(f"Request error: {str(e)}")
+            yield format_sse('error', {'error': f"Request failed: {str(e)}"})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def build_generation_request(data):
+    """
+    Assemble the EEP1 schedule-generation request for the logged-in user:
+    the schedule plus stored preferences and Google Calendar data.
+    Returns (request_data, None) or (None, (error body, status code)).
+    """
+    # Check if this is a regeneration request
+    is_regeneration = data.get('regenerate', False)
+
+    # Get user data from SQLite Cloud
+    conn = get_cloud_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT parsed_json, preferences, google_calendar FROM user WHERE email = ?", 
+        (session['user'],)
+    )
+    user_row = cursor.fetchone()
+    conn.close()
+
+    if not user_row:
+        logger.error(f"User not found in database: {session['user']}")
+        return None, ({"error": "User not found"}, 404)
+
+    # Determine which schedule data to use
+    schedule = None
+
+    # If regeneration is requested and parsed_json exists, use that
+    if is_regeneration and user_row[0]:  # parsed_json
+        try:
+            schedule = json.loads(user_row[0])
+            logger.info("Using stored parsed JSON for schedule regeneration")
+        except json.JSONDecodeError:
+            logger.error(f"Error parsing stored JSON for user {session['user']}")
+
+    # Otherwise use schedule from request or current_schedule
+    if not schedule:
+        schedule = data.get('schedule', current_schedule)
+        logger.info("Using current schedule or schedule from request")
+
+    if not schedule:
+        logger.error("No schedule available for optimization")
+        return None, ({"error": "No schedule available"}, 400)
+
+    # Always load and include user preferences
+    user_preferences = None
+    if user_row[1]:  # preferences
+        try:
+            user_preferences = json.loads(user_row[1])
+            logger.info(f"Including user preferences in optimization request")
+        except json.JSONDecodeError:
+            logger.error(f"Error parsing user preferences JSON for user {session['user']}")
+
+    # Always load and include Google Calendar if available
+    google_calendar = None
+    if user_row[2]:  # google_calendar
+        try:
+            google_calendar = json.loads(user_row[2])
+            logger.info(f"Including Google Calendar data in optimization request")
+        except json.JSONDecodeError:
+            logger.error(f"Error parsing Google Calendar JSON for user {session['user']}")
+
+    # Always include all available data in the request
+    request_data = {
+        'schedule': schedule
+    }
+
+    # Add preferences if available
+    if user_preferences:
+        request_data['preferences'] = user_preferences
+
+    # Add Google Calendar if available
+    if google_calendar:
+        request_data['google_calendar'] = google_calendar
+
+    # Lets EEP1 attribute the LLM usage of regenerations separately
+    if is_regeneration:
+        request_data['regenerate'] = True
+
+    # Let the caller pick the generation engine (local, llm or hybrid)
+    if data.get('engine'):
+        request_data['engine'] = data['engine']
+
+    return request_data, None
+
 @app.route('/generate-optimized-schedule', methods=['POST'])
 @login_required
 def generate_optimized_schedule():
@@ -580,80 +881,22 @@ def generate_optimized_schedule():
         data = request.get_json()
         logger.info("Generating optimized schedule")
         
-        # Check if this is a regeneration request
-        is_regeneration = data.get('regenerate', False)
-        
-        # Get user data from SQLite Cloud
-        conn = get_cloud_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT parsed_json, preferences, google_calendar FROM user WHERE email = ?", 
-            (session['user'],)
-        )
-        user_row = cursor.fetchone()
-        conn.close()
-        
-        if not user_row:
-            logger.error(f"User not found in database: {session['user']}")
-            return jsonify({"error": "User not found"}), 404
-        
-        # Determine which schedule data to use
-        schedule = None
-        
-        # If regeneration is requested and parsed_json exists, use that
-        if is_regeneration and user_row[0]:  # parsed_json
-            try:
-                schedule = json.loads(user_row[0])
-                logger.info("Using stored parsed JSON for schedule regeneration")
-            except json.JSONDecodeError:
-                logger.error(f"Error parsing stored JSON for user {session['user']}")
-        
-        # Otherwise use schedule from request or current_schedule
-        if not schedule:
-            schedule = data.get('schedule', current_schedule)
-            logger.info("Using current schedule or schedule from request")
-        
-        if not schedule:
-            logger.error("No schedule available for optimization")
-            return jsonify({"error": "No schedule available"}), 400
-        
-        # Always load and include user preferences
-        user_preferences = None
-        if user_row[1]:  # preferences
-            try:
-                user_preferences = json.loads(user_row[1])
-                logger.info(f"Including user preferences in optimization request")
-            except json.JSONDecodeError:
-                logger.error(f"Error parsing user preferences JSON for user {session['user']}")
-        
-        # Always load and include Google Calendar if available
-        google_calendar = None
-        if user_row[2]:  # google_calendar
-            try:
-                google_calendar = json.loads(user_row[2])
-                logger.info(f"Including Google Calendar data in optimization request")
-            except json.JSONDecodeError:
-                logger.error(f"Error parsing Google Calendar JSON for user {session['user']}")
+        request_data, error = build_generation_request(data)
+        if error:
+            return jsonify(error[0]), error[1]
         
         # Call EEP1 to generate optimized schedule (it will call IEP2 internally)
         logger.info("Calling EEP1 to generate optimized schedule")
         
-        # Always include all available data in the request
-        request_data = {
-            'schedule': schedule
-        }
-        
-        # Add preferences if available
-        if user_preferences:
-            request_data['preferences'] = user_preferences
-            
-        # Add Google Calendar if available
-        if google_calendar:
-            request_data['google_calendar'] = google_calendar
+        # Streaming mode: relay EEP1's events so the page can render days as they finish
+        if data.get('stream'):
+            request_data['stream'] = True
+            return stream_generated_schedule(request_data, session['user'])
         
-        response = requests.post(
+        response = http_client.post(
             f'{EEP1_URL}/generate-optimized-schedule',
             json=request_data,
+            headers=eep1_headers(),
             timeout=350  # Longer timeout for schedule generation
         )
         
@@ -674,24 +917,7 @@ def generate_optimized_schedule():
         logger.info("Updated current schedule with optimized schedule")
         
         # Update user's record with the new schedule
-        try:
-            # Connect to SQLite Cloud
-            conn = get_cloud_connection()
-            cursor = conn.cursor()
-            
-            # Update the latest_schedule
-            current_time = datetime.utcnow().isoformat()
-            schedule_json = json.dumps(response_data)
-            
-            cursor.execute(
-                "UPDATE user SET latest_schedule = ?, schedule_timestamp = ? WHERE email = ?",
-                (schedule_json, current_time, session['user'])
-            )
-            
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            logger.error(f"Error updating user record: {str(e)}")
+        save_latest_schedule(session['user'], response_data)
 
         return jsonify(response_data)
         
@@ -705,6 +931,59 @@ def generate_optimized_schedule():
         logger.error(f"Unexpected error: {str(e)}")
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+@app.route('/schedule-jobs', methods=['POST'])
+@login_required
+def submit_schedule_job():
+    """Queue schedule generation in EEP1 and return the job id without waiting for it."""
+    try:
+        data = request.get_json() or {}
+        request_data, error = build_generation_request(data)
+        if error:
+            return jsonify(error[0]), error[1]
+        
+        response = http_client.post(
+            f'{EEP1_URL}/jobs/generate-schedule',
+            json=request_data,
+            headers=eep1_headers(),
+            timeout=30
+        )
+        return jsonify(response.json()), response.status_code
+    except requests.RequestException as e:
+        logger.error(f"Request error: {str(e)}")
+        return jsonify({"error": f"Request failed: {str(e)}"}), 500
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+@app.route('/schedule-jobs/<job_id>', methods=['GET'])
+@login_required
+def get_schedule_job(job_id):
+    """Poll a schedule-generation job; the result is stored the first time it is seen succeeded."""
+    global current_schedule
+    try:
+        response = http_client.get(f'{EEP1_URL}/jobs/{job_id}', headers=eep1_headers(), timeout=10)
+        job = response.json()
+        if (response.ok and job.get('status') == 'succeeded' and job.get('result')
+                and session.get('saved_schedule_job') != job_id):
+            current_schedule = job['result']
+            save_latest_schedule(session['user'], job['result'])
+            session['saved_schedule_job'] = job_id
+        return jsonify(job), response.status_code
+    except requests.RequestException as e:
+        logger.error(f"Request error: {str(e)}")
+        return jsonify({"error": f"Request failed: {str(e)}"}), 500
+
+@app.route('/schedule-jobs/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_schedule_job(job_id):
+    """Cancel a schedule-generation job."""
+    try:
+        response = http_client.post(f'{EEP1_URL}/jobs/{job_id}/cancel', headers=eep1_headers(), timeout=10)
+        return jsonify(response.json()), response.status_code
+    except requests.RequestException as e:
+        logger.error(f"Request error: {str(e)}")
+        return jsonify({"error": f"Request failed: {str(e)}"}), 500
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == "GET":
@@ -739,6 +1018,7 @@ def login():
                 
             # Success! Set up the session
             session['user'] = email
+            profile_cache.invalidate(email)
             session['first_name'] = user_row[3]  # first_name
             logger.info(f"User logged in successfully: {email}")
             
@@ -811,6 +1091,7 @@ def register():
             
             # Automatically log in the user after registration
             session['user'] = email
+            profile_cache.invalidate(email)
             session['first_name'] = first_name
             logger.info(f"User registered and logged in successfully: {email}")
             # Redirect to preferences page instead of index
@@ -843,6 +1124,7 @@ def reset_schedule():
         
         conn.commit()
         conn.close()
+        profile_cache.invalidate(session['user'])
         logger.info(f"Reset schedule data for user: {session['user']}")
             
         # Reset the global current_schedule
@@ -850,7 +1132,7 @@ def reset_schedule():
         current_schedule = None
 
         # Call EEP1 to reset the stored schedule from storage
-        response = requests.post(f'{EEP1_URL}/reset-stored-schedule', timeout=10)
+        response = http_client.post(f'{EEP1_URL}/reset-stored-schedule', headers=eep1_headers(), timeout=10)
         if response.ok:
             logger.info("Successfully reset stored schedule in EEP1.")
         else:
@@ -881,6 +1163,7 @@ def preferences():
     user_row = cursor.fetchone()
     
     if not user_row:
+        conn.close()
         logger.error(f"User not found in database: {user_email}")
         return redirect(url_for('logout'))
     
@@ -912,6 +1195,7 @@ def preferences():
                 (preferences_json, 1, user_email)
             )
             conn.commit()
+            profile_cache.invalidate(user_email)
             logger.info(f"Preferences saved for user: {user_email}")
             
             # Close connection
@@ -956,7 +1240,7 @@ def google_calendar_authorize():
         redirect_uri = f"{request.url_root.rstrip('/')}/google-calendar/callback"
         
         # Call EEP1 to get the authorization URL
-        response = requests.get(
+        response = http_client.get(
             f"{EEP1_URL}/google-calendar/authorize", 
             params={'redirect_uri': redirect_uri},
             timeout=10
@@ -1031,7 +1315,7 @@ def export_to_google_calendar():
         if imported_events:
             export_data['imported_events'] = imported_events
         
-        response = requests.post(
+        response = http_client.post(
             f"{EEP1_URL}/google-calendar/export-schedule",
             json=export_data,
             timeout=60  # Longer timeout for exporting many events
@@ -1081,7 +1365,7 @@ def google_calendar_callback():
         }
         
         # Call EEP1 to exchange the code for tokens
-        response = requests.post(
+        response = http_client.post(
             f"{EEP1_URL}/google-calendar/callback",
             json=callback_data,
             timeout=10
@@ -1105,7 +1389,7 @@ def google_calendar_callback():
         session['google_credentials'] = credentials
         
         # Use the credentials to fetch the user's calendar
-        fetch_response = requests.post(
+        fetch_response = http_client.post(
             f"{EEP1_URL}/google-calendar/fetch",
             json={'credentials': credentials},
             timeout=30
@@ -1130,6 +1414,7 @@ def google_calendar_callback():
         user.google_calendar = json.dumps(google_calendar)
         user.google_calendar_timestamp = datetime.utcnow()
         db.session.commit()
+        profile_cache.invalidate(user.email)
         
         logger.info(f"Google Calendar data saved for user {user.email}")
         flash('Google Calendar imported successfully!')
@@ -1187,7 +1472,7 @@ def chat():
         }
         
         # Send to EEP1 for processing
-        response = requests.post(f'{EEP1_URL}/chat', json=eep1_data, timeout=300)
+        response = http_client.post(f'{EEP1_URL}/chat', json=eep1_data, headers=eep1_headers(), timeout=300)
         response.raise_for_status()
         response_data = response.json()
         
@@ -1212,6 +1497,7 @@ def chat():
             user.latest_schedule = json.dumps(response_data['schedule'])
             user.schedule_timestamp = datetime.utcnow()
             db.session.commit()
+            profile_cache.invalidate(user.email)
             
         return jsonify(response_data)
         
@@ -1243,7 +1529,7 @@ def finalize_chat():
         original_prompt = user.custom_prompt
         if not original_prompt:
             # Fetch the default prompt from EEP1
-            prompt_response = requests.get(f'{EEP1_URL}/get-prompt', params={'user_id': user.id}, timeout=30)
+            prompt_response = http_client.get(f'{EEP1_URL}/get-prompt', params={'user_id': user.id}, timeout=30)
             prompt_response.raise_for_status()
             original_prompt = prompt_response.json().get('prompt', '')
             
@@ -1255,7 +1541,7 @@ def finalize_chat():
         }
         
         # Send to EEP1 for processing
-        response = requests.post(f'{EEP1_URL}/update-prompt', json=data, timeout=300)
+        response = http_client.post(f'{EEP1_URL}/update-prompt', json=data, timeout=300)
         response.raise_for_status()
         response_data = response.json()
         
@@ -1263,6 +1549,7 @@ def finalize_chat():
         if 'custom_prompt' in response_data:
             user.custom_prompt = response_data['custom_prompt']
             db.session.commit()
+            profile_cache.invalidate(user.email)
             logger.info(f"Updated custom prompt for user {user.email}")
             
             # Clear chat history after updating prompt
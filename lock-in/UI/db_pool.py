@@ -0,0 +1,259 @@
+"""
+Database connection pooling for the UI service.
+Keeps a bounded set of open connections per worker process so routes can
+reuse them instead of opening a new SQLite Cloud session on every request.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class PoolExhaustedError(Exception):
+    """Raised when no connection becomes available before the acquire timeout."""
+
+
+class PooledConnection:
+    """
+    Thin wrapper around a DB-API connection checked out from a ConnectionPool.
+    Calling close() returns the connection to the pool instead of closing it,
+    so existing code written against plain connections keeps working.
+    """
+
+    def __init__(self, pool, raw_conn):
+        self._pool = pool
+        self._raw_conn = raw_conn
+        self._released = False
+
+    def cursor(self):
+        return self._raw_conn.cursor()
+
+    def commit(self):
+        return self._raw_conn.commit()
+
+    def rollback(self):
+        return self._raw_conn.rollback()
+
+    def execute(self, *args, **kwargs):
+        return self._raw_conn.execute(*args, **kwargs)
+
+    @property
+    def released(self):
+        return self._released
+
+    def close(self, discard=False, rollback=False):
+        """
+        Return the connection to the pool (or discard it if it is broken).
+        With rollback=True an open transaction is rolled back first, so it
+        cannot leak into the next checkout; a failing rollback discards it.
+        """
+        if self._released:
+            return
+        if rollback and not discard:
+            try:
+                self._raw_conn.rollback()
+            except Exception:
+                discard = True
+        self._released = True
+        self._pool._release(self._raw_conn, discard=discard)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            try:
+                self._raw_conn.rollback()
+            except Exception:
+                # A failing rollback means the connection itself is unusable
+                self.close(discard=True)
+                return False
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of database connections.
+
+    Args:
+        factory: Callable returning a new DB-API connection
+        max_size: Maximum number of open connections (idle + checked out)
+        acquire_timeout: Seconds to wait for a free connection before giving up
+        max_idle_seconds: Idle connections older than this are closed
+        health_check_interval: Connections idle longer than this are pinged before reuse
+        metrics_dict: Optional metrics dictionary returned by setup_metrics
+        service_name: Label used when recording pool metrics
+    """
+
+    def __init__(self, factory, max_size=4, acquire_timeout=10.0, max_idle_seconds=300.0,
+                 health_check_interval=30.0, metrics_dict=None, service_name='ui'):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self._factory = factory
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_idle_seconds = max_idle_seconds
+        self.health_check_interval = health_check_interval
+        self.metrics_dict = metrics_dict
+        self.service_name = service_name
+
+        self._lock = threading.Condition()
+        self._idle = deque()  # (raw_conn, last_used) pairs, most recently used on the right
+        self._in_use = 0
+        self._pid = os.getpid()
+
+    # -------------------------------
+    # Public API
+    # -------------------------------
+
+    def connection(self):
+        """Check out a connection. Use as a context manager or call close() when done."""
+        start_time = time.time()
+        raw_conn = self._acquire()
+        wait_time = time.time() - start_time
+        self._record('db_pool_checkouts_total')
+        self._observe('db_pool_wait_seconds', wait_time)
+        return PooledConnection(self, raw_conn)
+
+    def stats(self):
+        """Return a snapshot of pool usage."""
+        with self._lock:
+            return {
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'max_size': self.max_size
+            }
+
+    def close_all(self):
+        """Close every idle connection. Checked-out connections are closed when released."""
+        with self._lock:
+            while self._idle:
+                raw_conn, _ = self._idle.popleft()
+                self._close_quietly(raw_conn)
+            self._update_gauges()
+
+    # -------------------------------
+    # Internal helpers
+    # -------------------------------
+
+    def _acquire(self):
+        deadline = time.time() + self.acquire_timeout
+        with self._lock:
+            self._reset_after_fork()
+            exhausted_recorded = False
+            while True:
+                self._evict_idle()
+
+                # Reuse the most recently returned connection when possible
+                while self._idle:
+                    raw_conn, last_used = self._idle.pop()
+                    if time.time() - last_used > self.health_check_interval and not self._is_healthy(raw_conn):
+                        logger.warning("Discarding unhealthy pooled connection")
+                        self._close_quietly(raw_conn)
+                        continue
+                    self._in_use += 1
+                    self._update_gauges()
+                    return raw_conn
+
+                # Open a new connection if we are below the limit
+                if self._in_use < self.max_size:
+                    self._in_use += 1
+                    break
+
+                if not exhausted_recorded:
+                    self._record('db_pool_exhausted_total')
+                    exhausted_recorded = True
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PoolExhaustedError(
+                        f"No database connection available after {self.acquire_timeout} seconds"
+                    )
+                self._lock.wait(remaining)
+
+        # Connect outside the lock so slow handshakes do not block other threads
+        try:
+            raw_conn = self._factory()
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+        with self._lock:
+            self._update_gauges()
+        return raw_conn
+
+    def _release(self, raw_conn, discard=False):
+        with self._lock:
+            self._in_use = max(0, self._in_use - 1)
+            if discard or os.getpid() != self._pid:
+                self._close_quietly(raw_conn)
+            else:
+                self._idle.append((raw_conn, time.time()))
+            self._evict_idle()
+            self._update_gauges()
+            self._lock.notify()
+
+    def _evict_idle(self):
+        now = time.time()
+        # Oldest connections sit on the left of the deque
+        while self._idle and now - self._idle[0][1] > self.max_idle_seconds:
+            raw_conn, _ = self._idle.popleft()
+            self._close_quietly(raw_conn)
+
+    def _reset_after_fork(self):
+        # Connections must never be shared between gunicorn worker processes
+        if os.getpid() != self._pid:
+            self._idle.clear()
+            self._in_use = 0
+            self._pid = os.getpid()
+
+    def _is_healthy(self, raw_conn):
+        try:
+            cursor = raw_conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            return True
+        except Exception as e:
+            logger.debug(f"Connection health check failed: {str(e)}")
+            return False
+
+    @staticmethod
+    def _close_quietly(raw_conn):
+        try:
+            raw_conn.close()
+        except Exception:
+            pass
+
+    def _record(self, name):
+        if self.metrics_dict and name in self.metrics_dict:
+            self.metrics_dict[name].labels(service=self.service_name).inc()
+
+    def _observe(self, name, value):
+        if self.metrics_dict and name in self.metrics_dict:
+            self.metrics_dict[name].labels(service=self.service_name).observe(value)
+
+    def _update_gauges(self):
+        if self.metrics_dict and 'db_pool_connections' in self.metrics_dict:
+            gauge = self.metrics_dict['db_pool_connections']
+            gauge.labels(service=self.service_name, state='idle').set(len(self._idle))
+            gauge.labels(service=self.service_name, state='in_use').set(self._in_use)
+
+
+def get_pool_size_from_env(default=4):
+    """
+    Size the pool for one worker process.
+    DB_POOL_SIZE wins if set, otherwise match the number of gunicorn threads per worker.
+    """
+    for var in ('DB_POOL_SIZE', 'GUNICORN_THREADS'):
+        value = os.getenv(var)
+        if value:
+            try:
+                return max(1, int(value))
+            except ValueError:
+                logger.warning(f"Ignoring invalid {var} value: {value}")
+    return default
@@ -0,0 +1,100 @@
+"""
+In-process cache of per-user profile fields read on almost every request
+(preferences status, preferences, custom prompt, schedule timestamps and tier).
+Entries expire after a TTL and the cache is bounded with LRU eviction.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+# Columns loaded into a cached profile, in SELECT order
+PROFILE_COLUMNS = [
+    'preferences_completed',
+    'preferences',
+    'custom_prompt',
+    'schedule_timestamp',
+    'parsed_json_timestamp',
+    'google_calendar_timestamp',
+    'has_latest_schedule',
+    'tier'
+]
+
+PROFILE_QUERY = (
+    "SELECT preferences_completed, preferences, custom_prompt, schedule_timestamp, "
+    "parsed_json_timestamp, google_calendar_timestamp, latest_schedule IS NOT NULL, tier "
+    "FROM user WHERE email = ?"
+)
+
+
+def profile_from_row(row):
+    """Convert a PROFILE_QUERY row into a profile dictionary."""
+    profile = dict(zip(PROFILE_COLUMNS, row))
+    profile['preferences_completed'] = bool(profile['preferences_completed'])
+    profile['has_latest_schedule'] = bool(profile['has_latest_schedule'])
+    return profile
+
+
+class ProfileCache:
+    """
+    Thread-safe LRU cache with a per-entry TTL, keyed by user email.
+
+    Args:
+        ttl_seconds: How long an entry stays valid after it is stored
+        max_size: Maximum number of cached profiles
+        metrics_dict: Optional metrics dictionary returned by setup_metrics
+        service_name: Label used when recording cache metrics
+    """
+
+    def __init__(self, ttl_seconds=300.0, max_size=1024, metrics_dict=None, service_name='ui'):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.metrics_dict = metrics_dict
+        self.service_name = service_name
+        self._entries = OrderedDict()  # email -> (expires_at, profile)
+        self._lock = threading.Lock()
+
+    def get(self, email):
+        """Return a copy of the cached profile, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(email)
+                self._record('cache_hits_total')
+                return dict(entry[1])
+            if entry is not None:
+                del self._entries[email]
+            self._record('cache_misses_total')
+            return None
+
+    def set(self, email, profile):
+        """Store a profile, evicting the least recently used entry if full."""
+        with self._lock:
+            self._entries[email] = (time.time() + self.ttl_seconds, dict(profile))
+            self._entries.move_to_end(email)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._update_size()
+
+    def invalidate(self, email):
+        """Drop the cached profile after the user's row has been written."""
+        with self._lock:
+            self._entries.pop(email, None)
+            self._update_size()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._update_size()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _record(self, name):
+        if self.metrics_dict and name in self.metrics_dict:
+            self.metrics_dict[name].labels(service=self.service_name, cache='user_profile').inc()
+
+    def _update_size(self):
+        if self.metrics_dict and 'cache_entries' in self.metrics_dict:
+            self.metrics_dict['cache_entries'].labels(service=self.service_name, cache='user_profile').set(len(self._entries))
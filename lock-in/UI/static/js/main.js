@@ -38,138 +38,115 @@ function signUp() {
 
 // Schedule functions
 let currentQuestions = [];
-let currentQuestionIndex = 0;
 let currentSchedule = null;
 let allMissingInfoResolved = false;
 
-function showQuestionDialog(questions) {
-    // Remove loading overlay if it exists
-    let overlay = document.getElementById('loadingOverlay');
-    if (overlay) {
-        overlay.remove();
-    }
-    if (!questions || questions.length === 0) {
-        console.warn('No questions to display');
-        return;
-    }
-    
-    const question = questions[0]; // Get the first question
-    const dialog = document.getElementById('questionDialog');
-    
-    // Set data attributes to store question info
-    dialog.dataset.questionId = question.target_id;
-    dialog.dataset.questionType = question.type;
-    dialog.dataset.questionTarget = question.target;
-    dialog.dataset.questionField = question.field;
-    dialog.dataset.questionTargetType = question.target_type;
-    
-    // For AM/PM questions, store the original time value
-    if (question.type === 'ampm' && question.original_time) {
-        dialog.dataset.originalTime = question.original_time;
-    }
-    
-    // Set the question text
-    document.getElementById('questionText').textContent = question.question;
-    
-    // Create appropriate input based on question type
-    const inputContainer = document.getElementById('questionInput');
-    inputContainer.innerHTML = '';
-    
-    // Check if the question specifies input_type as dropdown
+function createQuestionInput(question, index) {
+    // Create the input matching the question type; every input gets the id answer-<index>
+    let input;
     if (question.input_type === 'dropdown' && question.options && question.options.length > 0) {
-        // Create a dropdown/select element
-        const selectElement = document.createElement('select');
-        selectElement.id = 'dropdownInput';
-        selectElement.className = 'form-control';
-        selectElement.required = true;
-        
+        input = document.createElement('select');
+
         // Add empty default option
         const defaultOption = document.createElement('option');
         defaultOption.value = '';
         defaultOption.textContent = 'Please select an option';
         defaultOption.disabled = true;
         defaultOption.selected = true;
-        selectElement.appendChild(defaultOption);
-        
+        input.appendChild(defaultOption);
+
         // Add options from the question
         question.options.forEach(option => {
             const optionElement = document.createElement('option');
             optionElement.value = option.value;
             optionElement.textContent = option.text;
-            selectElement.appendChild(optionElement);
+            input.appendChild(optionElement);
         });
-        
-        inputContainer.appendChild(selectElement);
     } else if (question.type === 'time') {
-        // Create time input
-        const timeInput = document.createElement('input');
-        timeInput.type = 'time';
-        timeInput.id = 'timeInput';
-        timeInput.className = 'form-control';
-        timeInput.required = true;
-        inputContainer.appendChild(timeInput);
+        input = document.createElement('input');
+        input.type = 'time';
     } else if (question.type === 'duration') {
-        // Create duration input (minutes)
-        const durationInput = document.createElement('input');
-        durationInput.type = 'number';
-        durationInput.id = 'durationInput';
-        durationInput.className = 'form-control';
-        durationInput.min = '1';
-        durationInput.placeholder = 'Duration in minutes';
-        durationInput.required = true;
-        inputContainer.appendChild(durationInput);
+        input = document.createElement('input');
+        input.type = 'number';
+        input.min = '1';
+        input.placeholder = 'Duration in minutes';
     } else {
-        // Create text input for other types (like course_code)
-        const answerInput = document.createElement('input');
-        answerInput.type = 'text';
-        answerInput.id = 'answerInput';
-        answerInput.className = 'form-control';
-        answerInput.placeholder = 'Your answer';
-        answerInput.required = true;
-        
+        // Text input for other types (like course_code)
+        input = document.createElement('input');
+        input.type = 'text';
+        input.placeholder = 'Your answer';
         if (question.type === 'course_code') {
-            answerInput.placeholder = 'e.g., EECE503';
-            answerInput.pattern = '[A-Z]{2,4}[0-9]{3}[A-Z]?';
+            input.placeholder = 'e.g., EECE503';
+            input.pattern = '[A-Z]{2,4}[0-9]{3}[A-Z]?';
         }
-        
-        inputContainer.appendChild(answerInput);
     }
-    
+    input.id = `answer-${index}`;
+    input.className = 'form-control';
+    input.required = true;
+    return input;
+}
+
+function showQuestionDialog(questions) {
+    // Remove loading overlay if it exists
+    let overlay = document.getElementById('loadingOverlay');
+    if (overlay) {
+        overlay.remove();
+    }
+    if (!questions || questions.length === 0) {
+        console.warn('No questions to display');
+        return;
+    }
+
+    // All questions are shown in one form and submitted together
+    currentQuestions = questions;
+    const dialog = document.getElementById('questionDialog');
+    document.getElementById('questionText').textContent = questions.length === 1
+        ? 'Please answer the following question:'
+        : `Please answer the following ${questions.length} questions:`;
+
+    const inputContainer = document.getElementById('questionInput');
+    inputContainer.innerHTML = '';
+    questions.forEach((question, index) => {
+        const item = document.createElement('div');
+        item.className = 'question-item';
+
+        const label = document.createElement('label');
+        label.htmlFor = `answer-${index}`;
+        label.textContent = question.question;
+        item.appendChild(label);
+        item.appendChild(createQuestionInput(question, index));
+        inputContainer.appendChild(item);
+    });
+
     // Show the dialog
     dialog.classList.remove('hidden');
 }
 
 function submitAnswer() {
-    // Get the current question information from the dialog
-    const dialog = document.querySelector('#questionDialog');
-    const questionId = dialog.dataset.questionId;
-    const questionType = dialog.dataset.questionType;
-    const questionTarget = dialog.dataset.questionTarget;
-    const questionField = dialog.dataset.questionField;
-    const questionTargetType = dialog.dataset.questionTargetType;
-    const originalTime = dialog.dataset.originalTime; // For AM/PM questions
-
-    // Get the answer from the appropriate input field
-    let answer;
-    
-    // Check if we're dealing with a dropdown input
-    const dropdownInput = document.getElementById('dropdownInput');
-    if (dropdownInput) {
-        answer = dropdownInput.value;
-    } else if (questionType === 'time') {
-        const timeInput = document.getElementById('timeInput');
-        answer = timeInput ? timeInput.value : '';
-    } else if (questionType === 'duration') {
-        const durationInput = document.getElementById('durationInput');
-        answer = durationInput ? durationInput.value : '';
-    } else {
-        const answerInput = document.getElementById('answerInput');
-        answer = answerInput ? answerInput.value : '';
-    }
+    // Collect an answer for every question in the dialog
+    const answers = [];
+    for (let index = 0; index < currentQuestions.length; index++) {
+        const question = currentQuestions[index];
+        const input = document.getElementById(`answer-${index}`);
+        const answer = input ? input.value : '';
+        if (!answer) {
+            alert(`Please answer: ${question.question}`);
+            if (input) {
+                input.focus();
+            }
+            return;
+        }
 
-    if (!answer) {
-        alert('Please provide an answer');
-        return;
+        const entry = {
+            item_id: question.target_id,
+            type: question.type,
+            answer: answer
+        };
+        // Add original_time for AM/PM questions
+        if (question.type === 'ampm' && question.original_time) {
+            entry.original_time = question.original_time;
+        }
+        answers.push(entry);
     }
 
     // Disable the submit button to prevent double submission
@@ -177,73 +154,51 @@ function submitAnswer() {
     submitBtn.disabled = true;
     submitBtn.innerText = 'Submitting...';
 
-    // If currentSchedule is null, try to retrieve from localStorage
-    if (!currentSchedule) {
-        const storedSchedule = localStorage.getItem('currentSchedule');
-        if (storedSchedule) {
-            currentSchedule = JSON.parse(storedSchedule);
-        }
-    }
-
-    // Prepare the request body
-    const requestBody = {
-        item_id: questionId,
-        type: questionType,
-        answer: answer,
-        field: questionField,
-        target: questionTarget,
-        target_type: questionTargetType,
-        schedule: currentSchedule
-    };
-
-    // Add original_time for AM/PM questions
-    if (questionType === 'ampm' && originalTime) {
-        requestBody.original_time = originalTime;
-    }
-
-    fetch('http://localhost:5002/answer-question', {
+    fetch('http://localhost:5002/answer-questions', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
         },
-        body: JSON.stringify(requestBody),
+        body: JSON.stringify({ answers: answers }),
     })
     .then(response => {
         if (!response.ok) {
-            throw new Error(`HTTP error ${response.status}`);
+            return response.json()
+                .catch(() => ({}))
+                .then(data => { throw new Error(data.error || `HTTP error ${response.status}`); });
         }
         return response.json();
     })
     .then(data => {
-        console.log('Answer response:', data);
+        console.log('Answers response:', data);
         currentSchedule = data.schedule;
         localStorage.setItem('currentSchedule', JSON.stringify(currentSchedule));
 
-        // Close the current question dialog
+        // Close the question dialog
         closeDialog();
 
         if (data.questions && data.questions.length > 0) {
-            // Show the next question
+            // Answers can raise follow-up questions (e.g. AM/PM for a new time)
             showQuestionDialog(data.questions);
         } else {
             // No more missing info questions
             allMissingInfoResolved = true;
             document.getElementById('scheduleOutput').innerHTML = '<div class="info-message">Generating your optimized schedule...</div>';
-            
+
             // Go directly to optimization
             setTimeout(() => {
                 generateOptimizedSchedule();
             }, 500);
         }
-        
+
         // Re-enable the button
         submitBtn.disabled = false;
         submitBtn.innerText = 'Submit';
     })
     .catch(error => {
         console.error('Error:', error);
-        alert(`Error submitting answer: ${error.message}`);
-        
+        alert(`Error submitting answers: ${error.message}`);
+
         // Re-enable the button
         submitBtn.disabled = false;
         submitBtn.innerText = 'Submit';
@@ -253,7 +208,6 @@ function submitAnswer() {
 function closeDialog() {
     document.getElementById('questionDialog').classList.add('hidden');
     currentQuestions = [];
-    currentQuestionIndex = 0;
 }
 
 function setLoadingState(state) {
@@ -390,23 +344,20 @@ function generateOptimizedSchedule() {
     
     setLoadingState('optimizing');
     
-    // Call the backend directly to generate the optimized schedule
-    fetch('http://localhost:5002/generate-optimized-schedule', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({
-            schedule: currentSchedule
-        })
-    })
-    .then(response => {
-        if (!response.ok) {
-            return response.json().then(data => {
-                throw new Error(data.error || 'Failed to generate optimized schedule');
-            });
-        }
-        return response.json();
+    const showPartialCalendar = partialCalendar => {
+        // Replace the loading overlay with the days generated so far
+        const overlay = document.getElementById('loadingOverlay');
+        if (overlay) overlay.remove();
+        displayFormattedSchedule({ generated_calendar: partialCalendar });
+    };
+    
+    // Stream the generation so each day is shown as soon as it is ready; if the stream
+    // cannot be read or the connection drops, queue a background job and poll it instead
+    streamScheduleGeneration(showPartialCalendar)
+    .catch(error => {
+        if (!(error instanceof StreamUnavailableError)) throw error;
+        console.warn('Schedule stream unavailable, polling a background job instead:', error.message);
+        return submitScheduleJob(showPartialCalendar);
     })
     .then(data => {
         // Reset the chat hidden flag so the chat interface will be visible
@@ -422,6 +373,139 @@ function generateOptimizedSchedule() {
     });
 }
 
+// Raised when the schedule stream could not be read to its end (as opposed to an error
+// reported by the server), so the generation can be retried as a polled job
+class StreamUnavailableError extends Error {}
+
+// Generate the schedule through the streaming route.
+// Calls onPartial for every completed day and resolves with the final schedule.
+function streamScheduleGeneration(onPartial) {
+    if (!window.ReadableStream || !window.TextDecoder) {
+        return Promise.reject(new StreamUnavailableError('Streaming is not supported by this browser'));
+    }
+    return fetch('http://localhost:5002/generate-optimized-schedule', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream'
+        },
+        body: JSON.stringify({
+            schedule: currentSchedule,
+            stream: true
+        })
+    })
+    .catch(error => {
+        throw new StreamUnavailableError(error.message);
+    })
+    .then(response => {
+        if (!response.ok) {
+            return response.json().then(data => {
+                throw new Error(data.error || 'Failed to generate optimized schedule');
+            });
+        }
+        if (!response.body) {
+            throw new StreamUnavailableError('The response cannot be read as a stream');
+        }
+        return readScheduleStream(response, (day, events, partialCalendar) => onPartial(partialCalendar));
+    });
+}
+
+// Read the server-sent events of a streamed schedule generation.
+// Calls onDay for every completed day and resolves with the final schedule.
+function readScheduleStream(response, onDay) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    const partialCalendar = {};
+    let buffer = '';
+
+    function handleEvent(rawEvent) {
+        let eventName = 'message';
+        const dataLines = [];
+        rawEvent.split('\n').forEach(line => {
+            if (line.startsWith('event:')) eventName = line.slice(6).trim();
+            else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+        });
+        if (!dataLines.length) return null;
+        const data = JSON.parse(dataLines.join('\n'));
+
+        if (eventName === 'day') {
+            partialCalendar[data.day] = data.events;
+            onDay(data.day, data.events, partialCalendar);
+        } else if (eventName === 'error') {
+            throw new Error(data.error || 'Failed to generate optimized schedule');
+        } else if (eventName === 'complete') {
+            return data;
+        }
+        return null;
+    }
+
+    function pump() {
+        return reader.read()
+            .catch(error => {
+                throw new StreamUnavailableError(error.message);
+            })
+            .then(({ done, value }) => {
+                if (value) buffer += decoder.decode(value, { stream: true });
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+                for (const rawEvent of events) {
+                    const result = handleEvent(rawEvent);
+                    if (result) return result;
+                }
+                if (done) throw new StreamUnavailableError('Schedule stream ended unexpectedly');
+                return pump();
+            });
+    }
+
+    return pump();
+}
+
+// Queue the generation as a background job and poll it until it finishes.
+function submitScheduleJob(onPartial) {
+    return fetch('http://localhost:5002/schedule-jobs', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+            schedule: currentSchedule
+        })
+    })
+    .then(response => response.json().then(data => {
+        if (!response.ok) {
+            throw new Error(data.error || 'Failed to generate optimized schedule');
+        }
+        return pollScheduleJob(data.job_id, onPartial);
+    }));
+}
+
+// Poll a schedule-generation job until it finishes.
+// Calls onPartial whenever more days are ready and resolves with the final schedule.
+function pollScheduleJob(jobId, onPartial, interval = 1500) {
+    let shownDays = 0;
+
+    function poll() {
+        return fetch(`http://localhost:5002/schedule-jobs/${jobId}`)
+            .then(response => response.json().then(job => {
+                if (!response.ok) {
+                    throw new Error(job.error || 'Failed to check schedule generation');
+                }
+                const partial = job.partial || {};
+                if (Object.keys(partial).length > shownDays) {
+                    shownDays = Object.keys(partial).length;
+                    onPartial(partial);
+                }
+                if (job.status === 'succeeded') return job.result;
+                if (job.status === 'failed' || job.status === 'cancelled') {
+                    throw new Error(job.error || `Schedule generation ${job.status}`);
+                }
+                return new Promise(resolve => setTimeout(resolve, interval)).then(poll);
+            }));
+    }
+
+    return poll();
+}
+
 // --- UPDATED displayFormattedSchedule ---
 // in your main.js
 
@@ -18,13 +18,14 @@ def run_basic_tests():
     # Create a test suite with just the basic tests
     suite = unittest.TestSuite()
     
-    # Add the basic tests
+    # Add the basic tests and the standalone module tests that don't import the app
     try:
-        basic_tests = loader.discover(
-            start_dir=os.path.dirname(os.path.abspath(__file__)),
-            pattern='basic_test.py'
-        )
-        suite.addTests(basic_tests)
+        for pattern in ['basic_test.py', 'test_db_pool.py', 'test_profile_cache.py']:
+            basic_tests = loader.discover(
+                start_dir=os.path.dirname(os.path.abspath(__file__)),
+                pattern=pattern
+            )
+            suite.addTests(basic_tests)
     except Exception as e:
         print(f"Error loading basic tests: {e}")
         return False
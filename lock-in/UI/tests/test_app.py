@@ -172,7 +172,7 @@ class TestUIApp(unittest.TestCase):
         self.patcher_session = patch('app.session', {'user': 'test@example.com'})
         self.mock_session = self.patcher_session.start()
 
-    @patch('app.requests.post')
+    @patch('app.http_client.post')
     def test_parse_schedule_route(self, mock_post):
         """Test parse-schedule route with successful parsing response."""
         # Configure the mock to return a successful response
@@ -224,7 +224,7 @@ class TestUIApp(unittest.TestCase):
         self.assertIn(b'<!DOCTYPE html>', response.data)
         self.assertIn(b'Login', response.data)
 
-    @patch('app.requests.post')
+    @patch('app.http_client.post')
     def test_get_schedule_route(self, mock_post):
         """Test get-schedule route."""
         # Configure the mock to return a successful response
@@ -249,7 +249,7 @@ class TestUIApp(unittest.TestCase):
         self.assertEqual(data['status'], 'success')
         self.assertIn('schedule', data)
         
-    @patch('app.requests.post')
+    @patch('app.http_client.post')
     def test_reset_schedule_route(self, mock_post):
         """Test reset-schedule route."""
         # Configure the mock to return a successful response
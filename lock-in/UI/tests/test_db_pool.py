@@ -0,0 +1,144 @@
+import unittest
+import os
+import sys
+import sqlite3
+import tempfile
+import threading
+import time
+
+# Add parent directory to path to import the pool module without importing app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_pool import ConnectionPool, PoolExhaustedError, get_pool_size_from_env
+
+
+class TestConnectionPool(unittest.TestCase):
+    """Unit tests for the UI database connection pool, backed by a local SQLite file."""
+
+    def setUp(self):
+        """Create a temporary SQLite database with a user table."""
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE user (email TEXT, preferences_completed INTEGER)")
+        conn.execute("INSERT INTO user VALUES ('test@example.com', 1)")
+        conn.commit()
+        conn.close()
+
+        self.opened = 0
+
+        def factory():
+            self.opened += 1
+            return sqlite3.connect(self.db_path, check_same_thread=False)
+
+        self.factory = factory
+
+    def tearDown(self):
+        """Remove the temporary database."""
+        os.remove(self.db_path)
+
+    def test_connections_are_reused(self):
+        """Test that closing a pooled connection returns it for reuse."""
+        pool = ConnectionPool(self.factory, max_size=2)
+        for _ in range(5):
+            conn = pool.connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT preferences_completed FROM user WHERE email = ?", ('test@example.com',))
+            self.assertEqual(cursor.fetchone()[0], 1)
+            conn.close()
+
+        self.assertEqual(self.opened, 1)
+        self.assertEqual(pool.stats(), {'idle': 1, 'in_use': 0, 'max_size': 2})
+
+    def test_context_manager_releases_connection(self):
+        """Test that the context manager form releases the connection."""
+        pool = ConnectionPool(self.factory, max_size=1)
+        with pool.connection() as conn:
+            conn.cursor().execute("UPDATE user SET preferences_completed = 0")
+            conn.commit()
+        self.assertEqual(pool.stats()['in_use'], 0)
+
+        # Closing twice must not corrupt the accounting
+        conn.close()
+        self.assertEqual(pool.stats()['idle'], 1)
+
+    def test_abandoned_transaction_is_rolled_back(self):
+        """Test that close(rollback=True) drops uncommitted work before the connection is reused."""
+        pool = ConnectionPool(self.factory, max_size=1)
+        conn = pool.connection()
+        conn.cursor().execute("UPDATE user SET preferences_completed = 0")
+        conn.close(rollback=True)
+
+        conn = pool.connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT preferences_completed FROM user WHERE email = ?", ('test@example.com',))
+        self.assertEqual(cursor.fetchone()[0], 1)
+        conn.close()
+        self.assertEqual(self.opened, 1)
+
+    def test_pool_is_bounded(self):
+        """Test that checkouts beyond max_size time out with PoolExhaustedError."""
+        pool = ConnectionPool(self.factory, max_size=1, acquire_timeout=0.05)
+        conn = pool.connection()
+        with self.assertRaises(PoolExhaustedError):
+            pool.connection()
+        conn.close()
+        pool.connection().close()
+        self.assertEqual(self.opened, 1)
+
+    def test_waiting_thread_gets_released_connection(self):
+        """Test that a waiting checkout is served as soon as a connection is returned."""
+        pool = ConnectionPool(self.factory, max_size=1, acquire_timeout=2)
+        conn = pool.connection()
+        results = []
+
+        def worker():
+            other = pool.connection()
+            results.append(other)
+            other.close()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        time.sleep(0.05)
+        conn.close()
+        thread.join(timeout=2)
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(self.opened, 1)
+
+    def test_idle_connections_are_evicted(self):
+        """Test that connections idle longer than max_idle_seconds are closed."""
+        pool = ConnectionPool(self.factory, max_size=2, max_idle_seconds=0.01)
+        pool.connection().close()
+        time.sleep(0.05)
+        pool.connection().close()
+        self.assertEqual(self.opened, 2)
+
+    def test_unhealthy_connections_are_replaced(self):
+        """Test that a connection failing its health check is discarded."""
+        pool = ConnectionPool(self.factory, max_size=1, health_check_interval=0)
+        conn = pool.connection()
+        conn._raw_conn.close()  # Simulate a dropped server connection
+        conn.close()
+
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM user")
+            self.assertEqual(cursor.fetchone()[0], 1)
+        self.assertEqual(self.opened, 2)
+
+    def test_pool_size_from_env(self):
+        """Test per-worker pool sizing from environment variables."""
+        original = os.environ.pop('DB_POOL_SIZE', None)
+        try:
+            os.environ['DB_POOL_SIZE'] = '8'
+            self.assertEqual(get_pool_size_from_env(), 8)
+            os.environ['DB_POOL_SIZE'] = 'invalid'
+            self.assertEqual(get_pool_size_from_env(default=3), 3)
+        finally:
+            os.environ.pop('DB_POOL_SIZE', None)
+            if original is not None:
+                os.environ['DB_POOL_SIZE'] = original
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -125,7 +125,7 @@ class TestUIIntegration(unittest.TestCase):
         self.patcher_conn.stop()
         self.patcher_session.stop()
 
-    @patch('app.requests.post')
+    @patch('app.http_client.post')
     def test_parse_schedule_integration_with_eep1(self, mock_post):
         """Test UI integration with EEP1 for parsing schedules."""
         # Configure the mock for EEP1 parsing response
@@ -167,7 +167,7 @@ class TestUIIntegration(unittest.TestCase):
                 break
         self.assertTrue(update_called)
 
-    @patch('app.requests.post')
+    @patch('app.http_client.post')
     def test_parse_schedule_with_missing_info(self, mock_post):
         """Test integration when schedule has missing information."""
         # Configure the mock for EEP1 parsing with missing info
@@ -207,7 +207,7 @@ class TestUIIntegration(unittest.TestCase):
         
         # Verify the questions were stored in the session
 
-    @patch('app.requests.get')
+    @patch('app.http_client.get')
     def test_get_schedule_integration_with_eep1(self, mock_get):
         """Test UI integration with EEP1 for getting schedules."""
         # Configure mock cursor to return a user with a schedule
@@ -223,7 +223,7 @@ class TestUIIntegration(unittest.TestCase):
         self.assertEqual(data['status'], 'success')
         self.assertIn('schedule', data)
 
-    @patch('app.requests.post')
+    @patch('app.http_client.post')
     def test_answer_question_integration(self, mock_post):
         """Test integration of answering questions about missing schedule information."""
         # Configure mock cursor to return a user with a schedule with missing info
@@ -275,7 +275,37 @@ class TestUIIntegration(unittest.TestCase):
                 break
         self.assertTrue(update_called)
 
-    @patch('app.requests.post')
+    @patch('app.http_client.post')
+    def test_answer_questions_batch_integration(self, mock_post):
+        """Test that all answers go to EEP1 in one call and are saved with one update."""
+        mock_response = MagicMock()
+        mock_response.ok = True
+        mock_response.json.return_value = {
+            'success': True,
+            'answered': 2,
+            'schedule': self.schedule_with_missing_info,
+            'questions': None,
+            'has_more_questions': False,
+            'ready_for_optimization': True
+        }
+        mock_post.return_value = mock_response
+
+        answers = [
+            {'item_id': 'meeting-1', 'type': 'time', 'answer': '14:00'},
+            {'item_id': 'meeting-1', 'type': 'duration', 'answer': '90'}
+        ]
+        response = self.client.post('/answer-questions', json={'answers': answers}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(json.loads(response.data)['ready_for_optimization'])
+        mock_post.assert_called_once()
+        self.assertTrue(mock_post.call_args[0][0].endswith('/answer-questions'))
+        self.assertEqual(mock_post.call_args[1]['json'], {'answers': answers})
+        updates = [call for call in self.mock_cursor.execute.call_args_list if 'UPDATE user' in call[0][0]]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('parsed_json', updates[0][0][0])
+
+    @patch('app.http_client.post')
     def test_integration_end_to_end_flow(self, mock_post):
         """Test an end-to-end flow of the application with mocked services."""
         if self.mock_mode:
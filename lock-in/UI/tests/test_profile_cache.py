@@ -0,0 +1,82 @@
+import unittest
+import os
+import sys
+import time
+from unittest.mock import MagicMock
+
+# Add parent directory to path to import the cache module without importing app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from profile_cache import ProfileCache, profile_from_row
+
+
+class TestProfileCache(unittest.TestCase):
+    """Unit tests for the per-user profile cache."""
+
+    def setUp(self):
+        """Set up a sample profile."""
+        self.profile = profile_from_row((1, '{"wake_time": "07:00"}', None, '2024-01-01T00:00:00', None, None, 1, None))
+
+    def test_profile_from_row(self):
+        """Test conversion of a database row into a profile dictionary."""
+        self.assertTrue(self.profile['preferences_completed'])
+        self.assertTrue(self.profile['has_latest_schedule'])
+        self.assertEqual(self.profile['schedule_timestamp'], '2024-01-01T00:00:00')
+        self.assertIsNone(self.profile['custom_prompt'])
+
+    def test_get_returns_copy(self):
+        """Test that cached profiles cannot be mutated by callers."""
+        cache = ProfileCache()
+        cache.set('test@example.com', self.profile)
+        cached = cache.get('test@example.com')
+        cached['preferences_completed'] = False
+        self.assertTrue(cache.get('test@example.com')['preferences_completed'])
+
+    def test_entries_expire(self):
+        """Test that entries are dropped after the TTL."""
+        cache = ProfileCache(ttl_seconds=0.01)
+        cache.set('test@example.com', self.profile)
+        time.sleep(0.03)
+        self.assertIsNone(cache.get('test@example.com'))
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_eviction(self):
+        """Test that the least recently used profile is evicted when full."""
+        cache = ProfileCache(max_size=2)
+        cache.set('a@example.com', self.profile)
+        cache.set('b@example.com', self.profile)
+        cache.get('a@example.com')
+        cache.set('c@example.com', self.profile)
+
+        self.assertIsNotNone(cache.get('a@example.com'))
+        self.assertIsNone(cache.get('b@example.com'))
+        self.assertIsNotNone(cache.get('c@example.com'))
+
+    def test_invalidate(self):
+        """Test explicit invalidation after a write."""
+        cache = ProfileCache()
+        cache.set('test@example.com', self.profile)
+        cache.invalidate('test@example.com')
+        self.assertIsNone(cache.get('test@example.com'))
+
+        # Invalidating an unknown user is a no-op
+        cache.invalidate('unknown@example.com')
+
+    def test_hit_and_miss_metrics(self):
+        """Test that hits and misses are counted."""
+        metrics_dict = {
+            'cache_hits_total': MagicMock(),
+            'cache_misses_total': MagicMock(),
+            'cache_entries': MagicMock()
+        }
+        cache = ProfileCache(metrics_dict=metrics_dict)
+        cache.get('test@example.com')
+        cache.set('test@example.com', self.profile)
+        cache.get('test@example.com')
+
+        metrics_dict['cache_misses_total'].labels.assert_called_with(service='ui', cache='user_profile')
+        metrics_dict['cache_hits_total'].labels.return_value.inc.assert_called_once()
+        metrics_dict['cache_entries'].labels.return_value.set.assert_called_with(1)
+
+
+if __name__ == '__main__':
+    unittest.main()
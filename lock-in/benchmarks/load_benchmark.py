@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Concurrent-request load benchmark for the LLM-bound services.
+
+By default it starts IEP2 under gunicorn twice, once with sync workers and once
+with gevent workers, points it at a local fake Anthropic endpoint that answers
+after a fixed delay, and fires concurrent /api/generate requests at it. This
+measures how many in-flight LLM calls one deployment can hold, without calling
+the real API.
+
+Use --url to load-test an already running service instead.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+LOCK_IN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IEP2_DIR = os.path.join(LOCK_IN_DIR, 'IEP2')
+
+FAKE_COMPLETION = {
+    "id": "msg_benchmark",
+    "type": "message",
+    "role": "assistant",
+    "content": [{"type": "text", "text": "{\"Monday\": []}"}],
+    "usage": {"input_tokens": 10, "output_tokens": 5}
+}
+
+
+class SlowLLMHandler(BaseHTTPRequestHandler):
+    """Fake Messages API that waits `latency` seconds before answering."""
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        time.sleep(self.server.latency)
+        body = json.dumps(FAKE_COMPLETION).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def run_load(url, concurrency, total_requests, request_timeout):
+    """Send total_requests POSTs with `concurrency` in flight; return summary stats."""
+    payload = {'prompt': 'benchmark prompt', 'max_tokens': 16}
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one_request(_):
+        nonlocal errors
+        start = time.time()
+        try:
+            response = requests.post(url, json=payload, timeout=request_timeout)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        with lock:
+            if ok:
+                latencies.append(time.time() - start)
+            else:
+                errors += 1
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one_request, range(total_requests)))
+    elapsed = time.time() - start
+
+    latencies.sort()
+
+    def percentile(p):
+        if not latencies:
+            return float('nan')
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    return {
+        'requests': total_requests,
+        'ok': len(latencies),
+        'errors': errors,
+        'elapsed': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(0.50),
+        'p95': percentile(0.95)
+    }
+
+
+def benchmark_worker_class(worker_class, args, llm_url):
+    """Start IEP2 under gunicorn with the given worker class and load it."""
+    port = free_port()
+    env = dict(
+        os.environ,
+        ANTHROPIC_API_KEY='benchmark',
+        ANTHROPIC_API_URL=llm_url,
+        GUNICORN_WORKER_CLASS=worker_class,
+        GUNICORN_WORKERS=str(args.workers)
+    )
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+         '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'app:app'],
+        cwd=IEP2_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        if not wait_for_port(port):
+            raise RuntimeError(f"gunicorn ({worker_class}) did not start")
+        return run_load(f'http://127.0.0.1:{port}/api/generate', args.concurrency,
+                        args.requests, args.request_timeout)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def print_row(label, stats):
+    print(f"{label:<10} {stats['ok']:>5}/{stats['requests']:<5} {stats['errors']:>6} "
+          f"{stats['elapsed']:>9.2f} {stats['throughput']:>10.1f} {stats['p50']:>8.2f} {stats['p95']:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-request benchmark for Lock-in services")
+    parser.add_argument('--url', help="Load-test this running endpoint instead of starting IEP2")
+    parser.add_argument('--concurrency', type=int, default=100, help="Requests in flight at once")
+    parser.add_argument('--requests', type=int, default=200, help="Total number of requests")
+    parser.add_argument('--latency', type=float, default=1.0, help="Fake LLM response time in seconds")
+    parser.add_argument('--workers', type=int, default=2, help="Gunicorn worker processes")
+    parser.add_argument('--worker-classes', default='sync,gevent', help="Comma-separated worker classes to compare")
+    parser.add_argument('--request-timeout', type=float, default=350, help="Client timeout per request")
+    args = parser.parse_args()
+
+    header = f"{'workers':<10} {'ok':>11} {'errors':>6} {'elapsed s':>9} {'req/s':>10} {'p50 s':>8} {'p95 s':>8}"
+
+    if args.url:
+        print(header)
+        print_row('target', run_load(args.url, args.concurrency, args.requests, args.request_timeout))
+        return
+
+    llm_server = FakeLLMServer(('127.0.0.1', 0), SlowLLMHandler)
+    llm_server.latency = args.latency
+    threading.Thread(target=llm_server.serve_forever, daemon=True).start()
+    llm_url = f"http://127.0.0.1:{llm_server.server_address[1]}/v1/messages"
+
+    print(f"IEP2 /api/generate, {args.workers} workers, fake LLM latency {args.latency}s, "
+          f"{args.requests} requests at concurrency {args.concurrency}")
+    print(header)
+    try:
+        for worker_class in args.worker_classes.split(','):
+            print_row(worker_class, benchmark_worker_class(worker_class.strip(), args, llm_url))
+    finally:
+        llm_server.shutdown()
+        llm_server.server_close()
+
+
+if __name__ == '__main__':
+    main()
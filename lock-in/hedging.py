@@ -0,0 +1,225 @@
+"""
+Hedged LLM calls with a tail-latency cutoff.
+
+A hedged call starts the primary request and, if it has not produced a
+result by a percentile of the recent latencies of the same task, model and
+input size (sizes are bucketed by powers of two, so a 40-event edit is not
+judged by the latency of 3-event ones), fires one backup request (to the
+same or an alternate model). The first valid result wins. Backups are
+capped at a share of the calls in the window, which bounds the extra cost.
+
+Each request of a hedged call is given a threading.Event that is set when
+the other request won. Requests read their answer as a stream and stop (and
+close it) once the event is set, so the loser gives back its connection and
+stops generating instead of being billed in full. A loser that returns
+anyway is passed to release().
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+
+from model_router import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+NONE = 'none'          # answered before the cutoff (or no cutoff known yet)
+FIRED = 'fired'        # a backup request was sent
+OVER_BUDGET = 'over_budget'  # the cutoff passed but the hedge budget was spent
+
+PRIMARY = 'primary'
+BACKUP = 'backup'
+
+
+def size_bucket(size):
+    """Power-of-two range of an input size, e.g. '8-15' for 10 items ('0' for an empty input)."""
+    size = max(int(size), 0)
+    if size == 0:
+        return '0'
+    low = 1 << (size.bit_length() - 1)
+    return f"{low}-{2 * low - 1}" if low > 1 else '1'
+
+
+def latency_key(task, size=None):
+    """Key under which the latencies of a task are tracked: the task, with the bucket of its size if known."""
+    return task if size is None else f"{task}:{size_bucket(size)}"
+
+
+def _start(fn):
+    """Run fn in a daemon thread and return a Future of its result."""
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(fn())
+        except Exception as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name='llm-hedge', daemon=True).start()
+    return future
+
+
+class Hedger:
+    """
+    Runs LLM calls with an optional backup request.
+
+    Args:
+        enabled: When False calls run inline, without hedging
+        percentile: Quantile of recent latencies after which the backup is sent
+        min_delay: Shortest wait in seconds before a backup
+        max_delay: Longest wait in seconds before a backup (None for no limit)
+        budget: Largest share of calls in the window that may send a backup
+        backup_model: Model of the backups (None for the primary model)
+        latency: LatencyTracker of the calls' latencies per (task and size bucket, model)
+        metrics_dict: Optional metrics dictionary returned by setup_metrics
+        service_name: Service label for metrics
+    """
+
+    def __init__(self, enabled=True, percentile=0.95, min_delay=1.0, max_delay=None, budget=0.05,
+                 backup_model=None, latency=None, metrics_dict=None, service_name=None, clock=time.monotonic):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.backup_model = backup_model
+        self.latency = latency or LatencyTracker(min_samples=10, clock=clock)
+        self.metrics_dict = metrics_dict
+        self.service_name = service_name
+        self._clock = clock
+        self._calls = deque()  # (timestamp, hedged)
+        self._lock = threading.Lock()
+
+    def delay(self, task, model, size=None):
+        """
+        Seconds to wait for the primary before a backup, or None until enough
+        latencies of calls of the same size bucket are known.
+        """
+        cutoff = self.latency.percentile(latency_key(task, size), model, self.percentile)
+        if cutoff is None:
+            return None
+        cutoff = max(cutoff, self.min_delay)
+        return min(cutoff, self.max_delay) if self.max_delay else cutoff
+
+    def call(self, task, model, request, valid=lambda result: True, release=None, size=None):
+        """
+        Return (result, winner) for request(model, cancelled), where winner is
+        PRIMARY or BACKUP. A result is a winner only if valid(result); when
+        neither call produced a valid result, the primary's outcome is
+        returned (or raised). size (items in the input) selects the latencies
+        the cutoff is taken from.
+
+        cancelled is None when the call cannot be hedged, so the request can
+        be sent as usual; otherwise it is a threading.Event set once the
+        request lost, which should then stop reading its answer. release(result)
+        is called on the result of the loser, if it returns one.
+        """
+        if not self.enabled:
+            return request(model, None), PRIMARY
+        key = latency_key(task, size)
+        delay = self.delay(task, model, size)
+        if delay is None:
+            result = self._timed(key, model, lambda: request(model, None), valid)
+            self._count(task, NONE)
+            return result, PRIMARY
+
+        started = self._clock()
+        cancelled = {PRIMARY: threading.Event(), BACKUP: threading.Event()}
+        primary = _start(lambda: self._timed(key, model, lambda: request(model, cancelled[PRIMARY]), valid))
+        if wait([primary], timeout=delay).done:
+            self._count(task, NONE)
+            return primary.result(), PRIMARY
+        if not self._admit():
+            self._count(task, OVER_BUDGET)
+            return primary.result(), PRIMARY
+
+        backup_model = self.backup_model or model
+        logger.info(f"No {task} result from {model} after {delay:.1f}s, sending a backup request to {backup_model}")
+        self._count(task, FIRED)
+        backup = _start(lambda: self._timed(key, backup_model, lambda: request(backup_model, cancelled[BACKUP]), valid))
+        pending = {primary: PRIMARY, backup: BACKUP}
+        while pending:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                role = pending.pop(future)
+                if future.exception() is None and valid(future.result()):
+                    for loser in pending.values():
+                        cancelled[loser].set()
+                    self._settle(task, role, started, pending, valid, release)
+                    return future.result(), role
+        return primary.result(), PRIMARY
+
+    # -------------------------------
+    # Internal helpers
+    # -------------------------------
+
+    def _timed(self, key, model, fn, valid):
+        """Run fn and record its latency under key when it produced a valid result."""
+        start = self._clock()
+        result = fn()
+        if valid(result):
+            self.latency.observe(key, model, self._clock() - start)
+        return result
+
+    def _settle(self, task, winner, started, pending, valid, release):
+        """Record the winner and release the loser once it returns."""
+        won_after = self._clock() - started
+        if self.metrics_dict and 'llm_hedge_wins_total' in self.metrics_dict:
+            self.metrics_dict['llm_hedge_wins_total'].labels(service=self.service_name, task=task, winner=winner).inc()
+        for future in pending:
+            def finished(future, loser=pending[future]):
+                if future.exception() is not None:
+                    return
+                # A primary stopped by its cancel event never finished, so the time saved is unknown
+                if loser == PRIMARY and valid(future.result()):
+                    self._observe_saved(task, self._clock() - started - won_after)
+                if release:
+                    try:
+                        release(future.result())
+                    except Exception as e:
+                        logger.warning(f"Could not release the losing {task} call: {str(e)}")
+            future.add_done_callback(finished)
+
+    def _admit(self):
+        """Whether one more backup stays within the budget of the calls in the window."""
+        now = self._clock()
+        with self._lock:
+            while self._calls and self._calls[0][0] < now - self.latency.window_seconds:
+                self._calls.popleft()
+            calls = len(self._calls) + 1
+            hedges = sum(1 for _, hedged in self._calls if hedged) + 1
+            return hedges <= self.budget * calls
+
+    def _count(self, task, hedge):
+        with self._lock:
+            self._calls.append((self._clock(), hedge == FIRED))
+        if self.metrics_dict and 'llm_hedged_calls_total' in self.metrics_dict:
+            self.metrics_dict['llm_hedged_calls_total'].labels(service=self.service_name, task=task, hedge=hedge).inc()
+
+    def _observe_saved(self, task, seconds):
+        if self.metrics_dict and 'llm_hedge_latency_saved_seconds' in self.metrics_dict:
+            self.metrics_dict['llm_hedge_latency_saved_seconds'].labels(
+                service=self.service_name, task=task
+            ).observe(max(seconds, 0.0))
+
+
+def create_hedger_from_env(service_name, metrics_dict=None):
+    """Hedger configured by the LLM_HEDGE_* environment variables (disabled unless LLM_HEDGE_ENABLED is true)."""
+    max_delay = float(os.getenv('LLM_HEDGE_MAX_DELAY', '0')) or None
+    return Hedger(
+        enabled=os.getenv('LLM_HEDGE_ENABLED', 'false').lower() in ('1', 'true', 'yes'),
+        percentile=float(os.getenv('LLM_HEDGE_PERCENTILE', '0.95')),
+        min_delay=float(os.getenv('LLM_HEDGE_MIN_DELAY', '1')),
+        max_delay=max_delay,
+        budget=float(os.getenv('LLM_HEDGE_BUDGET', '0.05')),
+        backup_model=os.getenv('LLM_HEDGE_MODEL') or None,
+        latency=LatencyTracker(
+            window_seconds=float(os.getenv('LLM_HEDGE_WINDOW', '300')),
+            min_samples=int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '10'))
+        ),
+        metrics_dict=metrics_dict,
+        service_name=service_name
+    )
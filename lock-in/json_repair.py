@@ -0,0 +1,326 @@
+"""
+Extraction and repair of JSON embedded in LLM output.
+
+Finds the JSON object in a model response (plain, inside code fences or
+surrounded by prose, possibly one of several objects) and repairs the usual
+defects locally: trailing commas, comments, raw newlines and control
+characters inside strings, and output truncated mid-object. Which repairs
+were needed is reported, so the rare cases that still need an LLM to fix
+the response can be measured.
+"""
+
+import re
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+FENCE_RE = re.compile(r"```(?:json|JSON)?[ \t]*\n?(.*?)```", re.DOTALL)
+
+# Repair names reported in ExtractionResult.repairs and the json_repairs_total metric
+TRAILING_COMMA = 'trailing_comma'
+COMMENT = 'comment'
+CONTROL_CHARACTER = 'control_character'
+UNTERMINATED_STRING = 'unterminated_string'
+TRUNCATED_VALUE = 'truncated_value'
+AUTO_CLOSED = 'auto_closed'
+
+CLOSERS = {'{': '}', '[': ']'}
+ESCAPES = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
+LITERALS = ('true', 'false', 'null')
+
+
+class ExtractionResult:
+    """
+    A JSON value found in text.
+
+    Attributes:
+        value: The parsed object or array
+        strategy: 'direct' (the whole text), 'fenced' (a code block) or 'scanned' (found in prose)
+        repairs: Names of the repairs applied, empty if the JSON was valid as written
+    """
+
+    def __init__(self, value, strategy, repairs=None):
+        self.value = value
+        self.strategy = strategy
+        self.repairs = repairs or []
+
+    @property
+    def repaired(self):
+        return bool(self.repairs)
+
+
+# ===============================
+# Scanning
+# ===============================
+
+class JsonScanner:
+    """
+    Incremental scanner for JSON objects and arrays embedded in text.
+    feed() returns the top-level values completed by the new text, so it can
+    run over a streamed response; pending() returns the unterminated value at
+    the end of the text, if any.
+    """
+
+    def __init__(self, openers='{['):
+        self.openers = openers
+        self.buffer = ''
+        self._pos = 0
+        self._stack = []
+        self._start = None
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text):
+        self.buffer += text
+        completed = []
+        buffer = self.buffer
+        for i in range(self._pos, len(buffer)):
+            char = buffer[i]
+            if self._start is None:
+                if char in self.openers:
+                    self._start = i
+                    self._stack = [char]
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._stack.append(char)
+            elif char in '}]':
+                self._stack.pop()
+                if not self._stack:
+                    completed.append(buffer[self._start:i + 1])
+                    self._start = None
+        self._pos = len(buffer)
+        return completed
+
+    def pending(self):
+        return self.buffer[self._start:] if self._start is not None else None
+
+
+# ===============================
+# Repair
+# ===============================
+
+def _last_significant(out):
+    """Index of the last non-whitespace character in out, or -1."""
+    i = len(out) - 1
+    while i >= 0 and out[i].isspace():
+        i -= 1
+    return i
+
+
+def _close_truncated(out, stack, repairs, key_open):
+    """Finish a value cut off mid-way and close every open bracket."""
+    # Drop a partial bare token such as `tru` or `12.`
+    i = _last_significant(out)
+    token_end = i
+    while i >= 0 and (out[i].isalnum() or out[i] in '.-+'):
+        i -= 1
+    token = ''.join(out[i + 1:token_end + 1])
+    if token and token not in LITERALS:
+        try:
+            json.loads(token)
+        except ValueError:
+            del out[i + 1:]
+            repairs.add(TRUNCATED_VALUE)
+
+    i = _last_significant(out)
+    last = out[i] if i >= 0 else ''
+    if last == ',':
+        del out[i:]
+        repairs.add(TRUNCATED_VALUE)
+    elif last == ':':
+        out.append('null')
+        repairs.add(TRUNCATED_VALUE)
+    elif last == '"' and key_open:
+        # The text ended right after an object key
+        out.append(': null')
+        repairs.add(TRUNCATED_VALUE)
+
+    out.extend(CLOSERS[opener] for opener in reversed(stack))
+    repairs.add(AUTO_CLOSED)
+
+
+def repair_json(fragment):
+    """
+    Repair a JSON fragment in one pass. Returns (repaired text, sorted list of repairs).
+    The result is not guaranteed to parse; callers should still json.loads it.
+    """
+    out = []
+    repairs = set()
+    stack = []
+    in_string = False
+    escape = False
+    key_open = False  # the last string was an object key not yet followed by ':'
+    expect_key = False
+    i = 0
+    n = len(fragment)
+
+    while i < n:
+        char = fragment[i]
+        if in_string:
+            if escape:
+                escape = False
+                out.append(char)
+            elif char == '\\':
+                escape = True
+                out.append(char)
+            elif char == '"':
+                in_string = False
+                out.append(char)
+            elif ord(char) < 0x20:
+                out.append(ESCAPES.get(char, f"\\u{ord(char):04x}"))
+                repairs.add(CONTROL_CHARACTER)
+            else:
+                out.append(char)
+            i += 1
+            continue
+
+        if char == '/' and fragment.startswith('//', i):
+            end = fragment.find('\n', i)
+            i = n if end < 0 else end
+            repairs.add(COMMENT)
+            continue
+        if char == '/' and fragment.startswith('/*', i):
+            end = fragment.find('*/', i + 2)
+            i = n if end < 0 else end + 2
+            repairs.add(COMMENT)
+            continue
+
+        if char == '"':
+            in_string = True
+            key_open = expect_key
+        elif char in '{[':
+            stack.append(char)
+            expect_key = char == '{'
+        elif char in '}]':
+            last = _last_significant(out)
+            if last >= 0 and out[last] == ',':
+                del out[last]
+                repairs.add(TRAILING_COMMA)
+            if stack:
+                stack.pop()
+            expect_key = False
+        elif char == ':':
+            key_open = False
+            expect_key = False
+        elif char == ',':
+            expect_key = bool(stack) and stack[-1] == '{'
+        out.append(char)
+        i += 1
+
+    if in_string:
+        if escape:
+            out.pop()
+        out.append('"')
+        repairs.add(UNTERMINATED_STRING)
+    if stack:
+        _close_truncated(out, stack, repairs, key_open)
+
+    return ''.join(out), sorted(repairs)
+
+
+def parse_fragment(fragment):
+    """
+    Parse a JSON object or array, repairing it if needed.
+    Returns (value, repairs), or (None, repairs) if it cannot be parsed.
+    """
+    try:
+        value = json.loads(fragment)
+        repairs = []
+    except ValueError:
+        repaired, repairs = repair_json(fragment)
+        try:
+            value = json.loads(repaired)
+        except ValueError:
+            return None, repairs
+    if not isinstance(value, (dict, list)):
+        return None, repairs
+    return value, repairs
+
+
+# ===============================
+# Extraction
+# ===============================
+
+def _find_json(text, prefer_keys):
+    stripped = text.strip()
+    try:
+        value = json.loads(stripped)
+        if isinstance(value, (dict, list)):
+            return ExtractionResult(value, 'direct')
+    except ValueError:
+        pass
+
+    candidates = [(block, 'fenced') for block in FENCE_RE.findall(text)]
+    scanner = JsonScanner()
+    candidates += [(span, 'scanned') for span in scanner.feed(text)]
+    if scanner.pending():
+        candidates.append((scanner.pending(), 'scanned'))
+
+    results = []
+    for position, (fragment, strategy) in enumerate(candidates):
+        value, repairs = parse_fragment(fragment.strip())
+        if value is not None:
+            results.append((position, len(fragment), ExtractionResult(value, strategy, repairs)))
+    if not results:
+        return None
+
+    def rank(entry):
+        position, size, result = entry
+        is_object = isinstance(result.value, dict)
+        has_key = is_object and any(key in result.value for key in prefer_keys)
+        # Objects with an expected key first, then objects before arrays (a bracket in
+        # prose is rarely the answer), then intact ones, then the biggest, then the earliest
+        return (not has_key, not is_object, result.repaired, -size, position)
+
+    return min(results, key=rank)[2]
+
+
+def extract_json(text, prefer_keys=(), metrics_dict=None, service_name=None):
+    """
+    Find and parse the JSON object in an LLM response.
+
+    Args:
+        text: The model output
+        prefer_keys: When the text holds several objects, prefer one with any of these keys
+        metrics_dict: Optional metrics dictionary returned by setup_metrics
+        service_name: Service label for metrics
+
+    Returns:
+        ExtractionResult, or None if no JSON could be recovered
+    """
+    result = _find_json(text, prefer_keys) if isinstance(text, str) and text.strip() else None
+    if result is None:
+        logger.warning("No JSON could be extracted from the model output")
+        outcome = 'failed'
+    elif result.repaired:
+        logger.info(f"Repaired model JSON ({result.strategy}): {', '.join(result.repairs)}")
+        outcome = 'repaired'
+    else:
+        outcome = 'direct' if result.strategy == 'direct' else 'extracted'
+    record_extraction(metrics_dict, service_name, outcome, result.repairs if result else ())
+    return result
+
+
+def record_extraction(metrics_dict, service_name, outcome, repairs=()):
+    """
+    Count an extraction outcome: 'direct', 'extracted', 'repaired', 'failed',
+    or 'llm_fallback' when a caller had to ask an LLM to fix the output.
+    """
+    if not metrics_dict or 'json_extractions_total' not in metrics_dict:
+        return
+    metrics_dict['json_extractions_total'].labels(service=service_name, result=outcome).inc()
+    for repair in repairs:
+        metrics_dict['json_repairs_total'].labels(service=service_name, repair=repair).inc()
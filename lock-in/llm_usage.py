@@ -0,0 +1,265 @@
+"""
+Token and cost accounting for LLM calls.
+
+Token counts are read from the `usage` block of the provider response
+(OpenAI chat completions or Anthropic messages), including prompt-cache reads
+and writes, and priced per model. Every call is attributed to a service,
+endpoint, model, user and feature (parse, generate, chat, ...), exported as
+Prometheus counters and appended to a SQLite ledger that can be aggregated
+per user or per feature.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+TOKEN_TYPES = ('input', 'output', 'cache_read', 'cache_write')
+
+# USD per million tokens: (input, output, cache read, cache write). Matched by longest model prefix.
+MODEL_PRICES = {
+    'gpt-3.5-turbo': (0.50, 1.50, 0.50, 0.50),
+    'gpt-4-1106-preview': (10.00, 30.00, 10.00, 10.00),
+    'gpt-4o-mini': (0.15, 0.60, 0.075, 0.15),
+    'gpt-4o': (2.50, 10.00, 1.25, 2.50),
+    'claude-3-haiku': (0.25, 1.25, 0.03, 0.30),
+    'claude-3-5-haiku': (0.80, 4.00, 0.08, 1.00),
+    'claude-3-5-sonnet': (3.00, 15.00, 0.30, 3.75),
+    'claude-3-7-sonnet': (3.00, 15.00, 0.30, 3.75),
+    'claude-3-opus': (15.00, 75.00, 1.50, 18.75),
+}
+
+# Columns the ledger can be aggregated by
+GROUP_COLUMNS = ('user_id', 'feature', 'service', 'endpoint', 'model')
+
+
+def _field(usage, name):
+    if usage is None:
+        return None
+    if isinstance(usage, dict):
+        return usage.get(name)
+    return getattr(usage, name, None)
+
+
+def _count(value):
+    try:
+        return max(int(value or 0), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def normalize_usage(usage):
+    """
+    Convert an OpenAI or Anthropic usage block (dict or SDK object) to
+    {'input', 'output', 'cache_read', 'cache_write'} token counts, where input
+    excludes tokens read from or written to the prompt cache.
+    """
+    if _field(usage, 'prompt_tokens') is not None or _field(usage, 'completion_tokens') is not None:
+        # OpenAI: prompt_tokens includes the cached prompt tokens
+        cached = _count(_field(_field(usage, 'prompt_tokens_details'), 'cached_tokens'))
+        return {
+            'input': max(_count(_field(usage, 'prompt_tokens')) - cached, 0),
+            'output': _count(_field(usage, 'completion_tokens')),
+            'cache_read': cached,
+            'cache_write': 0
+        }
+    return {
+        'input': _count(_field(usage, 'input_tokens')),
+        'output': _count(_field(usage, 'output_tokens')),
+        'cache_read': _count(_field(usage, 'cache_read_input_tokens')),
+        'cache_write': _count(_field(usage, 'cache_creation_input_tokens'))
+    }
+
+
+def load_prices():
+    """MODEL_PRICES updated with the LLM_PRICES environment variable ({model: [input, output, cache read, cache write]})."""
+    prices = dict(MODEL_PRICES)
+    override = os.getenv('LLM_PRICES')
+    if override:
+        try:
+            prices.update({model: tuple(float(price) for price in values) for model, values in json.loads(override).items()})
+        except (ValueError, TypeError, AttributeError) as e:
+            logger.error(f"Ignoring invalid LLM_PRICES: {str(e)}")
+    return prices
+
+
+def estimate_cost(model, tokens, prices=None):
+    """Cost in USD of normalized token counts; 0.0 for models without a price."""
+    prices = prices or MODEL_PRICES
+    matches = [name for name in prices if model and model.startswith(name)]
+    if not matches:
+        return 0.0
+    rates = prices[max(matches, key=len)]
+    return sum(tokens.get(token_type, 0) * rate for token_type, rate in zip(TOKEN_TYPES, rates)) / 1_000_000
+
+
+# ===============================
+# Ledger
+# ===============================
+
+class UsageLedger:
+    """
+    Append-only SQLite ledger of LLM calls.
+
+    Args:
+        path: SQLite file path, or ':memory:' for a ledger kept by this process only
+    """
+
+    def __init__(self, path=':memory:'):
+        if path != ':memory:':
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        if path != ':memory:':
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS llm_usage ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL, "
+            "service TEXT NOT NULL, endpoint TEXT, model TEXT, user_id TEXT, feature TEXT, "
+            "input_tokens INTEGER NOT NULL, output_tokens INTEGER NOT NULL, "
+            "cache_read_tokens INTEGER NOT NULL, cache_write_tokens INTEGER NOT NULL, "
+            "cost_usd REAL NOT NULL, latency_ms REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS llm_usage_created_at ON llm_usage (created_at)")
+        self._db.commit()
+
+    def record(self, service, endpoint, model, tokens, cost_usd, user_id=None, feature=None, latency_ms=None):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO llm_usage (created_at, service, endpoint, model, user_id, feature, input_tokens, "
+                "output_tokens, cache_read_tokens, cache_write_tokens, cost_usd, latency_ms) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), service, endpoint, model, user_id, feature, tokens['input'], tokens['output'],
+                 tokens['cache_read'], tokens['cache_write'], cost_usd, latency_ms)
+            )
+            self._db.commit()
+
+    def summary(self, group_by='user_id', since=None):
+        """
+        Totals per value of group_by (one of GROUP_COLUMNS), most expensive first.
+        since: Optional UNIX timestamp; only calls after it are counted.
+        """
+        if group_by not in GROUP_COLUMNS:
+            raise ValueError(f"Cannot group by '{group_by}'. Use one of: {', '.join(GROUP_COLUMNS)}")
+        query = (
+            f"SELECT {group_by}, COUNT(*), SUM(input_tokens), SUM(output_tokens), SUM(cache_read_tokens), "
+            f"SUM(cache_write_tokens), SUM(cost_usd), AVG(latency_ms) FROM llm_usage"
+        )
+        params = ()
+        if since is not None:
+            query += " WHERE created_at >= ?"
+            params = (since,)
+        query += f" GROUP BY {group_by} ORDER BY SUM(cost_usd) DESC, COUNT(*) DESC"
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [{
+            group_by: row[0],
+            'calls': row[1],
+            'input_tokens': row[2],
+            'output_tokens': row[3],
+            'cache_read_tokens': row[4],
+            'cache_write_tokens': row[5],
+            'cost_usd': round(row[6], 6),
+            'avg_latency_ms': round(row[7], 1) if row[7] is not None else None
+        } for row in rows]
+
+    def by_user(self, since=None):
+        return self.summary('user_id', since)
+
+    def by_feature(self, since=None):
+        return self.summary('feature', since)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# ===============================
+# Recording
+# ===============================
+
+class UsageRecorder:
+    """
+    Records the usage of each LLM call in the Prometheus metrics and the ledger.
+
+    Args:
+        service_name: Service that made the call (e.g. 'iep2')
+        ledger: Optional UsageLedger
+        metrics_dict: Optional metrics dictionary returned by setup_metrics
+        prices: {model prefix: (input, output, cache read, cache write)} in USD per million tokens
+    """
+
+    def __init__(self, service_name, ledger=None, metrics_dict=None, prices=None):
+        self.service_name = service_name
+        self.ledger = ledger
+        self.metrics_dict = metrics_dict
+        self.prices = prices or MODEL_PRICES
+
+    def record(self, provider, model, usage, endpoint=None, user_id=None, feature=None, latency=None):
+        """
+        Record one call from its provider usage block. Returns the normalized
+        token counts with the cost under 'cost_usd'.
+        """
+        tokens = normalize_usage(usage)
+        cost = estimate_cost(model, tokens, self.prices)
+        if self.metrics_dict:
+            for token_type in TOKEN_TYPES:
+                if tokens[token_type]:
+                    self.metrics_dict['llm_tokens_total'].labels(
+                        service=provider, model=model, type=token_type
+                    ).inc(tokens[token_type])
+            if cost and 'llm_cost_usd_total' in self.metrics_dict:
+                self.metrics_dict['llm_cost_usd_total'].labels(
+                    service=self.service_name, model=model, feature=feature or 'unknown'
+                ).inc(cost)
+        if self.ledger is not None:
+            try:
+                self.ledger.record(self.service_name, endpoint, model, tokens, cost, user_id=user_id, feature=feature,
+                                   latency_ms=latency * 1000 if latency is not None else None)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to write LLM usage to the ledger: {str(e)}")
+        logger.info(f"LLM usage ({feature or endpoint}, {model}): {tokens}, ${cost:.5f}")
+        return dict(tokens, cost_usd=cost)
+
+
+def usage_attribution(headers):
+    """(user_id, feature) of an LLM call, from the X-User-ID and X-LLM-Feature request headers."""
+    return headers.get('X-User-ID') or None, headers.get('X-LLM-Feature') or None
+
+
+def usage_summary(recorder, args):
+    """
+    Body and status code for a GET /usage request: totals grouped by the
+    group_by query parameter (default user_id), optionally since a UNIX timestamp.
+    """
+    if recorder is None or recorder.ledger is None:
+        return {'error': 'LLM usage ledger is disabled'}, 404
+    group_by = args.get('group_by', 'user_id')
+    try:
+        since = float(args['since']) if args.get('since') else None
+        return {'group_by': group_by, 'totals': recorder.ledger.summary(group_by, since)}, 200
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+
+def create_usage_recorder_from_env(service_name, metrics_dict=None):
+    """
+    Build the recorder from LLM_LEDGER_* environment variables. The ledger is
+    written to LLM_LEDGER_PATH (kept in memory if unset) unless
+    LLM_LEDGER_ENABLED is false.
+    """
+    ledger = None
+    if os.getenv('LLM_LEDGER_ENABLED', 'true').lower() not in ('0', 'false', 'no'):
+        path = os.getenv('LLM_LEDGER_PATH') or ':memory:'
+        try:
+            ledger = UsageLedger(path)
+        except sqlite3.Error as e:
+            logger.error(f"Could not open LLM usage ledger at {path}: {str(e)}")
+    return UsageRecorder(service_name, ledger=ledger, metrics_dict=metrics_dict, prices=load_prices())